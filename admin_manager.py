@@ -14,6 +14,8 @@ from rebecca_manager import RebeccaPanelManager
 from pasargad_manager import PasargadPanelManager
 from marzneshin_manager import MarzneshinPanelManager
 from guard_manager import GuardPanelManager
+from panel_health import GuardedSession, panel_health
+from panel_migration import PanelMigrationJob
 
 logger = logging.getLogger(__name__)
 
@@ -55,6 +57,10 @@ class AdminManager:
             manager.username = panel.get('username')
             manager.password = panel.get('password')
             
+            # Route all panel HTTP through the panel's circuit breaker
+            if getattr(manager, 'session', None) is not None:
+                manager.session = GuardedSession.wrap(manager.session, panel_id, panel_health)
+            
             # For Rebecca/Marzban, we might need subscription_url if available
             if hasattr(manager, 'subscription_url'):
                 manager.subscription_url = panel.get('subscription_url')
@@ -102,6 +108,8 @@ class AdminManager:
     def test_panel_connection(self, panel_id: int) -> Tuple[bool, str]:
         """Test connection to a panel"""
         try:
+            # An explicit admin test always reaches the panel, even with an open circuit
+            panel_health.reset(panel_id)
             manager = self.get_panel_manager(panel_id)
             if not manager:
                 return False, "Panel manager could not be initialized"
@@ -213,7 +221,8 @@ class AdminManager:
             else:
                 # 3x-ui Panel
                 # We need to find a suitable inbound since one wasn't specified
-                inbounds = manager.get_inbounds()
+                # (from the inbound metadata cache - no full listing per purchase)
+                inbounds = manager.get_cached_inbounds()
                 if not inbounds:
                     return False, "No inbounds found on panel", None
                 
@@ -261,9 +270,20 @@ class AdminManager:
             logger.error(f"Error in create_client_on_all_panel_inbounds: {e}")
             return False, f"System error: {str(e)}", None
 
-    def migrate_panel(self, source_panel_id: int, dest_panel_id: int, delete_source: bool) -> Tuple[bool, str, Dict]:
+    def migrate_panel(self, source_panel_id: int, dest_panel_id: int, delete_source: bool = False,
+                      max_workers: int = 8) -> Tuple[bool, str, Dict]:
         """
         Migrate all clients from a source panel to a destination panel.
+        
+        Runs as a resumable job (see panel_migration): creates go out in parallel,
+        progress is checkpointed per client, and calling this again for the same
+        panels resumes an interrupted or partly failed migration.
+        
+        Args:
+            source_panel_id: Panel to move clients from
+            dest_panel_id: Panel to move clients to
+            delete_source: Delete migrated clients from the source panel
+            max_workers: Concurrent creates on the destination panel
         """
         try:
             source_panel_mgr = self.get_panel_manager(source_panel_id)
@@ -274,83 +294,9 @@ class AdminManager:
             if not dest_panel_mgr:
                 return False, f"Destination panel manager not found for ID {dest_panel_id}", {}
 
-            # Get all clients from the source panel
-            source_clients = source_panel_mgr.get_all_clients()
-            if source_clients is None: # Check for None explicitly, as empty list is valid
-                return False, "Failed to retrieve clients from source panel.", {}
-
-            success_count = 0
-            failed_count = 0
-            skipped_count = 0
-            deleted_source_count = 0
-            migration_details = []
-
-            for client in source_clients:
-                try:
-                    client_name = client.get('username')
-                    client_uuid = client.get('uuid') or client_name # Fallback to username if uuid is missing (Marzban)
-                    protocol = client.get('protocol', 'vless')
-                    
-                    # Calculate remaining volume
-                    total_bytes = client.get('total_traffic', 0)
-                    used_bytes = client.get('used_traffic', 0)
-                    remaining_bytes = max(0, total_bytes - used_bytes)
-                    remaining_gb = remaining_bytes / (1024 * 1024 * 1024)
-                    
-                    # Get remaining days
-                    expire_days = client.get('expire_days', 0)
-                    
-                    if not client_name:
-                        skipped_count += 1
-                        migration_details.append(f"Skipped client with no identifiable name.")
-                        continue
-
-                    # Create client on the destination panel
-                    # We use remaining volume and duration
-                    created_client = dest_panel_mgr.create_client(
-                        inbound_id=0, # Placeholder for panels that don't use inbound_id directly
-                        client_name=client_name,
-                        protocol=protocol,
-                        expire_days=expire_days,
-                        total_gb=remaining_gb,
-                        sub_id=client.get('sub_id') # Pass sub_id if available
-                    )
-
-                    if created_client:
-                        success_count += 1
-                        migration_details.append(f"Migrated {client_name} ({protocol}) successfully. Remaining: {remaining_gb:.2f}GB, {expire_days} days.")
-
-                        # Update database
-                        if self.db:
-                            self.db.update_client_panel(client_uuid, dest_panel_id, created_client)
-
-                        # If migration is successful and delete_source is true, delete from source
-                        if delete_source:
-                            inbound_id = client.get('inbound_id', 0)
-                            # Use source_panel_mgr to delete!
-                            if source_panel_mgr.delete_client(inbound_id, client_uuid):
-                                deleted_source_count += 1
-                                migration_details.append(f"Deleted {client_name} from source panel.")
-                            else:
-                                migration_details.append(f"Failed to delete {client_name} from source panel.")
-                    else:
-                        failed_count += 1
-                        migration_details.append(f"Failed to migrate {client_name} ({protocol}).")
-
-                except Exception as e:
-                    failed_count += 1
-                    migration_details.append(f"Error migrating client {client.get('username', 'Unknown')}: {str(e)}")
-
-            stats = {
-                "success": success_count,
-                "failed": failed_count,
-                "skipped": skipped_count,
-                "deleted_source": deleted_source_count,
-                "details": migration_details
-            }
-
-            message = f"Migration complete. Success: {success_count}, Failed: {failed_count}, Skipped: {skipped_count}"
-            return True, message, stats
+            job = PanelMigrationJob(self.db, source_panel_id, dest_panel_id, delete_source=delete_source,
+                                    max_workers=max_workers)
+            return job.run(source_panel_mgr, dest_panel_mgr)
 
         except Exception as e:
             logger.error(f"Error during panel migration: {e}")
@@ -383,6 +329,10 @@ class AdminManager:
                 if self.db.add_panel_inbound(panel_id, inbound_id, name, protocol, port, is_enabled):
                     count += 1
             
+            # Refresh the 3x-ui create path's inbound metadata with what was just synced
+            if isinstance(manager, PanelManager) and hasattr(manager, 'refresh_inbound_cache'):
+                manager.refresh_inbound_cache(inbounds)
+            
             return True, f"Successfully synced {count} inbounds"
             
         except Exception as e:
@@ -0,0 +1,4 @@
+"""
+Benchmarks for VPN Bot
+Standalone measurement scripts, run from the project root: python3 -m benchmarks.<name>
+"""
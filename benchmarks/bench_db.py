@@ -0,0 +1,113 @@
+"""
+Benchmark Database
+Points the project configuration at a throwaway MySQL database for benchmarks.
+
+use_bench_database() must run before config.py is imported: it loads .env the
+same way config.py does, refuses any database whose name does not end in
+BENCH_DATABASE_SUFFIX (so a bot's database, e.g. another bot's in multi-bot
+mode, can never be dropped) and overrides MYSQL_DATABASE for this process. The reports and receipts channels
+are switched off so benchmark purchases never post to Telegram.
+open_bench_database() then drops and recreates that database and returns a
+ProfessionalDatabaseManager on it, with the full schema and indexes.
+"""
+
+import os
+import re
+import logging
+from itertools import islice
+from typing import Iterable, List, Sequence, Tuple
+
+from dotenv import load_dotenv
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BENCH_DATABASE = 'vpn_bot_bench'
+# Only databases named like this are ever dropped
+BENCH_DATABASE_SUFFIX = '_bench'
+# Synthetic users get Telegram IDs from here up, far from real ones
+TELEGRAM_ID_BASE = 7_000_000_000
+
+
+def use_bench_database(name: str = DEFAULT_BENCH_DATABASE, pool_size: int = None):
+    """Configure this process for the benchmark database (call before importing config)"""
+    load_dotenv()
+    if not re.match(r'^[A-Za-z0-9_]+$', name):
+        raise SystemExit(f"Invalid benchmark database name: {name}")
+    if not is_bench_database(name):
+        raise SystemExit(f"Refusing to use '{name}' as the benchmark database - it is dropped and "
+                         f"recreated, so its name must end in '{BENCH_DATABASE_SUFFIX}'")
+    if name == os.getenv('MYSQL_DATABASE', 'vpn_bot'):
+        raise SystemExit(f"Refusing to benchmark against the bot's database '{name}' - "
+                         f"pass a throwaway --database")
+    os.environ['MYSQL_DATABASE'] = name
+    os.environ['REPORTS_CHANNEL_ID'] = '0'
+    os.environ['RECEIPTS_CHANNEL_ID'] = '0'
+    os.environ['DB_PROFILING_ENABLED'] = 'true'  # Query counts come from query_profiler
+    os.environ.setdefault('BOT_TOKEN', '0:benchmark')
+    os.environ.setdefault('ADMIN_ID', '1')
+    if pool_size:
+        os.environ['DB_POOL_SIZE'] = str(pool_size)
+
+
+def is_bench_database(name: str) -> bool:
+    """Whether a database name is clearly a throwaway benchmark database"""
+    return name.endswith(BENCH_DATABASE_SUFFIX) and len(name) > len(BENCH_DATABASE_SUFFIX)
+
+
+def open_bench_database(reset: bool = True):
+    """ProfessionalDatabaseManager on the benchmark database, recreated empty when reset"""
+    import mysql.connector
+    from config import MYSQL_CONFIG
+    from professional_database import ProfessionalDatabaseManager
+
+    if reset:
+        # Checked again here: MYSQL_DATABASE may not have come from use_bench_database()
+        if not is_bench_database(MYSQL_CONFIG['database']):
+            raise SystemExit(f"Refusing to drop '{MYSQL_CONFIG['database']}': not a benchmark database "
+                             f"(name must end in '{BENCH_DATABASE_SUFFIX}')")
+        server_config = {key: MYSQL_CONFIG[key] for key in ('host', 'port', 'user', 'password')}
+        conn = mysql.connector.connect(**server_config)
+        try:
+            cursor = conn.cursor()
+            cursor.execute(f"DROP DATABASE IF EXISTS `{MYSQL_CONFIG['database']}`")
+            cursor.close()
+        finally:
+            conn.close()
+        logger.info(f"🗑️ Recreating benchmark database '{MYSQL_CONFIG['database']}'")
+    return ProfessionalDatabaseManager(MYSQL_CONFIG.copy())
+
+
+def insert_rows(db, table: str, columns: Sequence[str], rows: Iterable[tuple], batch_size: int = 5000) -> int:
+    """Bulk insert (multi-row INSERTs of batch_size rows); rows may be a generator"""
+    sql = f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join(['%s'] * len(columns))})"
+    rows = iter(rows)
+    inserted = 0
+    with db.get_connection() as conn:
+        cursor = conn.cursor()
+        try:
+            while True:
+                batch = list(islice(rows, batch_size))
+                if not batch:
+                    break
+                cursor.executemany(sql, batch)
+                conn.commit()
+                inserted += len(batch)
+        finally:
+            cursor.close()
+    return inserted
+
+
+def seed_users(db, count: int, balance: int = 0) -> List[Tuple[int, int]]:
+    """Insert `count` synthetic users; returns [(users.id, telegram_id)]"""
+    insert_rows(db, 'users', ('telegram_id', 'username', 'first_name', 'balance', 'referral_code'), (
+        (TELEGRAM_ID_BASE + i, f"bench{i}", f"Bench {i}", balance, f"BENCH{i:08d}")
+        for i in range(count)
+    ))
+    with db.get_connection() as conn:
+        cursor = conn.cursor()
+        try:
+            cursor.execute('SELECT id, telegram_id FROM users WHERE telegram_id >= %s ORDER BY id',
+                           (TELEGRAM_ID_BASE,))
+            return [(row[0], row[1]) for row in cursor.fetchall()]
+        finally:
+            cursor.close()
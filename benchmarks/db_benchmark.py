@@ -0,0 +1,334 @@
+#!/usr/bin/env python3
+"""
+Database Benchmark
+Latency distribution and query count of ProfessionalDatabaseManager hot methods on synthetic fleets.
+
+For each fleet size in --clients (e.g. 10k, 100k, 1M services) a throwaway
+MySQL database (benchmarks/bench_db.py) is recreated and seeded with a
+deterministic fleet: panels, one user per SERVICES_PER_USER services, the
+services with a realistic spread of status/expiry/creation dates, one invoice
+per service and balance transactions per user. Every benchmark case then runs
+--calls times at each --concurrency level and records p50/p90/p99/max
+latency, calls/sec, and SQL statements and rows per call (query_profiler).
+
+Results are written as JSON (benchmarks/results/db-<timestamp>.json by
+default). --compare prints the change against an earlier results file, so
+an index or query change can be judged on the same fleet.
+
+Usage: python3 -m benchmarks.db_benchmark [--clients 10000,100000,1000000]
+       [--concurrency 1,8,32] [--calls 200] [--cases get_user,get_all_services_paginated,...]
+       [--database vpn_bot_bench] [--output results.json] [--compare old.json] [--reuse]
+"""
+
+import os
+import sys
+import json
+import time
+import uuid
+import random
+import argparse
+import logging
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.bench_db import DEFAULT_BENCH_DATABASE, TELEGRAM_ID_BASE, use_bench_database, \
+    open_bench_database, insert_rows, seed_users
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+SERVICES_PER_USER = 3
+PANELS = 10
+BULK_UPDATE_SIZE = 1000  # Services per bulk_update_client_status call (one monitor flush)
+FULL_SCAN_CALLS = 5      # Calls of methods that return the whole fleet
+# Run once per monitor cycle, never concurrently - and several copies of a 1M-row result don't fit in memory
+SINGLE_THREADED_CASES = ('get_all_active_services',)
+
+
+# ==================== Fleet ====================
+
+def seed_fleet(db, clients: int, seed: int = 1) -> dict:
+    """Deterministic synthetic fleet of `clients` services"""
+    rng = random.Random(seed)
+    now = datetime.now().replace(microsecond=0)
+    started = time.perf_counter()
+
+    panel_types = ('3x-ui', 'marzban', 'rebecca', 'pasargad', 'marzneshin', 'guard')
+    panel_ids = [db.add_panel(name=f"bench-panel-{i}", url=f"https://panel{i}.bench.invalid",
+                              username='admin', password='admin', api_endpoint=f"https://panel{i}.bench.invalid",
+                              default_inbound_id=1, price_per_gb=1000,
+                              panel_type=panel_types[i % len(panel_types)])
+                 for i in range(PANELS)]
+
+    users = seed_users(db, max(1, clients // SERVICES_PER_USER), balance=100000)
+    user_ids = [user_id for user_id, _ in users]
+
+    def client_rows():
+        for i in range(clients):
+            created = now - timedelta(seconds=rng.randint(0, 365 * 86400))
+            expires = created + timedelta(days=rng.choice((30, 60, 90, 180)))
+            total_gb = rng.choice((10, 20, 50, 100))
+            roll = rng.random()
+            if roll < 0.85:
+                status, active, exhausted, expired = 'active', 1, None, None
+            elif roll < 0.90:
+                # Disabled within the last day: still in the monitor's grace period
+                status, active = 'disabled', 0
+                exhausted, expired = now - timedelta(hours=rng.randint(1, 24)), None
+            else:
+                status, active = 'disabled', 0
+                exhausted, expired = None, now - timedelta(days=rng.randint(2, 60))
+            yield (rng.choice(user_ids), rng.choice(panel_ids), f"svc{i}", str(uuid.UUID(int=rng.getrandbits(128))),
+                   1, 'vless', total_gb, round(rng.uniform(0, total_gb), 2), active, status,
+                   created, expires, exhausted, expired, f"sub{i}")
+
+    insert_rows(db, 'clients', ('user_id', 'panel_id', 'client_name', 'client_uuid', 'inbound_id',
+                                'protocol', 'total_gb', 'used_gb', 'is_active', 'status', 'created_at',
+                                'expires_at', 'exhausted_at', 'expired_at', 'sub_id'), client_rows())
+
+    def invoice_rows():
+        for i in range(clients):
+            created = now - timedelta(seconds=rng.randint(0, 365 * 86400))
+            gb = rng.choice((10, 20, 50, 100))
+            status = rng.choices(('paid', 'completed', 'pending', 'pending_approval'), (60, 30, 8, 2))[0]
+            yield (rng.choice(user_ids), rng.choice(panel_ids), gb, gb * 1000, status,
+                   rng.choice(('balance', 'gateway', 'card')), f"ORD{i:09d}", f"TX{i:09d}",
+                   created, created if status in ('paid', 'completed') else None)
+
+    insert_rows(db, 'invoices', ('user_id', 'panel_id', 'gb_amount', 'amount', 'status', 'payment_method',
+                                 'order_id', 'transaction_id', 'created_at', 'paid_at'), invoice_rows())
+
+    def transaction_rows():
+        for user_id in user_ids:
+            for _ in range(2):
+                yield (user_id, rng.choice((10000, 50000, -20000)), rng.choice(('recharge', 'purchase')),
+                       'bench', now - timedelta(seconds=rng.randint(0, 365 * 86400)))
+
+    insert_rows(db, 'balance_transactions', ('user_id', 'amount', 'transaction_type', 'description',
+                                             'created_at'), transaction_rows())
+
+    # Fresh table statistics, as on a long-running server
+    with db.get_connection() as conn:
+        cursor = conn.cursor()
+        for table in ('users', 'clients', 'invoices', 'balance_transactions'):
+            cursor.execute(f'ANALYZE TABLE {table}')
+            cursor.fetchall()
+        cursor.close()
+
+    seconds = time.perf_counter() - started
+    logger.info(f"🌱 Seeded {clients:,} services, {len(users):,} users in {seconds:.0f}s")
+    return {'clients': clients, 'users': len(users), 'panels': PANELS, 'seed_seconds': round(seconds, 1)}
+
+
+def fleet_size(db) -> int:
+    with db.get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('SELECT COUNT(*) FROM clients')
+        count = cursor.fetchone()[0]
+        cursor.close()
+    return count
+
+
+# ==================== Cases ====================
+
+def build_cases(db, fleet: dict) -> dict:
+    """Case name -> (call(rng), calls override or None)"""
+    users = fleet['users']
+
+    def telegram_id(rng):
+        return TELEGRAM_ID_BASE + rng.randrange(users)
+
+    def bulk_updates(rng):
+        return [{'id': rng.randint(1, fleet['clients']), 'used_gb': round(rng.uniform(0, 100), 2)}
+                for _ in range(BULK_UPDATE_SIZE)]
+
+    # Halfway through the services listing, reached by OFFSET and by the keyset cursor
+    # the listing hands out (the page after deep_page)
+    deep_page = max(1, fleet['clients'] // 20)
+    page, _ = db.get_all_services_paginated(page=deep_page)
+    deep_cursor = db.encode_page_cursor(page[-1] if page else None)
+
+    return {
+        'get_user': (lambda rng: db.get_user(telegram_id(rng)), None),
+        'get_user_clients': (lambda rng: db.get_user_clients(telegram_id(rng)), None),
+        'get_user_transactions': (lambda rng: db.get_user_transactions(telegram_id(rng), limit=10), None),
+        'get_user_services_paginated': (lambda rng: db.get_user_services_paginated(telegram_id(rng)), None),
+        'get_all_active_services': (lambda rng: db.get_all_active_services(), FULL_SCAN_CALLS),
+        'bulk_update_client_status': (lambda rng: db.bulk_update_client_status(bulk_updates(rng)), None),
+        'get_all_services_paginated[page=1]': (lambda rng: db.get_all_services_paginated(page=1), None),
+        f'get_all_services_paginated[page={deep_page}]':
+            (lambda rng: db.get_all_services_paginated(page=deep_page), None),
+        'get_all_services_paginated[after=cursor]':
+            (lambda rng: db.get_all_services_paginated(after=deep_cursor), None),
+        'get_all_services_paginated[search=name]':
+            (lambda rng: db.get_all_services_paginated(search=f"svc{rng.randrange(fleet['clients'])}"), None),
+        'get_all_services_paginated[search=telegram_id]':
+            (lambda rng: db.get_all_services_paginated(search=str(telegram_id(rng))), None),
+        'get_all_users_paginated[page=1]': (lambda rng: db.get_all_users_paginated(page=1), None),
+        'get_all_users_paginated[search=name]':
+            (lambda rng: db.get_all_users_paginated(search=f"bench{rng.randrange(users)}"), None),
+        'get_gateway_invoices_paginated[page=1]': (lambda rng: db.get_gateway_invoices_paginated(page=1), None),
+        'get_gateway_invoices_paginated[status=successful]':
+            (lambda rng: db.get_gateway_invoices_paginated(status_filter='successful'), None),
+        'get_gateway_invoices_paginated[search=order_id]':
+            (lambda rng: db.get_gateway_invoices_paginated(
+                search=f"ORD{rng.randrange(fleet['clients']):09d}"), None),
+    }
+
+
+def _percentile(values, pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def run_case(name: str, call, calls: int, concurrency: int, seed: int = 1) -> dict:
+    """`calls` calls spread over `concurrency` threads"""
+    from query_profiler import query_profiler
+
+    def timed(i):
+        rng = random.Random(seed * 1_000_003 + i)
+        start = time.perf_counter()
+        call(rng)
+        return (time.perf_counter() - start) * 1000
+
+    query_profiler.reset()
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        latencies = list(pool.map(timed, range(calls)))
+    elapsed = time.perf_counter() - started
+    snapshot = query_profiler.snapshot(top=50)
+
+    return {
+        'case': name,
+        'concurrency': concurrency,
+        'calls': calls,
+        'calls_per_sec': round(calls / elapsed, 1),
+        'mean_ms': round(sum(latencies) / calls, 2),
+        'p50_ms': round(_percentile(latencies, 50), 2),
+        'p90_ms': round(_percentile(latencies, 90), 2),
+        'p99_ms': round(_percentile(latencies, 99), 2),
+        'max_ms': round(max(latencies), 2),
+        'queries_per_call': round(snapshot['total_queries'] / calls, 2),
+        'rows_per_call': round(sum(m['rows'] for m in snapshot['methods']) / calls, 1),
+        'errors': sum(m['errors'] for m in snapshot['methods']),
+    }
+
+
+# ==================== Report ====================
+
+def print_results(clients: int, results: list):
+    logger.info(f"\n{clients:,} services")
+    logger.info(f"{'case':<52} {'conc':>4} {'calls/s':>8} {'p50 ms':>8} {'p99 ms':>8} "
+                f"{'max ms':>8} {'q/call':>6} {'rows/call':>9}")
+    for r in results:
+        logger.info(f"{r['case']:<52} {r['concurrency']:>4} {r['calls_per_sec']:>8.1f} {r['p50_ms']:>8.2f} "
+                    f"{r['p99_ms']:>8.2f} {r['max_ms']:>8.1f} {r['queries_per_call']:>6.1f} "
+                    f"{r['rows_per_call']:>9.1f}")
+
+
+def print_comparison(current: dict, previous: dict):
+    """p50/p99/query changes per (fleet size, case, concurrency) present in both runs"""
+    def index(report):
+        return {(fleet['clients'], r['case'], r['concurrency']): r
+                for fleet in report['fleets'] for r in fleet['results']}
+
+    old = index(previous)
+    logger.info(f"\nChange vs {previous.get('started_at', 'previous run')}")
+    logger.info(f"{'services':>9} {'case':<52} {'conc':>4} {'p50':>8} {'p99':>8} {'q/call':>8}")
+    for key, new in index(current).items():
+        before = old.get(key)
+        if not before:
+            continue
+
+        def change(field):
+            if not before[field]:
+                return '-'
+            return f"{(new[field] - before[field]) / before[field] * 100:+.0f}%"
+
+        logger.info(f"{key[0]:>9,} {key[1]:<52} {key[2]:>4} {change('p50_ms'):>8} {change('p99_ms'):>8} "
+                    f"{change('queries_per_call'):>8}")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--clients', default='10000,100000,1000000', help='fleet sizes (services)')
+    parser.add_argument('--concurrency', default='1,8,32', help='thread counts')
+    parser.add_argument('--calls', type=int, default=200, help='calls per case and concurrency')
+    parser.add_argument('--cases', help='comma-separated case name prefixes (default: all)')
+    parser.add_argument('--database', default=DEFAULT_BENCH_DATABASE,
+                        help="dropped and recreated; must end in '_bench'")
+    parser.add_argument('--output', help='results file (default: benchmarks/results/db-<timestamp>.json)')
+    parser.add_argument('--compare', help='earlier results file to compare against')
+    parser.add_argument('--reuse', action='store_true',
+                        help='keep the database when it already holds a fleet of the requested size')
+    args = parser.parse_args()
+    started_at = datetime.now()
+
+    sizes = [int(size) for size in args.clients.split(',')]
+    levels = [int(level) for level in args.concurrency.split(',')]
+
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    logging.getLogger().setLevel(logging.WARNING)
+    for name in (__name__, 'benchmarks.bench_db'):
+        logging.getLogger(name).setLevel(logging.INFO)
+
+    # One pooled connection per benchmark thread (mysql-connector caps pools at 32)
+    if max(levels) > 32:
+        logger.warning("⚠️ Concurrency above 32 waits on the connection pool")
+    use_bench_database(args.database, pool_size=min(max(levels), 32))
+
+    fleets = []
+    db = None
+    for clients in sizes:
+        if args.reuse and db is None:
+            db = open_bench_database(reset=False)
+        if args.reuse and fleet_size(db) == clients:
+            users = max(1, clients // SERVICES_PER_USER)
+            fleet = {'clients': clients, 'users': users, 'panels': PANELS, 'seed_seconds': 0}
+            logger.info(f"♻️ Reusing the existing {clients:,} service fleet")
+        else:
+            db = open_bench_database()
+            fleet = seed_fleet(db, clients)
+
+        cases = build_cases(db, fleet)
+        if args.cases:
+            prefixes = tuple(args.cases.split(','))
+            cases = {name: case for name, case in cases.items() if name.startswith(prefixes)}
+
+        results = []
+        for name, (call, calls) in cases.items():
+            for concurrency in ([1] if name in SINGLE_THREADED_CASES else levels):
+                results.append(run_case(name, call, calls or args.calls, concurrency))
+                logger.info(f"   {name} x{concurrency}: p50 {results[-1]['p50_ms']:.2f} ms, "
+                            f"p99 {results[-1]['p99_ms']:.2f} ms")
+        print_results(clients, results)
+        fleets.append(dict(fleet, results=results))
+
+    with db.get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('SELECT VERSION()')
+        server_version = cursor.fetchone()[0]
+        cursor.close()
+
+    report = {
+        'started_at': started_at.isoformat(timespec='seconds'),
+        'server_version': server_version,
+        'settings': {'calls': args.calls, 'concurrency': levels, 'bulk_update_size': BULK_UPDATE_SIZE},
+        'fleets': fleets,
+    }
+    output = args.output or os.path.join(BASE_DIR, 'results', f"db-{started_at:%Y%m%d-%H%M%S}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+    logger.info(f"\n💾 Results written to {output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            print_comparison(report, json.load(f))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,370 @@
+#!/usr/bin/env python3
+"""
+Load Test
+Throughput, latency, DB queries and memory of the monitors, purchases and webapp routes.
+
+Starts one mock panel per panel type (benchmarks/mock_panels.py) with
+--clients users each, seeds a throwaway MySQL database (benchmarks/bench_db.py)
+with those panels, users and their services, then runs the phases:
+
+  traffic   TrafficMonitor.check_all_services, --cycles times
+  sync      OptimizedMonitor.sync_all_clients_optimized, --cycles times
+  purchase  POST /api/create-service (balance payment), one buyer per request
+  routes    user and admin pages through the Flask test client
+
+Monitor phases report services/sec and p50/p99 cycle time; request phases
+report requests/sec and p50/p99 request time. Every phase reports DB queries
+per cycle/request (query_profiler), panel requests per cycle/request and
+process RSS. --json writes the results so runs can be compared.
+
+Monitor notifications are written to the outbox but never delivered, and
+purchase reports are off (REPORTS_CHANNEL_ID=0). Needs MySQL credentials in
+.env or the environment; the --database named is dropped and recreated.
+
+Usage: python3 -m benchmarks.load_test [--clients 1000] [--latency-ms 50]
+       [--failure-rate 0.01] [--panels 3x-ui,marzban,...] [--phases traffic,sync,purchase,routes]
+       [--cycles 5] [--purchases 100] [--route-requests 100] [--concurrency 16]
+       [--database vpn_bot_bench] [--json results.json]
+"""
+
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import logging
+import resource
+import contextlib
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+import psutil
+
+from benchmarks.bench_db import DEFAULT_BENCH_DATABASE, use_bench_database, open_bench_database, \
+    insert_rows, seed_users
+from benchmarks.mock_panels import GB, PANEL_APIS, MockPanelServer
+
+logger = logging.getLogger(__name__)
+
+USER_ROUTES = ('/dashboard', '/services', '/services/{service_id}', '/transactions',
+               '/api/panels', '/api/services/refresh')
+ADMIN_ROUTES = ('/admin/services', '/admin/users')
+SERVICES_PER_USER = 3
+
+
+def _percentile(values, pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def _rss_mb() -> float:
+    return psutil.Process().memory_info().rss / 1024 ** 2
+
+
+def _peak_rss_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # KB on Linux
+
+
+def _buyer_ip(index: int) -> str:
+    """A distinct client address per simulated user, so per-IP rate limits apply per user"""
+    return f"10.{(index >> 16) & 255}.{(index >> 8) & 255}.{index & 255}"
+
+
+# ==================== Seeding ====================
+
+def seed(db, panels: dict, users_count: int) -> dict:
+    """Panels rows for the mocks, users, and one service per mock panel user"""
+    panel_ids = {}
+    for panel_type, panel in panels.items():
+        panel_ids[panel_type] = db.add_panel(
+            name=f"mock-{panel_type}", url=panel.url, username='admin', password='admin',
+            api_endpoint=panel.url, default_inbound_id=1, price_per_gb=1000,
+            panel_type=panel_type, sale_type='gigabyte')
+
+    users = seed_users(db, users_count, balance=10 ** 9)
+    admin_telegram_id = users[0][1]
+    with db.get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('UPDATE users SET is_admin = 1 WHERE telegram_id = %s', (admin_telegram_id,))
+        cursor.close()
+
+    rows = []
+    for panel_type, panel in panels.items():
+        inbound_ids = getattr(panel.api, 'inbound_ids', {})
+        for index, user in enumerate(panel.api.users.values()):
+            owner_id = users[index % len(users)][0]
+            rows.append((
+                owner_id, panel_ids[panel_type], user['username'], user['uuid'],
+                inbound_ids.get(user['username'], 1), 'vless', round(user['total'] / GB, 2),
+                datetime.fromtimestamp(user['expire']) if user['expire'] else None,
+                user['username'], 1, 'active',
+            ))
+    insert_rows(db, 'clients', ('user_id', 'panel_id', 'client_name', 'client_uuid', 'inbound_id',
+                                'protocol', 'total_gb', 'expires_at', 'sub_id', 'is_active', 'status'), rows)
+
+    # One service per user for /services/<id>
+    with db.get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('SELECT u.telegram_id, MIN(c.id) FROM users u JOIN clients c ON c.user_id = u.id '
+                       'GROUP BY u.telegram_id')
+        service_by_user = {row[0]: row[1] for row in cursor.fetchall()}
+        cursor.close()
+
+    logger.info(f"🌱 Seeded {len(panel_ids)} panels, {len(users)} users, {len(rows)} services")
+    return {
+        'panel_ids': panel_ids,
+        'telegram_ids': [telegram_id for _, telegram_id in users],
+        'admin_telegram_id': admin_telegram_id,
+        'service_by_user': service_by_user,
+    }
+
+
+# ==================== Phases ====================
+
+def _panel_counters(panels: dict):
+    return (sum(p.requests for p in panels.values()), sum(p.failures for p in panels.values()))
+
+
+def monitor_phase(name: str, run_cycle, cycles: int, db, panels: dict) -> dict:
+    """Run one monitor cycle `cycles` times; services/sec and per-cycle costs"""
+    from query_profiler import query_profiler
+
+    services = len(db.get_all_active_services())
+    durations, queries, panel_requests, panel_failures = [], [], [], 0
+    rss_before = _rss_mb()
+    top_methods = []
+    for cycle in range(cycles):
+        query_profiler.reset()
+        requests_before, failures_before = _panel_counters(panels)
+        start = time.perf_counter()
+        run_cycle()
+        durations.append((time.perf_counter() - start) * 1000)
+        snapshot = query_profiler.snapshot(top=5)
+        queries.append(snapshot['total_queries'])
+        requests_after, failures_after = _panel_counters(panels)
+        panel_requests.append(requests_after - requests_before)
+        panel_failures += failures_after - failures_before
+        top_methods = snapshot['methods']
+        logger.info(f"   {name} cycle {cycle + 1}/{cycles}: {durations[-1]:.0f} ms, "
+                    f"{queries[-1]} queries, {panel_requests[-1]} panel requests")
+
+    return {
+        'phase': name,
+        'cycles': cycles,
+        'services': services,
+        'services_per_sec': round(services * cycles / (sum(durations) / 1000), 1) if durations else 0,
+        'p50_ms': round(_percentile(durations, 50), 1),
+        'p99_ms': round(_percentile(durations, 99), 1),
+        'db_queries_per_cycle': round(sum(queries) / cycles, 1),
+        'panel_requests_per_cycle': round(sum(panel_requests) / cycles, 1),
+        'panel_failures': panel_failures,
+        'rss_mb': round(_rss_mb(), 1),
+        'rss_delta_mb': round(_rss_mb() - rss_before, 1),
+        'top_db_methods': top_methods,
+    }
+
+
+def request_phase(name: str, send, total: int, concurrency: int, panels: dict) -> dict:
+    """Send `total` requests with `concurrency` threads; send(i) -> ok"""
+    from query_profiler import query_profiler
+
+    query_profiler.reset()
+    requests_before, failures_before = _panel_counters(panels)
+    rss_before = _rss_mb()
+
+    def timed(i):
+        start = time.perf_counter()
+        try:
+            ok = send(i)
+        except Exception as e:
+            logger.debug(f"{name} request {i} failed: {e}")
+            ok = False
+        return (time.perf_counter() - start) * 1000, ok
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(timed, range(total)))
+    elapsed = time.perf_counter() - started
+
+    snapshot = query_profiler.snapshot(top=5)
+    requests_after, failures_after = _panel_counters(panels)
+    latencies = [r[0] for r in results]
+    return {
+        'phase': name,
+        'requests': total,
+        'errors': sum(1 for r in results if not r[1]),
+        'rps': round(total / elapsed, 1),
+        'p50_ms': round(_percentile(latencies, 50), 1),
+        'p99_ms': round(_percentile(latencies, 99), 1),
+        'db_queries_per_request': round(snapshot['total_queries'] / total, 1),
+        'panel_requests_per_request': round((requests_after - requests_before) / total, 2),
+        'panel_failures': failures_after - failures_before,
+        'rss_mb': round(_rss_mb(), 1),
+        'rss_delta_mb': round(_rss_mb() - rss_before, 1),
+        'top_db_methods': snapshot['methods'],
+    }
+
+
+def _client(app, telegram_id: int):
+    """Flask test client logged in as telegram_id"""
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['user_id'] = telegram_id
+        session['first_name'] = 'Bench'
+        session['photo_url'] = '/static/images/default-avatar.png'  # Skip the Telegram avatar lookup
+    return client
+
+
+def run_traffic(db, admin_manager, panels: dict, cycles: int) -> dict:
+    from traffic_monitor import TrafficMonitor
+    from notification_dispatcher import NotificationDispatcher
+
+    monitor = TrafficMonitor(db, admin_manager, None)
+    monitor.dispatcher = NotificationDispatcher(db)  # Outbox only - run() is never started
+    return monitor_phase('traffic', lambda: asyncio.run(monitor.check_all_services()), cycles, db, panels)
+
+
+def run_sync(db, admin_manager, panels: dict, cycles: int) -> dict:
+    from optimized_monitor import OptimizedMonitor
+
+    monitor = OptimizedMonitor(db, admin_manager)
+    try:
+        return monitor_phase('sync', monitor.sync_all_clients_optimized, cycles, db, panels)
+    finally:
+        monitor.executor.shutdown(wait=False)
+
+
+def run_purchases(app, fleet: dict, panels: dict, total: int, concurrency: int) -> dict:
+    panel_ids = list(fleet['panel_ids'].values())
+    buyers = fleet['telegram_ids']
+
+    def purchase(i):
+        response = _client(app, buyers[i % len(buyers)]).post(
+            '/api/create-service',
+            json={'panel_id': panel_ids[i % len(panel_ids)], 'payment_method': 'balance',
+                  'purchase_type': 'gigabyte', 'volume_gb': 10},
+            environ_base={'REMOTE_ADDR': _buyer_ip(i)})
+        return response.status_code == 200 and (response.get_json() or {}).get('success')
+
+    return request_phase('purchase', purchase, total, concurrency, panels)
+
+
+def run_routes(app, fleet: dict, panels: dict, per_route: int, concurrency: int) -> list:
+    users = [t for t in fleet['telegram_ids'] if t in fleet['service_by_user']]
+    results = []
+    for route in USER_ROUTES + ADMIN_ROUTES:
+        def request(i, route=route):
+            if route in ADMIN_ROUTES:
+                telegram_id = fleet['admin_telegram_id']
+            else:
+                telegram_id = users[(i * 7919) % len(users)]
+            path = route.format(service_id=fleet['service_by_user'].get(telegram_id))
+            response = _client(app, telegram_id).get(path, environ_base={'REMOTE_ADDR': _buyer_ip(i)})
+            return response.status_code in (200, 304)
+
+        results.append(request_phase(f"GET {route}", request, per_route, concurrency, panels))
+    return results
+
+
+# ==================== Report ====================
+
+def print_report(results: list):
+    monitors = [r for r in results if 'cycles' in r]
+    requests = [r for r in results if 'requests' in r]
+    if monitors:
+        logger.info(f"\n{'phase':<10} {'services':>8} {'svc/s':>8} {'p50 ms':>9} {'p99 ms':>9} "
+                    f"{'DB q/cycle':>10} {'panel req':>9} {'RSS MB':>7}")
+        for r in monitors:
+            logger.info(f"{r['phase']:<10} {r['services']:>8} {r['services_per_sec']:>8.1f} "
+                        f"{r['p50_ms']:>9.0f} {r['p99_ms']:>9.0f} {r['db_queries_per_cycle']:>10.0f} "
+                        f"{r['panel_requests_per_cycle']:>9.0f} {r['rss_mb']:>7.0f}")
+    if requests:
+        logger.info(f"\n{'phase':<32} {'req/s':>7} {'p50 ms':>8} {'p99 ms':>8} {'DB q/req':>8} "
+                    f"{'panel/req':>9} {'errors':>6} {'RSS MB':>7}")
+        for r in requests:
+            logger.info(f"{r['phase']:<32} {r['rps']:>7.1f} {r['p50_ms']:>8.0f} {r['p99_ms']:>8.0f} "
+                        f"{r['db_queries_per_request']:>8.1f} {r['panel_requests_per_request']:>9.2f} "
+                        f"{r['errors']:>6} {r['rss_mb']:>7.0f}")
+    logger.info(f"\nPeak RSS: {_peak_rss_mb():.0f} MB")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--clients', type=int, default=1000, help='users per mock panel')
+    parser.add_argument('--latency-ms', type=float, default=50, help='mock panel response time')
+    parser.add_argument('--failure-rate', type=float, default=0.0, help='share of panel requests answered with 500')
+    parser.add_argument('--panels', default=','.join(PANEL_APIS))
+    parser.add_argument('--phases', default='traffic,sync,purchase,routes')
+    parser.add_argument('--cycles', type=int, default=5)
+    parser.add_argument('--purchases', type=int, default=100)
+    parser.add_argument('--route-requests', type=int, default=100, help='requests per route')
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--database', default=DEFAULT_BENCH_DATABASE,
+                        help="dropped and recreated; must end in '_bench'")
+    parser.add_argument('--json', help='write results to this file')
+    parser.add_argument('--verbose', action='store_true', help="keep the project's own log output")
+    args = parser.parse_args()
+    started_at = datetime.now().isoformat(timespec='seconds')
+
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    if not args.verbose:
+        logging.getLogger().setLevel(logging.WARNING)
+        for name in (__name__, 'benchmarks.mock_panels', 'benchmarks.bench_db'):
+            logging.getLogger(name).setLevel(logging.INFO)
+
+    # Room for the request threads plus the monitors' panel executors
+    use_bench_database(args.database, pool_size=min(args.concurrency + 4, 32))
+    panel_types = [p for p in args.panels.split(',') if p]
+    phases = args.phases.split(',')
+
+    with contextlib.ExitStack() as stack:
+        panels = {panel_type: stack.enter_context(MockPanelServer(
+            panel_type, clients=args.clients, latency_ms=args.latency_ms,
+            failure_rate=args.failure_rate, seed=index + 1))
+            for index, panel_type in enumerate(panel_types)}
+        if not args.verbose:
+            # The panel managers print() every call
+            stack.enter_context(contextlib.redirect_stdout(stack.enter_context(open(os.devnull, 'w'))))
+
+        db = open_bench_database()
+        fleet = seed(db, panels, max(1, args.clients * len(panels) // SERVICES_PER_USER))
+
+        from admin_manager import AdminManager
+        admin_manager = AdminManager(db)
+        app = None
+        if 'purchase' in phases or 'routes' in phases:
+            from webapp import app
+            app.config['DB'] = db
+
+        results = []
+        for phase in phases:
+            logger.info(f"▶️ {phase}")
+            if phase == 'traffic':
+                results.append(run_traffic(db, admin_manager, panels, args.cycles))
+            elif phase == 'sync':
+                results.append(run_sync(db, admin_manager, panels, args.cycles))
+            elif phase == 'purchase':
+                results.append(run_purchases(app, fleet, panels, args.purchases, args.concurrency))
+            elif phase == 'routes':
+                results.extend(run_routes(app, fleet, panels, args.route_requests, args.concurrency))
+            else:
+                logger.warning(f"⚠️ Unknown phase '{phase}', skipping")
+
+    print_report(results)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({
+                'started_at': started_at,
+                'settings': vars(args),
+                'peak_rss_mb': round(_peak_rss_mb(), 1),
+                'results': results,
+            }, f, indent=2, ensure_ascii=False, default=str)
+        logger.info(f"💾 Results written to {args.json}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,468 @@
+"""
+Mock Panel Servers
+Local stand-ins for the panel HTTP APIs, with configurable size, latency and failures.
+
+MockPanelServer serves a fleet of synthetic users over the same endpoints and
+JSON shapes the panel managers call, on a free localhost port, from a thread
+of the benchmark process. Every request sleeps `latency_ms` (a slow panel) and
+fails with HTTP 500 with probability `failure_rate`, so throughput can be
+measured against panels that behave like real ones under load.
+
+PANEL_APIS has one API per panel type the bot supports (3x-ui, Marzban,
+Rebecca, Pasargad, Marzneshin, Guard). Logins always succeed; user changes
+made through the API (create, disable, delete, traffic limits) are kept, so
+a monitor cycle sees the effect of the previous one.
+"""
+
+import json
+import time
+import uuid
+import random
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+from urllib.parse import urlparse
+
+logger = logging.getLogger(__name__)
+
+GB = 1024 ** 3
+
+
+def make_users(count: int, prefix: str = 'user') -> List[Dict]:
+    """Synthetic panel users: name, UUID, traffic, expiry and activity"""
+    now = int(time.time())
+    rng = random.Random(f"{prefix}:{count}")
+    users = []
+    for i in range(count):
+        total = rng.choice((10, 20, 50, 100)) * GB
+        up, down = rng.randint(0, total // 4), rng.randint(0, total // 2)
+        users.append({
+            'username': f"{prefix}{i}",
+            'uuid': str(uuid.UUID(int=rng.getrandbits(128))),
+            'total': total,
+            'up': up,
+            'down': down,
+            'expire': now + rng.randint(-5, 60) * 86400,
+            'created': now - rng.randint(1, 90) * 86400,
+            'online': now - rng.randint(0, 86400) if up + down else None,
+            'enabled': rng.random() > 0.05,
+        })
+    return users
+
+
+def new_user(name: str, data_limit: int = 0, expire: int = 0) -> Dict:
+    """A user created through the API: no traffic yet"""
+    return {
+        'username': name, 'uuid': str(uuid.uuid4()), 'total': data_limit or 0, 'up': 0, 'down': 0,
+        'expire': expire or 0, 'created': int(time.time()), 'online': None, 'enabled': True,
+    }
+
+
+def _iso(timestamp: Optional[int]) -> Optional[str]:
+    if not timestamp:
+        return None
+    return datetime.fromtimestamp(timestamp, tz=timezone.utc).strftime('%Y-%m-%dT%H:%M:%S')
+
+
+class MarzbanAPI:
+    """Marzban REST API (/api/admin/token, /api/user/<name>, /api/users)"""
+
+    panel_type = 'marzban'
+    token_path = '/api/admin/token'
+    user_path = '/api/user/'
+    users_path = '/api/users'
+    create_path = '/api/user'
+
+    def __init__(self, users: List[Dict]):
+        self.users = {u['username']: u for u in users}
+
+    def _user_json(self, user: Dict, base_url: str) -> Dict:
+        return {
+            'username': user['username'],
+            'status': 'active' if user['enabled'] else 'disabled',
+            'used_traffic': user['up'] + user['down'],
+            'data_limit': user['total'],
+            'expire': user['expire'],
+            'online_at': _iso(user['online']),
+            'created_at': _iso(user['created']),
+            'proxies': {'vless': {'id': user['uuid']}},
+            'inbounds': {'vless': ['VLESS TCP']},
+            'links': [f"vless://{user['uuid']}@mock:443?type=tcp#{user['username']}"],
+            'subscription_url': f"{base_url}/sub/{user['username']}",
+        }
+
+    def _users_json(self, base_url: str) -> Dict:
+        return {'users': [self._user_json(u, base_url) for u in self.users.values()],
+                'total': len(self.users)}
+
+    def _create_user(self, body: Dict) -> Dict:
+        name = body.get('username') or f"user{len(self.users)}"
+        user = self.users[name] = new_user(name, body.get('data_limit'), body.get('expire'))
+        return user
+
+    def _update_user(self, user: Dict, body: Dict):
+        if 'data_limit' in body:
+            user['total'] = body['data_limit'] or 0
+        if 'expire' in body:
+            user['expire'] = body['expire'] or 0
+        if 'status' in body:
+            user['enabled'] = body['status'] == 'active'
+        if 'enabled' in body:
+            user['enabled'] = bool(body['enabled'])
+
+    def _user_action(self, user: Dict, action: str):
+        if action == 'reset':
+            user['up'] = user['down'] = 0
+        elif action == 'revoke_sub':
+            user['uuid'] = str(uuid.uuid4())
+
+    def _inbounds(self) -> List[Dict]:
+        return [{'tag': 'VLESS TCP', 'protocol': 'vless', 'port': 443, 'settings': {'clients': []}}]
+
+    def handle(self, method: str, path: str, body, base_url: str):
+        """(status, json) for one request"""
+        if method == 'POST' and path == self.token_path:
+            return 200, {'access_token': 'mock-token', 'token_type': 'bearer'}
+        if method == 'GET' and path == self.users_path:
+            return 200, self._users_json(base_url)
+        if method == 'POST' and path == self.create_path:
+            return 200, self._user_json(self._create_user(body), base_url)
+        if path.startswith(self.user_path):
+            name, _, action = path[len(self.user_path):].partition('/')
+            user = self.users.get(name)
+            if user is None:
+                return 404, {'detail': 'User not found'}
+            if method == 'DELETE':
+                del self.users[name]
+                return 200, {}
+            if method == 'PUT':
+                self._update_user(user, body)
+            elif method == 'POST' and action:
+                self._user_action(user, action)
+            return 200, self._user_json(user, base_url)
+        return self.handle_other(method, path, body, base_url)
+
+    def handle_other(self, method: str, path: str, body, base_url: str):
+        """Panel-specific endpoints outside the user API"""
+        if method == 'GET' and path in ('/api/inbounds', '/api/hosts'):
+            # Keyed by protocol, as Marzban returns it - the manager falls through to /api/core/config
+            return 200, {'vless': [{'tag': i['tag'], 'protocol': i['protocol'], 'port': i['port']}
+                                   for i in self._inbounds()]}
+        if method == 'GET' and path == '/api/core/config':
+            return 200, {'inbounds': self._inbounds()}
+        if method == 'GET' and path == '/api/system':
+            return 200, {'total_user': len(self.users),
+                         'users_active': sum(1 for u in self.users.values() if u['enabled'])}
+        return 404, {'detail': 'Not Found'}
+
+
+class RebeccaAPI(MarzbanAPI):
+    """Rebecca: the Marzban user API plus services (/api/services)"""
+
+    panel_type = 'rebecca'
+
+    def handle_other(self, method: str, path: str, body, base_url: str):
+        if method == 'GET' and path == '/api/services':
+            return 200, {'services': [{'id': 1, 'name': 'Main'}]}
+        return super().handle_other(method, path, body, base_url)
+
+
+class PasargadAPI(MarzbanAPI):
+    """PasarGuard: the Marzban user API with groups (/api/groups) instead of inbounds"""
+
+    panel_type = 'pasargad'
+
+    def handle_other(self, method: str, path: str, body, base_url: str):
+        if method == 'GET' and path == '/api/groups':
+            return 200, {'groups': [{'id': 1, 'name': 'Main'}], 'total': 1}
+        return super().handle_other(method, path, body, base_url)
+
+
+class MarzneshinAPI(MarzbanAPI):
+    """Marzneshin REST API (/api/admins/token, /api/users/<name>, /api/services)"""
+
+    panel_type = 'marzneshin'
+    token_path = '/api/admins/token'
+    user_path = '/api/users/'
+    create_path = '/api/users'
+
+    def _user_json(self, user: Dict, base_url: str) -> Dict:
+        data = super()._user_json(user, base_url)
+        data.update({'enabled': user['enabled'], 'key': user['uuid'].replace('-', ''),
+                     'subscription_url': f"/sub/{user['username']}/{user['uuid'].replace('-', '')}"})
+        return data
+
+    def _users_json(self, base_url: str) -> Dict:
+        return {'items': [self._user_json(u, base_url) for u in self.users.values()],
+                'total': len(self.users)}
+
+    def _user_action(self, user: Dict, action: str):
+        if action == 'disable':
+            user['enabled'] = False
+        elif action == 'enable':
+            user['enabled'] = True
+        else:
+            super()._user_action(user, action)
+
+    def handle_other(self, method: str, path: str, body, base_url: str):
+        if method == 'GET' and path == '/api/services':
+            return 200, {'items': [{'id': 1, 'name': 'Main', 'inbound_ids': [1]}], 'total': 1}
+        if method == 'GET' and path == '/api/inbounds':
+            return 200, [dict(i, id=n) for n, i in enumerate(self._inbounds(), 1)]
+        return super().handle_other(method, path, body, base_url)
+
+
+class XUIAPI:
+    """3x-ui panel API (/login, /panel/api/inbounds/...) with users spread over inbounds"""
+
+    panel_type = '3x-ui'
+    CLIENTS_PER_INBOUND = 250
+
+    def __init__(self, users: List[Dict]):
+        self.users = {u['username']: u for u in users}
+        self.inbound_ids = {}  # username -> inbound id
+        for index, name in enumerate(self.users):
+            self.inbound_ids[name] = index // self.CLIENTS_PER_INBOUND + 1
+
+    def _inbound_json(self, inbound_id: int) -> Dict:
+        members = [self.users[n] for n, i in self.inbound_ids.items() if i == inbound_id]
+        clients = [{'id': u['uuid'], 'email': u['username'], 'totalGB': u['total'],
+                    'expiryTime': u['expire'] * 1000, 'enable': u['enabled'], 'subId': u['username']}
+                   for u in members]
+        stats = [{'id': inbound_id, 'uuid': u['uuid'], 'email': u['username'], 'up': u['up'], 'down': u['down'],
+                  'total': u['total'], 'expiryTime': u['expire'] * 1000, 'enable': u['enabled'],
+                  'lastOnline': (u['online'] or 0) * 1000} for u in members]
+        return {
+            'id': inbound_id, 'remark': f"vless-{inbound_id}", 'protocol': 'vless',
+            'port': 20000 + inbound_id, 'enable': True, 'listen': '',
+            'settings': json.dumps({'clients': clients, 'decryption': 'none'}),
+            'streamSettings': json.dumps({'network': 'tcp', 'security': 'none'}),
+            'clientStats': stats,
+        }
+
+    def _inbound_count(self) -> int:
+        return max(self.inbound_ids.values(), default=0) or 1
+
+    def _apply_clients(self, inbound_id: int, clients: List[Dict], replace: bool):
+        by_uuid = {c.get('id'): c for c in clients}
+        if replace:
+            for name in [n for n, i in self.inbound_ids.items() if i == inbound_id]:
+                if self.users[name]['uuid'] not in by_uuid:
+                    del self.users[name], self.inbound_ids[name]
+        known = {u['uuid']: u for u in self.users.values()}
+        for client_uuid, client in by_uuid.items():
+            user = known.get(client_uuid)
+            if user is None:
+                user = new_user(client.get('email') or client_uuid, client.get('totalGB'),
+                                (client.get('expiryTime') or 0) // 1000)
+                user['uuid'] = client_uuid
+                self.users[user['username']] = user
+                self.inbound_ids[user['username']] = inbound_id
+            user['enabled'] = client.get('enable', True)
+            user['total'] = client.get('totalGB', user['total'])
+
+    def handle(self, method: str, path: str, body, base_url: str):
+        """(status, json) for one request"""
+        if path == '/login':
+            return 200, {'success': True, 'msg': 'Login Successfully'}
+        if method == 'GET' and path == '/panel/api/inbounds/list':
+            return 200, {'success': True,
+                         'obj': [self._inbound_json(i) for i in range(1, self._inbound_count() + 1)]}
+        if method == 'GET' and path.startswith('/panel/api/inbounds/get/'):
+            inbound_id = int(path.rsplit('/', 1)[1])
+            if not 1 <= inbound_id <= self._inbound_count():
+                return 200, {'success': False, 'msg': 'inbound not found'}
+            return 200, {'success': True, 'obj': self._inbound_json(inbound_id)}
+        if method == 'POST' and (path == '/panel/api/inbounds/addClient' or
+                                 path.startswith('/panel/api/inbounds/update/')):
+            replace = path != '/panel/api/inbounds/addClient'
+            inbound_id = int(path.rsplit('/', 1)[1] if replace else body.get('id') or 0)
+            settings = json.loads(body.get('settings') or '{}')
+            self._apply_clients(inbound_id, settings.get('clients', []), replace=replace)
+            return 200, {'success': True, 'msg': ''}
+        if method == 'POST' and path.startswith('/panel/api/inbounds/updateClient/'):
+            client_uuid = path.rsplit('/', 1)[1]
+            clients = json.loads(body.get('settings') or '{}').get('clients', [])
+            if client_uuid not in {u['uuid'] for u in self.users.values()} or not clients:
+                return 200, {'success': False, 'msg': 'client not found'}
+            self._apply_clients(int(body.get('id') or 0), clients[:1], replace=False)
+            return 200, {'success': True, 'msg': ''}
+        if method == 'POST' and '/delClient/' in path:
+            client_uuid = path.rsplit('/', 1)[1]
+            name = next((n for n, u in self.users.items() if u['uuid'] == client_uuid), None)
+            if name is None:
+                return 200, {'success': False, 'msg': 'client not found'}
+            del self.users[name], self.inbound_ids[name]
+            return 200, {'success': True, 'msg': ''}
+        if path == '/server/status':
+            return 200, {'success': True, 'obj': {'cpu': 5.0, 'mem': {'current': 1, 'total': 2}}}
+        return 404, {'success': False, 'msg': 'Not Found'}
+
+
+class GuardAPI:
+    """Guard REST API (X-API-Key, /api/subscriptions, /api/services, /api/nodes)"""
+
+    panel_type = 'guard'
+    prefix = '/api'
+
+    def __init__(self, users: List[Dict]):
+        self.users = {u['username']: u for u in users}
+
+    def _subscription_json(self, user: Dict, base_url: str) -> Dict:
+        return {
+            'id': user['uuid'], 'username': user['username'],
+            'limit_usage': user['total'], 'current_usage': user['up'] + user['down'],
+            'total_usage': user['up'] + user['down'], 'reset_usage': 0,
+            'limit_expire': max(user['expire'] - user['created'], 0) if user['expire'] else 0,
+            'created_at': _iso(user['created']), 'online_at': _iso(user['online']),
+            'is_online': False, 'enabled': user['enabled'], 'is_active': True,
+            'access_key': user['uuid'].replace('-', ''),
+            'link': f"{base_url}/guards/{user['uuid'].replace('-', '')}",
+            'service_ids': [1],
+        }
+
+    def handle(self, method: str, path: str, body, base_url: str):
+        """(status, json) for one request"""
+        if not path.startswith(self.prefix + '/'):
+            return 404, {'detail': 'Not Found'}
+        path = path[len(self.prefix):]
+        if path == '/admins/current':
+            return 200, {'username': 'admin', 'role': 'owner'}
+        if path == '/nodes':
+            return 200, [{'id': 1, 'remark': 'node-1', 'status': 'connected'}]
+        if path == '/services':
+            return 200, [{'id': 1, 'remark': 'Main', 'node_ids': [1], 'users_count': len(self.users)}]
+        if path == '/stats/subscriptions':
+            return 200, {'total': len(self.users),
+                         'active': sum(1 for u in self.users.values() if u['enabled'])}
+        if path == '/subscriptions':
+            if method == 'POST':
+                created = []
+                for item in body if isinstance(body, list) else [body]:
+                    user = new_user(item['username'], item.get('limit_usage'))
+                    if item.get('limit_expire'):
+                        user['expire'] = user['created'] + item['limit_expire']
+                    self.users[user['username']] = user
+                    created.append(self._subscription_json(user, base_url))
+                return 201, created
+            return 200, [self._subscription_json(u, base_url) for u in self.users.values()]
+        if method == 'POST' and path in ('/subscriptions/enable', '/subscriptions/disable',
+                                         '/subscriptions/revoke', '/subscriptions/reset'):
+            action = path.rsplit('/', 1)[1]
+            for name in body.get('usernames', []):
+                user = self.users.get(name)
+                if user is None:
+                    continue
+                if action in ('enable', 'disable'):
+                    user['enabled'] = action == 'enable'
+                elif action == 'revoke':
+                    user['uuid'] = str(uuid.uuid4())
+                else:
+                    user['up'] = user['down'] = 0
+            return 200, {}
+        if path.startswith('/subscriptions/'):
+            name = path[len('/subscriptions/'):]
+            user = self.users.get(name)
+            if user is None:
+                return 404, {'detail': 'Subscription not found'}
+            if method == 'DELETE':
+                del self.users[name]
+                return 200, {}
+            if method == 'PUT':
+                if 'limit_usage' in body:
+                    user['total'] = body['limit_usage'] or 0
+                if 'limit_expire' in body:
+                    user['expire'] = user['created'] + body['limit_expire'] if body['limit_expire'] else 0
+            return 200, self._subscription_json(user, base_url)
+        return 404, {'detail': 'Not Found'}
+
+
+PANEL_APIS = {
+    api.panel_type: api
+    for api in (XUIAPI, MarzbanAPI, RebeccaAPI, PasargadAPI, MarzneshinAPI, GuardAPI)
+}
+
+
+class MockPanelServer:
+    """One mock panel on 127.0.0.1:<free port>"""
+
+    def __init__(self, panel_type: str = 'marzban', clients: int = 100, latency_ms: float = 0,
+                 failure_rate: float = 0.0, seed: int = 1, prefix: Optional[str] = None):
+        self.panel_type = panel_type
+        # Usernames/UUIDs differ per panel type, so several mocks can share one database
+        self.api = PANEL_APIS[panel_type](make_users(clients, prefix or panel_type.replace('-', '')))
+        self.latency = latency_ms / 1000
+        self.failure_rate = failure_rate
+        self.requests = 0
+        self.failures = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server: Optional[ThreadingHTTPServer] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def _handler(self):
+        panel = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, *args):
+                pass
+
+            def _serve(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                raw = self.rfile.read(length) if length else b''
+                try:
+                    body = json.loads(raw) if raw and raw[:1] in (b'{', b'[') else {}
+                except ValueError:
+                    body = {}
+                with panel._lock:
+                    panel.requests += 1
+                    fail = panel._rng.random() < panel.failure_rate
+                    if fail:
+                        panel.failures += 1
+                if panel.latency:
+                    time.sleep(panel.latency)
+                if fail:
+                    status, payload = 500, {'detail': 'mock failure'}
+                else:
+                    with panel._lock:
+                        status, payload = panel.api.handle(
+                            self.command, urlparse(self.path).path, body, panel.url)
+                data = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            do_GET = do_POST = do_PUT = do_DELETE = _serve
+
+        return Handler
+
+    def start(self) -> 'MockPanelServer':
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), self._handler())
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True,
+                         name=f"mock-{self.panel_type}").start()
+        logger.info(f"🧪 Mock {self.panel_type} panel at {self.url} "
+                    f"(latency {self.latency * 1000:.0f} ms, failure rate {self.failure_rate:.0%})")
+        return self
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
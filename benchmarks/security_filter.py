@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+Security Filter Benchmark
+Measures the per-request cost of the request path filter in security_utils.
+
+Times detect_attack_patterns() and the full secure_before_request() on a mix
+of ordinary app paths, static assets and scanner paths, next to a plain
+per-pattern substring scan of the same ATTACK_PATTERNS (how the filter used to
+work) as a baseline. With --max-us the script exits non-zero when the compiled
+filter's average cost per path goes above the bound, so it can gate a build.
+
+Usage: python3 -m benchmarks.security_filter [--iterations N] [--max-us 10]
+"""
+
+import sys
+import time
+import argparse
+import logging
+
+from flask import Flask
+
+import security_utils
+from security_utils import ATTACK_PATTERNS, detect_attack_patterns, secure_before_request
+
+logger = logging.getLogger(__name__)
+
+SAMPLE_PATHS = (
+    # Ordinary traffic
+    '/', '/dashboard', '/services', '/transactions', '/profile',
+    '/api/service/1842/qr.png', '/api/service/1842/config', '/user/photo',
+    '/admin/users?page=3&search=ali', '/admin/panels/7/inbounds', '/health',
+    '/static/dist/css/style.3f9a1c2b7d4e.css', '/static/js/app.js', '/favicon.ico',
+    # Scanner traffic
+    '/.env', '/wp-admin/setup-config.php', '/vendor/phpunit/phpunit/src/Util/PHP/eval-stdin.php',
+    '/cgi-bin/luci/;stok=/locale', '/actuator/gateway/routes', '/../../etc/passwd',
+    '/index.php?XDEBUG_SESSION_START=phpstorm', '/+CSCOE+/logon.html',
+)
+
+
+def baseline_detect(path: str):
+    """Reference implementation: one substring scan per pattern and category"""
+    path_lower = path.lower()
+    for attack_type, patterns in ATTACK_PATTERNS:
+        if any(pattern in path_lower for pattern in patterns):
+            return True, attack_type
+    return False, ''
+
+
+def _time_per_call(func, paths, iterations: int) -> float:
+    """Average microseconds per call over all paths"""
+    start = time.perf_counter()
+    for _ in range(iterations):
+        for path in paths:
+            func(path)
+    return (time.perf_counter() - start) / (iterations * len(paths)) * 1e6
+
+
+def _time_before_request(app: Flask, paths, iterations: int) -> float:
+    """Average microseconds of secure_before_request() inside a request context"""
+    total = 0.0
+    for path in paths:
+        with app.test_request_context(path, environ_base={'REMOTE_ADDR': '203.0.113.10'}):
+            start = time.perf_counter()
+            for _ in range(iterations):
+                secure_before_request()
+            total += time.perf_counter() - start
+            # Don't let the scanner paths block the benchmark IP
+            security_utils._blocked_ips.clear()
+            security_utils._suspicious_activity.clear()
+    return total / (iterations * len(paths)) * 1e6
+
+
+def run(iterations: int = 2000) -> dict:
+    # Scanner paths get the benchmark IP blocked, which logs on every hit
+    logging.getLogger('security_utils').setLevel(logging.CRITICAL)
+
+    mismatches = [p for p in SAMPLE_PATHS if baseline_detect(p) != detect_attack_patterns(p)]
+    if mismatches:
+        raise AssertionError(f"Compiled filter disagrees with baseline on: {mismatches}")
+
+    app = Flask(__name__)
+    app.secret_key = 'benchmark'
+    return {
+        'paths': len(SAMPLE_PATHS),
+        'baseline_us': _time_per_call(baseline_detect, SAMPLE_PATHS, iterations),
+        'compiled_us': _time_per_call(detect_attack_patterns, SAMPLE_PATHS, iterations),
+        'before_request_us': _time_before_request(app, SAMPLE_PATHS, max(1, iterations // 10)),
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--iterations', type=int, default=2000)
+    parser.add_argument('--max-us', type=float, default=None,
+                        help='fail when the compiled filter averages more than this per path')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    result = run(args.iterations)
+    logger.info(f"🔎 Request path filter over {result['paths']} paths:")
+    logger.info(f"  substring scan (baseline): {result['baseline_us']:.2f} µs/path")
+    logger.info(f"  compiled filter:           {result['compiled_us']:.2f} µs/path "
+                f"({result['baseline_us'] / result['compiled_us']:.1f}x)")
+    logger.info(f"  secure_before_request():   {result['before_request_us']:.2f} µs/request")
+
+    if args.max_us is not None and result['compiled_us'] > args.max_us:
+        logger.error(f"❌ Compiled filter above bound: {result['compiled_us']:.2f} > {args.max_us} µs")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
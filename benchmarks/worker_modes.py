@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+"""
+Webapp Worker Mode Load Test
+Throughput of the gunicorn worker classes when every request waits on a slow panel.
+
+Starts a mock Marzban panel with a fixed response latency, then for each
+worker class runs gunicorn with the project's gunicorn.conf.py against a
+small Flask app whose route does what service pages do: look the client up on
+the panel through MarzbanPanelManager. The same burst of concurrent requests
+is sent to each mode and requests/sec and p50/p99 latency are reported.
+
+With sync workers throughput is capped at workers / panel latency; gthread
+and gevent workers keep serving while requests wait on the panel.
+
+Usage: python3 -m benchmarks.worker_modes [--latency-ms 300] [--requests 200]
+       [--concurrency 32] [--modes sync,gthread,gevent]
+"""
+
+import os
+import sys
+import time
+import signal
+import socket
+import argparse
+import logging
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from flask import Flask, jsonify
+
+from benchmarks.mock_panels import MockPanelServer
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# ==================== App under test (runs inside gunicorn) ====================
+
+app = Flask(__name__)
+_manager = None
+
+
+def _get_manager():
+    global _manager
+    if _manager is None:
+        from marzban_manager import MarzbanPanelManager
+        manager = MarzbanPanelManager()
+        manager.base_url = os.environ['MOCK_PANEL_URL']
+        manager.username = manager.password = 'admin'
+        _manager = manager
+    return _manager
+
+
+@app.route('/service/<username>')
+def service(username):
+    details = _get_manager().get_client_details(0, username)
+    return jsonify({'success': details is not None})
+
+
+# ==================== Load generator ====================
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def _wait_ready(url: str, process, timeout: float = 30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"gunicorn exited with code {process.returncode}")
+        try:
+            requests.get(url, timeout=1)
+            return
+        except requests.RequestException:
+            time.sleep(0.2)
+    raise RuntimeError("gunicorn did not start in time")
+
+
+def _percentile(values, pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def run_mode(worker_class: str, panel_url: str, usernames, total: int, concurrency: int,
+             workers: int = 2, threads: int = 8) -> dict:
+    """Start gunicorn in one worker mode, send the burst, stop it"""
+    port = _free_port()
+    env = dict(os.environ,
+               WEBAPP_WORKER_CLASS=worker_class, WEBAPP_WORKERS=str(workers),
+               WEBAPP_THREADS=str(threads), WEBAPP_BIND=f"127.0.0.1:{port}",
+               MOCK_PANEL_URL=panel_url, PYTHONPATH=BASE_DIR)
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-c', os.path.join(BASE_DIR, 'gunicorn.conf.py'),
+         '--access-logfile', '/dev/null', '--log-level', 'warning', 'benchmarks.worker_modes:app'],
+        cwd=BASE_DIR, env=env)
+    base = f"http://127.0.0.1:{port}"
+    try:
+        _wait_ready(f"{base}/service/{usernames[0]}", process)
+        session = requests.Session()
+        session.mount('http://', requests.adapters.HTTPAdapter(pool_maxsize=concurrency))
+
+        def call(i):
+            start = time.perf_counter()
+            response = session.get(f"{base}/service/{usernames[i % len(usernames)]}", timeout=120)
+            return time.perf_counter() - start, response.status_code == 200 and response.json()['success']
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            results = list(pool.map(call, range(total)))
+        elapsed = time.perf_counter() - started
+        session.close()
+    finally:
+        process.send_signal(signal.SIGINT)  # Quick shutdown, don't wait for keep-alive connections
+        try:
+            process.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+    latencies = [r[0] * 1000 for r in results]
+    return {
+        'mode': worker_class,
+        'requests': total,
+        'errors': sum(1 for r in results if not r[1]),
+        'rps': total / elapsed,
+        'p50_ms': _percentile(latencies, 50),
+        'p99_ms': _percentile(latencies, 99),
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--latency-ms', type=float, default=300, help='mock panel response time')
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--modes', default='sync,gthread,gevent')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    logging.getLogger('marzban_manager').setLevel(logging.WARNING)
+
+    results = []
+    with MockPanelServer('marzban', clients=500, latency_ms=args.latency_ms) as panel:
+        usernames = list(panel.api.users)
+        for mode in args.modes.split(','):
+            if mode == 'gevent':
+                try:
+                    import gevent  # noqa: F401
+                except ImportError:
+                    logger.info("⏭️ gevent not installed, skipping")
+                    continue
+            logger.info(f"▶️ {mode}: {args.requests} requests, {args.concurrency} concurrent")
+            results.append(run_mode(mode, panel.url, usernames, args.requests, args.concurrency,
+                                    workers=args.workers, threads=args.threads))
+
+    logger.info(f"\n{'mode':<8} {'req/s':>8} {'p50 ms':>8} {'p99 ms':>8} {'errors':>7}")
+    for r in results:
+        logger.info(f"{r['mode']:<8} {r['rps']:>8.1f} {r['p50_ms']:>8.0f} {r['p99_ms']:>8.0f} {r['errors']:>7}")
+    return 1 if any(r['errors'] for r in results) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
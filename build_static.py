@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+"""
+Static Asset Build
+Fingerprints, minifies and precompresses static/ into static/dist/ and writes a manifest.
+
+Every css/js asset under static/css, static/js and static/themes is written
+as dist/<dir>/<name>.<hash>.<ext> together with .gz (and .br when the
+`brotli` package is installed) siblings, so nginx can serve it with
+gzip_static and a far-future `immutable` Cache-Control. Templates keep using
+url_for('static', filename='css/x.css'); static_assets.py rewrites that to
+the fingerprinted file listed in dist/manifest.json.
+
+Minification uses rcssmin/rjsmin when installed. Without them CSS gets a
+conservative built-in pass (comments and whitespace outside strings) and JS
+is copied unchanged.
+
+Usage: python3 build_static.py [--clean]
+"""
+
+import os
+import re
+import sys
+import gzip
+import json
+import shutil
+import hashlib
+import logging
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+STATIC_DIR = os.path.join(BASE_DIR, 'static')
+DIST_DIR = os.path.join(STATIC_DIR, 'dist')
+MANIFEST_PATH = os.path.join(DIST_DIR, 'manifest.json')
+SOURCE_DIRS = ('css', 'js', 'themes')
+EXTENSIONS = ('.css', '.js', '.svg')
+
+try:
+    import rcssmin
+except ImportError:
+    rcssmin = None
+
+try:
+    import rjsmin
+except ImportError:
+    rjsmin = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+_CSS_STRING = re.compile(r'("(?:\\.|[^"\\])*"|\'(?:\\.|[^\'\\])*\')')
+_CSS_COMMENT = re.compile(r'/\*(?!!).*?\*/', re.S)
+
+
+def minify_css(source: str) -> str:
+    if rcssmin:
+        return rcssmin.cssmin(source)
+    out = []
+    for i, part in enumerate(_CSS_STRING.split(_CSS_COMMENT.sub('', source))):
+        if i % 2:  # String literal - keep as is
+            out.append(part)
+            continue
+        part = re.sub(r'\s+', ' ', part)
+        part = re.sub(r'\s*([{};,>])\s*', r'\1', part)
+        out.append(part.replace(';}', '}'))
+    return ''.join(out).strip()
+
+
+def minify_js(source: str) -> str:
+    return rjsmin.jsmin(source) if rjsmin else source
+
+
+def _iter_sources():
+    for source_dir in SOURCE_DIRS:
+        for root, _, files in os.walk(os.path.join(STATIC_DIR, source_dir)):
+            for name in sorted(files):
+                if name.endswith(EXTENSIONS):
+                    path = os.path.join(root, name)
+                    yield os.path.relpath(path, STATIC_DIR).replace(os.sep, '/'), path
+
+
+def _write(path: str, data: bytes):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(data)
+    # Same mtime for the file and its compressed siblings (gzip_static checks it)
+    with open(path + '.gz', 'wb') as f:
+        f.write(gzip.compress(data, compresslevel=9, mtime=0))
+    if brotli:
+        with open(path + '.br', 'wb') as f:
+            f.write(brotli.compress(data, quality=11))
+
+
+def build(clean: bool = False) -> dict:
+    """Build dist/ and return the manifest {source path: dist path}"""
+    if clean and os.path.isdir(DIST_DIR):
+        shutil.rmtree(DIST_DIR)
+
+    manifest = {}
+    original_bytes = minified_bytes = 0
+    for rel_path, path in _iter_sources():
+        with open(path, 'rb') as f:
+            raw = f.read()
+        if rel_path.endswith('.css'):
+            data = minify_css(raw.decode('utf-8')).encode('utf-8')
+        elif rel_path.endswith('.js'):
+            data = minify_js(raw.decode('utf-8')).encode('utf-8')
+        else:
+            data = raw
+
+        digest = hashlib.sha256(data).hexdigest()[:12]
+        stem, ext = os.path.splitext(rel_path)
+        dist_rel = f"dist/{stem}.{digest}{ext}"
+        dist_path = os.path.join(STATIC_DIR, dist_rel)
+        if not os.path.exists(dist_path):
+            _write(dist_path, data)
+        manifest[rel_path] = dist_rel
+        original_bytes += len(raw)
+        minified_bytes += len(data)
+
+    os.makedirs(DIST_DIR, exist_ok=True)
+    tmp_path = MANIFEST_PATH + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, MANIFEST_PATH)
+
+    _remove_stale(set(manifest.values()))
+    logger.info(f"✅ Built {len(manifest)} static assets: {original_bytes // 1024} KB → "
+                f"{minified_bytes // 1024} KB minified (brotli: {'yes' if brotli else 'no'})")
+    return manifest
+
+
+def _remove_stale(current: set):
+    """Delete fingerprinted files no longer referenced by the manifest"""
+    for root, _, files in os.walk(DIST_DIR):
+        for name in files:
+            path = os.path.join(root, name)
+            rel = os.path.relpath(path, STATIC_DIR).replace(os.sep, '/')
+            base = rel[:-3] if rel.endswith(('.gz', '.br')) else rel
+            if base != 'dist/manifest.json' and base not in current:
+                os.remove(path)
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    build(clean='--clean' in sys.argv)
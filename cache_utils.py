@@ -227,12 +227,18 @@ def cache_key_products_panel(panel_id: int) -> str:
     bot_prefix = _get_bot_prefix()
     return f"{bot_prefix}products:panel:{panel_id}"
 
+def cache_key_user_pages(user_id: int) -> str:
+    """Generate cache key for a user's rendered pages ({path: (etag, body)})"""
+    bot_prefix = _get_bot_prefix()
+    return f"{bot_prefix}{CACHE_PREFIX_USER}pages:{user_id}"
+
 def invalidate_user_cache(user_id: int):
     """Invalidate all cache entries for a user"""
     bot_prefix = _get_bot_prefix()
     cache.delete(cache_key_user(user_id))
     cache.delete(cache_key_user_services(user_id))
     cache.delete(cache_key_stats(user_id))
+    cache.delete(cache_key_user_pages(user_id))
 
 def invalidate_panel_cache(panel_id: int):
     """Invalidate all cache entries for a panel"""
@@ -87,11 +87,68 @@ MYSQL_CONFIG = {
     'charset': 'utf8mb4',
     'collation': 'utf8mb4_unicode_ci',
     'autocommit': True,
-    'pool_size': 5,  # Reduced to prevent "too many connections" error   
+    'pool_size': int(os.getenv('DB_POOL_SIZE', '5')),  # Per process; gunicorn.conf.py sizes it to the worker's concurrency
     'pool_reset_session': True,
     'buffered': True
 }
 
+# Database Profiling Configuration
+# Per-method DB timing and slow-query capture (see query_profiler.py)
+DB_PROFILING_CONFIG = {
+    'enabled': os.getenv('DB_PROFILING_ENABLED', 'true').lower() in ('1', 'true', 'yes'),
+    'slow_query_ms': float(os.getenv('DB_SLOW_QUERY_MS', '200')),
+    'report_interval_hours': int(os.getenv('DB_PROFILING_REPORT_HOURS', '6')),  # 0 disables channel reports
+}
+
+# Panel Sync Engine Configuration
+# One process (elected via MySQL GET_LOCK) polls panels; see sync_engine.py
+SYNC_ENGINE_CONFIG = {
+    'interval_seconds': int(os.getenv('SYNC_INTERVAL_SECONDS', '180')),  # Base per-panel interval
+    'min_interval_seconds': int(os.getenv('SYNC_MIN_INTERVAL_SECONDS', '60')),  # Also used for at-risk panels
+    'max_interval_seconds': int(os.getenv('SYNC_MAX_INTERVAL_SECONDS', '900')),
+    'max_backoff_seconds': int(os.getenv('SYNC_MAX_BACKOFF_SECONDS', '1800')),  # Failing panels
+    'max_workers': int(os.getenv('SYNC_MAX_WORKERS', '20')),  # Global cap on concurrent panel fetches
+    'webapp_leader_candidate': os.getenv('SYNC_WEBAPP_CANDIDATE', 'true').lower() in ('1', 'true', 'yes'),
+    'refresh_snapshot_max_age': int(os.getenv('SYNC_REFRESH_MAX_AGE', '60')),  # /api/services/refresh reuses younger snapshots
+}
+
+# Panel Circuit Breaker Configuration (see panel_health.py)
+PANEL_HEALTH_CONFIG = {
+    'failure_threshold': int(os.getenv('PANEL_FAILURE_THRESHOLD', '3')),  # Consecutive failures that open the circuit
+    'cooldown_seconds': int(os.getenv('PANEL_CIRCUIT_COOLDOWN', '30')),  # First wait before a half-open probe
+    'degraded_timeout': int(os.getenv('PANEL_DEGRADED_TIMEOUT', '10')),  # Request timeout while a panel is failing
+}
+
+# 3x-ui Client Creation (see inbound_cache.py)
+PANEL_CREATE_CONFIG = {
+    'inbound_cache_ttl': int(os.getenv('PANEL_INBOUND_CACHE_TTL', '600')),  # Seconds inbound metadata is reused
+    'coalesce_window_ms': int(os.getenv('PANEL_CREATE_COALESCE_MS', '150')),  # 0 disables addClient coalescing
+    'max_batch': int(os.getenv('PANEL_CREATE_MAX_BATCH', '50')),  # Clients per coalesced addClient
+}
+
+# QR Code Cache Configuration (see qr_cache.py)
+QR_CACHE_CONFIG = {
+    'directory': os.getenv('QR_CACHE_DIR', ''),  # Empty = ./cache/qr next to the app
+    'max_files': int(os.getenv('QR_CACHE_MAX_FILES', '5000')),  # Least recently used PNGs beyond this are removed
+    'max_age': int(os.getenv('QR_CACHE_MAX_AGE', '86400')),  # Browser Cache-Control max-age for QR images
+}
+
+# Profile Photo Cache Configuration (see photo_cache.py)
+PHOTO_CACHE_CONFIG = {
+    'directory': os.getenv('PHOTO_CACHE_DIR', ''),  # Empty = ./cache/photos next to the app
+    'max_mb': int(os.getenv('PHOTO_CACHE_MAX_MB', '50')),  # Least recently served avatars beyond this are removed
+    'avatar_size': int(os.getenv('PHOTO_CACHE_AVATAR_SIZE', '160')),  # Avatars are stored as NxN JPEGs
+    'refresh_hours': int(os.getenv('PHOTO_CACHE_REFRESH_HOURS', '24')),  # Background re-check of a user's photo
+}
+
+# Request Rate Limiting Configuration (see rate_limiter.py)
+RATE_LIMIT_CONFIG = {
+    'backend': os.getenv('RATE_LIMIT_BACKEND', 'shared'),  # shared = one table for all gunicorn workers, local = per worker
+    'max_keys': int(os.getenv('RATE_LIMIT_MAX_KEYS', '16384')),  # Fixed table size; idle keys are evicted beyond it
+    'shared_path': os.getenv('RATE_LIMIT_SHARED_PATH', ''),  # Empty = /dev/shm/ratelimit-<database>
+    'namespace': MYSQL_CONFIG['database'],  # Keeps bots sharing a host apart
+}
+
 # Validate required database config
 if not MYSQL_CONFIG['password']:
     raise ValueError("MYSQL_PASSWORD must be set in .env file")
@@ -4,81 +4,222 @@ Adds indexes and optimizes frequently used queries
 """
 
 import logging
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Tuple
 
 logger = logging.getLogger(__name__)
 
-def create_database_indexes(db_manager):
+# Desired secondary indexes: (table, index_name, columns)
+# An index counts as present when any existing index starts with the same columns,
+# so UNIQUE keys and wider composites also satisfy a single-column entry.
+DESIRED_INDEXES = [
+    # Users table
+    ('users', 'idx_users_referral_code', ('referral_code',)),
+    ('users', 'idx_users_referred_by', ('referred_by',)),
+    ('users', 'idx_users_is_admin', ('is_admin',)),
+    ('users', 'idx_users_created_id', ('created_at', 'id')),
+    
+    # Clients table
+    ('clients', 'idx_clients_user_id', ('user_id',)),
+    ('clients', 'idx_clients_panel_id', ('panel_id',)),
+    ('clients', 'idx_clients_created_id', ('created_at', 'id')),
+    ('clients', 'idx_clients_expires_at', ('expires_at',)),
+    # get_all_active_services: active branch + grace-period branches (index merge)
+    ('clients', 'idx_clients_active_panel', ('is_active', 'panel_id')),
+    ('clients', 'idx_clients_status_exhausted', ('status', 'exhausted_at')),
+    ('clients', 'idx_clients_status_expired', ('status', 'expired_at')),
+    # Expiry index delta sync (deadlines changed since the last tick; updated_at without the trigger)
+    ('clients', 'idx_clients_deadline_updated_at', ('deadline_updated_at',)),
+    ('clients', 'idx_clients_updated_at', ('updated_at',)),
+    
+    # Invoices table
+    ('invoices', 'idx_invoices_panel_id', ('panel_id',)),
+    ('invoices', 'idx_invoices_status', ('status',)),
+    ('invoices', 'idx_invoices_order_id', ('order_id',)),
+    ('invoices', 'idx_invoices_created_id', ('created_at', 'id')),
+    # get_user_transactions: paid invoices of one user
+    ('invoices', 'idx_invoices_user_status_paid', ('user_id', 'status', 'paid_at')),
+    
+    # Panels table
+    ('panels', 'idx_panels_is_active', ('is_active',)),
+    ('panels', 'idx_panels_panel_type', ('panel_type',)),
+    
+    # Products table
+    ('products', 'idx_products_panel_id', ('panel_id',)),
+    ('products', 'idx_products_category_id', ('category_id',)),
+    ('products', 'idx_products_is_active', ('is_active',)),
+    
+    # Balance transactions: get_user_transactions orders a user's rows by date
+    ('balance_transactions', 'idx_balance_transactions_user_created', ('user_id', 'created_at')),
+    ('balance_transactions', 'idx_balance_transactions_type', ('transaction_type',)),
+    ('balance_transactions', 'idx_balance_transactions_created_at', ('created_at',)),
+    
+    # Discount / gift codes
+    ('discount_codes', 'idx_discount_codes_code', ('code',)),
+    ('discount_codes', 'idx_discount_codes_is_active', ('is_active',)),
+    ('gift_codes', 'idx_gift_codes_code', ('code',)),
+    ('gift_codes', 'idx_gift_codes_is_active', ('is_active',)),
+]
+
+# Hot queries checked by the EXPLAIN report: (name, sql, sample params)
+HOT_QUERIES = [
+    ('get_user', 'SELECT * FROM users WHERE telegram_id = %s', (0,)),
+    ('get_user_clients', '''
+        SELECT c.* FROM clients c JOIN users u ON c.user_id = u.id
+        WHERE u.telegram_id = %s ORDER BY c.created_at DESC
+    ''', (0,)),
+    ('get_all_active_services', '''
+        SELECT c.id FROM clients c JOIN panels p ON c.panel_id = p.id
+        WHERE p.is_active = 1
+          AND (c.is_active = 1
+               OR (c.status = 'disabled' AND c.exhausted_at > NOW() - INTERVAL 25 HOUR)
+               OR (c.status = 'disabled' AND c.expired_at > NOW() - INTERVAL 25 HOUR))
+    ''', ()),
+    ('get_user_transactions.balance', '''
+        SELECT * FROM balance_transactions WHERE user_id = %s ORDER BY created_at DESC LIMIT 20
+    ''', (0,)),
+    ('get_user_transactions.invoices', '''
+        SELECT id FROM invoices WHERE user_id = %s AND status IN ('paid', 'completed')
+        ORDER BY COALESCE(paid_at, created_at) DESC LIMIT 20
+    ''', (0,)),
+    ('get_services_for_deletion', '''
+        SELECT id FROM clients
+        WHERE status = 'disabled' AND exhausted_at IS NOT NULL
+          AND exhausted_at < NOW() - INTERVAL 24 HOUR
+    ''', ()),
+    ('admin_services_page', '''
+        SELECT c.id FROM clients c ORDER BY c.created_at DESC, c.id DESC LIMIT 10
+    ''', ()),
+]
+
+
+class IndexManager:
     """
-    Create database indexes for better query performance
+    Keeps the schema's secondary indexes in line with DESIRED_INDEXES
     
-    This should be called once during database initialization
+    Existing indexes are read from information_schema and only the missing
+    ones are created, using online DDL so tables stay writable.
     """
-    try:
-        with db_manager.get_connection() as conn:
+    
+    def __init__(self, db_manager, desired: List = None):
+        self.db = db_manager
+        self.desired = desired if desired is not None else DESIRED_INDEXES
+    
+    def get_existing_indexes(self, cursor) -> Dict[str, Dict[str, List[str]]]:
+        """Read actual indexes as {table: {index_name: [columns in order]}}"""
+        cursor.execute('''
+            SELECT TABLE_NAME, INDEX_NAME, COLUMN_NAME
+            FROM INFORMATION_SCHEMA.STATISTICS
+            WHERE TABLE_SCHEMA = DATABASE()
+            ORDER BY TABLE_NAME, INDEX_NAME, SEQ_IN_INDEX
+        ''')
+        existing: Dict[str, Dict[str, List[str]]] = {}
+        for table, index_name, column in cursor.fetchall():
+            existing.setdefault(table, {}).setdefault(index_name, []).append(column)
+        return existing
+    
+    def diff(self, existing: Dict[str, Dict[str, List[str]]]) -> List[Tuple[str, str, Tuple[str, ...]]]:
+        """Return desired indexes not covered by an existing index"""
+        missing = []
+        for table, index_name, columns in self.desired:
+            if table not in existing:
+                continue  # Table not created (optional feature) - nothing to index
+            table_indexes = existing[table]
+            covered = any(
+                tuple(index_columns[:len(columns)]) == tuple(columns)
+                for index_columns in table_indexes.values()
+            )
+            if not covered and index_name not in table_indexes:
+                missing.append((table, index_name, columns))
+        return missing
+    
+    def create_missing(self) -> Dict[str, List[str]]:
+        """
+        Create missing indexes
+        
+        Returns:
+            {'created': [...], 'failed': [...]} with "table.index" names
+        """
+        result = {'created': [], 'failed': []}
+        with self.db.get_connection() as conn:
             cursor = conn.cursor()
+            missing = self.diff(self.get_existing_indexes(cursor))
             
-            # Indexes for users table
-            indexes = [
-                # Users table indexes
-                "CREATE INDEX IF NOT EXISTS idx_users_telegram_id ON users(telegram_id)",
-                "CREATE INDEX IF NOT EXISTS idx_users_referral_code ON users(referral_code)",
-                "CREATE INDEX IF NOT EXISTS idx_users_referred_by ON users(referred_by)",
-                "CREATE INDEX IF NOT EXISTS idx_users_is_admin ON users(is_admin)",
-                "CREATE INDEX IF NOT EXISTS idx_users_created_at ON users(created_at)",
-                
-                # Clients table indexes
-                "CREATE INDEX IF NOT EXISTS idx_clients_user_id ON clients(user_id)",
-                "CREATE INDEX IF NOT EXISTS idx_clients_panel_id ON clients(panel_id)",
-                "CREATE INDEX IF NOT EXISTS idx_clients_is_active ON clients(is_active)",
-                "CREATE INDEX IF NOT EXISTS idx_clients_status ON clients(status)",
-                "CREATE INDEX IF NOT EXISTS idx_clients_created_at ON clients(created_at)",
-                "CREATE INDEX IF NOT EXISTS idx_clients_expires_at ON clients(expires_at)",
-                
-                # Invoices table indexes
-                "CREATE INDEX IF NOT EXISTS idx_invoices_user_id ON invoices(user_id)",
-                "CREATE INDEX IF NOT EXISTS idx_invoices_panel_id ON invoices(panel_id)",
-                "CREATE INDEX IF NOT EXISTS idx_invoices_status ON invoices(status)",
-                "CREATE INDEX IF NOT EXISTS idx_invoices_order_id ON invoices(order_id)",
-                "CREATE INDEX IF NOT EXISTS idx_invoices_created_at ON invoices(created_at)",
-                
-                # Panels table indexes
-                "CREATE INDEX IF NOT EXISTS idx_panels_is_active ON panels(is_active)",
-                "CREATE INDEX IF NOT EXISTS idx_panels_panel_type ON panels(panel_type)",
-                
-                # Products table indexes
-                "CREATE INDEX IF NOT EXISTS idx_products_panel_id ON products(panel_id)",
-                "CREATE INDEX IF NOT EXISTS idx_products_category_id ON products(category_id)",
-                "CREATE INDEX IF NOT EXISTS idx_products_is_active ON products(is_active)",
-                
-                # Balance transactions indexes
-                "CREATE INDEX IF NOT EXISTS idx_balance_transactions_user_id ON balance_transactions(user_id)",
-                "CREATE INDEX IF NOT EXISTS idx_balance_transactions_type ON balance_transactions(transaction_type)",
-                "CREATE INDEX IF NOT EXISTS idx_balance_transactions_created_at ON balance_transactions(created_at)",
-                
-                # Discount codes indexes
-                "CREATE INDEX IF NOT EXISTS idx_discount_codes_code ON discount_codes(code)",
-                "CREATE INDEX IF NOT EXISTS idx_discount_codes_is_active ON discount_codes(is_active)",
-                
-                # Gift codes indexes
-                "CREATE INDEX IF NOT EXISTS idx_gift_codes_code ON gift_codes(code)",
-                "CREATE INDEX IF NOT EXISTS idx_gift_codes_is_active ON gift_codes(is_active)",
-            ]
-            
-            for index_sql in indexes:
+            for table, index_name, columns in missing:
+                column_sql = ', '.join(f'`{column}`' for column in columns)
                 try:
-                    cursor.execute(index_sql)
-                    logger.info(f"Created index: {index_sql[:50]}...")
+                    cursor.execute(
+                        f'ALTER TABLE `{table}` ADD INDEX `{index_name}` ({column_sql}), '
+                        f'ALGORITHM=INPLACE, LOCK=NONE'
+                    )
+                    result['created'].append(f'{table}.{index_name}')
+                    logger.info(f"✅ Created index {index_name} on {table}({', '.join(columns)})")
                 except Exception as e:
-                    # Index might already exist, ignore error
-                    logger.debug(f"Index creation skipped (might exist): {e}")
+                    result['failed'].append(f'{table}.{index_name}')
+                    logger.warning(f"⚠️ Could not create index {index_name} on {table}: {e}")
             
             conn.commit()
-            logger.info("✅ Database indexes created successfully")
-            
+        return result
+    
+    def explain_hot_queries(self) -> List[Dict]:
+        """
+        Run EXPLAIN on HOT_QUERIES
+        
+        Returns:
+            One entry per query with the access plan of each table and a
+            full_scan flag when any table is read without an index
+        """
+        report = []
+        with self.db.get_connection() as conn:
+            cursor = conn.cursor(dictionary=True)
+            for name, sql, params in HOT_QUERIES:
+                try:
+                    cursor.execute('EXPLAIN ' + sql, params)
+                    plan = [{
+                        'table': row.get('table'),
+                        'type': row.get('type'),
+                        'key': row.get('key'),
+                        'rows': row.get('rows'),
+                        'extra': row.get('Extra'),
+                    } for row in cursor.fetchall()]
+                    report.append({
+                        'query': name,
+                        'plan': plan,
+                        'full_scan': any(step['type'] == 'ALL' for step in plan),
+                        'estimated_rows': sum(int(step['rows'] or 0) for step in plan),
+                    })
+                except Exception as e:
+                    report.append({'query': name, 'error': str(e)})
+        return report
+    
+    def format_report(self, report: List[Dict]) -> str:
+        """Format an EXPLAIN report as plain text"""
+        lines = []
+        for entry in report:
+            if 'error' in entry:
+                lines.append(f"❌ {entry['query']}: {entry['error']}")
+                continue
+            status = '⚠️' if entry['full_scan'] else '✅'
+            keys = ', '.join(f"{step['table']}:{step['key'] or step['type']}" for step in entry['plan'])
+            lines.append(f"{status} {entry['query']} (~{entry['estimated_rows']} rows) [{keys}]")
+        return '\n'.join(lines)
+
+
+def create_database_indexes(db_manager) -> Dict[str, List[str]]:
+    """
+    Create missing database indexes for better query performance
+    
+    This is called during database initialization and is cheap when the
+    schema is already up to date (a single information_schema read).
+    """
+    try:
+        result = IndexManager(db_manager).create_missing()
+        if result['created']:
+            logger.info(f"✅ Created {len(result['created'])} database indexes")
+        return result
     except Exception as e:
         logger.error(f"Error creating database indexes: {e}")
         # Don't raise - indexes are optional optimizations
+        return {'created': [], 'failed': []}
 
 def optimize_user_query(db_manager, user_id: int) -> Optional[Dict]:
     """
@@ -143,3 +284,11 @@ def optimize_services_query(db_manager, user_id: int, limit: Optional[int] = Non
         logger.error(f"Error in optimized services query: {e}")
         return []
 
+
+
+if __name__ == '__main__':
+    # Print the index diff and EXPLAIN report for the configured database
+    from professional_database import ProfessionalDatabaseManager
+    
+    manager = IndexManager(ProfessionalDatabaseManager())
+    print(manager.format_report(manager.explain_hot_queries()))
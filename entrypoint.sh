@@ -71,6 +71,10 @@ print('Database initialized successfully!')
     log_warn "Continuing despite migration error..."
 }
 
+# Build fingerprinted/precompressed static assets (served by nginx)
+log_info "Building static assets..."
+python3 build_static.py || log_warn "Static asset build failed, serving unbuilt files"
+
 # Ensure SSL Directory Exists
 mkdir -p /etc/nginx/ssl
 
@@ -141,6 +145,30 @@ server {
         root /var/www/certbot;
     }
 
+    location /static/dist/ {
+        alias /app/static/dist/;
+        gzip_static on;
+        gzip_vary on;
+        add_header Cache-Control "public, max-age=31536000, immutable";
+        access_log off;
+    }
+
+    # Uploaded receipts stay behind the webapp
+    location /static/receipts/ {
+        proxy_pass http://127.0.0.1:5000;
+        proxy_set_header Host $host;
+        proxy_set_header X-Real-IP $remote_addr;
+        proxy_set_header X-Forwarded-For $proxy_add_x_forwarded_for;
+        proxy_set_header X-Forwarded-Proto $scheme;
+    }
+
+    location /static/ {
+        alias /app/static/;
+        gzip_static on;
+        expires 1h;
+        access_log off;
+    }
+
     location / {
         proxy_pass http://127.0.0.1:5000;
         proxy_set_header Host $host;
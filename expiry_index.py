@@ -0,0 +1,167 @@
+"""
+Expiry Timer Index
+Min-heap of service deadlines so the monitor only looks at services that are due.
+
+Deadlines tracked per service:
+- three_day_warning: expires_at - 4 days (the 3-day warning fires while remaining_days <= 3)
+- plan_expiry: expires_at of plan services that are not disabled yet
+- exhausted_deletion: exhausted_at + 24h grace for disabled services
+- expired_deletion: expired_at + 24h grace for disabled plan services
+
+The index is loaded once, then kept current by reading only rows whose
+deadline_updated_at moved since the last sync (a trigger bumps it when a
+deadline column changes, so traffic syncs do not), with an hourly full
+reload as a safety net. Stale heap entries are skipped lazily. Entries handed out by
+pop_due() are re-evaluated with refresh(), so a deadline that could not be
+handled (panel down) comes due again on the next tick.
+"""
+
+import heapq
+import itertools
+import threading
+import time
+import logging
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Iterable
+
+logger = logging.getLogger(__name__)
+
+
+class ExpiryIndex:
+    """Deadline min-heap over clients"""
+
+    THREE_DAY_WARNING = 'three_day_warning'
+    PLAN_EXPIRY = 'plan_expiry'
+    EXHAUSTED_DELETION = 'exhausted_deletion'
+    EXPIRED_DELETION = 'expired_deletion'
+
+    GRACE_PERIOD = timedelta(hours=24)
+    WARNING_LEAD = timedelta(days=4)
+    FULL_RELOAD_SECONDS = 3600  # Safety net against missed deltas (manual DB edits, failed queries)
+
+    def __init__(self, db):
+        self.db = db
+        self._heap = []  # (deadline_ts, seq, service_id, kind)
+        self._deadlines: Dict[tuple, float] = {}  # {(service_id, kind): deadline_ts} - current entries
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+        self._synced_until: Optional[datetime] = None
+        self._loaded_at = 0.0
+        self.loaded = False
+
+    @classmethod
+    def compute_deadlines(cls, row: Dict) -> Dict[str, datetime]:
+        """Deadlines that apply to one clients row in its current state"""
+        deadlines = {}
+        status = row.get('status')
+        expires_at = row.get('expires_at')
+
+        if row.get('product_id') and isinstance(expires_at, datetime) and status != 'disabled':
+            deadlines[cls.PLAN_EXPIRY] = expires_at
+            if not row.get('warned_one_week'):
+                deadlines[cls.THREE_DAY_WARNING] = expires_at - cls.WARNING_LEAD
+
+        if status == 'disabled':
+            if isinstance(row.get('exhausted_at'), datetime):
+                deadlines[cls.EXHAUSTED_DELETION] = row['exhausted_at'] + cls.GRACE_PERIOD
+            if row.get('product_id') and isinstance(row.get('expired_at'), datetime):
+                deadlines[cls.EXPIRED_DELETION] = row['expired_at'] + cls.GRACE_PERIOD
+
+        return deadlines
+
+    def _apply_row(self, row: Dict):
+        service_id = row['id']
+        deadlines = self.compute_deadlines(row)
+        for kind in (self.THREE_DAY_WARNING, self.PLAN_EXPIRY, self.EXHAUSTED_DELETION, self.EXPIRED_DELETION):
+            key = (service_id, kind)
+            deadline = deadlines.get(kind)
+            if deadline is None:
+                self._deadlines.pop(key, None)
+                continue
+            ts = deadline.timestamp()
+            if self._deadlines.get(key) != ts:
+                self._deadlines[key] = ts
+                heapq.heappush(self._heap, (ts, next(self._seq), service_id, kind))
+
+    def _forget(self, service_id: int):
+        for kind in (self.THREE_DAY_WARNING, self.PLAN_EXPIRY, self.EXHAUSTED_DELETION, self.EXPIRED_DELETION):
+            self._deadlines.pop((service_id, kind), None)
+
+    def load(self):
+        """Build the index from all clients of active panels"""
+        started = time.time()
+        rows = self.db.get_expiry_index_rows()
+        with self._lock:
+            self._heap = []
+            self._deadlines = {}
+            for row in rows:
+                self._apply_row(row)
+            self._synced_until = max((r['changed_at'] for r in rows if r.get('changed_at')), default=datetime.now())
+            self._loaded_at = time.time()
+            self.loaded = True
+        logger.info(f"⏱️ Expiry index loaded: {len(self._deadlines)} deadlines from {len(rows)} services "
+                    f"in {time.time() - started:.2f}s")
+
+    def sync_changes(self) -> int:
+        """Apply rows changed since the last sync (renewals, status changes, new services)"""
+        if not self.loaded or time.time() - self._loaded_at >= self.FULL_RELOAD_SECONDS:
+            self.load()
+            return len(self._deadlines)
+        rows = self.db.get_expiry_index_rows(updated_since=self._synced_until)
+        with self._lock:
+            for row in rows:
+                self._apply_row(row)
+                if row.get('changed_at') and row['changed_at'] > self._synced_until:
+                    self._synced_until = row['changed_at']
+        return len(rows)
+
+    def refresh(self, service_ids: Iterable[int]):
+        """Re-evaluate services (after handling them) from the database"""
+        service_ids = list(set(service_ids))
+        if not service_ids:
+            return
+        rows = self.db.get_expiry_index_rows(service_ids=service_ids)
+        found = set()
+        with self._lock:
+            for row in rows:
+                found.add(row['id'])
+                self._apply_row(row)
+            for service_id in service_ids:
+                if service_id not in found:
+                    self._forget(service_id)  # Deleted or panel deactivated
+
+    def pop_due(self, now: float = None) -> Dict[str, List[int]]:
+        """
+        Remove and return every deadline that has passed
+
+        Returns:
+            {kind: [service_id, ...]}
+        """
+        now = now or time.time()
+        due: Dict[str, List[int]] = {}
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now:
+                ts, _, service_id, kind = heapq.heappop(self._heap)
+                key = (service_id, kind)
+                if self._deadlines.get(key) != ts:
+                    continue  # Superseded by a newer deadline or removed
+                del self._deadlines[key]
+                due.setdefault(kind, []).append(service_id)
+            # Drop stale entries once they make up most of the heap
+            if len(self._heap) > 2 * len(self._deadlines) + 1024:
+                self._heap = [(ts, next(self._seq), sid, kind)
+                              for (sid, kind), ts in self._deadlines.items()]
+                heapq.heapify(self._heap)
+        return due
+
+    def next_deadline(self) -> Optional[float]:
+        with self._lock:
+            while self._heap:
+                ts, _, service_id, kind = self._heap[0]
+                if self._deadlines.get((service_id, kind)) == ts:
+                    return ts
+                heapq.heappop(self._heap)
+        return None
+
+    def __len__(self):
+        return len(self._deadlines)
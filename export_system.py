@@ -5,9 +5,15 @@ Exports users, orders, and payments to CSV/Excel formats
 
 import csv
 import io
+import os
+import gzip
+import json
+import queue
+import hashlib
 import logging
-from typing import Optional, Dict, List
-from datetime import datetime
+import threading
+from typing import Optional, Dict, List, Callable, Tuple
+from datetime import datetime, timedelta
 from enum import Enum
 
 logger = logging.getLogger(__name__)
@@ -395,3 +401,401 @@ class DataExporter:
 
 # Global instance
 data_exporter = DataExporter()
+
+
+class ExportJobStatus(Enum):
+    """Lifecycle states of a background export job"""
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    EXPIRED = 'expired'
+
+
+class ExportJobManager:
+    """
+    Runs exports off the request path.
+    
+    Jobs are persisted in the export_jobs table and executed by a single
+    worker thread. Finished artifacts are stored gzip-compressed on disk
+    until their TTL passes, so they can be downloaded again without
+    re-running the query. Identical requests (same type, format and filters)
+    inside the dedup window reuse the existing job.
+    """
+    
+    def __init__(self, db, exporter: DataExporter = None, storage_dir: str = 'exports',
+                 ttl_hours: int = 24, dedup_minutes: int = 10):
+        """
+        Initialize export job manager
+        
+        Args:
+            db: ProfessionalDatabaseManager instance
+            exporter: DataExporter used to build the files (default: new instance)
+            storage_dir: Directory for compressed artifacts
+            ttl_hours: How long finished artifacts stay downloadable
+            dedup_minutes: Window in which identical requests share one job
+        """
+        self.db = db
+        self.exporter = exporter or DataExporter(db)
+        self.storage_dir = storage_dir
+        self.ttl_hours = ttl_hours
+        self.dedup_minutes = dedup_minutes
+        self.notifier: Optional[Callable[[Dict, int], None]] = None
+        
+        self._queue: "queue.Queue[int]" = queue.Queue()
+        self._watchers: Dict[int, set] = {}  # {job_id: {telegram_id, ...}}
+        self._lock = threading.Lock()
+        self._worker: Optional[threading.Thread] = None
+        
+        os.makedirs(self.storage_dir, exist_ok=True)
+        self._ensure_tables_exist()
+    
+    def _ensure_tables_exist(self):
+        """Ensure the export_jobs table exists"""
+        try:
+            with self.db.get_connection() as conn:
+                cursor = conn.cursor(dictionary=True)
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS export_jobs (
+                        id INT AUTO_INCREMENT PRIMARY KEY,
+                        export_type VARCHAR(50) NOT NULL,
+                        export_format VARCHAR(10) NOT NULL DEFAULT 'csv',
+                        filters JSON,
+                        request_hash CHAR(64) NOT NULL,
+                        requested_by BIGINT NOT NULL,
+                        status VARCHAR(20) NOT NULL DEFAULT 'pending',
+                        file_path VARCHAR(500),
+                        file_name VARCHAR(255),
+                        file_size BIGINT DEFAULT 0,
+                        error TEXT,
+                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                        started_at TIMESTAMP NULL,
+                        finished_at TIMESTAMP NULL,
+                        expires_at TIMESTAMP NULL,
+                        INDEX idx_request_hash_created (request_hash, created_at),
+                        INDEX idx_status (status),
+                        INDEX idx_expires_at (expires_at)
+                    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+                ''')
+                conn.commit()
+        except Exception as e:
+            logger.error(f"Error creating export_jobs table: {e}")
+    
+    def set_notifier(self, notifier: Callable[[Dict, int], None]):
+        """
+        Set the callback used when a job finishes.
+        
+        The callback receives the job row and the telegram_id to notify. It is
+        called from the worker thread, so async senders must hand the work
+        over to their own event loop.
+        """
+        self.notifier = notifier
+    
+    # ==================== Queue ====================
+    
+    def start(self):
+        """Start the worker thread and requeue jobs interrupted by a restart"""
+        with self._lock:
+            if self._worker and self._worker.is_alive():
+                return
+            self._recover_jobs()
+            self._worker = threading.Thread(target=self._run, daemon=True, name="ExportWorker")
+            self._worker.start()
+            logger.info("✅ Export worker started")
+    
+    def submit(self, export_type: ExportType, requested_by: int,
+               format: ExportFormat = ExportFormat.CSV, filters: Dict = None) -> Optional[Dict]:
+        """
+        Queue an export, or reuse an identical recent one
+        
+        Args:
+            export_type: Data to export
+            requested_by: Telegram ID of the requesting admin (notified on completion)
+            format: Export format
+            filters: Optional filters passed to the exporter
+            
+        Returns:
+            Job row (status may already be 'done' for a deduplicated request).
+            watcher_notified is True when a reused job finished while the request
+            was being registered and the requester has already been notified
+            (the caller must not deliver the result again).
+        """
+        filters = filters or {}
+        request_hash = self._request_hash(export_type, format, filters)
+        
+        try:
+            existing = self._find_reusable_job(request_hash)
+            if existing:
+                if existing['status'] in (ExportJobStatus.PENDING.value, ExportJobStatus.RUNNING.value):
+                    job, notified = self._watch_job(existing['id'], requested_by)
+                    existing = dict(job or existing, watcher_notified=notified)
+                logger.info(f"Reusing export job {existing['id']} for {export_type.value}")
+                return existing
+            
+            with self.db.get_connection() as conn:
+                cursor = conn.cursor(dictionary=True)
+                cursor.execute('''
+                    INSERT INTO export_jobs (export_type, export_format, filters, request_hash, requested_by)
+                    VALUES (%s, %s, %s, %s, %s)
+                ''', (export_type.value, format.value, json.dumps(filters, default=str),
+                      request_hash, requested_by))
+                job_id = cursor.lastrowid
+                conn.commit()
+            
+            self._add_watcher(job_id, requested_by)
+            self._queue.put(job_id)
+            return self.get_job(job_id)
+        except Exception as e:
+            logger.error(f"Error submitting export job: {e}")
+            return None
+    
+    def get_job(self, job_id: int) -> Optional[Dict]:
+        """Get export job by ID"""
+        try:
+            with self.db.get_connection() as conn:
+                cursor = conn.cursor(dictionary=True)
+                cursor.execute('SELECT * FROM export_jobs WHERE id = %s', (job_id,))
+                return cursor.fetchone()
+        except Exception as e:
+            logger.error(f"Error getting export job {job_id}: {e}")
+            return None
+    
+    def get_recent_jobs(self, limit: int = 5) -> List[Dict]:
+        """Get the most recent downloadable artifacts"""
+        try:
+            with self.db.get_connection() as conn:
+                cursor = conn.cursor(dictionary=True)
+                cursor.execute('''
+                    SELECT * FROM export_jobs
+                    WHERE status = %s AND expires_at > NOW()
+                    ORDER BY finished_at DESC
+                    LIMIT %s
+                ''', (ExportJobStatus.DONE.value, limit))
+                return cursor.fetchall()
+        except Exception as e:
+            logger.error(f"Error getting recent export jobs: {e}")
+            return []
+    
+    def read_artifact(self, job: Dict) -> Optional[bytes]:
+        """Read and decompress a finished job's artifact"""
+        path = job.get('file_path') if job else None
+        if not path or not os.path.exists(path):
+            return None
+        try:
+            with gzip.open(path, 'rb') as f:
+                return f.read()
+        except Exception as e:
+            logger.error(f"Error reading export artifact {path}: {e}")
+            return None
+    
+    # ==================== Worker ====================
+    
+    def _run(self):
+        """Worker loop: run queued jobs, purge expired artifacts when idle"""
+        while True:
+            try:
+                job_id = self._queue.get(timeout=300)
+            except queue.Empty:
+                self.cleanup_expired()
+                continue
+            try:
+                self._process_job(job_id)
+            except Exception as e:
+                logger.error(f"Error in export worker for job {job_id}: {e}")
+            finally:
+                self._queue.task_done()
+    
+    def _process_job(self, job_id: int):
+        """Run a single export job and store its artifact"""
+        job = self.get_job(job_id)
+        if not job or job['status'] != ExportJobStatus.PENDING.value:
+            return
+        
+        self._update_job(job_id, status=ExportJobStatus.RUNNING.value, started_at=datetime.now())
+        
+        export_type = ExportType(job['export_type'])
+        format = ExportFormat(job['export_format'])
+        filters = json.loads(job['filters']) if job.get('filters') else None
+        
+        export_func = self._export_functions().get(export_type)
+        file_bytes = export_func(format, filters) if export_func else None
+        
+        if not file_bytes:
+            self._update_job(job_id, status=ExportJobStatus.FAILED.value, finished_at=datetime.now(),
+                             error='No data or export error')
+        else:
+            file_name = self.exporter.get_export_filename(export_type, format)
+            file_path = os.path.join(self.storage_dir, f"{job_id}_{file_name}.gz")
+            with gzip.open(file_path, 'wb', compresslevel=6) as f:
+                f.write(file_bytes)
+            
+            finished_at = datetime.now()
+            self._update_job(
+                job_id,
+                status=ExportJobStatus.DONE.value,
+                file_path=file_path,
+                file_name=file_name,
+                file_size=os.path.getsize(file_path),
+                finished_at=finished_at,
+                expires_at=finished_at + timedelta(hours=self.ttl_hours)
+            )
+            logger.info(f"✅ Export job {job_id} ({export_type.value}) finished: {file_name}")
+        
+        self._notify_watchers(job_id)
+    
+    def _export_functions(self) -> Dict[ExportType, Callable]:
+        """Map export types to exporter methods"""
+        return {
+            ExportType.USERS: self.exporter.export_users,
+            ExportType.ORDERS: self.exporter.export_orders,
+            ExportType.INVOICES: self.exporter.export_orders,
+            ExportType.PAYMENTS: self.exporter.export_payments,
+            ExportType.SERVICES: self.exporter.export_services,
+        }
+    
+    def _notify_watchers(self, job_id: int):
+        """Tell everyone waiting on a job that it finished"""
+        with self._lock:
+            watchers = self._watchers.pop(job_id, set())
+        
+        job = self.get_job(job_id)
+        if not job:
+            return
+        watchers.add(job['requested_by'])
+        
+        if not self.notifier:
+            return
+        for telegram_id in watchers:
+            try:
+                self.notifier(job, telegram_id)
+            except Exception as e:
+                logger.error(f"Error notifying {telegram_id} about export job {job_id}: {e}")
+    
+    def _recover_jobs(self):
+        """Requeue jobs that were pending or running when the process stopped"""
+        try:
+            with self.db.get_connection() as conn:
+                cursor = conn.cursor(dictionary=True)
+                cursor.execute(
+                    'UPDATE export_jobs SET status = %s, started_at = NULL WHERE status = %s',
+                    (ExportJobStatus.PENDING.value, ExportJobStatus.RUNNING.value)
+                )
+                cursor.execute(
+                    'SELECT id FROM export_jobs WHERE status = %s ORDER BY id',
+                    (ExportJobStatus.PENDING.value,)
+                )
+                pending = [row['id'] for row in cursor.fetchall()]
+                conn.commit()
+            for job_id in pending:
+                self._queue.put(job_id)
+            if pending:
+                logger.info(f"Requeued {len(pending)} interrupted export jobs")
+        except Exception as e:
+            logger.error(f"Error recovering export jobs: {e}")
+    
+    def cleanup_expired(self) -> int:
+        """Delete artifacts past their TTL and mark their jobs expired"""
+        try:
+            with self.db.get_connection() as conn:
+                cursor = conn.cursor(dictionary=True)
+                cursor.execute(
+                    'SELECT id, file_path FROM export_jobs WHERE status = %s AND expires_at <= NOW()',
+                    (ExportJobStatus.DONE.value,)
+                )
+                expired = cursor.fetchall()
+                for row in expired:
+                    if row['file_path'] and os.path.exists(row['file_path']):
+                        try:
+                            os.remove(row['file_path'])
+                        except OSError as e:
+                            logger.warning(f"Could not remove export artifact {row['file_path']}: {e}")
+                    cursor.execute('UPDATE export_jobs SET status = %s WHERE id = %s',
+                                   (ExportJobStatus.EXPIRED.value, row['id']))
+                conn.commit()
+                if expired:
+                    logger.info(f"Cleaned {len(expired)} expired export artifacts")
+                return len(expired)
+        except Exception as e:
+            logger.error(f"Error cleaning expired exports: {e}")
+            return 0
+    
+    # ==================== Helpers ====================
+    
+    @staticmethod
+    def _request_hash(export_type: ExportType, format: ExportFormat, filters: Dict) -> str:
+        """Stable hash identifying identical export requests"""
+        payload = json.dumps({'type': export_type.value, 'format': format.value, 'filters': filters},
+                             sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+    
+    def _find_reusable_job(self, request_hash: str) -> Optional[Dict]:
+        """Find a queued, running or still-downloadable identical job"""
+        with self.db.get_connection() as conn:
+            cursor = conn.cursor(dictionary=True)
+            cursor.execute('''
+                SELECT * FROM export_jobs
+                WHERE request_hash = %s
+                  AND created_at >= NOW() - INTERVAL %s MINUTE
+                  AND (status IN (%s, %s) OR (status = %s AND expires_at > NOW()))
+                ORDER BY id DESC
+                LIMIT 1
+            ''', (request_hash, self.dedup_minutes,
+                  ExportJobStatus.PENDING.value, ExportJobStatus.RUNNING.value, ExportJobStatus.DONE.value))
+            job = cursor.fetchone()
+        
+        if job and job['status'] == ExportJobStatus.DONE.value and not (
+                job.get('file_path') and os.path.exists(job['file_path'])):
+            return None
+        return job
+    
+    def _add_watcher(self, job_id: int, telegram_id: int):
+        """Register a telegram_id to notify when a job finishes"""
+        with self._lock:
+            self._watchers.setdefault(job_id, set()).add(telegram_id)
+    
+    def _watch_job(self, job_id: int, telegram_id: int) -> Tuple[Optional[Dict], bool]:
+        """
+        Register a watcher on a job found pending or running, then re-check it
+        
+        The job may have finished (and notified its watchers) between the lookup
+        and the registration; the worker marks a job finished before notifying,
+        so a finished status here means either the worker or this call notifies.
+        
+        Returns:
+            (job row as of after the registration, whether telegram_id has
+            already been notified of the finished job)
+        """
+        self._add_watcher(job_id, telegram_id)
+        job = self.get_job(job_id)
+        if not job or job['status'] in (ExportJobStatus.PENDING.value, ExportJobStatus.RUNNING.value):
+            return job, False
+        
+        with self._lock:
+            watchers = self._watchers.get(job_id)
+            if not watchers or telegram_id not in watchers:
+                return job, bool(self.notifier)  # Already notified by the worker
+            watchers.discard(telegram_id)
+            if not watchers:
+                del self._watchers[job_id]
+        
+        # The worker always notifies the original requester itself
+        if self.notifier and telegram_id != job['requested_by']:
+            try:
+                self.notifier(job, telegram_id)
+            except Exception as e:
+                logger.error(f"Error notifying {telegram_id} about export job {job_id}: {e}")
+        return job, bool(self.notifier)
+    
+    def _update_job(self, job_id: int, **fields):
+        """Update columns of an export job"""
+        if not fields:
+            return
+        columns = ', '.join(f"{key} = %s" for key in fields)
+        try:
+            with self.db.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute(f'UPDATE export_jobs SET {columns} WHERE id = %s',
+                               (*fields.values(), job_id))
+                conn.commit()
+        except Exception as e:
+            logger.error(f"Error updating export job {job_id}: {e}")
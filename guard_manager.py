@@ -11,6 +11,7 @@ import urllib3
 import logging
 from typing import Dict, List, Optional, Tuple
 from datetime import datetime, timedelta
+from panel_batch import PanelBatchOperations
 
 # Disable SSL warnings for self-signed certificates
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
@@ -18,7 +19,7 @@ urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 logger = logging.getLogger(__name__)
 
 
-class GuardPanelManager:
+class GuardPanelManager(PanelBatchOperations):
     # Guard (GuardCore) Panel Manager
     def __init__(self):
         self.session = requests.Session()
@@ -1012,6 +1013,51 @@ class GuardPanelManager:
             traceback.print_exc()
             return None
     
+    def _bulk_subscriptions(self, method: str, path: str, usernames: Dict[str, str]) -> Dict[str, bool]:
+        # Call one of Guard's bulk subscription endpoints for many usernames at once
+        # 
+        # Args:
+        #     method: HTTP method
+        #     path: Endpoint path
+        #     usernames: {client_uuid: username}
+        #     
+        # Returns:
+        #     {client_uuid: success}
+        results = {client_uuid: False for client_uuid in usernames}
+        if not usernames:
+            return results
+        try:
+            if not self.ensure_logged_in():
+                return results
+            
+            response = self.session.request(
+                method,
+                f"{self.base_url}{path}",
+                json={"usernames": list(set(usernames.values()))},
+                verify=False,
+                timeout=60
+            )
+            
+            if response.status_code in [200, 204]:
+                logger.info(f"✅ Guard bulk {path}: {len(usernames)} subscriptions")
+                return {client_uuid: True for client_uuid in usernames}
+            logger.error(f"❌ Guard bulk {path} failed: {response.status_code}")
+        except Exception as e:
+            logger.error(f"❌ Error in Guard bulk {path}: {e}")
+        return results
+    
+    def disable_clients(self, clients: List[Dict]) -> Dict[str, bool]:
+        return self._bulk_subscriptions('POST', '/api/subscriptions/disable', {
+            c['client_uuid']: c.get('client_name') or c['client_uuid'] for c in clients})
+    
+    def enable_clients(self, clients: List[Dict]) -> Dict[str, bool]:
+        return self._bulk_subscriptions('POST', '/api/subscriptions/enable', {
+            c['client_uuid']: c.get('client_name') or c['client_uuid'] for c in clients})
+    
+    def delete_clients(self, clients: List[Dict]) -> Dict[str, bool]:
+        return self._bulk_subscriptions('DELETE', '/api/subscriptions', {
+            c['client_uuid']: c['client_uuid'] for c in clients})
+    
     def reset_client_traffic(self, inbound_id: int, client_uuid: str) -> bool:
         # Reset subscription traffic usage
         # 
@@ -0,0 +1,65 @@
+"""
+Gunicorn Configuration for the Webapp
+Worker mode, concurrency and the matching per-worker DB pool size.
+
+WEBAPP_WORKER_CLASS selects how a worker handles concurrent requests:
+  gthread (default) - WEBAPP_THREADS requests per worker on OS threads
+  gevent            - up to WEBAPP_WORKER_CONNECTIONS greenlets per worker
+                      (needs `pip install gevent`; falls back to gthread)
+  sync              - one request per worker, the old behaviour
+Routes that wait on panels or Telegram (refresh_services, QR codes, service
+creation, avatars) then only tie up one thread/greenlet instead of a whole
+worker.
+
+Each worker's MySQL pool is sized to its concurrency through DB_POOL_SIZE,
+which config.py reads when the worker imports the app. Requests beyond the
+pool size wait for a free connection (see
+ProfessionalDatabaseManager._wait_for_pooled_connection).
+
+This file only reads environment variables: importing config.py here would
+load it in the master before DB_POOL_SIZE is set.
+"""
+
+import os
+import logging
+
+logger = logging.getLogger('gunicorn.error')
+
+# Connections kept for the worker's background threads (sync watcher, avatar refresh)
+BACKGROUND_DB_CONNECTIONS = 2
+# mysql-connector's pool limit (ProfessionalDatabaseManager.MAX_POOL_SIZE)
+MAX_POOL_SIZE = 32
+
+bind = os.getenv('WEBAPP_BIND', '127.0.0.1:5000')
+workers = int(os.getenv('WEBAPP_WORKERS', '2'))
+worker_class = os.getenv('WEBAPP_WORKER_CLASS', 'gthread').lower()
+threads = int(os.getenv('WEBAPP_THREADS', '8'))
+worker_connections = int(os.getenv('WEBAPP_WORKER_CONNECTIONS', '100'))
+timeout = int(os.getenv('WEBAPP_TIMEOUT', '120'))
+graceful_timeout = 30
+accesslog = '-'
+errorlog = '-'
+
+if worker_class == 'gevent':
+    try:
+        import gevent  # noqa: F401
+    except ImportError:
+        logger.warning("⚠️ gevent is not installed - using gthread workers")
+        worker_class = 'gthread'
+
+if worker_class == 'gthread':
+    concurrency = threads
+elif worker_class == 'gevent':
+    concurrency = worker_connections
+else:
+    worker_class, threads, concurrency = 'sync', 1, 1
+
+_pool_size = min(concurrency + BACKGROUND_DB_CONNECTIONS, MAX_POOL_SIZE)
+os.environ.setdefault('DB_POOL_SIZE', str(max(_pool_size, 5)))
+
+
+def on_starting(server):
+    server.log.info(
+        f"🚀 Webapp: {workers} {worker_class} worker(s) x {concurrency} concurrent requests, "
+        f"DB pool {os.environ['DB_POOL_SIZE']} per worker "
+        f"({workers * int(os.environ['DB_POOL_SIZE'])} MySQL connections max)")
@@ -0,0 +1,194 @@
+"""
+3x-ui Inbound Metadata Cache and addClient Coalescing
+Keeps client creation off the full inbound listing and merges concurrent creates.
+
+InboundMetadataCache holds, per panel and inbound, what create_client needs
+from the inbound (protocol, port, remark, stream settings, validated settings
+without the client list). It is filled on first use or when an admin syncs the
+panel's inbounds, and expires after a TTL so out-of-band edits on the panel are
+picked up.
+
+AddClientCoalescer merges creates for the same inbound that arrive within a
+short window into one `/panel/api/inbounds/addClient` call carrying several
+clients. The first caller of a window waits for the window to close, posts the
+batch on its own (already logged-in) session and hands every waiting caller
+its result. If the panel rejects a merged batch (e.g. one duplicate email),
+the clients are retried one by one so a single bad client does not fail the
+others.
+"""
+
+import threading
+import time
+import logging
+from typing import Dict, List, Optional, Callable
+
+logger = logging.getLogger(__name__)
+
+
+class InboundMetadataCache:
+    """Validated inbound metadata per panel (keyed by panel base URL)"""
+
+    def __init__(self, ttl_seconds: float = 600):
+        self.ttl = ttl_seconds
+        self._entries: Dict[str, Dict[int, tuple]] = {}  # {panel_key: {inbound_id: (stored_at, metadata)}}
+        # Complete inbound listings from replace_panel(); single put()s and evictions never touch them
+        self._listings: Dict[str, tuple] = {}  # {panel_key: (listed_at, [metadata, ...])}
+        self._lock = threading.Lock()
+
+    def get(self, panel_key: str, inbound_id: int) -> Optional[Dict]:
+        with self._lock:
+            entry = self._entries.get(panel_key, {}).get(inbound_id)
+            if not entry:
+                return None
+            stored_at, metadata = entry
+            if time.time() - stored_at > self.ttl:
+                del self._entries[panel_key][inbound_id]
+                return None
+            return metadata
+
+    def get_panel(self, panel_key: str) -> Optional[List[Dict]]:
+        """
+        The panel's complete inbound listing, or None when there is no fresh one
+
+        Only replace_panel() records a listing; entries cached one at a time by
+        put() do not count, since they may cover only some of the inbounds.
+        """
+        with self._lock:
+            listing = self._listings.get(panel_key)
+            if not listing:
+                return None
+            listed_at, metadata_list = listing
+            if time.time() - listed_at > self.ttl:
+                del self._listings[panel_key]
+                return None
+            return list(metadata_list)
+
+    def put(self, panel_key: str, inbound_id: int, metadata: Dict):
+        with self._lock:
+            self._entries.setdefault(panel_key, {})[inbound_id] = (time.time(), metadata)
+
+    def replace_panel(self, panel_key: str, metadata_by_inbound: Dict[int, Dict]):
+        """Swap in a full refresh of one panel (drops inbounds that no longer exist)"""
+        now = time.time()
+        with self._lock:
+            self._entries[panel_key] = {inbound_id: (now, metadata)
+                                        for inbound_id, metadata in metadata_by_inbound.items()}
+            self._listings[panel_key] = (now, list(metadata_by_inbound.values()))
+
+    def note_clients_added(self, panel_key: str, inbound_id: int, count: int):
+        """
+        Keep the cached client count and capacity check current
+
+        can_add_client/valid are recomputed against max_clients the same way
+        validation does; a full inbound is dropped so the next create re-reads it.
+        """
+        with self._lock:
+            entry = self._entries.get(panel_key, {}).get(inbound_id)
+            if not entry:
+                return
+            metadata = entry[1]
+            current_clients = metadata.get('current_clients', 0) + count
+            metadata['current_clients'] = current_clients
+            max_clients = metadata.get('max_clients')
+            if max_clients is None:
+                return
+            metadata['can_add_client'] = current_clients < max_clients
+            if not metadata['can_add_client']:
+                metadata['valid'] = False
+                metadata['error'] = f"Maximum client limit reached ({max_clients})"
+                del self._entries[panel_key][inbound_id]
+
+    def invalidate(self, panel_key: str = None, inbound_id: int = None):
+        with self._lock:
+            if panel_key is None:
+                self._entries.clear()
+                self._listings.clear()
+            elif inbound_id is None:
+                self._entries.pop(panel_key, None)
+                self._listings.pop(panel_key, None)
+            else:
+                self._entries.get(panel_key, {}).pop(inbound_id, None)
+
+
+class _PendingBatch:
+    def __init__(self):
+        self.clients: List[Dict] = []
+        self.results: Dict[str, bool] = {}
+        self.closed = False
+        self.done = threading.Event()
+
+
+class AddClientCoalescer:
+    """Merge concurrent addClient requests per panel inbound"""
+
+    def __init__(self, window_seconds: float = 0.15, max_batch: int = 50):
+        self.window = window_seconds
+        self.max_batch = max_batch
+        self._pending: Dict[tuple, _PendingBatch] = {}
+        self._lock = threading.Lock()
+
+    def submit(self, panel_key: str, inbound_id: int, client: Dict,
+               post: Callable[[List[Dict]], bool]) -> bool:
+        """
+        Add one client, possibly together with others created at the same time
+
+        Args:
+            panel_key: Panel identity (base URL)
+            inbound_id: Target inbound
+            client: 3x-ui client settings entry (must have 'id')
+            post: Callable that adds a list of clients in one request (caller's session)
+
+        Returns:
+            Whether this client was added
+        """
+        if self.window <= 0:
+            return post([client])
+
+        key = (panel_key, inbound_id)
+        with self._lock:
+            batch = self._pending.get(key)
+            leader = batch is None or batch.closed or len(batch.clients) >= self.max_batch
+            if leader:
+                batch = self._pending[key] = _PendingBatch()
+            batch.clients.append(client)
+
+        if not leader:
+            batch.done.wait(timeout=120)
+            return batch.results.get(client['id'], False)
+
+        time.sleep(self.window)
+        with self._lock:
+            batch.closed = True
+            if self._pending.get(key) is batch:
+                del self._pending[key]
+
+        try:
+            if post(batch.clients):
+                batch.results = {c['id']: True for c in batch.clients}
+            elif len(batch.clients) > 1:
+                logger.warning(f"⚠️ Batched addClient of {len(batch.clients)} clients on inbound {inbound_id} "
+                               f"failed, retrying one by one")
+                batch.results = {c['id']: bool(post([c])) for c in batch.clients}
+        except Exception as e:
+            logger.error(f"❌ addClient batch on inbound {inbound_id} failed: {e}")
+        finally:
+            batch.done.set()
+        if len(batch.clients) > 1:
+            logger.info(f"📦 Coalesced {len(batch.clients)} client creates into one addClient on inbound {inbound_id}")
+        return batch.results.get(client['id'], False)
+
+
+def _create_globals():
+    try:
+        from config import PANEL_CREATE_CONFIG
+    except ImportError:
+        PANEL_CREATE_CONFIG = {}
+    return (
+        InboundMetadataCache(ttl_seconds=PANEL_CREATE_CONFIG.get('inbound_cache_ttl', 600)),
+        AddClientCoalescer(window_seconds=PANEL_CREATE_CONFIG.get('coalesce_window_ms', 150) / 1000.0,
+                           max_batch=PANEL_CREATE_CONFIG.get('max_batch', 50)),
+    )
+
+
+# Process-wide instances shared by every 3x-ui PanelManager
+inbound_metadata_cache, add_client_coalescer = _create_globals()
@@ -11,13 +11,14 @@ import urllib3
 import logging
 from typing import Dict, List, Optional, Tuple
 from datetime import datetime, timedelta
+from panel_batch import PanelBatchOperations
 
 # Disable SSL warnings for self-signed certificates
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
 logger = logging.getLogger(__name__)
 
-class MarzbanPanelManager:
+class MarzbanPanelManager(PanelBatchOperations):
     def __init__(self):
         self.base_url = None
         self.username = None
@@ -746,6 +747,56 @@ class MarzbanPanelManager:
             print(f"❌ Error disabling Marzban user: {e}")
             return False
     
+    def enable_client(self, inbound_id: int, client_uuid: str, client_name: str = None) -> bool:
+        """Enable user on Marzban panel (after renewal)"""
+        try:
+            if not self.ensure_logged_in():
+                return False
+            
+            # Marzban uses username for identification, not UUID
+            # If client_name is provided, use it. Otherwise fall back to client_uuid (which might be the username)
+            username = client_name if client_name else client_uuid
+            
+            # Get current user data
+            response = self.session.get(
+                f"{self.base_url}/api/user/{username}",
+                verify=False,
+                timeout=30
+            )
+            
+            if response.status_code != 200:
+                return False
+            
+            current_user = response.json()
+            
+            # Update user status to active
+            update_data = {
+                "status": "active",
+                "proxies": current_user.get('proxies', {}),
+                "expire": current_user.get('expire'),
+                "data_limit": current_user.get('data_limit'),
+                "data_limit_reset_strategy": current_user.get('data_limit_reset_strategy', 'no_reset')
+            }
+            
+            # Update user
+            response = self.session.put(
+                f"{self.base_url}/api/user/{username}",
+                json=update_data,
+                verify=False,
+                timeout=30
+            )
+            
+            if response.status_code == 200:
+                print(f"✅ Successfully enabled Marzban user: {username}")
+                return True
+            else:
+                print(f"❌ Failed to enable Marzban user: {response.status_code}")
+                return False
+            
+        except Exception as e:
+            print(f"❌ Error enabling Marzban user: {e}")
+            return False
+    
     def delete_client(self, inbound_id: int, client_uuid: str) -> bool:
         """Delete user from Marzban panel"""
         try:
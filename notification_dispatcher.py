@@ -0,0 +1,408 @@
+"""
+Notification Dispatcher
+One outbound queue for user notifications sent by the monitors.
+
+Notifications are persisted to `notification_outbox` before sending and
+marked sent afterwards, so a restart neither drops queued messages nor
+resends delivered ones. Sending order is by priority (disable/delete
+notices before expiry notices before 70% warnings), paced by a global token
+bucket (Telegram allows ~30 msg/s per bot) and a per-chat token bucket
+(~1 msg/s per chat). Identical pending notices are collapsed, and 429
+responses pause sending for the `retry_after` Telegram asks for.
+
+Only one process should run the dispatcher loop (the bot's TrafficMonitor);
+any process may enqueue.
+"""
+
+import asyncio
+import hashlib
+import heapq
+import itertools
+import json
+import threading
+import time
+import logging
+from enum import IntEnum
+from typing import Dict, Optional, Any
+
+from telegram import InlineKeyboardMarkup
+from telegram.error import RetryAfter, Forbidden, BadRequest, TimedOut, NetworkError, TelegramError
+
+logger = logging.getLogger(__name__)
+
+
+class NotificationPriority(IntEnum):
+    """Lower value is sent first"""
+    CRITICAL = 0  # Service disabled / deleted
+    HIGH = 1      # Service expired
+    NORMAL = 2    # Expiry warnings
+    LOW = 3       # Usage warnings
+
+
+class TokenBucket:
+    """Classic token bucket; tokens refill continuously at `rate` per second"""
+
+    __slots__ = ('rate', 'capacity', 'tokens', 'updated')
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def wait_time(self, now: float = None) -> float:
+        """Seconds until one token is available (0 if available now)"""
+        now = now or time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def take(self):
+        self.tokens -= 1
+
+
+class NotificationDispatcher:
+    """Persistent priority queue with per-chat and global rate limiting"""
+
+    MAX_ATTEMPTS = 5
+    REFILL_SECONDS = 5  # How often rows enqueued by other processes are picked up
+    CHAT_BUCKET_TTL = 600  # Idle per-chat buckets are dropped after this many seconds
+
+    def __init__(self, db, bot=None, global_rate: float = 25, chat_rate: float = 1.0, chat_burst: int = 3):
+        """
+        Initialize dispatcher
+
+        Args:
+            db: Database manager
+            bot: telegram.Bot bound to the loop that runs `run()`
+            global_rate: Messages per second across all chats
+            chat_rate: Messages per second to a single chat
+            chat_burst: Messages a chat may receive back to back
+        """
+        self.db = db
+        self.bot = bot
+        self.global_bucket = TokenBucket(global_rate, max(1, global_rate))
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.chat_buckets: Dict[int, TokenBucket] = {}
+
+        self._heap = []  # (priority, not_before, seq, outbox_id, chat_id)
+        self._queued_ids = set()
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+        self._paused_until = 0.0
+        self._wakeup = None
+        self._loop = None
+        self.running = False
+        self.stats = {'sent': 0, 'failed': 0, 'retried': 0, 'deduplicated': 0, 'rate_limited': 0}
+
+        self._ensure_tables_exist()
+
+    def _ensure_tables_exist(self):
+        try:
+            with self.db.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS notification_outbox (
+                        id BIGINT AUTO_INCREMENT PRIMARY KEY,
+                        chat_id BIGINT NOT NULL,
+                        priority TINYINT NOT NULL DEFAULT 2,
+                        kind VARCHAR(50),
+                        pending_key CHAR(64) NULL,
+                        text TEXT NOT NULL,
+                        parse_mode VARCHAR(20),
+                        reply_markup TEXT,
+                        status VARCHAR(20) NOT NULL DEFAULT 'pending',
+                        attempts INT DEFAULT 0,
+                        next_attempt_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                        last_error VARCHAR(255),
+                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                        sent_at TIMESTAMP NULL,
+                        UNIQUE KEY uniq_pending_key (pending_key),
+                        INDEX idx_status_next (status, next_attempt_at)
+                    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+                ''')
+                conn.commit()
+                cursor.close()
+        except Exception as e:
+            logger.error(f"❌ Error creating notification_outbox table: {e}")
+
+    # ==================== Enqueue ====================
+
+    def enqueue(self, chat_id: int, text: str, reply_markup: InlineKeyboardMarkup = None,
+                priority: NotificationPriority = NotificationPriority.NORMAL, kind: str = None,
+                dedup_key: str = None, parse_mode: str = 'Markdown') -> bool:
+        """
+        Persist a notification and queue it for delivery
+
+        Args:
+            chat_id: Telegram chat ID
+            text: Message text
+            reply_markup: Optional inline keyboard
+            priority: Delivery priority
+            kind: Notification type (for logs and dedup)
+            dedup_key: Identity of the notice; a second pending notice with the same
+                key is dropped. Defaults to chat + kind + text.
+            parse_mode: Telegram parse mode
+
+        Returns:
+            True if queued, False if it duplicated a pending notice or failed
+        """
+        key = hashlib.sha256(f"{chat_id}|{kind}|{dedup_key or text}".encode('utf-8')).hexdigest()
+        markup_json = json.dumps(reply_markup.to_dict(), ensure_ascii=False) if reply_markup else None
+        try:
+            with self.db.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    INSERT IGNORE INTO notification_outbox
+                        (chat_id, priority, kind, pending_key, text, parse_mode, reply_markup)
+                    VALUES (%s, %s, %s, %s, %s, %s, %s)
+                ''', (chat_id, int(priority), kind, key, text, parse_mode, markup_json))
+                outbox_id = cursor.lastrowid if cursor.rowcount else None
+                conn.commit()
+                cursor.close()
+        except Exception as e:
+            logger.error(f"❌ Error queuing notification for {chat_id}: {e}")
+            return False
+
+        if not outbox_id:
+            self.stats['deduplicated'] += 1
+            return False
+
+        self._push(int(priority), time.time(), outbox_id, chat_id)
+        return True
+
+    def _push(self, priority: int, not_before: float, outbox_id: int, chat_id: int):
+        with self._lock:
+            if outbox_id in self._queued_ids:
+                return
+            self._queued_ids.add(outbox_id)
+            heapq.heappush(self._heap, (priority, not_before, next(self._seq), outbox_id, chat_id))
+        if self._loop and self._wakeup:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    def _refill(self):
+        """Queue pending rows not yet in memory (restart recovery, other processes)"""
+        try:
+            with self.db.get_connection() as conn:
+                cursor = conn.cursor(dictionary=True)
+                cursor.execute('''
+                    SELECT id, chat_id, priority, UNIX_TIMESTAMP(next_attempt_at) AS not_before
+                    FROM notification_outbox
+                    WHERE status = 'pending'
+                    ORDER BY priority, id
+                    LIMIT 1000
+                ''')
+                rows = cursor.fetchall()
+                cursor.close()
+        except Exception as e:
+            logger.error(f"❌ Error loading pending notifications: {e}")
+            return
+        for row in rows:
+            self._push(row['priority'], float(row['not_before'] or 0), row['id'], row['chat_id'])
+
+    # ==================== Delivery ====================
+
+    def _pop_ready(self, now: float):
+        """
+        Highest-priority item whose retry time and chat bucket allow sending now
+
+        Returns:
+            (item, wait_seconds) - item is None when nothing is ready yet
+        """
+        deferred = []
+        item = None
+        wait = self.REFILL_SECONDS
+        with self._lock:
+            while self._heap:
+                candidate = heapq.heappop(self._heap)
+                priority, not_before, seq, outbox_id, chat_id = candidate
+                if not_before > now:
+                    wait = min(wait, not_before - now)
+                    deferred.append(candidate)
+                    continue
+                bucket = self.chat_buckets.get(chat_id)
+                chat_wait = bucket.wait_time() if bucket else 0.0
+                if chat_wait > 0:
+                    wait = min(wait, chat_wait)
+                    deferred.append(candidate)
+                    continue
+                item = candidate
+                self._queued_ids.discard(outbox_id)
+                break
+            for candidate in deferred:
+                heapq.heappush(self._heap, candidate)
+        return item, wait
+
+    def _load_row(self, outbox_id: int) -> Optional[Dict[str, Any]]:
+        with self.db.get_connection() as conn:
+            cursor = conn.cursor(dictionary=True)
+            cursor.execute("SELECT * FROM notification_outbox WHERE id = %s AND status = 'pending'",
+                           (outbox_id,))
+            row = cursor.fetchone()
+            cursor.close()
+            return row
+
+    def _mark(self, outbox_id: int, status: str, error: str = None, retry_in: float = None):
+        with self.db.get_connection() as conn:
+            cursor = conn.cursor()
+            if status == 'pending':
+                cursor.execute('''
+                    UPDATE notification_outbox
+                    SET attempts = attempts + 1, last_error = %s,
+                        next_attempt_at = NOW() + INTERVAL %s SECOND
+                    WHERE id = %s
+                ''', ((error or '')[:255], int(retry_in or 0), outbox_id))
+            else:
+                # pending_key is cleared so the same notice can be queued again later
+                cursor.execute('''
+                    UPDATE notification_outbox
+                    SET status = %s, pending_key = NULL, attempts = attempts + 1, last_error = %s,
+                        sent_at = IF(%s = 'sent', NOW(), sent_at)
+                    WHERE id = %s
+                ''', (status, (error or '')[:255] or None, status, outbox_id))
+            conn.commit()
+            cursor.close()
+
+    async def _deliver(self, item):
+        priority, _, _, outbox_id, chat_id = item
+        row = await asyncio.to_thread(self._load_row, outbox_id)
+        if not row:
+            return  # Already delivered or failed (e.g. by a previous run)
+
+        reply_markup = None
+        try:
+            if row.get('reply_markup'):
+                reply_markup = InlineKeyboardMarkup.de_json(json.loads(row['reply_markup']), self.bot)
+        except Exception as e:
+            logger.warning(f"⚠️ Bad reply_markup in notification {outbox_id}: {e}")
+            await self._retry_or_fail(item, row, f"Bad reply_markup: {e}")
+            return
+
+        bucket = self.chat_buckets.get(chat_id)
+        if bucket is None:
+            bucket = self.chat_buckets[chat_id] = TokenBucket(self.chat_rate, self.chat_burst)
+        bucket.take()
+        self.global_bucket.take()
+
+        try:
+            await self.bot.send_message(
+                chat_id=chat_id,
+                text=row['text'],
+                parse_mode=row.get('parse_mode') or None,
+                reply_markup=reply_markup
+            )
+        except RetryAfter as e:
+            retry_after = e.retry_after
+            seconds = retry_after.total_seconds() if hasattr(retry_after, 'total_seconds') else float(retry_after)
+            # Flood control applies to the whole bot, so everything waits
+            self._paused_until = time.time() + seconds
+            self.stats['rate_limited'] += 1
+            logger.warning(f"⏳ Telegram flood control: pausing notifications for {seconds:.0f}s")
+            await asyncio.to_thread(self._mark, outbox_id, 'pending', f"RetryAfter {seconds:.0f}s", seconds)
+            self._push(priority, time.time() + seconds, outbox_id, chat_id)
+            return
+        except (Forbidden, BadRequest) as e:
+            # Blocked bot, deleted chat, bad markup - retrying will not help
+            self.stats['failed'] += 1
+            await asyncio.to_thread(self._mark, outbox_id, 'failed', str(e))
+            return
+        except (TimedOut, NetworkError) as e:
+            await self._retry_or_fail(item, row, str(e))
+            return
+        except TelegramError as e:
+            logger.warning(f"⚠️ Telegram error sending notification {outbox_id}: {e}")
+            await self._retry_or_fail(item, row, str(e))
+            return
+        except Exception as e:
+            logger.error(f"❌ Error sending notification {outbox_id}: {e}", exc_info=True)
+            await self._retry_or_fail(item, row, str(e))
+            return
+
+        self.stats['sent'] += 1
+        await asyncio.to_thread(self._mark, outbox_id, 'sent')
+
+    async def _retry_or_fail(self, item, row: Dict[str, Any], error: str):
+        """Count a failed attempt: back off and requeue, or mark failed after MAX_ATTEMPTS"""
+        priority, _, _, outbox_id, chat_id = item
+        attempts = (row.get('attempts') or 0) + 1
+        if attempts >= self.MAX_ATTEMPTS:
+            self.stats['failed'] += 1
+            await asyncio.to_thread(self._mark, outbox_id, 'failed', error)
+            return
+        delay = min(300, 5 * (2 ** attempts))
+        self.stats['retried'] += 1
+        await asyncio.to_thread(self._mark, outbox_id, 'pending', error, delay)
+        self._push(priority, time.time() + delay, outbox_id, chat_id)
+
+    def _prune_chat_buckets(self):
+        now = time.monotonic()
+        for chat_id in [c for c, b in self.chat_buckets.items() if now - b.updated > self.CHAT_BUCKET_TTL]:
+            del self.chat_buckets[chat_id]
+
+    def cleanup(self, days: int = 7) -> int:
+        """Delete delivered/failed rows older than `days`"""
+        try:
+            with self.db.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    DELETE FROM notification_outbox
+                    WHERE status IN ('sent', 'failed') AND created_at < NOW() - INTERVAL %s DAY
+                ''', (days,))
+                deleted = cursor.rowcount
+                conn.commit()
+                cursor.close()
+                return deleted
+        except Exception as e:
+            logger.error(f"❌ Error cleaning notification outbox: {e}")
+            return 0
+
+    async def run(self):
+        """Delivery loop; run on the event loop the bot is bound to"""
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self.running = True
+        await asyncio.to_thread(self._refill)
+        last_refill = last_cleanup = time.time()
+        logger.info("📨 Notification dispatcher started")
+
+        while self.running:
+            try:
+                now = time.time()
+                if now - last_refill >= self.REFILL_SECONDS:
+                    await asyncio.to_thread(self._refill)
+                    self._prune_chat_buckets()
+                    last_refill = now
+                if now - last_cleanup >= 3600:
+                    await asyncio.to_thread(self.cleanup)
+                    last_cleanup = now
+
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+
+                global_wait = self.global_bucket.wait_time()
+                if global_wait > 0:
+                    await asyncio.sleep(global_wait)
+                    continue
+
+                item, wait = self._pop_ready(now)
+                if item is None:
+                    self._wakeup.clear()
+                    try:
+                        await asyncio.wait_for(self._wakeup.wait(), timeout=max(0.05, wait))
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+
+                await self._deliver(item)
+            except Exception as e:
+                logger.error(f"❌ Error in notification dispatcher: {e}", exc_info=True)
+                await asyncio.sleep(1)
+
+    def stop(self):
+        self.running = False
+        if self._loop and self._wakeup:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
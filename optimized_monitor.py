@@ -11,8 +11,10 @@ from typing import List, Dict, Optional, Set
 from concurrent.futures import ThreadPoolExecutor, as_completed
 from collections import defaultdict
 import threading
-from telegram import Bot, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
 from config import BOT_CONFIG
+from sync_engine import extract_panel_clients
+from notification_dispatcher import NotificationDispatcher, NotificationPriority
 
 logger = logging.getLogger(__name__)
 
@@ -42,11 +44,8 @@ class OptimizedMonitor:
         self.panel_data_cache = {}  # {panel_id: {'data': {...}, 'timestamp': ...}}
         self.cache_ttl = 30  # Cache for 30 seconds
         
-        # Rate limiting for message sending
-        self.message_queue = asyncio.Queue()
-        self.message_semaphore = asyncio.Semaphore(5)
-        self.last_message_time = {}
-        self.min_message_interval = 1.0
+        # Notifications go through the shared outbox; the bot's dispatcher delivers them
+        self.dispatcher = None
         
     def get_panel_manager_cached(self, panel_id: int):
         """Get panel manager with session caching"""
@@ -74,139 +73,7 @@ class OptimizedMonitor:
             inbounds = panel_manager.get_inbounds()
             if not inbounds:
                 return {}
-            
-            all_clients = {}
-            
-            # Extract all clients from all inbounds
-            for inbound in inbounds:
-                try:
-                    # Ensure inbound is a dict
-                    if not isinstance(inbound, dict) or inbound is None:
-                        logger.debug(f"⚠️ Skipping non-dict or None inbound in panel {panel_id}")
-                        continue
-                    
-                    inbound_id = inbound.get('id') if inbound else None
-                    if not inbound_id:
-                        continue
-                    
-                    # Get clients - check both direct clients and settings.clients (like get_client_details does)
-                    clients = []
-                    
-                    # First check direct clients (most common in newer 3x-ui versions)
-                    if 'clients' in inbound and isinstance(inbound['clients'], list):
-                        clients = inbound['clients']
-                    
-                    # If no direct clients, check settings.clients
-                    if not clients:
-                        settings = inbound.get('settings', {})
-                        if settings is None:
-                            settings = {}
-                        
-                        if isinstance(settings, str):
-                            import json
-                            try:
-                                settings = json.loads(settings)
-                            except:
-                                continue
-                        
-                        # Ensure settings is a dict after parsing
-                        if isinstance(settings, dict) and 'clients' in settings:
-                            clients = settings.get('clients', [])
-                    
-                    # Ensure clients is a list
-                    if not isinstance(clients, list):
-                        continue
-                    
-                    if len(clients) == 0:
-                        continue  # Skip inbounds with no clients
-                    
-                    # Get clientStats for traffic data
-                    client_stats = inbound.get('clientStats', [])
-                    
-                    # Process each client
-                    for client in clients:
-                        # Ensure client is a dict
-                        if not isinstance(client, dict):
-                            continue
-                        
-                        client_uuid = client.get('id')
-                        if not client_uuid:
-                            continue
-                        
-                        # Get traffic stats - try multiple sources
-                        stat = None
-                        used_traffic = 0
-                        last_activity = 0
-                        
-                        # Priority 1: Get from clientStats - try multiple matching methods
-                        if client_stats and isinstance(client_stats, list):
-                            for stat_item in client_stats:
-                                # Ensure stat_item is a dict
-                                if not isinstance(stat_item, dict):
-                                    continue
-                                # Different 3x-ui versions use different field names
-                                stat_id = stat_item.get('id', '')
-                                stat_uuid = stat_item.get('uuid', '')
-                                stat_email = stat_item.get('email', '')
-                                
-                                stat_id_str = str(stat_id) if stat_id else ''
-                                stat_uuid_str = str(stat_uuid) if stat_uuid else ''
-                                
-                                email_uuid = ''
-                                if '@' in str(stat_email):
-                                    email_parts = str(stat_email).split('@')[0]
-                                    if len(email_parts) > 30:  # UUID-like length
-                                        email_uuid = email_parts
-                                
-                                if (stat_id_str == str(client_uuid) or 
-                                    stat_uuid_str == str(client_uuid) or
-                                    email_uuid == str(client_uuid)):
-                                    stat = stat_item
-                                    up_bytes = stat.get('up', 0) or 0
-                                    down_bytes = stat.get('down', 0) or 0
-                                    used_traffic = up_bytes + down_bytes
-                                    last_activity = stat.get('lastOnline', 0) or 0
-                                    break
-                        
-                        # Priority 2: Get from client object directly
-                        if used_traffic == 0:
-                            if 'up' in client and 'down' in client:
-                                up_bytes = client.get('up', 0) or 0
-                                down_bytes = client.get('down', 0) or 0
-                                used_traffic = up_bytes + down_bytes
-                            elif 'upload' in client and 'download' in client:
-                                up_bytes = client.get('upload', 0) or 0
-                                down_bytes = client.get('download', 0) or 0
-                                used_traffic = up_bytes + down_bytes
-                        
-                        # Get last activity
-                        if last_activity == 0:
-                            last_activity = stat.get('lastOnline', 0) if stat else 0
-                            if last_activity == 0:
-                                last_activity = client.get('lastOnline', 0) or 0
-                        
-                        # Get total traffic
-                        total_traffic = client.get('totalGB', 0)
-                        if total_traffic == 0:
-                            total_traffic = client.get('total', 0) or client.get('totalGB', 0)
-                        
-                        client_details = {
-                            'id': client_uuid,
-                            'inbound_id': inbound_id,
-                            'total_traffic': total_traffic,
-                            'used_traffic': used_traffic,
-                            'expiryTime': client.get('expiryTime', 0),
-                            'enable': client.get('enable', True),
-                            'last_activity': last_activity,
-                            'email': client.get('email', 'Unknown')
-                        }
-                        
-                        all_clients[str(client_uuid)] = client_details
-                except Exception as e:
-                    logger.debug(f"⚠️ Error processing inbound in panel {panel_id}: {e}")
-                    continue
-            
-            return all_clients
+            return extract_panel_clients(inbounds, panel_id)
             
         except Exception as e:
             logger.error(f"❌ Error getting batch clients from panel {panel_id}: {e}", exc_info=True)
@@ -473,59 +340,22 @@ class OptimizedMonitor:
         if not updates:
             return
         
-        try:
-            with self.db.get_connection() as conn:
-                cursor = conn.cursor()
-                try:
-                    update_query = '''
-                        UPDATE clients 
-                        SET used_gb = %s,
-                            last_activity = %s,
-                            cached_is_online = %s,
-                            remaining_days = %s,
-                            expires_at = %s,
-                            updated_at = NOW()
-                        WHERE id = %s
-                    '''
-                    
-                    values = [
-                        (
-                            update['used_gb'],
-                            update['last_activity'],
-                            update['is_online'],
-                            update['remaining_days'],
-                            update['expires_at'],
-                            update['client_id']
-                        )
-                        for update in updates
-                    ]
-                    
-                    cursor.executemany(update_query, values)
-                    conn.commit()
-                    
-                except Exception as e:
-                    conn.rollback()
-                    logger.error(f"❌ Error in batch update: {e}")
-                    raise
-                finally:
-                    cursor.close()
-                    
-        except Exception as e:
-            logger.error(f"❌ Error in batch_update_clients: {e}", exc_info=True)
+        self.db.bulk_update_client_sync_data([
+            {
+                'id': update['client_id'],
+                'used_gb': update['used_gb'],
+                'last_activity': update['last_activity'],
+                'is_online': update['is_online'],
+                'expires_at': update['expires_at']
+            }
+            for update in updates
+        ])
     
     async def send_notification(self, notification: Dict):
         """Send notification asynchronously"""
         try:
-            if not self.bot:
-                # Initialize bot if needed
-                token = self.bot_token or BOT_CONFIG.get('token')
-                if token:
-                    self.bot = Bot(token=token)
-                    await self.bot.initialize()
-            
-            if not self.bot:
-                logger.warning("⚠️ No bot instance available for notifications")
-                return
+            if not self.dispatcher:
+                self.dispatcher = NotificationDispatcher(self.db)
 
             notif_type = notification['type']
             service = notification['service']
@@ -556,11 +386,9 @@ class OptimizedMonitor:
                     [InlineKeyboardButton("🏠 صفحه اصلی", callback_data="main_menu")]
                 ]
                 
-                await self.bot.send_message(
-                    chat_id=user['telegram_id'],
-                    text=message,
-                    parse_mode='Markdown',
-                    reply_markup=InlineKeyboardMarkup(keyboard)
+                await asyncio.to_thread(
+                    self.dispatcher.enqueue, user['telegram_id'], message, InlineKeyboardMarkup(keyboard),
+                    NotificationPriority.LOW, '70_percent', f"service:{service['id']}"
                 )
                 
                 # Mark as warned
@@ -587,11 +415,9 @@ class OptimizedMonitor:
                     [InlineKeyboardButton("🏠 صفحه اصلی", callback_data="main_menu")]
                 ]
                 
-                await self.bot.send_message(
-                    chat_id=user['telegram_id'],
-                    text=message,
-                    parse_mode='Markdown',
-                    reply_markup=InlineKeyboardMarkup(keyboard)
+                await asyncio.to_thread(
+                    self.dispatcher.enqueue, user['telegram_id'], message, InlineKeyboardMarkup(keyboard),
+                    NotificationPriority.CRITICAL, 'exhausted', f"service:{service['id']}"
                 )
 
             elif notif_type == 'deleted_excessive':
@@ -606,11 +432,9 @@ class OptimizedMonitor:
 
                 keyboard = [[InlineKeyboardButton("🏠 صفحه اصلی", callback_data="main_menu")]]
                 
-                await self.bot.send_message(
-                    chat_id=user['telegram_id'],
-                    text=message,
-                    parse_mode='Markdown',
-                    reply_markup=InlineKeyboardMarkup(keyboard)
+                await asyncio.to_thread(
+                    self.dispatcher.enqueue, user['telegram_id'], message, InlineKeyboardMarkup(keyboard),
+                    NotificationPriority.CRITICAL, 'deleted_excessive', f"service:{service['id']}"
                 )
 
             elif notif_type == 'deleted_expired':
@@ -625,11 +449,9 @@ class OptimizedMonitor:
 
                 keyboard = [[InlineKeyboardButton("🏠 صفحه اصلی", callback_data="main_menu")]]
                 
-                await self.bot.send_message(
-                    chat_id=user['telegram_id'],
-                    text=message,
-                    parse_mode='Markdown',
-                    reply_markup=InlineKeyboardMarkup(keyboard)
+                await asyncio.to_thread(
+                    self.dispatcher.enqueue, user['telegram_id'], message, InlineKeyboardMarkup(keyboard),
+                    NotificationPriority.CRITICAL, 'deleted_expired', f"service:{service['id']}"
                 )
 
         except Exception as e:
@@ -0,0 +1,116 @@
+"""
+Batch Panel Operations
+Disable/enable/delete many clients of one panel in as few round-trips as the panel allows.
+
+Panel managers mix in PanelBatchOperations. The default fans the single-client
+methods out over a small thread pool (Marzban, Rebecca, Marzneshin, Pasargad
+have no bulk user endpoints); 3x-ui overrides it with one inbound read per
+inbound and its per-client updateClient/delClient endpoints (never a whole
+settings rewrite, which would drop clients added meanwhile), and Guard with
+its native bulk endpoints.
+
+The traffic monitor collects actions in a PanelActionQueue while it walks a
+cycle and flushes them per panel at the end, instead of one blocking call per
+service.
+"""
+
+import logging
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, List, Callable, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class PanelBatchOperations:
+    """
+    Mixin for panel managers
+
+    Every batch method takes a list of {'inbound_id', 'client_uuid', 'client_name'}
+    dicts and returns {client_uuid: success}.
+    """
+
+    BATCH_CONCURRENCY = 8
+
+    def _run_concurrently(self, clients: List[Dict], operation: Callable[[Dict], bool]) -> Dict[str, bool]:
+        results = {}
+        if not clients:
+            return results
+        if len(clients) == 1:
+            client = clients[0]
+            try:
+                results[client['client_uuid']] = bool(operation(client))
+            except Exception as e:
+                logger.error(f"❌ Panel operation failed for {client['client_uuid']}: {e}")
+                results[client['client_uuid']] = False
+            return results
+
+        with ThreadPoolExecutor(max_workers=min(self.BATCH_CONCURRENCY, len(clients))) as executor:
+            futures = {executor.submit(operation, client): client['client_uuid'] for client in clients}
+            for future in as_completed(futures):
+                client_uuid = futures[future]
+                try:
+                    results[client_uuid] = bool(future.result())
+                except Exception as e:
+                    logger.error(f"❌ Panel operation failed for {client_uuid}: {e}")
+                    results[client_uuid] = False
+        return results
+
+    def disable_clients(self, clients: List[Dict]) -> Dict[str, bool]:
+        """Disable several clients"""
+        return self._run_concurrently(clients, lambda c: self.disable_client(
+            c['inbound_id'], c['client_uuid'], client_name=c.get('client_name')))
+
+    def enable_clients(self, clients: List[Dict]) -> Dict[str, bool]:
+        """Enable several clients"""
+        if not hasattr(self, 'enable_client'):
+            logger.warning(f"⚠️ {type(self).__name__} cannot enable clients")
+            return {c['client_uuid']: False for c in clients}
+        return self._run_concurrently(clients, lambda c: self.enable_client(
+            c['inbound_id'], c['client_uuid'], client_name=c.get('client_name')))
+
+    def delete_clients(self, clients: List[Dict]) -> Dict[str, bool]:
+        """Delete several clients"""
+        return self._run_concurrently(clients, lambda c: self.delete_client(c['inbound_id'], c['client_uuid']))
+
+
+class PanelActionQueue:
+    """Panel actions collected during a monitor cycle, flushed per panel"""
+
+    ACTIONS = ('disable', 'enable', 'delete')
+
+    def __init__(self):
+        # {(panel_id, action): {service_id: (service, callback)}} - one entry per service and action
+        self._actions: Dict[Tuple[int, str], Dict[int, Tuple[Dict, Optional[Callable]]]] = defaultdict(dict)
+
+    def add(self, action: str, service: Dict, callback: Callable = None):
+        """
+        Queue an action
+
+        Args:
+            action: 'disable', 'enable' or 'delete'
+            service: clients row (panel_id, inbound_id, client_uuid, client_name)
+            callback: async callable(service, success) run after the flush
+        """
+        if action not in self.ACTIONS:
+            raise ValueError(f"Unknown panel action: {action}")
+        self._actions[(service['panel_id'], action)].setdefault(service['id'], (service, callback))
+
+    def __len__(self):
+        return sum(len(entries) for entries in self._actions.values())
+
+    def drain(self) -> Dict[Tuple[int, str], List[Tuple[Dict, Optional[Callable]]]]:
+        """Take all queued actions grouped by (panel_id, action)"""
+        actions = {key: list(entries.values()) for key, entries in self._actions.items()}
+        self._actions = defaultdict(dict)
+        return actions
+
+    @staticmethod
+    def execute(panel_manager, action: str, services: List[Dict]) -> Dict[str, bool]:
+        """Run one panel's batch (blocking) and return {client_uuid: success}"""
+        clients = [{
+            'inbound_id': s['inbound_id'],
+            'client_uuid': s['client_uuid'],
+            'client_name': s.get('client_name'),
+        } for s in services]
+        return getattr(panel_manager, f'{action}_clients')(clients)
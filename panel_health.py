@@ -0,0 +1,333 @@
+"""
+Panel Circuit Breaker and Health Scoring
+Guards every panel adapter's HTTP session so callers fail fast while a panel is down.
+
+Each panel gets a breaker that tracks an error-rate EWMA, a latency EWMA and
+consecutive failures. After repeated failures the circuit opens and requests
+raise PanelCircuitOpen immediately instead of waiting for the 30s timeout;
+after a cooldown one half-open probe is let through, and its outcome closes
+or re-opens the circuit. While a panel is degraded, requests use a shorter
+timeout. The state is per process; the sync engine leader persists its view
+to `panel_health` so the admin panel list can show it from any process.
+"""
+
+import threading
+import time
+import logging
+from typing import Dict, Optional, Any
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+
+class PanelCircuitOpen(requests.exceptions.ConnectionError):
+    """Raised instead of a request while the panel's circuit is open"""
+
+
+class PanelBreaker:
+    """Circuit breaker state and health metrics of one panel"""
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, panel_id: int, failure_threshold: int = 3, error_rate_threshold: float = 0.5,
+                 min_samples: int = 10, cooldown_seconds: float = 30, max_cooldown_seconds: float = 300,
+                 alpha: float = 0.2):
+        self.panel_id = panel_id
+        self.failure_threshold = failure_threshold
+        self.error_rate_threshold = error_rate_threshold
+        self.min_samples = min_samples
+        self.base_cooldown = cooldown_seconds
+        self.max_cooldown = max_cooldown_seconds
+        self.alpha = alpha
+
+        self.state = self.CLOSED
+        self.error_rate = 0.0  # EWMA of failures (0..1)
+        self.latency_ms = 0.0  # EWMA of successful request latency
+        self.samples = 0
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.cooldown = cooldown_seconds
+        self.probe_in_flight = False
+        self.total_requests = 0
+        self.total_failures = 0
+        self.rejected = 0
+        self.last_error = None
+        self.last_change = time.time()
+        self.lock = threading.Lock()
+
+    def _set_state(self, state: str):
+        if state != self.state:
+            logger.warning(f"🔌 Panel {self.panel_id} circuit {self.state} → {state}")
+            self.state = state
+            self.last_change = time.time()
+
+    def allow_request(self) -> bool:
+        """Whether a request may go out now (reserves the half-open probe)"""
+        with self.lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and time.time() - self.opened_at >= self.cooldown:
+                self._set_state(self.HALF_OPEN)
+            if self.state == self.HALF_OPEN and not self.probe_in_flight:
+                self.probe_in_flight = True
+                return True
+            self.rejected += 1
+            return False
+
+    @property
+    def degraded(self) -> bool:
+        return self.state != self.CLOSED or self.consecutive_failures > 0
+
+    def record_success(self, latency_ms: float):
+        with self.lock:
+            self.total_requests += 1
+            self.samples += 1
+            self.error_rate = (1 - self.alpha) * self.error_rate
+            self.latency_ms = latency_ms if self.samples == 1 else (
+                self.alpha * latency_ms + (1 - self.alpha) * self.latency_ms)
+            self.consecutive_failures = 0
+            if self.state != self.CLOSED:
+                self.probe_in_flight = False
+                self.cooldown = self.base_cooldown
+                self._set_state(self.CLOSED)
+
+    def record_failure(self, error: str):
+        with self.lock:
+            self.total_requests += 1
+            self.total_failures += 1
+            self.samples += 1
+            self.error_rate = self.alpha + (1 - self.alpha) * self.error_rate
+            self.consecutive_failures += 1
+            self.last_error = error[:200]
+
+            if self.state == self.HALF_OPEN:
+                # Failed probe: stay open longer next time
+                self.probe_in_flight = False
+                self.cooldown = min(self.max_cooldown, self.cooldown * 2)
+                self.opened_at = time.time()
+                self._set_state(self.OPEN)
+            elif self.state == self.CLOSED and (
+                    self.consecutive_failures >= self.failure_threshold or
+                    (self.samples >= self.min_samples and self.error_rate >= self.error_rate_threshold)):
+                self.opened_at = time.time()
+                self._set_state(self.OPEN)
+
+    def health_score(self) -> int:
+        """0-100: 100 is error-free and fast; open circuits score 0"""
+        if self.state == self.OPEN:
+            return 0
+        score = 100 * (1 - self.error_rate)
+        # Lose up to 30 points as the latency EWMA goes from 1s to 10s
+        if self.latency_ms > 1000:
+            score -= min(30.0, (self.latency_ms - 1000) / 300)
+        if self.state == self.HALF_OPEN:
+            score = min(score, 50)
+        return max(0, int(round(score)))
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self.lock:
+            return {
+                'panel_id': self.panel_id,
+                'state': self.state,
+                'health_score': self.health_score(),
+                'error_rate': round(self.error_rate, 3),
+                'latency_ms': round(self.latency_ms, 1),
+                'consecutive_failures': self.consecutive_failures,
+                'total_requests': self.total_requests,
+                'total_failures': self.total_failures,
+                'rejected': self.rejected,
+                'last_error': self.last_error,
+                'retry_in': round(max(0.0, self.opened_at + self.cooldown - time.time()), 1)
+                if self.state == self.OPEN else 0,
+            }
+
+
+class PanelHealthRegistry:
+    """Process-wide panel breakers"""
+
+    def __init__(self, degraded_timeout: float = 10, **breaker_options):
+        """
+        Initialize registry
+
+        Args:
+            degraded_timeout: Request timeout (seconds) while a panel is degraded
+            **breaker_options: Passed to every PanelBreaker
+        """
+        self.degraded_timeout = degraded_timeout
+        self.breaker_options = breaker_options
+        self.breakers: Dict[int, PanelBreaker] = {}
+        self.lock = threading.Lock()
+
+    def get(self, panel_id: int) -> PanelBreaker:
+        breaker = self.breakers.get(panel_id)
+        if breaker is None:
+            with self.lock:
+                breaker = self.breakers.get(panel_id)
+                if breaker is None:
+                    breaker = self.breakers[panel_id] = PanelBreaker(panel_id, **self.breaker_options)
+        return breaker
+
+    def is_available(self, panel_id: int) -> bool:
+        """Cheap check for callers that want to skip a panel without trying it"""
+        breaker = self.breakers.get(panel_id)
+        return breaker is None or breaker.state != PanelBreaker.OPEN or \
+            time.time() - breaker.opened_at >= breaker.cooldown
+
+    def describe(self, panel_id: int) -> Optional[Dict[str, Any]]:
+        breaker = self.breakers.get(panel_id)
+        return breaker.to_dict() if breaker else None
+
+    def snapshot(self) -> Dict[int, Dict[str, Any]]:
+        return {panel_id: breaker.to_dict() for panel_id, breaker in list(self.breakers.items())}
+
+    def reset(self, panel_id: int):
+        with self.lock:
+            self.breakers.pop(panel_id, None)
+
+    # ==================== Persistence ====================
+
+    @staticmethod
+    def ensure_table(db):
+        try:
+            with db.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS panel_health (
+                        panel_id INT PRIMARY KEY,
+                        state VARCHAR(20) NOT NULL DEFAULT 'closed',
+                        health_score INT DEFAULT 100,
+                        error_rate DOUBLE DEFAULT 0,
+                        latency_ms DOUBLE DEFAULT 0,
+                        consecutive_failures INT DEFAULT 0,
+                        last_error VARCHAR(255),
+                        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+                    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+                ''')
+                conn.commit()
+                cursor.close()
+        except Exception as e:
+            logger.error(f"❌ Error creating panel_health table: {e}")
+
+    def persist(self, db):
+        """Write this process's breaker state for the admin panel list"""
+        rows = [
+            (h['panel_id'], h['state'], h['health_score'], h['error_rate'], h['latency_ms'],
+             h['consecutive_failures'], (h['last_error'] or '')[:255] or None)
+            for h in self.snapshot().values()
+        ]
+        if not rows:
+            return
+        try:
+            with db.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.executemany('''
+                    INSERT INTO panel_health (panel_id, state, health_score, error_rate, latency_ms,
+                                              consecutive_failures, last_error)
+                    VALUES (%s, %s, %s, %s, %s, %s, %s)
+                    ON DUPLICATE KEY UPDATE state = VALUES(state), health_score = VALUES(health_score),
+                        error_rate = VALUES(error_rate), latency_ms = VALUES(latency_ms),
+                        consecutive_failures = VALUES(consecutive_failures), last_error = VALUES(last_error),
+                        updated_at = CURRENT_TIMESTAMP
+                ''', rows)
+                conn.commit()
+                cursor.close()
+        except Exception as e:
+            logger.error(f"❌ Error persisting panel health: {e}")
+
+    def load(self, db) -> Dict[int, Dict[str, Any]]:
+        """
+        Panel health for display: persisted leader view, overridden by this
+        process's own breakers where they have seen traffic
+        """
+        health = {}
+        try:
+            with db.get_connection() as conn:
+                cursor = conn.cursor(dictionary=True)
+                cursor.execute('SELECT * FROM panel_health')
+                for row in cursor.fetchall():
+                    health[row['panel_id']] = row
+                cursor.close()
+        except Exception as e:
+            logger.debug(f"Could not load panel health: {e}")
+        for panel_id, local in self.snapshot().items():
+            if local['total_requests']:
+                health[panel_id] = local
+        return health
+
+
+class GuardedSession(requests.Session):
+    """requests.Session that reports to, and is gated by, a panel breaker"""
+
+    def __init__(self, panel_id: int, registry: PanelHealthRegistry):
+        super().__init__()
+        self.panel_id = panel_id
+        self.registry = registry
+
+    @classmethod
+    def wrap(cls, session: requests.Session, panel_id: int, registry: PanelHealthRegistry = None):
+        """
+        Create a guarded copy of an adapter's freshly built session
+
+        Every Session setting is carried over, including mounted adapters (retry
+        and pool settings) and auth; the adapters are shared, not rebuilt.
+        """
+        guarded = cls(panel_id, registry or panel_health)
+        guarded.headers.update(session.headers)
+        guarded.cookies.update(session.cookies)
+        guarded.auth = session.auth
+        guarded.trust_env = session.trust_env
+        guarded.verify = session.verify
+        guarded.cert = session.cert
+        guarded.proxies = dict(session.proxies)
+        guarded.params = dict(session.params)
+        guarded.stream = session.stream
+        guarded.max_redirects = session.max_redirects
+        guarded.hooks = {event: list(hooks) for event, hooks in session.hooks.items()}
+        guarded.adapters.clear()
+        for prefix, adapter in session.adapters.items():
+            guarded.mount(prefix, adapter)
+        return guarded
+
+    def request(self, method, url, *args, **kwargs):
+        breaker = self.registry.get(self.panel_id)
+        if not breaker.allow_request():
+            raise PanelCircuitOpen(f"Panel {self.panel_id} circuit open, request to {url} skipped")
+
+        if breaker.degraded:
+            timeout = kwargs.get('timeout')
+            if timeout is None or (isinstance(timeout, (int, float)) and timeout > self.registry.degraded_timeout):
+                kwargs['timeout'] = self.registry.degraded_timeout
+
+        start = time.perf_counter()
+        try:
+            response = super().request(method, url, *args, **kwargs)
+        except Exception as e:
+            breaker.record_failure(f"{type(e).__name__}: {e}")
+            raise
+        latency_ms = (time.perf_counter() - start) * 1000
+        if response.status_code >= 500:
+            breaker.record_failure(f"HTTP {response.status_code}")
+        else:
+            # 4xx still means the panel answered
+            breaker.record_success(latency_ms)
+        return response
+
+
+def _create_registry() -> PanelHealthRegistry:
+    """Create the process-wide registry from PANEL_HEALTH_CONFIG"""
+    try:
+        from config import PANEL_HEALTH_CONFIG
+        return PanelHealthRegistry(
+            degraded_timeout=PANEL_HEALTH_CONFIG.get('degraded_timeout', 10),
+            failure_threshold=PANEL_HEALTH_CONFIG.get('failure_threshold', 3),
+            cooldown_seconds=PANEL_HEALTH_CONFIG.get('cooldown_seconds', 30),
+        )
+    except ImportError:
+        return PanelHealthRegistry()
+
+
+# Global registry instance
+panel_health = _create_registry()
@@ -11,13 +11,16 @@ import string
 import time
 import urllib3
 import re
+from collections import defaultdict
 from typing import Dict, List, Optional, Tuple
 from config import DEFAULT_PANEL_CONFIG
+from panel_batch import PanelBatchOperations
+from inbound_cache import inbound_metadata_cache, add_client_coalescer
 
 # Disable SSL warnings for self-signed certificates
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
-class PanelManager:
+class PanelManager(PanelBatchOperations):
     def __init__(self):
         self.base_url = DEFAULT_PANEL_CONFIG['api_endpoint']
         self.username = DEFAULT_PANEL_CONFIG['username']
@@ -440,35 +443,10 @@ class PanelManager:
             print(f"   Expire Days: {expire_days if expire_days > 0 else 'Unlimited'}")
             print(f"   Total GB: {total_gb if total_gb > 0 else 'Unlimited'}")
             
-            # Get the inbound details first
-            response = self.session.get(
-                f"{self.base_url}/panel/api/inbounds/list",
-                verify=False,
-                timeout=30
-            )
-            
-            if response.status_code != 200:
-                print("❌ Failed to get inbounds list")
+            # Validated inbound metadata (cached per panel, fetched on a miss)
+            validation = self._get_inbound_metadata(inbound_id)
+            if not validation:
                 return None
-            
-            result = response.json()
-            if not result.get('success') or 'obj' not in result:
-                print("❌ Invalid inbounds response")
-                return None
-            
-            # Find the target inbound
-            target_inbound = None
-            for inbound in result['obj']:
-                if inbound.get('id') == inbound_id:
-                    target_inbound = inbound
-                    break
-            
-            if not target_inbound:
-                print(f"❌ Inbound {inbound_id} not found")
-                return None
-            
-            # Validate inbound settings comprehensively
-            validation = self._validate_inbound_settings(target_inbound)
             if not validation['valid']:
                 print(f"❌ Inbound validation failed: {validation.get('error', 'Unknown error')}")
                 return None
@@ -524,47 +502,15 @@ class PanelManager:
             if validation['inbound_protocol'] == 'vless':
                 new_client["password"] = self._generate_password()
             
-            # Add new client to existing clients
-            current_settings = validation['settings'].copy()
-            if 'clients' not in current_settings:
-                current_settings['clients'] = []
-            
-            current_settings['clients'].append(new_client)
-            
-            # Prepare update data using validated inbound info
-            update_data = {
-                'up': target_inbound.get('up', 0),
-                'down': target_inbound.get('down', 0),
-                'total': target_inbound.get('total', 0),
-                'remark': target_inbound.get('remark', ''),
-                'enable': target_inbound.get('enable', True),
-                'expiryTime': target_inbound.get('expiryTime', 0),
-                'trafficReset': target_inbound.get('trafficReset', 0),
-                'lastTrafficResetTime': target_inbound.get('lastTrafficResetTime', 0),
-                'listen': target_inbound.get('listen', ''),
-                'port': validation['inbound_port'],
-                'protocol': validation['inbound_protocol'],
-                'settings': json.dumps(current_settings, ensure_ascii=False, separators=(',', ':')),
-                'streamSettings': target_inbound.get('streamSettings', '{}'),
-                'sniffing': target_inbound.get('sniffing', '{}')
-            }
-            
-            # Update the inbound with the new client
-            print(f"🔍 Adding client to inbound using validated settings...")
-            response = self.session.post(
-                f"{self.base_url}/panel/api/inbounds/update/{inbound_id}",
-                json=update_data,
-                verify=False,
-                timeout=30
+            # Add through addClient (only the new clients are sent, so concurrent creates
+            # cannot overwrite each other); creates arriving together share one request
+            print(f"🔍 Adding client to inbound {inbound_id}...")
+            added = add_client_coalescer.submit(
+                self.base_url, inbound_id, new_client,
+                lambda clients: self._add_clients(inbound_id, clients)
             )
-            
-            if response.status_code != 200:
-                print(f"❌ Failed to update inbound: {response.status_code}")
-                return None
-            
-            result = response.json()
-            if not result.get('success'):
-                print(f"❌ Failed to add client: {result.get('msg', 'Unknown error')}")
+            if not added:
+                print(f"❌ Failed to add client {client_name}")
                 return None
             
             print(f"✅ Successfully added client to panel!")
@@ -611,6 +557,99 @@ class PanelManager:
             
         return None
     
+    def _get_inbound_metadata(self, inbound_id: int) -> Optional[Dict]:
+        """Validated inbound metadata from the cache, or from the panel on a miss"""
+        metadata = inbound_metadata_cache.get(self.base_url, inbound_id)
+        if metadata:
+            return metadata
+        
+        response = self.session.get(
+            f"{self.base_url}/panel/api/inbounds/get/{inbound_id}",
+            verify=False,
+            timeout=30
+        )
+        if response.status_code != 200:
+            print(f"❌ Failed to get inbound {inbound_id}: {response.status_code}")
+            return None
+        result = response.json()
+        if not result.get('success') or not result.get('obj'):
+            print(f"❌ Inbound {inbound_id} not found")
+            return None
+        
+        metadata = self._inbound_metadata(result['obj'])
+        if metadata.get('valid'):
+            inbound_metadata_cache.put(self.base_url, inbound_id, metadata)
+        return metadata
+    
+    def _inbound_metadata(self, inbound: Dict) -> Dict:
+        """Validation result without the inbound's client list (the cached template)"""
+        metadata = self._validate_inbound_settings(inbound)
+        if metadata.get('valid'):
+            metadata['enable'] = inbound.get('enable', True)
+            template = dict(metadata['settings'])
+            template['clients'] = []
+            metadata['settings'] = template
+        return metadata
+    
+    def refresh_inbound_cache(self, inbounds: List[Dict] = None) -> int:
+        """
+        Rebuild this panel's inbound metadata cache (called when inbounds are synced)
+        
+        Args:
+            inbounds: Inbounds as returned by get_inbounds(); fetched when omitted
+            
+        Returns:
+            Number of inbounds cached
+        """
+        if inbounds is None:
+            inbounds = self.get_inbounds()
+        metadata_by_inbound = {}
+        for inbound in inbounds or []:
+            metadata = self._inbound_metadata(inbound)
+            if metadata.get('valid') and inbound.get('id') is not None:
+                metadata_by_inbound[inbound['id']] = metadata
+        inbound_metadata_cache.replace_panel(self.base_url, metadata_by_inbound)
+        return len(metadata_by_inbound)
+    
+    def get_cached_inbounds(self) -> List[Dict]:
+        """Inbound summaries (id, remark, protocol, port, enable) from the metadata cache, refreshed when cold"""
+        cached = inbound_metadata_cache.get_panel(self.base_url)
+        if cached is None:
+            # No fresh complete listing: entries cached one by one may miss inbounds
+            self.refresh_inbound_cache()
+            cached = inbound_metadata_cache.get_panel(self.base_url) or []
+        return [{
+            'id': m['inbound_id'],
+            'remark': m['inbound_remark'],
+            'protocol': m['inbound_protocol'],
+            'port': m['inbound_port'],
+            'enable': m.get('enable', True),
+        } for m in sorted(cached, key=lambda m: m['inbound_id'])]
+    
+    def _add_clients(self, inbound_id: int, clients: List[Dict]) -> bool:
+        """Add one or more clients to an inbound in a single addClient request"""
+        response = self.session.post(
+            f"{self.base_url}/panel/api/inbounds/addClient",
+            json={
+                'id': inbound_id,
+                'settings': json.dumps({'clients': clients}, ensure_ascii=False, separators=(',', ':'))
+            },
+            verify=False,
+            timeout=30
+        )
+        if response.status_code != 200:
+            print(f"❌ addClient failed: {response.status_code}")
+            return False
+        result = response.json()
+        if not result.get('success'):
+            print(f"❌ addClient rejected: {result.get('msg', 'Unknown error')}")
+            if 'inbound' in str(result.get('msg', '')).lower():
+                # Inbound changed or vanished on the panel - drop the stale metadata
+                inbound_metadata_cache.invalidate(self.base_url, inbound_id)
+            return False
+        inbound_metadata_cache.note_clients_added(self.base_url, inbound_id, len(clients))
+        return True
+    
     def _generate_client_config(self, client_name: str, protocol: str) -> Dict:
         """Generate client configuration based on protocol"""
         config = {}
@@ -1039,182 +1078,116 @@ class PanelManager:
     
     def disable_client(self, inbound_id: int, client_uuid: str, client_name: str = None) -> bool:
         """Disable client on panel"""
-        try:
-            if not self.login():
-                return False
-            
-            # Get current inbound settings
-            response = self.session.get(
-                f"{self.base_url}/panel/api/inbounds/list",
-                verify=False,
-                timeout=30
-            )
-            
-            if response.status_code != 200:
-                return False
-            
-            result = response.json()
-            if not result.get('success') or 'obj' not in result:
-                return False
-            
-            inbounds = result['obj']
-            for inbound in inbounds:
-                if inbound.get('id') == inbound_id:
-                    # Parse settings
-                    settings = inbound.get('settings', {})
-                    if isinstance(settings, str):
-                        try:
-                            import json
-                            settings = json.loads(settings)
-                        except:
-                            return False
-                    
-                    if isinstance(settings, dict) and 'clients' in settings:
-                        clients = settings['clients']
-                        # Find and disable the client
-                        for client in clients:
-                            if client.get('id') == client_uuid:
-                                client['enable'] = False
-                                break
-                        
-                        # Update settings
-                        settings['clients'] = clients
-                        
-                        # Prepare update data
-                        update_data = {
-                            'up': inbound.get('up', 0),
-                            'down': inbound.get('down', 0),
-                            'total': inbound.get('total', 0),
-                            'remark': inbound.get('remark', ''),
-                            'enable': inbound.get('enable', True),
-                            'expiryTime': inbound.get('expiryTime', 0),
-                            'trafficReset': inbound.get('trafficReset', 0),
-                            'lastTrafficResetTime': inbound.get('lastTrafficResetTime', 0),
-                            'listen': inbound.get('listen', ''),
-                            'port': inbound.get('port', 0),
-                            'protocol': inbound.get('protocol', ''),
-                            'settings': json.dumps(settings, ensure_ascii=False, separators=(',', ':')),
-                            'streamSettings': inbound.get('streamSettings', '{}'),
-                            'sniffing': inbound.get('sniffing', '{}')
-                        }
-                        
-                        # Send update to panel
-                        update_response = self.session.post(
-                            f"{self.base_url}/panel/api/inbounds/update/{inbound_id}",
-                            json=update_data,
-                            verify=False,
-                            timeout=30
-                        )
-                        
-                        if update_response.status_code == 200:
-                            result = update_response.json()
-                            return result.get('success', False)
-            return False
-            
-        except Exception as e:
-            print(f"❌ Error disabling client: {e}")
-            return False
+        return self.disable_clients([{'inbound_id': inbound_id, 'client_uuid': client_uuid}]).get(client_uuid, False)
     
     def delete_client(self, inbound_id: int, client_uuid: str) -> bool:
         """Delete client from panel completely"""
+        return self.delete_clients([{'inbound_id': inbound_id, 'client_uuid': client_uuid}]).get(client_uuid, False)
+    
+    def enable_client(self, inbound_id: int, client_uuid: str, client_name: str = None) -> bool:
+        """Enable client on panel"""
+        return self.enable_clients([{'inbound_id': inbound_id, 'client_uuid': client_uuid}]).get(client_uuid, False)
+    
+    def _get_inbound_clients(self, inbound_id: int) -> Optional[List[Dict]]:
+        """Client entries from an inbound's settings"""
+        response = self.session.get(
+            f"{self.base_url}/panel/api/inbounds/get/{inbound_id}",
+            verify=False,
+            timeout=30
+        )
+        if response.status_code != 200:
+            print(f"❌ Failed to get inbound {inbound_id}: {response.status_code}")
+            return None
+        result = response.json()
+        inbound = result.get('obj') if result.get('success') else None
+        if not inbound:
+            print(f"❌ Inbound {inbound_id} not found")
+            return None
+        
+        settings = inbound.get('settings', '{}')
+        if isinstance(settings, str):
+            settings = json.loads(settings)
+        if not isinstance(settings, dict) or 'clients' not in settings:
+            print(f"❌ No clients found in inbound {inbound_id}")
+            return None
+        return settings['clients']
+    
+    def _post_client_action(self, path: str, client_uuid: str, payload: Dict = None) -> bool:
+        """POST one per-client inbound endpoint (updateClient / delClient)"""
         try:
-            if not self.login():
-                print("❌ Failed to login to panel")
-                return False
-            
-            # Get inbound details (use get instead of list for more complete data)
-            response = self.session.get(
-                f"{self.base_url}/panel/api/inbounds/get/{inbound_id}",
-                verify=False,
-                timeout=30
-            )
-            
-            if response.status_code != 200:
-                print(f"❌ Failed to get inbound: {response.status_code}")
-                return False
-            
-            result = response.json()
-            if not result.get('success'):
-                print(f"❌ Failed to get inbound: {result.get('msg', 'Unknown error')}")
-                return False
-            
-            inbound = result.get('obj')
-            if not inbound:
-                print(f"❌ Inbound {inbound_id} not found")
-                return False
-            
-            # Parse settings
-            settings_str = inbound.get('settings', '{}')
-            if isinstance(settings_str, str):
-                try:
-                    settings = json.loads(settings_str)
-                except Exception as e:
-                    print(f"❌ Error parsing settings: {e}")
-                    return False
-            else:
-                settings = settings_str
-            
-            # Check if clients exist in settings
-            if not isinstance(settings, dict) or 'clients' not in settings:
-                print(f"❌ No clients found in inbound {inbound_id}")
-                return False
-            
-            clients = settings.get('clients', [])
-            original_count = len(clients)
-            
-            # Remove the client completely
-            settings['clients'] = [client for client in clients if client.get('id') != client_uuid]
-            
-            if len(settings['clients']) == original_count:
-                print(f"⚠️ Client {client_uuid} not found in inbound {inbound_id}")
-                return False
-            
-            print(f"✅ Found and removing client {client_uuid} from inbound {inbound_id}")
-            
-            # Prepare complete update data (same format as update_client_traffic)
-            update_data = {
-                'up': inbound.get('up', 0),
-                'down': inbound.get('down', 0),
-                'total': inbound.get('total', 0),
-                'remark': inbound.get('remark', ''),
-                'enable': inbound.get('enable', True),
-                'expiryTime': inbound.get('expiryTime', 0),
-                'trafficReset': inbound.get('trafficReset', 0),
-                'lastTrafficResetTime': inbound.get('lastTrafficResetTime', 0),
-                'listen': inbound.get('listen', ''),
-                'port': inbound.get('port', 0),
-                'protocol': inbound.get('protocol', ''),
-                'settings': json.dumps(settings, ensure_ascii=False, separators=(',', ':')),
-                'streamSettings': inbound.get('streamSettings', '{}'),
-                'sniffing': inbound.get('sniffing', '{}')
-            }
-            
-            # Send update to panel
-            print(f"🔍 Updating inbound to remove client completely...")
-            update_response = self.session.post(
-                f"{self.base_url}/panel/api/inbounds/update/{inbound_id}",
-                json=update_data,
+            response = self.session.post(
+                f"{self.base_url}/panel/api/inbounds/{path}",
+                json=payload,
                 verify=False,
                 timeout=30
             )
-            
-            if update_response.status_code != 200:
-                print(f"❌ Failed to update inbound: {update_response.status_code}")
-                return False
-            
-            update_result = update_response.json()
-            if not update_result.get('success'):
-                print(f"❌ Failed to delete client: {update_result.get('msg', 'Unknown error')}")
-                return False
-            
-            print(f"✅ Successfully deleted client {client_uuid} from inbound {inbound_id}")
-            return True
-            
+            if response.status_code == 200 and response.json().get('success'):
+                return True
+            print(f"❌ {path.split('/')[-2]} failed for client {client_uuid}: {response.status_code}")
         except Exception as e:
-            print(f"❌ Error deleting client: {e}")
-            import traceback
-            traceback.print_exc()
-            return False
+            print(f"❌ Error updating client {client_uuid}: {e}")
+        return False
+    
+    def _set_clients_enabled(self, clients: List[Dict], enabled: bool) -> Dict[str, bool]:
+        """
+        Enable or disable many clients: one read per inbound, then concurrent updateClient calls
+        
+        updateClient only rewrites the given client, so clients added to the inbound
+        meanwhile (addClient) are never overwritten by a stale copy of its settings.
+        
+        Args:
+            clients: [{'inbound_id', 'client_uuid', ...}]
+            
+        Returns:
+            {client_uuid: success}
+        """
+        results = {c['client_uuid']: False for c in clients}
+        if not clients or not self.login():
+            return results
+        
+        uuids_by_inbound = defaultdict(set)
+        for client in clients:
+            uuids_by_inbound[client['inbound_id']].add(client['client_uuid'])
+        
+        updates = []
+        for inbound_id, uuids in uuids_by_inbound.items():
+            try:
+                inbound_clients = self._get_inbound_clients(inbound_id)
+            except Exception as e:
+                print(f"❌ Error reading clients of inbound {inbound_id}: {e}")
+                continue
+            for client in inbound_clients or []:
+                if client.get('id') in uuids:
+                    updates.append({
+                        'client_uuid': client['id'],
+                        'payload': {
+                            'id': inbound_id,
+                            'settings': json.dumps({'clients': [dict(client, enable=enabled)]},
+                                                   ensure_ascii=False, separators=(',', ':'))
+                        }
+                    })
+        
+        # The per-client POSTs run BATCH_CONCURRENCY at a time on the logged-in session
+        results.update(self._run_concurrently(updates, lambda u: self._post_client_action(
+            f"updateClient/{u['client_uuid']}", u['client_uuid'], u['payload'])))
+        return results
+    
+    def disable_clients(self, clients: List[Dict]) -> Dict[str, bool]:
+        """Disable several clients - one read per inbound, concurrent updateClient calls"""
+        return self._set_clients_enabled(clients, False)
+    
+    def enable_clients(self, clients: List[Dict]) -> Dict[str, bool]:
+        """Enable several clients - one read per inbound, concurrent updateClient calls"""
+        return self._set_clients_enabled(clients, True)
+    
+    def delete_clients(self, clients: List[Dict]) -> Dict[str, bool]:
+        """Delete several clients - concurrent delClient calls, the rest of the inbound is untouched"""
+        results = {c['client_uuid']: False for c in clients}
+        if not clients or not self.login():
+            return results
+        results.update(self._run_concurrently(clients, lambda c: self._post_client_action(
+            f"{c['inbound_id']}/delClient/{c['client_uuid']}", c['client_uuid'])))
+        return results
     
     def reset_client_uuid(self, inbound_id: int, old_client_uuid: str) -> Optional[Dict]:
         """
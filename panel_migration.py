@@ -0,0 +1,288 @@
+"""
+Panel Migration Jobs
+Moves all clients of one panel to another in parallel, with checkpoints so an
+interrupted migration resumes where it stopped.
+
+The source listing is read once with get_all_clients(). Every client becomes a
+row in `panel_migration_items`; creates on the destination run on a bounded
+thread pool and each result is checkpointed as it completes. The `clients`
+table is updated in one bulk statement once the creates are done, and the
+source is cleaned up with the panel's batch delete. Re-running a migration
+between the same two panels picks up the unfinished job: clients already
+created are not created again.
+"""
+
+import json
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class PanelMigrationJob:
+    """One resumable source → destination migration"""
+
+    def __init__(self, db, source_panel_id: int, dest_panel_id: int, delete_source: bool = False,
+                 max_workers: int = 8):
+        self.db = db
+        self.source_panel_id = source_panel_id
+        self.dest_panel_id = dest_panel_id
+        self.delete_source = delete_source
+        self.max_workers = max(1, max_workers)
+        self.job_id = None
+        self.resumed = False
+        self._ensure_tables_exist()
+
+    def _ensure_tables_exist(self):
+        try:
+            with self.db.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS panel_migration_jobs (
+                        id INT AUTO_INCREMENT PRIMARY KEY,
+                        source_panel_id INT NOT NULL,
+                        dest_panel_id INT NOT NULL,
+                        delete_source TINYINT(1) DEFAULT 0,
+                        status VARCHAR(20) NOT NULL DEFAULT 'running',
+                        total INT DEFAULT 0,
+                        migrated INT DEFAULT 0,
+                        failed INT DEFAULT 0,
+                        skipped INT DEFAULT 0,
+                        deleted_source INT DEFAULT 0,
+                        duration_seconds DOUBLE DEFAULT 0,
+                        started_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                        finished_at TIMESTAMP NULL,
+                        INDEX idx_panels_status (source_panel_id, dest_panel_id, status)
+                    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+                ''')
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS panel_migration_items (
+                        job_id INT NOT NULL,
+                        source_uuid VARCHAR(255) NOT NULL,
+                        client_name VARCHAR(255),
+                        status VARCHAR(20) NOT NULL DEFAULT 'pending',
+                        new_client TEXT,
+                        db_updated TINYINT(1) DEFAULT 0,
+                        source_deleted TINYINT(1) DEFAULT 0,
+                        error VARCHAR(255),
+                        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+                        PRIMARY KEY (job_id, source_uuid)
+                    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+                ''')
+                conn.commit()
+                cursor.close()
+        except Exception as e:
+            logger.error(f"❌ Error creating panel migration tables: {e}")
+
+    # ==================== Checkpoints ====================
+
+    def _open_job(self):
+        """Resume the unfinished job between these panels or start a new one"""
+        with self.db.get_connection() as conn:
+            cursor = conn.cursor(dictionary=True)
+            cursor.execute('''
+                SELECT id FROM panel_migration_jobs
+                WHERE source_panel_id = %s AND dest_panel_id = %s AND status = 'running'
+                ORDER BY id DESC LIMIT 1
+            ''', (self.source_panel_id, self.dest_panel_id))
+            row = cursor.fetchone()
+            if row:
+                self.job_id = row['id']
+                self.resumed = True
+                cursor.execute('UPDATE panel_migration_jobs SET delete_source = %s WHERE id = %s',
+                               (1 if self.delete_source else 0, self.job_id))
+            else:
+                cursor.execute('''
+                    INSERT INTO panel_migration_jobs (source_panel_id, dest_panel_id, delete_source)
+                    VALUES (%s, %s, %s)
+                ''', (self.source_panel_id, self.dest_panel_id, 1 if self.delete_source else 0))
+                self.job_id = cursor.lastrowid
+            conn.commit()
+
+    def _register_items(self, clients: List[Tuple[str, str]]):
+        """Add source clients not yet known to this job as pending"""
+        if not clients:
+            return
+        with self.db.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.executemany('''
+                INSERT IGNORE INTO panel_migration_items (job_id, source_uuid, client_name)
+                VALUES (%s, %s, %s)
+            ''', [(self.job_id, uuid, name) for uuid, name in clients])
+            conn.commit()
+
+    def _load_items(self) -> Dict[str, Dict]:
+        with self.db.get_connection() as conn:
+            cursor = conn.cursor(dictionary=True)
+            cursor.execute('SELECT * FROM panel_migration_items WHERE job_id = %s', (self.job_id,))
+            return {row['source_uuid']: row for row in cursor.fetchall()}
+
+    def _checkpoint(self, source_uuid: str, status: str, new_client: Dict = None, error: str = None):
+        try:
+            with self.db.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    UPDATE panel_migration_items SET status = %s, new_client = %s, error = %s
+                    WHERE job_id = %s AND source_uuid = %s
+                ''', (status, json.dumps(new_client, default=str) if new_client else None,
+                      (error or '')[:255] or None, self.job_id, source_uuid))
+                conn.commit()
+        except Exception as e:
+            logger.error(f"❌ Migration checkpoint failed for {source_uuid}: {e}")
+
+    def _mark_items(self, column: str, source_uuids: List[str]):
+        if not source_uuids:
+            return
+        with self.db.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.executemany(f'''
+                UPDATE panel_migration_items SET {column} = 1
+                WHERE job_id = %s AND source_uuid = %s
+            ''', [(self.job_id, uuid) for uuid in source_uuids])
+            conn.commit()
+
+    def _finish_job(self, status: str, stats: Dict):
+        try:
+            with self.db.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    UPDATE panel_migration_jobs
+                    SET status = %s, total = %s, migrated = %s, failed = %s, skipped = %s,
+                        deleted_source = %s, duration_seconds = duration_seconds + %s,
+                        finished_at = IF(%s = 'completed', CURRENT_TIMESTAMP, NULL)
+                    WHERE id = %s
+                ''', (status, stats['total'], stats['success'], stats['failed'], stats['skipped'],
+                      stats['deleted_source'], stats['duration_seconds'], status, self.job_id))
+                conn.commit()
+        except Exception as e:
+            logger.error(f"❌ Error finishing migration job {self.job_id}: {e}")
+
+    # ==================== Run ====================
+
+    @staticmethod
+    def _create_on_dest(dest_panel_mgr, client: Dict) -> Optional[Dict]:
+        # Carry over the remaining volume and duration
+        total_bytes = client.get('total_traffic', 0) or 0
+        used_bytes = client.get('used_traffic', 0) or 0
+        remaining_gb = max(0, total_bytes - used_bytes) / (1024 * 1024 * 1024)
+        return dest_panel_mgr.create_client(
+            inbound_id=0,  # Placeholder for panels that don't use inbound_id directly
+            client_name=client.get('username'),
+            protocol=client.get('protocol', 'vless'),
+            expire_days=client.get('expire_days', 0),
+            total_gb=remaining_gb,
+            sub_id=client.get('sub_id')
+        )
+
+    def run(self, source_panel_mgr, dest_panel_mgr) -> Tuple[bool, str, Dict]:
+        started = time.time()
+        # Fetch before opening the job so a failed fetch leaves no empty running job behind
+        source_clients = source_panel_mgr.get_all_clients()
+        if source_clients is None:  # Empty list is valid
+            return False, "Failed to retrieve clients from source panel.", {}
+
+        self._open_job()
+
+        details = []
+        skipped = 0
+        by_uuid = {}
+        for client in source_clients:
+            client_name = client.get('username')
+            if not client_name:
+                skipped += 1
+                details.append("Skipped client with no identifiable name.")
+                continue
+            # Fallback to username if uuid is missing (Marzban)
+            by_uuid[client.get('uuid') or client_name] = client
+
+        self._register_items([(uuid, c.get('username')) for uuid, c in by_uuid.items()])
+        items = self._load_items()
+        todo = [uuid for uuid in by_uuid if items.get(uuid, {}).get('status') != 'created']
+        if self.resumed:
+            details.append(f"Resumed job #{self.job_id}: {len(by_uuid) - len(todo)} clients already migrated.")
+        logger.info(f"🚚 Migration #{self.job_id} panel {self.source_panel_id} → {self.dest_panel_id}: "
+                    f"{len(todo)} to create, {self.max_workers} workers")
+
+        # Create on the destination in parallel, checkpointing each result
+        created = {uuid: json.loads(item['new_client']) for uuid, item in items.items()
+                   if item['status'] == 'created' and item.get('new_client') and uuid in by_uuid}
+        failed = 0
+        if todo:
+            with ThreadPoolExecutor(max_workers=min(self.max_workers, len(todo))) as executor:
+                futures = {executor.submit(self._create_on_dest, dest_panel_mgr, by_uuid[uuid]): uuid
+                           for uuid in todo}
+                for future in as_completed(futures):
+                    uuid = futures[future]
+                    client_name = by_uuid[uuid].get('username')
+                    try:
+                        new_client = future.result()
+                        error = None if new_client else 'create_client returned nothing'
+                    except Exception as e:
+                        new_client, error = None, str(e)
+                    if new_client:
+                        created[uuid] = new_client
+                        self._checkpoint(uuid, 'created', new_client=new_client)
+                        details.append(f"Migrated {client_name} ({by_uuid[uuid].get('protocol', 'vless')}) successfully.")
+                    else:
+                        failed += 1
+                        self._checkpoint(uuid, 'failed', error=error)
+                        details.append(f"Failed to migrate {client_name}: {error}")
+
+        # Point the clients rows at the destination in one statement
+        db_updated = {uuid for uuid in created if items.get(uuid, {}).get('db_updated')}
+        pending_db = [uuid for uuid in created if uuid not in db_updated]
+        db_failed = False
+        if pending_db and self.db:
+            try:
+                self.db.bulk_update_client_panels(self.dest_panel_id, [(uuid, created[uuid]) for uuid in pending_db])
+            except Exception as e:
+                # Not checkpointed, so running the migration again repoints these rows
+                db_failed = True
+                details.append(f"Failed to update {len(pending_db)} clients in the database: {e}")
+            else:
+                self._mark_items('db_updated', pending_db)
+                db_updated.update(pending_db)
+
+        # Remove migrated clients from the source with the panel's batch delete
+        # (only those whose rows already point at the destination)
+        deleted_source = sum(1 for uuid in created if items.get(uuid, {}).get('source_deleted'))
+        if self.delete_source:
+            to_delete = [uuid for uuid in created
+                         if not items.get(uuid, {}).get('source_deleted') and (uuid in db_updated or not self.db)]
+            results = source_panel_mgr.delete_clients([{
+                'inbound_id': by_uuid[uuid].get('inbound_id', 0),
+                'client_uuid': uuid,
+                'client_name': by_uuid[uuid].get('username'),
+            } for uuid in to_delete]) if to_delete else {}
+            deleted = [uuid for uuid in to_delete if results.get(uuid)]
+            self._mark_items('source_deleted', deleted)
+            deleted_source += len(deleted)
+            if len(deleted) < len(to_delete):
+                details.append(f"Failed to delete {len(to_delete) - len(deleted)} clients from source panel.")
+
+        duration = time.time() - started
+        stats = {
+            "job_id": self.job_id,
+            "resumed": self.resumed,
+            "total": len(source_clients),
+            "success": len(created),
+            "failed": failed,
+            "skipped": skipped,
+            "deleted_source": deleted_source,
+            "duration_seconds": round(duration, 2),
+            "clients_per_second": round(len(todo) / duration, 2) if duration > 0 else 0,
+            "details": details
+        }
+        # A job with failures stays open so running the migration again retries them
+        self._finish_job('running' if failed or db_failed else 'completed', stats)
+
+        message = (f"Migration complete. Success: {len(created)}, Failed: {failed}, Skipped: {skipped} "
+                   f"in {duration:.1f}s ({stats['clients_per_second']} clients/s)")
+        if failed:
+            message += ". Run the migration again to retry the failed clients."
+        elif db_failed:
+            message += ". Updating the database failed; run the migration again to finish it."
+        logger.info(f"🚚 Migration #{self.job_id}: {message}")
+        return True, message, stats
@@ -0,0 +1,180 @@
+"""
+Adaptive Panel Polling Scheduler
+Decides when the sync engine polls each panel instead of one fixed interval.
+
+Each panel's interval follows its size (large listings are expensive), how
+much of its traffic changed since the previous poll, and whether any of its
+clients are close to a threshold (70% warning, exhaustion, expiry). Panels
+that fail back off exponentially with jitter so an outage does not cost a
+full timeout every cycle.
+"""
+
+import random
+import threading
+import time
+import logging
+from typing import Dict, List, Optional, Any
+
+logger = logging.getLogger(__name__)
+
+
+class PanelScheduleState:
+    """Polling state of one panel"""
+
+    def __init__(self, panel_id: int):
+        self.panel_id = panel_id
+        self.next_due = 0.0  # Poll immediately on first sight
+        self.interval = 0.0
+        self.client_count = 0
+        self.change_rate = 0.5  # EWMA of changed-client ratio, neutral until measured
+        self.at_risk = 0
+        self.failures = 0
+        self.last_polled = None
+        self.last_duration = 0.0
+
+    def to_dict(self) -> Dict[str, Any]:
+        now = time.time()
+        return {
+            'panel_id': self.panel_id,
+            'interval': round(self.interval, 1),
+            'due_in': round(max(0.0, self.next_due - now), 1),
+            'client_count': self.client_count,
+            'change_rate': round(self.change_rate, 3),
+            'at_risk': self.at_risk,
+            'failures': self.failures,
+            'last_polled': self.last_polled,
+            'last_duration': round(self.last_duration, 2),
+        }
+
+
+class PanelScheduler:
+    """Per-panel adaptive intervals with failure backoff"""
+
+    CHANGE_RATE_ALPHA = 0.5  # Weight of the newest change ratio in the EWMA
+
+    def __init__(self, base_interval: int = 180, min_interval: int = 60, max_interval: int = 900,
+                 at_risk_interval: int = 60, max_backoff: int = 1800, large_panel_clients: int = 5000):
+        """
+        Initialize scheduler
+
+        Args:
+            base_interval: Interval of an average panel in seconds
+            min_interval: Shortest interval any panel is polled at
+            max_interval: Longest interval of a healthy panel
+            at_risk_interval: Interval while clients are near a threshold
+            max_backoff: Longest delay after repeated failures
+            large_panel_clients: Client count at which the size factor peaks (2x)
+        """
+        self.base_interval = base_interval
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.at_risk_interval = at_risk_interval
+        self.max_backoff = max_backoff
+        self.large_panel_clients = large_panel_clients
+        self.panels: Dict[int, PanelScheduleState] = {}
+        self.lock = threading.Lock()
+
+    def _state(self, panel_id: int) -> PanelScheduleState:
+        state = self.panels.get(panel_id)
+        if state is None:
+            state = self.panels[panel_id] = PanelScheduleState(panel_id)
+        return state
+
+    def due_panels(self, panel_ids: List[int], now: float = None) -> List[int]:
+        """
+        Panels that should be polled now, most urgent first
+
+        At-risk panels come first, then the longest overdue, so when the
+        concurrency cap is reached the panels that matter most go out first.
+        Panels no longer active are forgotten.
+        """
+        now = now or time.time()
+        with self.lock:
+            for panel_id in list(self.panels):
+                if panel_id not in panel_ids:
+                    del self.panels[panel_id]
+            due = [self._state(pid) for pid in panel_ids if self._state(pid).next_due <= now]
+        due.sort(key=lambda s: (s.at_risk == 0, s.next_due))
+        return [state.panel_id for state in due]
+
+    def compute_interval(self, state: PanelScheduleState) -> float:
+        """Interval for a healthy panel from its size, change rate and risk"""
+        interval = float(self.base_interval)
+        # Size: up to 2x slower for large listings
+        interval *= 1 + min(state.client_count / max(self.large_panel_clients, 1), 1.0)
+        # Activity: 0.5x for panels where everything moves, 1.5x for idle ones
+        interval *= 1.5 - state.change_rate
+        if state.at_risk:
+            interval = min(interval, self.at_risk_interval)
+        return max(self.min_interval, min(self.max_interval, interval))
+
+    def record_success(self, panel_id: int, client_count: int, changed_ratio: Optional[float],
+                       at_risk: int, duration: float):
+        """
+        Record a successful poll and schedule the next one
+
+        Args:
+            panel_id: Panel ID
+            client_count: Clients in the listing
+            changed_ratio: Share of clients whose traffic changed (None on first poll)
+            at_risk: Clients near a threshold
+            duration: Poll duration in seconds
+        """
+        now = time.time()
+        with self.lock:
+            state = self._state(panel_id)
+            state.client_count = client_count
+            if changed_ratio is not None:
+                state.change_rate = (self.CHANGE_RATE_ALPHA * changed_ratio +
+                                     (1 - self.CHANGE_RATE_ALPHA) * state.change_rate)
+            state.at_risk = at_risk
+            state.failures = 0
+            state.last_polled = now
+            state.last_duration = duration
+            state.interval = self.compute_interval(state)
+            # Small jitter so panels scheduled together drift apart
+            state.next_due = now + state.interval * random.uniform(0.9, 1.0)
+            return state.interval
+
+    def record_failure(self, panel_id: int, duration: float = 0.0) -> float:
+        """Record a failed poll; back off exponentially with equal jitter"""
+        now = time.time()
+        with self.lock:
+            state = self._state(panel_id)
+            state.failures += 1
+            state.last_duration = duration
+            delay = min(self.max_backoff, self.min_interval * (2 ** (state.failures - 1)))
+            state.interval = random.uniform(delay / 2, delay)
+            state.next_due = now + state.interval
+            if state.failures in (1, 3) or state.failures % 10 == 0:
+                logger.warning(f"⚠️ Panel {panel_id} poll failed {state.failures}x, "
+                               f"next attempt in {state.interval:.0f}s")
+            return state.interval
+
+    def freshness_window(self, panel_id: int) -> float:
+        """How long a snapshot of this panel should be treated as current"""
+        with self.lock:
+            state = self.panels.get(panel_id)
+            interval = state.interval if state and state.interval else self.base_interval
+        return interval * 1.5
+
+    def snapshot(self) -> List[Dict[str, Any]]:
+        """Current schedule of all known panels"""
+        with self.lock:
+            return [state.to_dict() for state in self.panels.values()]
+
+
+def create_panel_scheduler(base_interval: int = None) -> PanelScheduler:
+    """Create a scheduler from SYNC_ENGINE_CONFIG"""
+    try:
+        from config import SYNC_ENGINE_CONFIG
+    except ImportError:
+        SYNC_ENGINE_CONFIG = {}
+    min_interval = SYNC_ENGINE_CONFIG.get('min_interval_seconds', 60)
+    return PanelScheduler(
+        base_interval=base_interval or SYNC_ENGINE_CONFIG.get('interval_seconds', 180),
+        min_interval=min_interval,
+        max_interval=SYNC_ENGINE_CONFIG.get('max_interval_seconds', 900),
+        at_risk_interval=min_interval,
+        max_backoff=SYNC_ENGINE_CONFIG.get('max_backoff_seconds', 1800)
+    )
@@ -4,10 +4,11 @@ import time
 import uuid as uuid_lib
 from typing import Dict, List, Optional, Tuple
 import logging
+from panel_batch import PanelBatchOperations
 
 logger = logging.getLogger(__name__)
 
-class PasargadPanelManager:
+class PasargadPanelManager(PanelBatchOperations):
     def __init__(self):
         self.base_url = None
         self.username = None
@@ -0,0 +1,224 @@
+"""
+Profile Photo Cache
+Keeps resized Telegram avatars on local disk so profile pictures cost no Bot API calls after the first view.
+
+Images are stored once per Telegram `file_unique_id` (users sharing a photo,
+or a user whose photo did not change, reuse the same file) and resized to
+avatar dimensions when downloaded. A small per-user reference file maps the
+telegram ID to its current file_unique_id (empty when the user has no photo);
+its mtime is when it was last checked. References older than the refresh
+interval are still served, and re-checked on a background thread, so at most
+one Bot API lookup per user per interval leaves the process.
+
+The image directory is bounded by total size; the least recently served images
+are removed first. The file_unique_id is a strong ETag for the image bytes.
+"""
+
+import os
+import time
+import logging
+import threading
+from io import BytesIO
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class ProfilePhotoCache:
+    """Disk-backed avatar cache keyed by Telegram file_unique_id"""
+
+    def __init__(self, directory: str, max_bytes: int = 50 * 1024 * 1024, avatar_size: int = 160,
+                 refresh_interval: int = 86400):
+        self.directory = directory
+        self.images_dir = os.path.join(directory, 'images')
+        self.refs_dir = os.path.join(directory, 'users')
+        self.max_bytes = max_bytes
+        self.avatar_size = avatar_size
+        self.refresh_interval = refresh_interval
+        self._refreshing = set()
+        self._lock = threading.Lock()
+        self._bytes_since_prune = 0
+        self._executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='photo-refresh')
+        for path in (self.images_dir, self.refs_dir):
+            try:
+                os.makedirs(path, exist_ok=True)
+            except OSError as e:
+                logger.error(f"❌ Could not create photo cache directory {path}: {e}")
+
+    # ==================== Disk ====================
+
+    def _image_path(self, unique_id: str) -> str:
+        return os.path.join(self.images_dir, f"{unique_id}.jpg")
+
+    def _ref_path(self, telegram_id: int) -> str:
+        return os.path.join(self.refs_dir, str(int(telegram_id)))
+
+    @staticmethod
+    def _write_atomic(path: str, data: bytes):
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def _read_ref(self, telegram_id: int) -> Tuple[Optional[str], float]:
+        """(file_unique_id or '' for no photo, age in seconds) - (None, 0) if never checked"""
+        path = self._ref_path(telegram_id)
+        try:
+            with open(path, 'r') as f:
+                unique_id = f.read().strip()
+            return unique_id, time.time() - os.path.getmtime(path)
+        except FileNotFoundError:
+            return None, 0
+        except (OSError, ValueError) as e:
+            logger.warning(f"⚠️ Could not read photo reference for {telegram_id}: {e}")
+            return None, 0
+
+    def _read_image(self, unique_id: str) -> Optional[bytes]:
+        path = self._image_path(unique_id)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            os.utime(path, None)  # Mark as recently used
+            return data or None
+        except OSError:
+            return None
+
+    def _resize(self, data: bytes) -> bytes:
+        from PIL import Image, ImageOps
+
+        img = Image.open(BytesIO(data)).convert('RGB')
+        img = ImageOps.fit(img, (self.avatar_size, self.avatar_size), Image.LANCZOS)
+        buffer = BytesIO()
+        img.save(buffer, format='JPEG', quality=85, optimize=True)
+        return buffer.getvalue()
+
+    def prune(self):
+        """Remove least recently served images above max_bytes"""
+        try:
+            entries = []
+            total = 0
+            for entry in os.scandir(self.images_dir):
+                stat = entry.stat()
+                if entry.name.endswith('.tmp'):
+                    if time.time() - stat.st_mtime > 300:
+                        os.remove(entry.path)  # Left behind by a crashed worker
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+                total += stat.st_size
+        except OSError as e:
+            logger.warning(f"⚠️ Could not scan photo cache: {e}")
+            return
+
+        if total <= self.max_bytes:
+            return
+        entries.sort()
+        removed = 0
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+                total -= size
+                removed += 1
+            except OSError:
+                pass
+        logger.info(f"🧹 Photo cache pruned {removed} least recently used avatars")
+
+    # ==================== Telegram ====================
+
+    def _fetch(self, telegram_id: int, known_unique_id: str = None) -> Optional[str]:
+        """Look up the user's photo, store it if new and update the reference"""
+        from telegram_helper import TelegramHelper
+
+        unique_id, data = TelegramHelper.fetch_user_profile_photo_sync(
+            telegram_id, min_size=self.avatar_size, known_unique_id=known_unique_id)
+
+        if unique_id and data is not None and not os.path.exists(self._image_path(unique_id)):
+            try:
+                data = self._resize(data)
+            except Exception as e:
+                logger.warning(f"⚠️ Could not resize avatar of {telegram_id}, storing original: {e}")
+            self._write_atomic(self._image_path(unique_id), data)
+            with self._lock:
+                self._bytes_since_prune += len(data)
+                should_prune = self._bytes_since_prune >= self.max_bytes // 20
+                if should_prune:
+                    self._bytes_since_prune = 0
+            if should_prune:
+                self.prune()
+
+        self._write_atomic(self._ref_path(telegram_id), unique_id.encode())
+        return unique_id
+
+    def _refresh_in_background(self, telegram_id: int, known_unique_id: str):
+        with self._lock:
+            if telegram_id in self._refreshing:
+                return
+            self._refreshing.add(telegram_id)
+
+        def refresh():
+            try:
+                self._fetch(telegram_id, known_unique_id)
+            except Exception as e:
+                logger.warning(f"⚠️ Background avatar refresh failed for {telegram_id}: {e}")
+            finally:
+                with self._lock:
+                    self._refreshing.discard(telegram_id)
+
+        self._executor.submit(refresh)
+
+    # ==================== Public API ====================
+
+    def get(self, telegram_id: int) -> Optional[Tuple[bytes, str]]:
+        """
+        Avatar of a user
+
+        Returns:
+            (jpeg_bytes, etag) or None if the user has no (reachable) photo
+        """
+        unique_id, age = self._read_ref(telegram_id)
+        data = self._read_image(unique_id) if unique_id else None
+
+        if unique_id is None or (unique_id and data is None):
+            # Never checked, or the image was pruned - fetch now
+            try:
+                unique_id = self._fetch(telegram_id, None)
+            except Exception as e:
+                logger.error(f"Error fetching profile photo for user {telegram_id}: {e}")
+                return None
+            data = self._read_image(unique_id) if unique_id else None
+        elif age > self.refresh_interval:
+            self._refresh_in_background(telegram_id, unique_id)
+
+        if not data:
+            return None
+        return data, f'"{unique_id}"'
+
+    def has_photo(self, telegram_id: int) -> bool:
+        """Whether the user has a photo, from the cached reference when there is one"""
+        unique_id, age = self._read_ref(telegram_id)
+        if unique_id is None:
+            return self.get(telegram_id) is not None
+        if age > self.refresh_interval:
+            self._refresh_in_background(telegram_id, unique_id)
+        return bool(unique_id)
+
+
+def _create_profile_photo_cache() -> ProfilePhotoCache:
+    try:
+        from config import PHOTO_CACHE_CONFIG
+    except ImportError:
+        PHOTO_CACHE_CONFIG = {}
+    directory = PHOTO_CACHE_CONFIG.get('directory') or os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), 'cache', 'photos')
+    return ProfilePhotoCache(
+        directory,
+        max_bytes=PHOTO_CACHE_CONFIG.get('max_mb', 50) * 1024 * 1024,
+        avatar_size=PHOTO_CACHE_CONFIG.get('avatar_size', 160),
+        refresh_interval=PHOTO_CACHE_CONFIG.get('refresh_hours', 24) * 3600,
+    )
+
+
+# Global instance
+profile_photo_cache = _create_profile_photo_cache()
@@ -6,8 +6,10 @@ MySQL Version
 
 import mysql.connector
 from mysql.connector import Error, pooling
+from mysql.connector.errors import PoolError
 import json
 import os
+import time
 import shutil
 import logging
 from typing import Dict, List, Optional, Tuple, Any
@@ -15,6 +17,8 @@ from datetime import datetime, timedelta
 from contextlib import contextmanager
 import threading
 from config import MYSQL_CONFIG
+from query_profiler import query_profiler, InstrumentedConnection
+from subscription_links import build_subscription_link
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -26,6 +30,12 @@ class ProfessionalDatabaseManager:
     # Store connection pools per database name
     _connection_pools = {}  # {database_name: connection_pool}
     _pool_lock = threading.Lock()
+    # mysql-connector refuses pools above 32 connections
+    MAX_POOL_SIZE = 32
+    # How long a thread waits for a free pooled connection before giving up
+    POOL_WAIT_SECONDS = float(os.getenv('DB_POOL_WAIT_SECONDS', '10'))
+    # Per-thread connection scope, see begin_connection_scope()
+    _scope_local = threading.local()
     
     def __init__(self, db_config: dict = None):
         self.db_config = db_config or MYSQL_CONFIG.copy()
@@ -34,6 +44,8 @@ class ProfessionalDatabaseManager:
         logger.debug(f"📊 ProfessionalDatabaseManager initialized with database_name: '{self.database_name}'")
         self.backup_dir = "database_backups"
         self.lock = threading.Lock()
+        self._fulltext_tables = {}  # {table: has FULLTEXT index}, filled lazily
+        self._deadline_tracking = None  # deadline_updated_at trigger present, checked lazily
         
         # Log database name for debugging
         logger.info(f"🔧 Initializing ProfessionalDatabaseManager for database: '{self.database_name}'")
@@ -84,9 +96,11 @@ class ProfessionalDatabaseManager:
                 # Double-check after acquiring lock
                 if self.database_name not in ProfessionalDatabaseManager._connection_pools:
                     try:
+                        # Sized to the process's concurrency (gunicorn.conf.py sets DB_POOL_SIZE per worker)
+                        pool_size = max(1, min(self.db_config.get('pool_size', 5), self.MAX_POOL_SIZE))
                         pool_config = {
                             'pool_name': f'vpn_bot_pool_{self.database_name}',  # Unique pool name per database
-                            'pool_size': min(self.db_config.get('pool_size', 5), 5),  # Max 5 connections per pool
+                            'pool_size': pool_size,
                             'pool_reset_session': self.db_config.get('pool_reset_session', True),
                             'host': self.db_config['host'],
                             'port': self.db_config['port'],
@@ -101,7 +115,7 @@ class ProfessionalDatabaseManager:
                         }
                         pool = pooling.MySQLConnectionPool(**pool_config)
                         ProfessionalDatabaseManager._connection_pools[self.database_name] = pool
-                        logger.info(f"MySQL connection pool initialized for database '{self.database_name}'")
+                        logger.info(f"MySQL connection pool initialized for database '{self.database_name}' ({pool_size} connections)")
                     except Error as e:
                         logger.error(f"Error initializing MySQL connection pool for database '{self.database_name}': {e}")
                         raise
@@ -137,44 +151,167 @@ class ProfessionalDatabaseManager:
             logger.error(f"Error ensuring database exists: {e}")
             raise
     
+    def _checkout_connection(self):
+        """Get a verified connection from this database's pool"""
+        # Get connection from the pool for this specific database
+        pool = ProfessionalDatabaseManager._connection_pools.get(self.database_name)
+        if not pool:
+            # Try to initialize connection pool if it doesn't exist
+            logger.warning(f"⚠️ Connection pool not found for '{self.database_name}', attempting to initialize...")
+            try:
+                self._init_connection_pool()
+                pool = ProfessionalDatabaseManager._connection_pools.get(self.database_name)
+                if not pool:
+                    raise Error(f"Failed to initialize connection pool for database '{self.database_name}'. Available pools: {list(ProfessionalDatabaseManager._connection_pools.keys())}")
+                logger.info(f"✅ Connection pool initialized for database '{self.database_name}'")
+            except Exception as e:
+                logger.error(f"❌ Error initializing connection pool for '{self.database_name}': {e}")
+                raise Error(f"No connection pool found for database '{self.database_name}' and failed to initialize: {e}. Available pools: {list(ProfessionalDatabaseManager._connection_pools.keys())}")
+        conn = self._wait_for_pooled_connection(pool)
+        # Verify connection is using correct database
+        cursor = conn.cursor()
+        cursor.execute("SELECT DATABASE() as db")
+        result = cursor.fetchone()
+        actual_db = result[0] if result else None
+        cursor.close()
+        if actual_db != self.database_name:
+            conn.close()
+            logger.error(f"❌ CRITICAL: Connection pool for '{self.database_name}' is connected to wrong database '{actual_db}'!")
+            raise Error(f"Connection pool mismatch: expected '{self.database_name}', got '{actual_db}'")
+        return conn
+    
+    def _wait_for_pooled_connection(self, pool):
+        """
+        Check out a pooled connection, waiting while all are in use
+        
+        mysql-connector raises PoolError at once when the pool is exhausted. With
+        threaded (gthread) or gevent workers more requests than connections can
+        be in flight, so wait for one to be returned instead of failing the request.
+        """
+        deadline = time.monotonic() + self.POOL_WAIT_SECONDS
+        delay = 0.005
+        while True:
+            try:
+                return pool.get_connection()
+            except PoolError:
+                if time.monotonic() >= deadline:
+                    logger.error(f"❌ No free connection in pool '{self.database_name}' after {self.POOL_WAIT_SECONDS}s")
+                    raise
+                time.sleep(delay)
+                delay = min(delay * 2, 0.1)
+    
+    # ==================== Request-scoped connections ====================
+    
+    @classmethod
+    def begin_connection_scope(cls) -> Dict:
+        """
+        Start a connection scope on the current thread
+        
+        Inside a scope, get_connection() checks out one connection per database
+        lazily on first use and reuses it for every later call, instead of a
+        pool round-trip (and SELECT DATABASE() check) per method. The webapp
+        opens a scope per request; end_connection_scope() returns the connections.
+        
+        Returns:
+            The scope dict {database_name: connection}
+        """
+        scope = {}
+        cls._scope_local.scope = scope
+        # Nesting depth per database (methods call other methods inside their
+        # `with get_connection()`) and databases whose connection hit an error
+        cls._scope_local.depth = {}
+        cls._scope_local.failed = set()
+        return scope
+    
+    @classmethod
+    def release_connection_scope(cls):
+        """
+        Return scoped connections to the pool but keep the scope open
+        
+        Call before slow non-DB work (panel HTTP calls) so the request does not
+        hold a pooled connection while waiting; the next DB call checks one out again.
+        Connections still inside a `with get_connection()` block are kept.
+        """
+        cls._release_scoped_connections(force=False)
+    
+    @classmethod
+    def end_connection_scope(cls):
+        """Close the current thread's scope and return its connections to the pool"""
+        cls._release_scoped_connections(force=True)
+        cls._scope_local.scope = None
+        cls._scope_local.depth = None
+        cls._scope_local.failed = None
+    
+    @classmethod
+    def _release_scoped_connections(cls, force: bool):
+        scope = getattr(cls._scope_local, 'scope', None)
+        if not scope:
+            return
+        depth = cls._scope_local.depth
+        for database_name, conn in list(scope.items()):
+            if depth.get(database_name) and not force:
+                continue
+            cls._return_scoped_connection(database_name, conn)
+            del scope[database_name]
+            depth.pop(database_name, None)
+            cls._scope_local.failed.discard(database_name)
+    
+    @staticmethod
+    def _return_scoped_connection(database_name: str, conn):
+        """Roll back anything left open and return a scoped connection"""
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except Exception as e:
+            logger.debug(f"Rollback of scoped connection for '{database_name}' failed: {e}")
+        try:
+            conn.close()
+        except Exception as e:
+            logger.warning(f"⚠️ Error returning scoped connection for '{database_name}': {e}")
+    
     @contextmanager
     def get_connection(self):
         """Context manager for database connections with proper error handling"""
         conn = None
-        try:
-            # Get connection from the pool for this specific database
-            pool = ProfessionalDatabaseManager._connection_pools.get(self.database_name)
-            if not pool:
-                # Try to initialize connection pool if it doesn't exist
-                logger.warning(f"⚠️ Connection pool not found for '{self.database_name}', attempting to initialize...")
-                try:
-                    self._init_connection_pool()
-                    pool = ProfessionalDatabaseManager._connection_pools.get(self.database_name)
-                    if not pool:
-                        raise Error(f"Failed to initialize connection pool for database '{self.database_name}'. Available pools: {list(ProfessionalDatabaseManager._connection_pools.keys())}")
-                    logger.info(f"✅ Connection pool initialized for database '{self.database_name}'")
-                except Exception as e:
-                    logger.error(f"❌ Error initializing connection pool for '{self.database_name}': {e}")
-                    raise Error(f"No connection pool found for database '{self.database_name}' and failed to initialize: {e}. Available pools: {list(ProfessionalDatabaseManager._connection_pools.keys())}")
-            conn = pool.get_connection()
-            # Verify connection is using correct database
-            cursor = conn.cursor()
-            cursor.execute("SELECT DATABASE() as db")
-            result = cursor.fetchone()
-            actual_db = result[0] if result else None
-            cursor.close()
-            if actual_db != self.database_name:
-                logger.error(f"❌ CRITICAL: Connection pool for '{self.database_name}' is connected to wrong database '{actual_db}'!")
-                raise Error(f"Connection pool mismatch: expected '{self.database_name}', got '{actual_db}'")
-            yield conn
+        local = ProfessionalDatabaseManager._scope_local
+        scope = getattr(local, 'scope', None)
+        entered = False
+        try:
+            if scope is not None:
+                conn = scope.get(self.database_name)
+                if conn is None:
+                    conn = self._checkout_connection()
+                    scope[self.database_name] = conn
+                local.depth[self.database_name] = local.depth.get(self.database_name, 0) + 1
+                entered = True
+            else:
+                conn = self._checkout_connection()
+            # Cursors of instrumented connections report timing to query_profiler
+            yield InstrumentedConnection(conn, query_profiler) if query_profiler.enabled else conn
         except Error as e:
             logger.error(f"Database error: {e}")
             if conn:
-                conn.rollback()
+                if scope is None:
+                    conn.rollback()
+                else:
+                    # The outermost block still owns the scoped connection; it is
+                    # rolled back and replaced when that block exits
+                    local.failed.add(self.database_name)
             raise
         finally:
-            if conn:
-                conn.close()
+            if scope is None:
+                if conn:
+                    conn.close()
+            elif entered and getattr(local, 'scope', None) is scope:
+                remaining = local.depth[self.database_name] - 1
+                local.depth[self.database_name] = remaining
+                if remaining == 0 and self.database_name in local.failed:
+                    # Do not reuse a connection that failed; the next call checks out a fresh one
+                    local.failed.discard(self.database_name)
+                    del local.depth[self.database_name]
+                    if scope.get(self.database_name) is conn:
+                        del scope[self.database_name]
+                    self._return_scoped_connection(self.database_name, conn)
     
     def init_database(self):
         """Initialize database with comprehensive schema"""
@@ -306,6 +443,7 @@ class ProfessionalDatabaseManager:
                         cached_is_online TINYINT DEFAULT 0,
                         data_last_synced TIMESTAMP NULL,
                         notes TEXT,
+                        deadline_updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                         FOREIGN KEY (user_id) REFERENCES users (id) ON DELETE CASCADE,
                         FOREIGN KEY (panel_id) REFERENCES panels (id) ON DELETE CASCADE,
                         INDEX idx_user_id (user_id),
@@ -1251,6 +1389,95 @@ class ProfessionalDatabaseManager:
                 ''')
                 logger.info("✅ Migration v5.1_add_panel_methods completed")
 
+            # Migration 14: Indexes for keyset pagination and admin search
+            cursor.execute("SELECT version FROM database_migrations WHERE version = 'v7.0_add_listing_search_indexes'")
+            if not cursor.fetchone():
+                logger.info("Running migration: Add listing pagination and search indexes")
+                
+                cursor.execute("""
+                    SELECT TABLE_NAME, INDEX_NAME FROM INFORMATION_SCHEMA.STATISTICS
+                    WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME IN ('users', 'clients', 'invoices')
+                """)
+                existing = {(row['TABLE_NAME'], row['INDEX_NAME']) for row in cursor.fetchall()}
+                
+                listing_indexes = [
+                    ('users', 'idx_users_created_id', 'ALTER TABLE users ADD INDEX idx_users_created_id (created_at, id)'),
+                    ('clients', 'idx_clients_created_id', 'ALTER TABLE clients ADD INDEX idx_clients_created_id (created_at, id)'),
+                    ('invoices', 'idx_invoices_created_id', 'ALTER TABLE invoices ADD INDEX idx_invoices_created_id (created_at, id)'),
+                    ('invoices', 'idx_invoices_transaction_id', 'ALTER TABLE invoices ADD INDEX idx_invoices_transaction_id (transaction_id)'),
+                    # ngram parser so Persian names and partial usernames match like LIKE '%term%'
+                    ('users', 'ft_users_names', 'ALTER TABLE users ADD FULLTEXT INDEX ft_users_names (username, first_name, last_name) WITH PARSER ngram'),
+                    ('clients', 'ft_clients_name', 'ALTER TABLE clients ADD FULLTEXT INDEX ft_clients_name (client_name) WITH PARSER ngram'),
+                ]
+                for table, index_name, ddl in listing_indexes:
+                    if (table, index_name) in existing:
+                        continue
+                    try:
+                        cursor.execute(ddl)
+                        logger.info(f"✅ Added index {index_name} on {table}")
+                    except Exception as e:
+                        # Searches fall back to LIKE when the FULLTEXT index is missing
+                        logger.warning(f"⚠️ Could not add index {index_name} on {table}: {e}")
+                
+                cursor.execute('''
+                    INSERT INTO database_migrations (version, description)
+                    VALUES ('v7.0_add_listing_search_indexes', 'Add (created_at, id) keyset and ngram FULLTEXT indexes for admin listings')
+                ''')
+                logger.info("✅ Migration v7.0_add_listing_search_indexes completed")
+
+            # Migration 15: Store the canonical subscription link on each client
+            cursor.execute("SELECT version FROM database_migrations WHERE version = 'v7.1_add_client_subscription_link'")
+            if not cursor.fetchone():
+                logger.info("Running migration: Add subscription_link to clients table")
+                
+                cursor.execute("""
+                    SELECT COLUMN_NAME 
+                    FROM INFORMATION_SCHEMA.COLUMNS 
+                    WHERE TABLE_SCHEMA = DATABASE() 
+                    AND TABLE_NAME = 'clients'
+                """)
+                columns = [row['COLUMN_NAME'] for row in cursor.fetchall()]
+                
+                if 'subscription_link' not in columns:
+                    cursor.execute('ALTER TABLE clients ADD COLUMN subscription_link TEXT')
+                    logger.info("✅ Added subscription_link column to clients table")
+                
+                updated = self._recompute_subscription_links(cursor)
+                logger.info(f"✅ Backfilled subscription links for {updated} clients")
+                
+                cursor.execute('''
+                    INSERT INTO database_migrations (version, description)
+                    VALUES ('v7.1_add_client_subscription_link', 'Add precomputed subscription_link to clients table')
+                ''')
+                conn.commit()
+                logger.info("✅ Migration v7.1_add_client_subscription_link completed")
+
+            # Migration 16: Deadline change stamp for the expiry index delta sync
+            cursor.execute("SELECT version FROM database_migrations WHERE version = 'v7.2_add_client_deadline_updated_at'")
+            if not cursor.fetchone():
+                logger.info("Running migration: Add deadline_updated_at to clients table")
+                
+                cursor.execute("""
+                    SELECT COLUMN_NAME 
+                    FROM INFORMATION_SCHEMA.COLUMNS 
+                    WHERE TABLE_SCHEMA = DATABASE() 
+                    AND TABLE_NAME = 'clients'
+                """)
+                columns = [row['COLUMN_NAME'] for row in cursor.fetchall()]
+                
+                if 'deadline_updated_at' not in columns:
+                    cursor.execute('ALTER TABLE clients ADD COLUMN deadline_updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP')
+                    cursor.execute('ALTER TABLE clients ADD INDEX idx_clients_deadline_updated_at (deadline_updated_at)')
+                    logger.info("✅ Added deadline_updated_at column to clients table")
+                
+                if self._ensure_deadline_trigger(cursor):
+                    cursor.execute('''
+                        INSERT INTO database_migrations (version, description)
+                        VALUES ('v7.2_add_client_deadline_updated_at', 'Add deadline_updated_at to clients, bumped by trigger when a deadline column changes')
+                    ''')
+                    conn.commit()
+                    logger.info("✅ Migration v7.2_add_client_deadline_updated_at completed")
+
         except Exception as e:
             logger.error(f"Migration error: {e}")
             # Don't raise, just log - we don't want to stop startup if a migration fails
@@ -1862,6 +2089,9 @@ class ProfessionalDatabaseManager:
                 
                 query = f"UPDATE panels SET {', '.join(updates)} WHERE id = %s"
                 cursor.execute(query, params)
+                if subscription_url is not None or panel_type is not None:
+                    updated = self._recompute_subscription_links(cursor, 'WHERE c.panel_id = %s', (panel_id,))
+                    logger.info(f"🔗 Recomputed {updated} subscription links for panel {panel_id}")
                 conn.commit()
                 
                 self.log_system_event('INFO', f'Panel updated: ID {panel_id}', 'panel_management')
@@ -2648,6 +2878,7 @@ class ProfessionalDatabaseManager:
                       inbound_id, protocol, expire_days, total_gb, expires_at, config_link, sub_id, product_id))
                 
                 client_id = cursor.lastrowid
+                self._recompute_subscription_links(cursor, 'WHERE c.id = %s', (client_id,))
                 conn.commit()
                 self.log_system_event('INFO', f'Client added: {client_name}', 'client_management', user_id)
                 return client_id
@@ -2665,12 +2896,67 @@ class ProfessionalDatabaseManager:
                     SET config_link = %s, updated_at = CURRENT_TIMESTAMP
                     WHERE id = %s
                 ''', (config_link, client_id))
+                self._recompute_subscription_links(cursor, 'WHERE c.id = %s', (client_id,))
                 conn.commit()
                 logger.info(f"Updated config for client {client_id}")
                 return True
         except Exception as e:
             logger.error(f"Error updating client config: {e}")
             return False
+
+    def _recompute_subscription_links(self, cursor, where: str = '', params: tuple = ()) -> int:
+        """Recompute clients.subscription_link for the selected clients on an open cursor (caller commits)"""
+        cursor.execute(f'''
+            SELECT c.id, c.client_uuid, c.sub_id, c.config_link, c.subscription_link,
+                   p.panel_type, p.subscription_url
+            FROM clients c
+            LEFT JOIN panels p ON c.panel_id = p.id
+            {where}
+        ''', params)
+        rows = cursor.fetchall()
+        if rows and not isinstance(rows[0], dict):
+            rows = [dict(zip(cursor.column_names, row)) for row in rows]
+        changes = []
+        for row in rows:
+            link = build_subscription_link(row, row) or None
+            if link != row['subscription_link']:
+                changes.append((link, row['id']))
+        if changes:
+            cursor.executemany('UPDATE clients SET subscription_link = %s WHERE id = %s', changes)
+        return len(changes)
+
+    def refresh_subscription_links(self, panel_id: int = None, client_ids: List[int] = None) -> int:
+        """
+        Recompute stored subscription links (after a panel's subscription_url or a client's UUID changed)
+        
+        Args:
+            panel_id: Only clients of this panel
+            client_ids: Only these clients
+            
+        Returns:
+            Number of clients whose link changed
+        """
+        if client_ids is not None and not client_ids:
+            return 0
+        conditions, params = [], []
+        if panel_id is not None:
+            conditions.append('c.panel_id = %s')
+            params.append(panel_id)
+        if client_ids:
+            conditions.append(f"c.id IN ({', '.join(['%s'] * len(client_ids))})")
+            params.extend(client_ids)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+        try:
+            with self.get_connection() as conn:
+                cursor = conn.cursor(dictionary=True)
+                updated = self._recompute_subscription_links(cursor, where, tuple(params))
+                conn.commit()
+                if updated:
+                    logger.info(f"🔗 Recomputed {updated} subscription links")
+                return updated
+        except Exception as e:
+            logger.error(f"Error refreshing subscription links: {e}")
+            return 0
     
     def update_client_cached_data(self, client_id: int, used_gb: float = None, 
                                    last_activity: int = None, is_online: bool = None,
@@ -2796,7 +3082,41 @@ class ProfessionalDatabaseManager:
         except Exception as e:
             logger.error(f"❌ Error in bulk_update_client_status: {e}")
             return False
-    
+
+    def bulk_update_client_sync_data(self, updates: List[Dict]) -> bool:
+        """
+        Bulk write panel sync results (single writer, see sync_engine.SyncEngine)
+        Args:
+            updates: List of dicts with keys: 'id', 'used_gb', 'last_activity' (ms),
+                     'is_online', 'expires_at' (datetime or None to keep current)
+        """
+        if not updates:
+            return True
+
+        try:
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                # updated_at is left to ON UPDATE so it only moves when a value changed
+                cursor.executemany('''
+                    UPDATE clients
+                    SET used_gb = %s,
+                        cached_used_gb = %s,
+                        cached_last_activity = %s,
+                        cached_is_online = %s,
+                        expires_at = COALESCE(%s, expires_at)
+                    WHERE id = %s
+                ''', [
+                    (u['used_gb'], u['used_gb'], min(int(u.get('last_activity') or 0), 9223372036854775807),
+                     1 if u.get('is_online') else 0, u.get('expires_at'), u['id'])
+                    for u in updates
+                ])
+                conn.commit()
+                logger.info(f"⚡ Bulk wrote sync data for {len(updates)} clients")
+                return True
+        except Exception as e:
+            logger.error(f"❌ Error in bulk_update_client_sync_data: {e}")
+            return False
+
     def update_client_total_gb(self, client_id: int, new_total_gb: float) -> bool:
         """Update client's total GB allowance"""
         try:
@@ -2903,6 +3223,7 @@ class ProfessionalDatabaseManager:
                 
                 query = f"UPDATE clients SET {', '.join(updates)} WHERE id = %s"
                 cursor.execute(query, params)
+                self._recompute_subscription_links(cursor, 'WHERE c.id = %s', (service_id,))
                 
                 conn.commit()
                 
@@ -2990,6 +3311,7 @@ class ProfessionalDatabaseManager:
                        WHERE id = %s''',
                     (new_panel_id, new_inbound_id, service_id)
                 )
+                self._recompute_subscription_links(cursor, 'WHERE c.id = %s', (service_id,))
                 
                 conn.commit()
                 
@@ -3078,7 +3400,68 @@ class ProfessionalDatabaseManager:
         except Exception as e:
             logger.error(f"Error getting user clients: {e}")
             return []
-    
+
+    def get_user_client(self, telegram_id: int, client_id: int) -> Optional[Dict]:
+        """Get one of the user's clients by telegram ID (same visibility as get_user_clients)"""
+        try:
+            with self.get_connection() as conn:
+                cursor = conn.cursor(dictionary=True)
+                cursor.execute('''
+                    SELECT c.*, p.name as panel_name
+                    FROM clients c
+                    JOIN panels p ON c.panel_id = p.id
+                    JOIN users u ON c.user_id = u.id
+                    WHERE c.id = %s AND u.telegram_id = %s
+                      AND (c.is_active = 1
+                       OR (c.status = 'disabled'
+                           AND ((c.exhausted_at IS NOT NULL
+                                 AND DATE_ADD(c.exhausted_at, INTERVAL 24 HOUR) > NOW())
+                              OR (c.expired_at IS NOT NULL
+                                  AND DATE_ADD(c.expired_at, INTERVAL 24 HOUR) > NOW()))))
+                ''', (client_id, telegram_id))
+                row = cursor.fetchone()
+                return dict(row) if row else None
+        except Exception as e:
+            logger.error(f"Error getting user client: {e}")
+            return None
+
+    def get_user_page_version(self, telegram_id: int) -> Optional[Dict]:
+        """
+        Cheap version stamp of everything the user's pages show
+        
+        Moves when the user row, any of their clients (the monitor's bulk
+        writes bump clients.updated_at), their transactions, panels or
+        settings change. seconds_since_change lets callers skip caching while a
+        change is still within the TIMESTAMP one-second resolution.
+        """
+        try:
+            with self.get_connection() as conn:
+                cursor = conn.cursor(dictionary=True)
+                cursor.execute('''
+                    SELECT v.*,
+                           TIMESTAMPDIFF(SECOND, GREATEST(COALESCE(v.user_changed, '1970-01-02'),
+                                                          COALESCE(v.clients_changed, '1970-01-02'),
+                                                          COALESCE(v.settings_changed, '1970-01-02')),
+                                         NOW()) AS seconds_since_change
+                    FROM (
+                        SELECT u.id, u.last_activity AS user_changed, u.balance,
+                               (SELECT MAX(c.updated_at) FROM clients c WHERE c.user_id = u.id) AS clients_changed,
+                               (SELECT COUNT(*) FROM clients c WHERE c.user_id = u.id) AS clients_count,
+                               (SELECT MAX(bt.id) FROM balance_transactions bt WHERE bt.user_id = u.id) AS last_transaction,
+                               (SELECT COUNT(*) FROM invoices i WHERE i.user_id = u.id
+                                  AND i.status IN ('paid', 'completed')) AS paid_invoices,
+                               (SELECT MAX(p.updated_at) FROM panels p) AS panels_changed,
+                               (SELECT MAX(s.updated_at) FROM settings s) AS settings_changed,
+                               CURDATE() AS today
+                        FROM users u
+                        WHERE u.telegram_id = %s
+                    ) v
+                ''', (telegram_id,))
+                return cursor.fetchone()
+        except Exception as e:
+            logger.error(f"Error getting user page version: {e}")
+            return None
+
     def get_user_service(self, service_id: int, user_id: int) -> Optional[Dict]:
         """Get a specific user service by service ID and user ID"""
         try:
@@ -3455,17 +3838,16 @@ class ProfessionalDatabaseManager:
                 cursor = conn.cursor(dictionary=True)
                 # Get all active services + disabled services in grace period (within last 25 hours)
                 # Only include services from active panels (is_active = 1)
+                # Grace-period predicates compare the raw columns so the (status, exhausted_at)
+                # and (status, expired_at) indexes can be used
                 cursor.execute('''
                     SELECT c.*, p.name as panel_name, p.default_inbound_id
                     FROM clients c 
                     JOIN panels p ON c.panel_id = p.id 
                     WHERE p.is_active = 1
                       AND (c.is_active = 1 
-                       OR (c.status = 'disabled' 
-                           AND ((c.exhausted_at IS NOT NULL 
-                                 AND DATE_ADD(c.exhausted_at, INTERVAL 25 HOUR) > NOW())
-                              OR (c.expired_at IS NOT NULL 
-                                  AND DATE_ADD(c.expired_at, INTERVAL 25 HOUR) > NOW()))))
+                           OR (c.status = 'disabled' AND c.exhausted_at > NOW() - INTERVAL 25 HOUR)
+                           OR (c.status = 'disabled' AND c.expired_at > NOW() - INTERVAL 25 HOUR))
                     ORDER BY c.created_at DESC
                 ''')
                 
@@ -3611,13 +3993,98 @@ class ProfessionalDatabaseManager:
         except Exception as e:
             logger.error(f"Error updating service expiration time: {e}")
     
-    def get_services_for_deletion(self) -> List[Dict]:
-        """Get services that should be deleted after 24 hours"""
+    # Columns the expiry index derives deadlines from; the trigger bumps
+    # clients.deadline_updated_at only when one of these changes
+    DEADLINE_COLUMNS = ('expires_at', 'exhausted_at', 'expired_at', 'status', 'warned_one_week',
+                        'product_id', 'panel_id')
+    
+    def _ensure_deadline_trigger(self, cursor) -> bool:
+        """Create the BEFORE UPDATE trigger maintaining clients.deadline_updated_at"""
+        cursor.execute('''
+            SELECT 1 FROM INFORMATION_SCHEMA.TRIGGERS
+            WHERE TRIGGER_SCHEMA = DATABASE() AND TRIGGER_NAME = 'trg_clients_deadline_updated_at'
+        ''')
+        if cursor.fetchone():
+            return True
+        unchanged = ' AND '.join(f'NEW.{col} <=> OLD.{col}' for col in self.DEADLINE_COLUMNS)
+        try:
+            cursor.execute(f'''
+                CREATE TRIGGER trg_clients_deadline_updated_at BEFORE UPDATE ON clients
+                FOR EACH ROW SET NEW.deadline_updated_at =
+                    IF({unchanged}, OLD.deadline_updated_at, CURRENT_TIMESTAMP)
+            ''')
+            logger.info("✅ Created trigger trg_clients_deadline_updated_at")
+            return True
+        except Exception as e:
+            # e.g. binary logging without SUPER / log_bin_trust_function_creators
+            logger.warning(f"⚠️ Could not create deadline trigger, expiry index deltas fall back to updated_at: {e}")
+            return False
+    
+    def _has_deadline_tracking(self, cursor) -> bool:
+        """Check (once) whether deadline_updated_at is maintained by its trigger"""
+        if self._deadline_tracking is None:
+            try:
+                cursor.execute('''
+                    SELECT 1 FROM INFORMATION_SCHEMA.TRIGGERS
+                    WHERE TRIGGER_SCHEMA = DATABASE() AND TRIGGER_NAME = 'trg_clients_deadline_updated_at'
+                ''')
+                self._deadline_tracking = cursor.fetchone() is not None
+            except Exception as e:
+                logger.debug(f"Could not check deadline trigger: {e}")
+                self._deadline_tracking = False
+        return self._deadline_tracking
+    
+    def get_expiry_index_rows(self, updated_since: datetime = None, service_ids: List[int] = None) -> List[Dict]:
+        """
+        Deadline columns of clients on active panels for the expiry index
+        
+        Each row carries changed_at: deadline_updated_at, which only moves when a
+        deadline column changes (traffic syncs leave it alone), or updated_at
+        when the trigger maintaining it could not be created.
+        
+        Args:
+            updated_since: Only rows whose changed_at is at or after this time (delta sync)
+            service_ids: Only these services (re-evaluation after handling)
+        """
+        try:
+            with self.get_connection() as conn:
+                cursor = conn.cursor(dictionary=True)
+                changed_col = 'c.deadline_updated_at' if self._has_deadline_tracking(cursor) else 'c.updated_at'
+                query = f'''
+                    SELECT c.id, c.product_id, c.status, c.expires_at, c.exhausted_at,
+                           c.expired_at, c.warned_one_week, {changed_col} AS changed_at
+                    FROM clients c
+                    JOIN panels p ON c.panel_id = p.id
+                    WHERE p.is_active = 1
+                '''
+                params = []
+                if updated_since is not None:
+                    # >= so rows written in the same second as the last sync are not missed
+                    query += f' AND {changed_col} >= %s'
+                    params.append(updated_since)
+                if service_ids:
+                    query += f" AND c.id IN ({', '.join(['%s'] * len(service_ids))})"
+                    params.extend(service_ids)
+                cursor.execute(query, params)
+                return cursor.fetchall()
+        except Exception as e:
+            logger.error(f"Error getting expiry index rows: {e}")
+            return []
+    
+    def get_services_for_deletion(self, service_ids: List[int] = None) -> List[Dict]:
+        """
+        Get services that should be deleted after 24 hours
+        
+        Args:
+            service_ids: Only check these services (due entries of the expiry index)
+        """
+        if service_ids is not None and not service_ids:
+            return []
         try:
             with self.get_connection() as conn:
                 cursor = conn.cursor(dictionary=True)
                 # Only include services from active panels
-                cursor.execute('''
+                query = '''
                     SELECT c.*, p.name as panel_name, p.default_inbound_id
                     FROM clients c 
                     JOIN panels p ON c.panel_id = p.id 
@@ -3625,22 +4092,33 @@ class ProfessionalDatabaseManager:
                       AND c.status = 'disabled' 
                       AND c.exhausted_at IS NOT NULL
                       AND DATE_ADD(c.exhausted_at, INTERVAL 24 HOUR) < NOW()
-                    ORDER BY c.exhausted_at ASC
-                ''')
+                '''
+                params = []
+                if service_ids:
+                    query += f" AND c.id IN ({', '.join(['%s'] * len(service_ids))})"
+                    params.extend(service_ids)
+                cursor.execute(query + ' ORDER BY c.exhausted_at ASC', params)
                 
                 return [dict(row) for row in cursor.fetchall()]
         except Exception as e:
             logger.error(f"Error getting services for deletion: {e}")
             return []
     
-    def get_expired_plan_services_for_deletion(self) -> List[Dict]:
-        """Get expired plan-based services that should be deleted after 24 hours grace period"""
+    def get_expired_plan_services_for_deletion(self, service_ids: List[int] = None) -> List[Dict]:
+        """
+        Get expired plan-based services that should be deleted after 24 hours grace period
+        
+        Args:
+            service_ids: Only check these services (due entries of the expiry index)
+        """
+        if service_ids is not None and not service_ids:
+            return []
         try:
             with self.get_connection() as conn:
                 cursor = conn.cursor(dictionary=True)
                 # Only include plan-based services (with product_id) from active panels
                 # that have expired and passed the grace period
-                cursor.execute('''
+                query = '''
                     SELECT c.*, p.name as panel_name, p.default_inbound_id
                     FROM clients c 
                     JOIN panels p ON c.panel_id = p.id 
@@ -3649,8 +4127,12 @@ class ProfessionalDatabaseManager:
                       AND c.expired_at IS NOT NULL
                       AND c.status = 'disabled'
                       AND DATE_ADD(c.expired_at, INTERVAL 24 HOUR) < NOW()
-                    ORDER BY c.expired_at ASC
-                ''')
+                '''
+                params = []
+                if service_ids:
+                    query += f" AND c.id IN ({', '.join(['%s'] * len(service_ids))})"
+                    params.extend(service_ids)
+                cursor.execute(query + ' ORDER BY c.expired_at ASC', params)
                 
                 return [dict(row) for row in cursor.fetchall()]
         except Exception as e:
@@ -4513,6 +4995,8 @@ class ProfessionalDatabaseManager:
                 
                 query = f"UPDATE panels SET {', '.join(updates)} WHERE id = %s"
                 cursor.execute(query, params)
+                if 'panel_type' in settings:
+                    self._recompute_subscription_links(cursor, 'WHERE c.panel_id = %s', (panel_id,))
                 conn.commit()
                 return True
         except Exception as e:
@@ -4761,27 +5245,168 @@ class ProfessionalDatabaseManager:
             logger.error(f"Error getting reserved services: {e}")
             return []
     
-    def get_all_services_paginated(self, page: int = 1, per_page: int = 10, search: str = None) -> Tuple[List[Dict], int]:
-        """Get all services with pagination and optional search"""
+    # ==================== Admin listing pagination ====================
+    
+    # Above this many rows the unfiltered listing total comes from table statistics
+    APPROX_COUNT_THRESHOLD = 50000
+    # Filtered (search) totals stop counting at this many matches
+    SEARCH_COUNT_CAP = 10000
+    # Minimum term length the ngram FULLTEXT parser can match (ngram_token_size)
+    FULLTEXT_MIN_TERM = 2
+    
+    @staticmethod
+    def encode_page_cursor(row: Optional[Dict]) -> Optional[str]:
+        """Build an opaque keyset cursor from a listing row's (created_at, id)"""
+        if not row or not row.get('created_at') or row.get('id') is None:
+            return None
+        return f"{row['created_at'].strftime('%Y%m%d%H%M%S')}_{row['id']}"
+    
+    @staticmethod
+    def _decode_page_cursor(token: Optional[str]) -> Optional[Tuple[datetime, int]]:
+        """Parse a cursor from encode_page_cursor(); invalid cursors are ignored"""
+        if not token:
+            return None
+        try:
+            created_part, id_part = token.split('_', 1)
+            return datetime.strptime(created_part, '%Y%m%d%H%M%S'), int(id_part)
+        except (ValueError, TypeError):
+            return None
+    
+    def _has_fulltext_index(self, cursor, table: str) -> bool:
+        """Check (once per table) whether a FULLTEXT search index exists"""
+        cache = self._fulltext_tables
+        if table not in cache:
+            try:
+                cursor.execute('''
+                    SELECT 1 FROM INFORMATION_SCHEMA.STATISTICS
+                    WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND INDEX_TYPE = 'FULLTEXT'
+                    LIMIT 1
+                ''', (table,))
+                cache[table] = cursor.fetchone() is not None
+            except Exception as e:
+                logger.debug(f"Could not check FULLTEXT index on {table}: {e}")
+                cache[table] = False
+        return cache[table]
+    
+    def _fulltext_phrase(self, search: str) -> Optional[str]:
+        """Turn user input into a BOOLEAN MODE phrase, or None if too short for ngram search"""
+        cleaned = ' '.join(''.join(' ' if ch in '+-<>()~*"@' else ch for ch in search).split())
+        if len(cleaned) < self.FULLTEXT_MIN_TERM:
+            return None
+        return f'"{cleaned}"'
+    
+    def _user_match_sql(self, cursor, search: str) -> Tuple[str, List]:
+        """SQL selecting users.id values matching a text search"""
+        phrase = self._fulltext_phrase(search) if self._has_fulltext_index(cursor, 'users') else None
+        if phrase:
+            return ('SELECT id FROM users WHERE MATCH(username, first_name, last_name) AGAINST (%s IN BOOLEAN MODE)',
+                    [phrase])
+        pattern = f'%{search}%'
+        return ('SELECT id FROM users WHERE username LIKE %s OR first_name LIKE %s OR last_name LIKE %s',
+                [pattern] * 3)
+    
+    def _has_match(self, cursor, match_sql: str, params: List) -> bool:
+        """Whether an exact-match fast path finds anything (else the search falls back to LIKE)"""
+        cursor.execute(f'SELECT 1 FROM ({match_sql}) m LIMIT 1', params)
+        return cursor.fetchone() is not None
+    
+    def _count_listing_rows(self, cursor, table: str, from_sql: str, where_sql: str,
+                            params: List, searching: bool) -> int:
+        """
+        Count rows for an admin listing without scanning large tables twice
+        
+        Unfiltered listings over APPROX_COUNT_THRESHOLD use the InnoDB row estimate,
+        searches stop counting at SEARCH_COUNT_CAP.
+        """
+        if not where_sql:
+            cursor.execute('''
+                SELECT TABLE_ROWS as count FROM INFORMATION_SCHEMA.TABLES
+                WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s
+            ''', (table,))
+            result = cursor.fetchone()
+            estimate = int(result['count'] or 0) if result else 0
+            if estimate >= self.APPROX_COUNT_THRESHOLD:
+                return estimate
+        
+        if searching:
+            cursor.execute(f'SELECT COUNT(*) as count FROM (SELECT 1 FROM {from_sql} {where_sql} LIMIT %s) t',
+                           params + [self.SEARCH_COUNT_CAP])
+        else:
+            cursor.execute(f'SELECT COUNT(*) as count FROM {from_sql} {where_sql}', params)
+        result = cursor.fetchone()
+        return int(result['count']) if result else 0
+    
+    def _fetch_listing_page(self, cursor, select_sql: str, from_sql: str, where_clauses: List[str],
+                            params: List, alias: str, page: int, per_page: int,
+                            after: str = None, before: str = None) -> List[Dict]:
+        """
+        Fetch one page ordered by (created_at, id) DESC
+        
+        With an `after`/`before` cursor the page is located by keyset seek, so deep
+        pages cost the same as the first one. Without a cursor OFFSET is used.
+        """
+        clauses = list(where_clauses)
+        page_params = list(params)
+        order = 'DESC'
+        offset = 0
+        
+        after_key = self._decode_page_cursor(after)
+        before_key = None if after_key else self._decode_page_cursor(before)
+        if after_key:
+            clauses.append(f'({alias}.created_at, {alias}.id) < (%s, %s)')
+            page_params.extend(after_key)
+        elif before_key:
+            clauses.append(f'({alias}.created_at, {alias}.id) > (%s, %s)')
+            page_params.extend(before_key)
+            order = 'ASC'
+        else:
+            offset = max(page - 1, 0) * per_page
+        
+        where_sql = (' WHERE ' + ' AND '.join(clauses)) if clauses else ''
+        cursor.execute(
+            f'SELECT {select_sql} FROM {from_sql}{where_sql} '
+            f'ORDER BY {alias}.created_at {order}, {alias}.id {order} LIMIT %s OFFSET %s',
+            page_params + [per_page, offset]
+        )
+        rows = [dict(row) for row in cursor.fetchall()]
+        if before_key:
+            rows.reverse()
+        return rows
+    
+    def get_all_services_paginated(self, page: int = 1, per_page: int = 10, search: str = None,
+                                   after: str = None, before: str = None) -> Tuple[List[Dict], int]:
+        """
+        Get all services with pagination and optional search
+        
+        Args:
+            page: Page number (used with OFFSET when no cursor is given)
+            per_page: Rows per page
+            search: Client name, username/name, panel name or Telegram ID (exact, else partial)
+            after: Cursor of the last row of the previous page (next page)
+            before: Cursor of the first row of the following page (previous page)
+        """
         try:
             with self.get_connection() as conn:
                 cursor = conn.cursor(dictionary=True)
                 
-                # Build query with optional search
-                query = '''
-                    SELECT c.*, p.name as panel_name, u.telegram_id, u.username, u.first_name, u.last_name
-                    FROM clients c 
-                    JOIN panels p ON c.panel_id = p.id 
-                    JOIN users u ON c.user_id = u.id
-                '''
-                
+                from_sql = '''clients c
+                    JOIN panels p ON c.panel_id = p.id
+                    JOIN users u ON c.user_id = u.id'''
+                count_from_sql = 'clients c'
                 where_clauses = []
                 params = []
                 
+                # SECURITY: Sanitize and limit search input length
+                search = search.strip()[:100] if search else ''
                 if search:
-                    # SECURITY: Sanitize and limit search input length
-                    search = search.strip()[:100]  # Limit to 100 characters
-                    if search:
+                    # Telegram ID fast path: unique index lookup instead of a LIKE scan
+                    exact_sql = '''SELECT c2.id FROM clients c2
+                        JOIN users u2 ON c2.user_id = u2.id WHERE u2.telegram_id = %s'''
+                    if search.isdigit() and self._has_match(cursor, exact_sql, [int(search)]):
+                        match_sql = exact_sql
+                        params = [int(search)]
+                    elif search.isdigit():
+                        # Partial Telegram ID or digits in a name
                         search_pattern = f'%{search}%'
                         where_clauses.append('''
                             (c.client_name LIKE %s OR 
@@ -4791,123 +5416,172 @@ class ProfessionalDatabaseManager:
                              u.last_name LIKE %s OR
                              p.name LIKE %s)
                         ''')
-                        params.extend([search_pattern] * 6)
-                
-                if where_clauses:
-                    query += ' WHERE ' + ' AND '.join(where_clauses)
-                
-                # Get total count
-                count_query = query.replace('SELECT c.*, p.name as panel_name, u.telegram_id, u.username, u.first_name, u.last_name', 'SELECT COUNT(*) as count')
-                cursor.execute(count_query, params)
-                result = cursor.fetchone()
-                total = result['count'] if result else 0
-                
-                # Get paginated results
-                query += ' ORDER BY c.created_at DESC LIMIT %s OFFSET %s'
-                params.extend([per_page, (page - 1) * per_page])
-                cursor.execute(query, params)
-                
-                services = [dict(row) for row in cursor.fetchall()]
+                        params = [search_pattern] * 6
+                    else:
+                        phrase = self._fulltext_phrase(search) if self._has_fulltext_index(cursor, 'clients') else None
+                        if phrase:
+                            name_sql = 'SELECT id FROM clients WHERE MATCH(client_name) AGAINST (%s IN BOOLEAN MODE)'
+                            name_params = [phrase]
+                        else:
+                            name_sql = 'SELECT id FROM clients WHERE client_name LIKE %s'
+                            name_params = [f'%{search}%']
+                        user_sql, user_params = self._user_match_sql(cursor, search)
+                        match_sql = f'''{name_sql}
+                            UNION SELECT id FROM clients WHERE user_id IN ({user_sql})
+                            UNION SELECT id FROM clients WHERE panel_id IN (SELECT id FROM panels WHERE name LIKE %s)'''
+                        params = name_params + user_params + [f'%{search}%']
+                    if where_clauses:
+                        count_from_sql = from_sql
+                    else:
+                        from_sql = f'({match_sql}) m JOIN {from_sql} ON c.id = m.id'
+                        count_from_sql = f'({match_sql}) m'
+                
+                where_sql = (' WHERE ' + ' AND '.join(where_clauses)) if where_clauses else ''
+                total = self._count_listing_rows(cursor, 'clients', count_from_sql, where_sql, params, bool(search))
+                services = self._fetch_listing_page(
+                    cursor,
+                    'c.*, p.name as panel_name, u.telegram_id, u.username, u.first_name, u.last_name',
+                    from_sql, where_clauses, params, 'c', page, per_page, after, before
+                )
                 return services, total
         except Exception as e:
             logger.error(f"Error getting paginated services: {e}")
             return [], 0
     
-    def get_gateway_invoices_paginated(self, page: int = 1, per_page: int = 10, search: str = None, status_filter: str = None) -> Tuple[List[Dict], int]:
-        """Get gateway invoices with pagination and optional search"""
+    def get_gateway_invoices_paginated(self, page: int = 1, per_page: int = 10, search: str = None,
+                                       status_filter: str = None, after: str = None,
+                                       before: str = None) -> Tuple[List[Dict], int]:
+        """
+        Get gateway invoices with pagination and optional search
+        
+        Args:
+            page: Page number (used with OFFSET when no cursor is given)
+            per_page: Rows per page
+            search: Invoice ID, order/transaction ID, amount, user name, panel name or Telegram ID
+                (IDs match exactly via indexes, else partially)
+            status_filter: 'successful', 'pending' or None for all
+            after: Cursor of the last row of the previous page (next page)
+            before: Cursor of the first row of the following page (previous page)
+        """
         try:
             with self.get_connection() as conn:
                 cursor = conn.cursor(dictionary=True)
                 
-                # Build query with optional search and status filter
-                query = '''
-                    SELECT i.*, u.telegram_id, u.username, u.first_name, u.last_name, p.name as panel_name
-                    FROM invoices i 
-                    JOIN users u ON i.user_id = u.id 
-                    JOIN panels p ON i.panel_id = p.id
-                    WHERE 1=1
-                '''
-                
+                from_sql = '''invoices i
+                    JOIN users u ON i.user_id = u.id
+                    JOIN panels p ON i.panel_id = p.id'''
+                count_from_sql = 'invoices i'
+                where_clauses = []
                 params = []
                 
                 # Status filter
-                if status_filter:
-                    if status_filter == 'successful':
-                        query += " AND i.status IN ('paid', 'completed')"
-                    elif status_filter == 'pending':
-                        query += " AND i.status IN ('pending', 'pending_approval')"
-                    elif status_filter == 'all':
-                        pass  # Show all
+                if status_filter == 'successful':
+                    where_clauses.append("i.status IN ('paid', 'completed')")
+                elif status_filter == 'pending':
+                    where_clauses.append("i.status IN ('pending', 'pending_approval')")
                 
+                # SECURITY: Sanitize and limit search input length
+                search = search.strip()[:100] if search else ''
                 if search:
-                    # SECURITY: Sanitize and limit search input length
-                    search = search.strip()[:100]  # Limit to 100 characters
-                    if search:
-                        search_pattern = f'%{search}%'
-                        query += ''' AND (
-                            CAST(i.id AS CHAR) LIKE %s OR
-                            i.order_id LIKE %s OR
-                            i.transaction_id LIKE %s OR
-                            CAST(i.amount AS CHAR) LIKE %s OR
-                            u.username LIKE %s OR
-                            CAST(u.telegram_id AS CHAR) LIKE %s OR
-                            u.first_name LIKE %s OR
-                            u.last_name LIKE %s OR
-                            p.name LIKE %s
-                        )'''
-                        params.extend([search_pattern] * 9)
-                
-                # Get total count
-                count_query = query.replace('SELECT i.*, u.telegram_id, u.username, u.first_name, u.last_name, p.name as panel_name', 'SELECT COUNT(*) as count')
-                cursor.execute(count_query, params)
-                result = cursor.fetchone()
-                total = result['count'] if result else 0
-                
-                # Get paginated results
-                query += ' ORDER BY i.created_at DESC LIMIT %s OFFSET %s'
-                params.extend([per_page, (page - 1) * per_page])
-                cursor.execute(query, params)
-                
-                invoices = [dict(row) for row in cursor.fetchall()]
+                    match_sql = None
+                    if any(ch.isdigit() for ch in search):
+                        # ID fast path: invoice ID, order/transaction ID or Telegram ID via indexes
+                        exact_sql = '''SELECT id FROM invoices WHERE order_id = %s
+                            UNION SELECT id FROM invoices WHERE transaction_id = %s'''
+                        exact_params = [search, search]
+                        if search.isdigit():
+                            exact_sql += '''
+                            UNION SELECT id FROM invoices WHERE id = %s
+                            UNION SELECT i2.id FROM invoices i2
+                                JOIN users u2 ON i2.user_id = u2.id WHERE u2.telegram_id = %s'''
+                            exact_params += [int(search), int(search)]
+                        if self._has_match(cursor, exact_sql, exact_params):
+                            match_sql, params = exact_sql, exact_params
+                        else:
+                            # Partial IDs, amounts and Telegram IDs
+                            search_pattern = f'%{search}%'
+                            where_clauses.append('''(
+                                CAST(i.id AS CHAR) LIKE %s OR
+                                i.order_id LIKE %s OR
+                                i.transaction_id LIKE %s OR
+                                CAST(i.amount AS CHAR) LIKE %s OR
+                                u.username LIKE %s OR
+                                CAST(u.telegram_id AS CHAR) LIKE %s OR
+                                u.first_name LIKE %s OR
+                                u.last_name LIKE %s OR
+                                p.name LIKE %s
+                            )''')
+                            params = [search_pattern] * 9
+                            count_from_sql = from_sql
+                    else:
+                        user_sql, user_params = self._user_match_sql(cursor, search)
+                        match_sql = f'''SELECT id FROM invoices WHERE order_id = %s
+                            UNION SELECT id FROM invoices WHERE transaction_id = %s
+                            UNION SELECT id FROM invoices WHERE user_id IN ({user_sql})
+                            UNION SELECT id FROM invoices WHERE panel_id IN (SELECT id FROM panels WHERE name LIKE %s)'''
+                        params = [search, search] + user_params + [f'%{search}%']
+                    if match_sql:
+                        from_sql = f'({match_sql}) m JOIN {from_sql} ON i.id = m.id'
+                        count_from_sql = f'({match_sql}) m JOIN invoices i ON i.id = m.id'
+                
+                where_sql = (' WHERE ' + ' AND '.join(where_clauses)) if where_clauses else ''
+                total = self._count_listing_rows(cursor, 'invoices', count_from_sql, where_sql, params, bool(search))
+                invoices = self._fetch_listing_page(
+                    cursor,
+                    'i.*, u.telegram_id, u.username, u.first_name, u.last_name, p.name as panel_name',
+                    from_sql, where_clauses, params, 'i', page, per_page, after, before
+                )
                 return invoices, total
         except Exception as e:
             logger.error(f"Error getting paginated gateway invoices: {e}")
             return [], 0
     
-    def get_all_users_paginated(self, page: int = 1, per_page: int = 10, search: str = None) -> Tuple[List[Dict], int]:
-        """Get all users with pagination and optional search"""
+    def get_all_users_paginated(self, page: int = 1, per_page: int = 10, search: str = None,
+                                after: str = None, before: str = None) -> Tuple[List[Dict], int]:
+        """
+        Get all users with pagination and optional search
+        
+        Args:
+            page: Page number (used with OFFSET when no cursor is given)
+            per_page: Rows per page
+            search: Username/name or Telegram ID (exact, else partial)
+            after: Cursor of the last row of the previous page (next page)
+            before: Cursor of the first row of the following page (previous page)
+        """
         try:
             with self.get_connection() as conn:
                 cursor = conn.cursor(dictionary=True)
                 
-                query = 'SELECT * FROM users'
+                where_clauses = []
                 params = []
                 
+                # SECURITY: Sanitize and limit search input length
+                search = search.strip()[:100] if search else ''
                 if search:
-                    # SECURITY: Sanitize and limit search input length
-                    search = search.strip()[:100]  # Limit to 100 characters
-                    if search:
+                    if search.isdigit() and self._has_match(
+                            cursor, 'SELECT id FROM users WHERE telegram_id = %s', [int(search)]):
+                        # Telegram ID fast path: unique index lookup instead of a LIKE scan
+                        where_clauses.append('u.telegram_id = %s')
+                        params = [int(search)]
+                    elif search.isdigit():
+                        # Partial Telegram ID or digits in a name
                         search_pattern = f'%{search}%'
-                        query += ''' WHERE (
-                            username LIKE %s OR
-                            CAST(telegram_id AS CHAR) LIKE %s OR
-                            first_name LIKE %s OR
-                            last_name LIKE %s
-                        )'''
-                        params.extend([search_pattern] * 4)
-                
-                # Get total count
-                count_query = query.replace('SELECT *', 'SELECT COUNT(*) as count')
-                cursor.execute(count_query, params)
-                result = cursor.fetchone()
-                total = result['count'] if result else 0
-                
-                # Get paginated results
-                query += ' ORDER BY created_at DESC LIMIT %s OFFSET %s'
-                params.extend([per_page, (page - 1) * per_page])
-                cursor.execute(query, params)
+                        where_clauses.append('''(
+                            u.username LIKE %s OR
+                            CAST(u.telegram_id AS CHAR) LIKE %s OR
+                            u.first_name LIKE %s OR
+                            u.last_name LIKE %s
+                        )''')
+                        params = [search_pattern] * 4
+                    else:
+                        user_sql, params = self._user_match_sql(cursor, search)
+                        where_clauses.append(f'u.id IN ({user_sql})')
                 
-                users = [dict(row) for row in cursor.fetchall()]
+                where_sql = (' WHERE ' + ' AND '.join(where_clauses)) if where_clauses else ''
+                total = self._count_listing_rows(cursor, 'users', 'users u', where_sql, params, bool(search))
+                users = self._fetch_listing_page(
+                    cursor, 'u.*', 'users u', where_clauses, params, 'u', page, per_page, after, before
+                )
                 return users, total
         except Exception as e:
             logger.error(f"Error getting paginated users: {e}")
@@ -5645,13 +6319,63 @@ class ProfessionalDatabaseManager:
                         updated_at = CURRENT_TIMESTAMP
                     WHERE client_uuid = %s
                 ''', (new_panel_id, new_inbound_id, new_uuid, new_sub_id, new_config_link, old_uuid))
+                moved = cursor.rowcount > 0
+                self._recompute_subscription_links(cursor, 'WHERE c.panel_id = %s AND c.client_uuid = %s',
+                                                   (new_panel_id, new_uuid))
                 
                 conn.commit()
-                return cursor.rowcount > 0
+                return moved
         except Exception as e:
             logger.error(f"Error updating client panel: {e}")
             return False
 
+    def bulk_update_client_panels(self, new_panel_id: int, migrated: List[Tuple[str, Dict]]) -> int:
+        """
+        Point many clients at a new panel after migration in one statement
+        
+        Args:
+            new_panel_id: Destination panel ID
+            migrated: [(old_uuid, new_client_data), ...] as returned by create_client
+            
+        Returns:
+            Number of rows updated
+            
+        Raises:
+            Exception: The update failed (callers checkpoint only after success)
+        """
+        if not migrated:
+            return 0
+        rows = []
+        for old_uuid, new_client_data in migrated:
+            rows.append((
+                new_panel_id,
+                new_client_data.get('inbound_id', 0),
+                new_client_data.get('id') or new_client_data.get('uuid'),
+                new_client_data.get('sub_id'),
+                new_client_data.get('subscription_url') or new_client_data.get('config_link'),
+                old_uuid
+            ))
+        try:
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.executemany('''
+                    UPDATE clients 
+                    SET panel_id = %s,
+                        inbound_id = %s,
+                        client_uuid = %s,
+                        sub_id = %s,
+                        config_link = %s,
+                        updated_at = CURRENT_TIMESTAMP
+                    WHERE client_uuid = %s
+                ''', rows)
+                moved = cursor.rowcount
+                self._recompute_subscription_links(cursor, 'WHERE c.panel_id = %s', (new_panel_id,))
+                conn.commit()
+                return moved
+        except Exception as e:
+            logger.error(f"Error bulk updating client panels: {e}")
+            raise
+
     # Panel Inbound Management
     def get_panel_inbound(self, panel_id: int, inbound_id: int) -> Optional[Dict]:
         """Get a specific inbound for a panel"""
@@ -5820,3 +6544,7 @@ class ProfessionalDatabaseManager:
         except Error as e:
             logger.error(f"Error deleting prize {prize_id}: {e}")
             return False
+
+
+# Record per-method call counts, latency and slow SQL for every public method
+query_profiler.instrument_class(ProfessionalDatabaseManager, exclude=('get_connection',))
@@ -0,0 +1,144 @@
+"""
+QR Code Rendering Cache
+Renders each config/subscription link to a PNG once and serves it from disk afterwards.
+
+Files are named after the SHA-256 of the link, so the same link always maps to
+the same PNG and the hash doubles as a strong ETag. Reads touch the file's
+mtime; when the directory grows past `max_files` the least recently used PNGs
+are removed. Writes go through a temporary file and os.replace() so concurrent
+workers never serve a half-written image.
+"""
+
+import os
+import time
+import hashlib
+import logging
+import threading
+from io import BytesIO
+from typing import Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class QRCodeCache:
+    """Disk-backed, LRU-bounded QR PNG cache keyed by link hash"""
+
+    def __init__(self, directory: str, max_files: int = 5000, box_size: int = 10, border: int = 5):
+        self.directory = directory
+        self.max_files = max(1, max_files)
+        self.box_size = box_size
+        self.border = border
+        self._lock = threading.Lock()
+        self._writes_since_prune = 0
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+        except OSError as e:
+            logger.error(f"❌ Could not create QR cache directory {self.directory}: {e}")
+
+    @staticmethod
+    def key_for(link: str) -> str:
+        return hashlib.sha256(link.encode('utf-8')).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.png")
+
+    def _render(self, link: str) -> bytes:
+        import qrcode
+
+        qr = qrcode.QRCode(version=1, box_size=self.box_size, border=self.border)
+        qr.add_data(link)
+        qr.make(fit=True)
+        img = qr.make_image(fill_color="black", back_color="white")
+        buffer = BytesIO()
+        img.save(buffer, format='PNG')
+        return buffer.getvalue()
+
+    def _read(self, key: str) -> Optional[bytes]:
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            os.utime(path, None)  # Mark as recently used
+            return data or None
+        except FileNotFoundError:
+            return None
+        except OSError as e:
+            logger.warning(f"⚠️ Could not read cached QR {key}: {e}")
+            return None
+
+    def _write(self, key: str, data: bytes):
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"⚠️ Could not store QR {key}: {e}")
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            return
+
+        with self._lock:
+            self._writes_since_prune += 1
+            # Listing the directory is the expensive part; do it every few writes
+            if self._writes_since_prune < max(1, self.max_files // 20):
+                return
+            self._writes_since_prune = 0
+        self.prune()
+
+    def prune(self):
+        """Remove least recently used PNGs above max_files"""
+        try:
+            entries = []
+            for entry in os.scandir(self.directory):
+                if entry.name.endswith('.png'):
+                    entries.append((entry.stat().st_mtime, entry.path))
+                elif entry.name.endswith('.tmp') and time.time() - entry.stat().st_mtime > 300:
+                    os.remove(entry.path)  # Left behind by a crashed worker
+        except OSError as e:
+            logger.warning(f"⚠️ Could not scan QR cache: {e}")
+            return
+
+        excess = len(entries) - self.max_files
+        if excess <= 0:
+            return
+        entries.sort()
+        removed = 0
+        for _, path in entries[:excess]:
+            try:
+                os.remove(path)
+                removed += 1
+            except OSError:
+                pass
+        logger.info(f"🧹 QR cache pruned {removed} least recently used images")
+
+    def get_png(self, link: str) -> Tuple[bytes, str]:
+        """
+        PNG for a link, rendered on first use
+
+        Returns:
+            (png_bytes, etag) - etag is the link hash, quoted
+        """
+        key = self.key_for(link)
+        data = self._read(key)
+        if data is None:
+            data = self._render(link)
+            self._write(key, data)
+        return data, f'"{key}"'
+
+
+def _create_qr_cache() -> QRCodeCache:
+    try:
+        from config import QR_CACHE_CONFIG
+    except ImportError:
+        QR_CACHE_CONFIG = {}
+    directory = QR_CACHE_CONFIG.get('directory') or os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), 'cache', 'qr')
+    return QRCodeCache(directory, max_files=QR_CACHE_CONFIG.get('max_files', 5000))
+
+
+# Global instance
+qr_cache = _create_qr_cache()
@@ -0,0 +1,264 @@
+"""
+Database Query Profiler for VPN Bot
+Records per-method call counts, latency percentiles and rows returned for
+ProfessionalDatabaseManager, and keeps the SQL text of slow queries.
+Designed to stay enabled in production: one thread-local push/pop per method
+call and two perf_counter() reads per executed statement.
+"""
+
+import time
+import threading
+import functools
+import logging
+from collections import deque
+from datetime import datetime
+from typing import Dict, List, Optional, Any
+
+logger = logging.getLogger(__name__)
+
+
+class MethodStats:
+    """Aggregated timing for one database method"""
+
+    SAMPLE_SIZE = 256  # Latency samples kept per method for percentiles
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.queries = 0
+        self.rows = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.samples = deque(maxlen=self.SAMPLE_SIZE)
+
+    def percentile(self, pct: float) -> float:
+        """Latency percentile (ms) over the recent samples"""
+        if not self.samples:
+            return 0.0
+        ordered = sorted(self.samples)
+        index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+        return ordered[index]
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'calls': self.calls,
+            'errors': self.errors,
+            'queries': self.queries,
+            'rows': self.rows,
+            'total_ms': round(self.total_ms, 2),
+            'avg_ms': round(self.total_ms / self.calls, 2) if self.calls else 0,
+            'p50_ms': round(self.percentile(50), 2),
+            'p95_ms': round(self.percentile(95), 2),
+            'p99_ms': round(self.percentile(99), 2),
+            'max_ms': round(self.max_ms, 2),
+        }
+
+
+class QueryProfiler:
+    """Collects per-method database timing and a slow-query log"""
+
+    def __init__(self, enabled: bool = True, slow_query_ms: float = 200, slow_log_size: int = 100):
+        """
+        Initialize profiler
+
+        Args:
+            enabled: Whether connections and methods are instrumented
+            slow_query_ms: Statements slower than this are kept with their SQL text
+            slow_log_size: Number of slow queries kept
+        """
+        self.enabled = enabled
+        self.slow_query_ms = slow_query_ms
+        self.methods: Dict[str, MethodStats] = {}
+        self.slow_queries = deque(maxlen=slow_log_size)
+        self.started_at = datetime.now()
+        self.lock = threading.Lock()
+        self._local = threading.local()
+
+    # ==================== Method scope ====================
+
+    def _stack(self) -> List[List]:
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def current_method(self) -> Optional[str]:
+        """Name of the innermost instrumented method on this thread"""
+        stack = self._stack()
+        return stack[-1][0] if stack else None
+
+    def instrument(self, name: str, func):
+        """Wrap a method so its calls, latency and queries are recorded under `name`"""
+        profiler = self
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not profiler.enabled:
+                return func(*args, **kwargs)
+            stack = profiler._stack()
+            frame = [name, 0, 0]  # [method, queries, rows]
+            stack.append(frame)
+            start = time.perf_counter()
+            failed = False
+            try:
+                return func(*args, **kwargs)
+            except Exception:
+                failed = True
+                raise
+            finally:
+                duration_ms = (time.perf_counter() - start) * 1000
+                stack.pop()
+                profiler._record_method(name, duration_ms, frame[1], frame[2], failed)
+
+        return wrapper
+
+    def instrument_class(self, cls, exclude: tuple = ()):
+        """Instrument every public method defined on a class"""
+        for attr, value in list(vars(cls).items()):
+            if attr.startswith('_') or attr in exclude or not callable(value):
+                continue
+            if isinstance(value, (staticmethod, classmethod)):
+                continue
+            setattr(cls, attr, self.instrument(attr, value))
+        return cls
+
+    # ==================== Recording ====================
+
+    def _record_method(self, name: str, duration_ms: float, queries: int, rows: int, failed: bool):
+        with self.lock:
+            stats = self.methods.get(name)
+            if stats is None:
+                stats = self.methods[name] = MethodStats()
+            stats.calls += 1
+            stats.queries += queries
+            stats.rows += rows
+            stats.total_ms += duration_ms
+            stats.samples.append(duration_ms)
+            if duration_ms > stats.max_ms:
+                stats.max_ms = duration_ms
+            if failed:
+                stats.errors += 1
+
+    def record_query(self, sql: Any, duration_ms: float, rows: int):
+        """Record one executed statement against the current method"""
+        stack = self._stack()
+        if stack:
+            frame = stack[-1]
+            frame[1] += 1
+            frame[2] += max(rows, 0)
+            method = frame[0]
+        else:
+            # Direct get_connection() use outside the manager (webapp routes, monitors)
+            method = None
+            self._record_method('<direct>', duration_ms, 1, max(rows, 0), False)
+
+        if duration_ms >= self.slow_query_ms:
+            text = sql.decode('utf-8', 'replace') if isinstance(sql, (bytes, bytearray)) else str(sql)
+            self.slow_queries.append({
+                'method': method or '<direct>',
+                'sql': ' '.join(text.split())[:1000],
+                'duration_ms': round(duration_ms, 2),
+                'rows': rows,
+                'at': datetime.now().isoformat(timespec='seconds'),
+            })
+
+    # ==================== Reporting ====================
+
+    def snapshot(self, top: int = 20, sort_by: str = 'total_ms') -> Dict[str, Any]:
+        """
+        Get current statistics
+
+        Args:
+            top: Number of methods to include
+            sort_by: MethodStats field to rank methods by (total_ms, p99_ms, calls, ...)
+        """
+        with self.lock:
+            methods = {name: stats.to_dict() for name, stats in self.methods.items()}
+            slow = list(self.slow_queries)
+
+        ranked = sorted(methods.items(), key=lambda item: item[1].get(sort_by, 0), reverse=True)[:top]
+        return {
+            'enabled': self.enabled,
+            'since': self.started_at.isoformat(timespec='seconds'),
+            'slow_query_ms': self.slow_query_ms,
+            'total_calls': sum(m['calls'] for m in methods.values()),
+            'total_queries': sum(m['queries'] for m in methods.values()),
+            'methods': [{'method': name, **stats} for name, stats in ranked],
+            'slow_queries': slow[-top:],
+        }
+
+    def reset(self):
+        """Clear collected statistics"""
+        with self.lock:
+            self.methods.clear()
+            self.slow_queries.clear()
+            self.started_at = datetime.now()
+
+
+class InstrumentedCursor:
+    """Cursor proxy that times execute()/executemany()"""
+
+    __slots__ = ('_cursor', '_profiler')
+
+    def __init__(self, cursor, profiler: QueryProfiler):
+        self._cursor = cursor
+        self._profiler = profiler
+
+    def execute(self, operation, params=None, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return self._cursor.execute(operation, params, *args, **kwargs)
+        finally:
+            self._profiler.record_query(operation, (time.perf_counter() - start) * 1000,
+                                        getattr(self._cursor, 'rowcount', 0) or 0)
+
+    def executemany(self, operation, seq_params, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return self._cursor.executemany(operation, seq_params, *args, **kwargs)
+        finally:
+            self._profiler.record_query(operation, (time.perf_counter() - start) * 1000,
+                                        getattr(self._cursor, 'rowcount', 0) or 0)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._cursor.close()
+        return False
+
+
+class InstrumentedConnection:
+    """Connection proxy whose cursors report to the profiler"""
+
+    __slots__ = ('_conn', '_profiler')
+
+    def __init__(self, conn, profiler: QueryProfiler):
+        self._conn = conn
+        self._profiler = profiler
+
+    def cursor(self, *args, **kwargs):
+        return InstrumentedCursor(self._conn.cursor(*args, **kwargs), self._profiler)
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+
+def _create_profiler() -> QueryProfiler:
+    """Create the process-wide profiler from DB_PROFILING_CONFIG"""
+    try:
+        from config import DB_PROFILING_CONFIG
+        return QueryProfiler(enabled=DB_PROFILING_CONFIG.get('enabled', True),
+                             slow_query_ms=DB_PROFILING_CONFIG.get('slow_query_ms', 200))
+    except ImportError:
+        return QueryProfiler()
+
+
+# Global profiler instance
+query_profiler = _create_profiler()
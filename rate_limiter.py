@@ -0,0 +1,240 @@
+"""
+Request Rate Limiter
+GCRA rate limiting with a fixed memory footprint, shared by all gunicorn workers.
+
+GCRA (generic cell rate algorithm) keeps one number per key: the theoretical
+arrival time (TAT) of the next request. Each allowed request pushes TAT
+forward by window / max_requests, and a request is refused when that would put
+TAT more than one window ahead of now. The result is "max_requests per
+window_seconds" with bursts of up to max_requests, checked in O(1) time with
+16 bytes per key - no per-request timestamp lists to rebuild or clean.
+
+Keys are stored in a fixed table of slots. By default the table is a
+memory-mapped file (on /dev/shm when available) so every worker process
+enforces the same limits. The table is set associative: a key hashes to a
+bucket of WAYS slots and, when the bucket is full, the slot with the oldest
+TAT - the key that has gone longest without a request - is reused. A scan from
+many IPs can only evict idle keys; it can never grow memory. Buckets are locked
+with fcntl byte-range locks across processes plus a thread lock inside one
+process (fcntl locks do not exclude threads of the same process).
+
+When the shared file cannot be opened the limiter falls back to an
+in-process LRU table of the same size.
+"""
+
+import os
+import time
+import mmap
+import struct
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Dict, Optional, Tuple, Any
+
+try:
+    import fcntl
+except ImportError:  # Windows - no shared table
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+_SLOT = struct.Struct('<Qd')  # key hash, TAT (unix time)
+
+
+def _hash_key(key: str) -> int:
+    """64-bit key hash; 0 marks an empty slot"""
+    return int.from_bytes(hashlib.blake2b(key.encode('utf-8'), digest_size=8).digest(), 'little') or 1
+
+
+def _gcra(tat: float, now: float, max_requests: int, window_seconds: float) -> Tuple[bool, float, float]:
+    """(allowed, new_tat, retry_after) for one request against a stored TAT"""
+    new_tat = max(tat, now) + window_seconds / max_requests
+    if new_tat - now > window_seconds:
+        return False, tat, new_tat - window_seconds - now
+    return True, new_tat, 0.0
+
+
+class LocalRateLimitStore:
+    """Per-process LRU table of key hash → TAT"""
+
+    shared = False
+
+    def __init__(self, max_keys: int):
+        self.max_keys = max_keys
+        self._tats: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def hit(self, key_hash: int, now: float, max_requests: int, window_seconds: float) -> Tuple[bool, float, bool]:
+        """(allowed, retry_after, evicted)"""
+        with self._lock:
+            tat = self._tats.pop(key_hash, 0.0)
+            allowed, tat, retry_after = _gcra(tat, now, max_requests, window_seconds)
+            self._tats[key_hash] = tat
+            evicted = False
+            if len(self._tats) > self.max_keys:
+                _, evicted_tat = self._tats.popitem(last=False)
+                evicted = evicted_tat > now  # Only a key still being limited counts
+            return allowed, retry_after, evicted
+
+    def reset(self, key_hash: int):
+        with self._lock:
+            self._tats.pop(key_hash, None)
+
+    def active_keys(self, now: float) -> int:
+        with self._lock:
+            return sum(1 for tat in self._tats.values() if tat > now)
+
+
+class SharedRateLimitStore:
+    """Set-associative key hash → TAT table in a memory-mapped file shared by all workers"""
+
+    shared = True
+    WAYS = 8
+
+    def __init__(self, path: str, max_keys: int):
+        self.path = path
+        self.buckets = max(1, max_keys // self.WAYS)
+        self.max_keys = self.buckets * self.WAYS
+        self._bucket_bytes = self.WAYS * _SLOT.size
+        size = self.buckets * self._bucket_bytes
+
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        fcntl.lockf(self._fd, fcntl.LOCK_EX)
+        try:
+            if os.fstat(self._fd).st_size != size:
+                # New file, or max_keys changed - start from an empty table
+                os.ftruncate(self._fd, 0)
+                os.ftruncate(self._fd, size)
+        finally:
+            fcntl.lockf(self._fd, fcntl.LOCK_UN)
+        self._map = mmap.mmap(self._fd, size)
+        self._lock = threading.Lock()
+        os.register_at_fork(after_in_child=self._reset_thread_lock)
+
+    def _reset_thread_lock(self):
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def _locked(self, bucket: int):
+        with self._lock:
+            fcntl.lockf(self._fd, fcntl.LOCK_EX, self._bucket_bytes, bucket * self._bucket_bytes)
+            try:
+                yield
+            finally:
+                fcntl.lockf(self._fd, fcntl.LOCK_UN, self._bucket_bytes, bucket * self._bucket_bytes)
+
+    def hit(self, key_hash: int, now: float, max_requests: int, window_seconds: float) -> Tuple[bool, float, bool]:
+        """(allowed, retry_after, evicted)"""
+        bucket = key_hash % self.buckets
+        base = bucket * self._bucket_bytes
+        with self._locked(bucket):
+            slot_offset = None
+            oldest_offset, oldest_tat, oldest_hash = base, None, 0
+            for way in range(self.WAYS):
+                offset = base + way * _SLOT.size
+                slot_hash, slot_tat = _SLOT.unpack_from(self._map, offset)
+                if slot_hash == key_hash:
+                    slot_offset, tat = offset, slot_tat
+                    break
+                if oldest_tat is None or slot_tat < oldest_tat:
+                    oldest_offset, oldest_tat, oldest_hash = offset, slot_tat, slot_hash
+            evicted = False
+            if slot_offset is None:
+                # Reuse the empty or least recently used slot of the bucket
+                slot_offset, tat = oldest_offset, 0.0
+                evicted = oldest_hash != 0 and oldest_tat > now  # Only a key still being limited counts
+            allowed, tat, retry_after = _gcra(tat, now, max_requests, window_seconds)
+            _SLOT.pack_into(self._map, slot_offset, key_hash, tat)
+            return allowed, retry_after, evicted
+
+    def reset(self, key_hash: int):
+        bucket = key_hash % self.buckets
+        base = bucket * self._bucket_bytes
+        with self._locked(bucket):
+            for way in range(self.WAYS):
+                offset = base + way * _SLOT.size
+                if _SLOT.unpack_from(self._map, offset)[0] == key_hash:
+                    _SLOT.pack_into(self._map, offset, 0, 0.0)
+
+    def active_keys(self, now: float) -> int:
+        # Unlocked snapshot - a torn read only skews the count by a slot or two
+        return sum(1 for slot_hash, tat in _SLOT.iter_unpack(self._map) if slot_hash and tat > now)
+
+
+class RateLimiter:
+    """GCRA limiter over a bounded key table, with per-process metrics"""
+
+    def __init__(self, store):
+        self.store = store
+        self._stats_lock = threading.Lock()
+        self._reset_stats()
+
+    def _reset_stats(self):
+        self.stats = {'allowed': 0, 'limited': 0, 'evictions': 0}
+        self.limited_by_endpoint: Dict[str, int] = {}
+
+    def hit(self, key: str, max_requests: int, window_seconds: float,
+            endpoint: Optional[str] = None) -> Tuple[bool, float]:
+        """
+        Count one request for key
+
+        Returns:
+            (allowed, retry_after_seconds) - retry_after is 0 when allowed
+        """
+        allowed, retry_after, evicted = self.store.hit(
+            _hash_key(key), time.time(), max_requests, window_seconds)
+        with self._stats_lock:
+            self.stats['allowed' if allowed else 'limited'] += 1
+            if evicted:
+                self.stats['evictions'] += 1
+            if not allowed and endpoint:
+                self.limited_by_endpoint[endpoint] = self.limited_by_endpoint.get(endpoint, 0) + 1
+        return allowed, retry_after
+
+    def reset(self, key: str):
+        """Forget a key (e.g. after a successful login)"""
+        self.store.reset(_hash_key(key))
+
+    def reset_stats(self):
+        with self._stats_lock:
+            self._reset_stats()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Counters of this worker process plus occupancy of the (possibly shared) key table"""
+        with self._stats_lock:
+            stats = dict(self.stats)
+            limited_by_endpoint = dict(sorted(self.limited_by_endpoint.items(), key=lambda kv: -kv[1]))
+        return {
+            **stats,
+            'limited_by_endpoint': limited_by_endpoint,
+            'backend': 'shared' if self.store.shared else 'local',
+            'max_keys': self.store.max_keys,
+            'active_keys': self.store.active_keys(time.time()),
+            'pid': os.getpid(),
+        }
+
+
+def _create_rate_limiter() -> RateLimiter:
+    try:
+        from config import RATE_LIMIT_CONFIG
+    except ImportError:
+        RATE_LIMIT_CONFIG = {}
+    max_keys = RATE_LIMIT_CONFIG.get('max_keys', 16384)
+
+    if RATE_LIMIT_CONFIG.get('backend', 'shared') == 'shared' and fcntl is not None:
+        path = RATE_LIMIT_CONFIG.get('shared_path') or os.path.join(
+            '/dev/shm' if os.path.isdir('/dev/shm') else os.path.join(
+                os.path.dirname(os.path.abspath(__file__)), 'cache'),
+            f"ratelimit-{RATE_LIMIT_CONFIG.get('namespace', 'vpn_bot')}")
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            return RateLimiter(SharedRateLimitStore(path, max_keys))
+        except OSError as e:
+            logger.warning(f"⚠️ Shared rate limit table unavailable ({e}), limiting per worker")
+    return RateLimiter(LocalRateLimitStore(max_keys))
+
+
+# Global instance
+rate_limiter = _create_rate_limiter()
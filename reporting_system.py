@@ -77,7 +77,7 @@ class ReportingSystem:
         'system': {
             'name': '🤖 سیستم',
             'icon': '🤖',
-            'report_types': ['bot_start', 'daily_summary', 'weekly_summary']
+            'report_types': ['bot_start', 'daily_summary', 'weekly_summary', 'db_performance']
         }
     }
     
@@ -1030,6 +1030,30 @@ class ReportingSystem:
 ✅ **بکاپ با موفقیت بازگردانی شد**
             """
         
+        elif report_type == "db_performance":
+            method_lines = "\n".join(
+                f"• `{m['method']}`: {m['calls']:,} بار | p50 {m['p50_ms']}ms | p99 {m['p99_ms']}ms | کل {m['total_ms'] / 1000:.1f}s"
+                for m in data.get('methods', [])
+            ) or "—"
+            slow_lines = "\n".join(
+                f"• `{q['method']}` {q['duration_ms']}ms: `{q['sql'][:120]}`"
+                for q in data.get('slow_queries', [])
+            ) or "—"
+            return f"""
+🗄️ **گزارش عملکرد دیتابیس**
+
+⏰ **زمان:** {timestamp}
+📅 **از:** {data.get('since', 'نامشخص')}
+🔢 **فراخوانی‌ها:** {data.get('total_calls', 0):,}
+🧮 **کوئری‌ها:** {data.get('total_queries', 0):,}
+
+🐢 **پرهزینه‌ترین متدها:**
+{method_lines}
+
+⚠️ **کوئری‌های کند (بیش از {data.get('slow_query_ms', 0):g}ms):**
+{slow_lines}
+            """
+        
         else:
             return f"""
 📋 **گزارش عمومی**
@@ -1048,6 +1072,24 @@ class ReportingSystem:
         """Report bot startup"""
         await self.send_report("bot_start", {})
     
+    async def report_db_performance(self, top: int = 10):
+        """Report per-method database timing and recent slow queries"""
+        from query_profiler import query_profiler
+        if not query_profiler.enabled:
+            return
+        snapshot = query_profiler.snapshot(top=top)
+        snapshot['slow_queries'] = snapshot['slow_queries'][-5:]
+        await self.send_report("db_performance", snapshot)
+    
+    async def start_db_performance_reports(self, interval_hours: int = 6):
+        """Send a database performance report every interval_hours"""
+        while True:
+            await asyncio.sleep(interval_hours * 3600)
+            try:
+                await self.report_db_performance()
+            except Exception as e:
+                logger.error(f"Error sending database performance report: {e}")
+    
     async def report_user_registration(self, user_data: Dict, referrer_data: Dict = None):
         """Report new user registration"""
         report_data = user_data.copy()
@@ -13,14 +13,12 @@ from functools import wraps
 from typing import Dict, Optional, Callable, Tuple
 from collections import defaultdict
 from datetime import datetime, timedelta
-from flask import request, session, jsonify, g, Response
+from flask import request, session, jsonify, g, Response, current_app
 import logging
 
-logger = logging.getLogger(__name__)
+from rate_limiter import rate_limiter
 
-# Rate limiting storage (in production, use Redis)
-_rate_limit_storage: Dict[str, list] = defaultdict(list)
-_rate_limit_lock = {}
+logger = logging.getLogger(__name__)
 
 # IP blocking storage - tracks blocked IPs and their unblock time
 _blocked_ips: Dict[str, float] = {}  # IP -> unblock timestamp
@@ -33,19 +31,136 @@ MAX_SUSPICIOUS_ACTIVITIES = 3  # Block after 3 suspicious activities (more aggre
 BLOCK_DURATION_HOURS = 48  # Block for 48 hours (longer block)
 SUSPICIOUS_ACTIVITY_WINDOW = 300  # 5 minutes window
 
-def clean_rate_limit_storage():
-    """Clean old entries from rate limit storage"""
-    current_time = time.time()
-    keys_to_remove = []
-    
-    for key, timestamps in _rate_limit_storage.items():
-        # Keep only entries from last hour
-        _rate_limit_storage[key] = [ts for ts in timestamps if current_time - ts < 3600]
-        if not _rate_limit_storage[key]:
-            keys_to_remove.append(key)
-    
-    for key in keys_to_remove:
-        del _rate_limit_storage[key]
+# ============================================
+# REQUEST PATH FILTER
+# ============================================
+# Substring patterns per attack category, in the order categories are reported
+# (from real scanner traffic in the logs). They are compiled once into a single
+# regex, so a clean request costs one scan of its lowercased path.
+ATTACK_PATTERNS = (
+    ('path_traversal', (
+        '../', '..\\', '%2e%2e%2f', '%2e%2e%5c',  # Basic traversal
+        '....//', '....\\\\',  # Double encoding attempts
+        '%252e%252e%252f',  # Double URL encoding
+        '..%2f', '..%5c',  # Mixed encoding
+        '/../', '\\..\\',  # With separators
+    )),
+    # PHP exploitation attempts (phpinfo, config.php, etc.)
+    ('php_exploitation', (
+        'phpunit', 'eval-stdin', 'phpinfo', 'php://', 'phar://',
+        'vendor/phpunit', 'composer.json', 'composer.lock',
+        'config.php', 'pinfo.php', 'test.php', 'info.php',
+        '?phpinfo', 'phpinfo=-1', 'phpinfo()',
+    )),
+    # WordPress scanning
+    ('wordpress_scanning', (
+        'wp-admin', 'wp-includes', 'wp-content', 'xmlrpc.php',
+        'wlwmanifest.xml', 'wp-config.php', 'wp-login.php',
+    )),
+    # Sensitive file access (.env, .git, robots.txt, etc.)
+    ('sensitive_file_access', (
+        '.env', '.git', '.svn', '.hg', '.bzr',  # Version control
+        '.sql', '.db', '.sqlite', '.sqlite3',  # Databases
+        'config.yaml', 'config.yml', 'docker-compose',  # Config files
+        'credentials', 'secrets', 'private',  # Sensitive names
+        '.backup', 'backup.sql', 'backup.zip', 'backup.tar', 'backup.tgz',  # Backup files
+        '.pem', '.key', '.crt', '.p12', '.pfx',  # Certificates
+        'phpinfo', 'info.php', 'test.php',  # Info disclosure
+        'admin.php', 'login.php', 'config.php',  # Admin files
+        'robots.txt',  # Common scanning target
+        'client_secrets.json',  # OAuth secrets
+        'appsettings.json',  # .NET config
+    )),
+    # CGI/Shell access attempts (/cgi-bin/luci/)
+    ('shell_access_attempt', (
+        '/cgi-bin/', '/bin/sh', '/bin/bash', '/usr/bin/env',
+        'cmd.exe', 'powershell.exe', 'wmic.exe',
+        'cgi-bin/luci', 'cgi-bin/', '/locale',
+    )),
+    # Cisco router exploits
+    ('cisco_exploit', ('/+csco', '/+csce')),
+    # Laravel/Symfony exploits (app_dev.php, _profiler/)
+    ('framework_exploit', (
+        '/.env', '/app_dev.php', '/_profiler/', '/debug/',
+        '/api/.env', '/laravel/.env', '/backend/.env',
+        '/misc/.env', '/content/.env', '/docker/.env',
+        '/env/.env', '/dev/.env', '/cron/.env',
+        '/localhost/.env', '/.gitlab-ci/.env',
+        '/laravel/.env.production', '/local/.env.prod',
+        '/public/.env', '/frontend/.env', '/locally/.env',
+        '/v2/.env', '/lab/.env', '/.vscode/.env',
+        '/.env.backup', '/.env.example',
+    )),
+    # Java exploitation (actuator/gateway/routes)
+    ('java_exploit', (
+        'actuator', '/gateway/routes', '.jar',
+        'spring-boot-actuator', '/actuator/',
+    )),
+    # XDEBUG exploitation attempts (?XDEBUG_SESSION_START=phpstorm)
+    ('xdebug_exploit', ('xdebug', 'xdebug_session')),
+    # Development server scanning (developmentserver/metadatauploader)
+    ('dev_server_scanning', (
+        'developmentserver', 'metadatauploader', 'dev.php',
+        'development', 'staging', 'test.php',
+    )),
+    # HTTP/2.0 protocol attacks (PRI * HTTP/2.0)
+    ('http2_protocol_attack', ('http/2.0', 'pri *')),
+)
+
+# Absolute system paths and Windows drive letters at the start of the path
+_TRAVERSAL_PREFIX = r'\A(?:/(?:etc|proc|sys)/|[a-z]:\\)'
+
+# Legitimate static assets (CSS, JS, images, fonts, icons) are never attack-checked
+STATIC_FILE_EXTENSIONS = ('.css', '.js', '.jpg', '.jpeg', '.png', '.gif', '.svg',
+                          '.woff', '.woff2', '.ttf', '.eot', '.ico', '.webp')
+
+# Only truly sensitive file types are blocked under /static/, not CSS/JS/images
+SENSITIVE_STATIC_PATTERNS = (
+    '.env', '.git', 'config.env', '.sql', '.db', '.sqlite',
+    '.log', '.ini', '.conf', '.key', '.pem', '.p12', '.pfx',
+    '.crt', 'secret', 'private', 'backup', '.bak', 'credentials',
+)
+
+ROOT_SENSITIVE_PATTERNS = ('/.env', '/config.env', '/.git/', '/.env.', '/env.js')
+
+
+def _literal_union(literals) -> str:
+    """
+    Regex source matching any of the literals, factored into a prefix trie.
+    A flat 'a|b|c' alternation makes the regex engine try every pattern at
+    every position; the trie tries one branch per distinct next character.
+    """
+    trie = {}
+    for literal in literals:
+        node = trie
+        for char in literal:
+            node = node.setdefault(char, {})
+        node[''] = {}  # End of a literal
+
+    def build(node) -> str:
+        branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ''
+        body = branches[0] if len(branches) == 1 else f"(?:{'|'.join(branches)})"
+        # A literal may end here: a shorter match is enough for a search
+        return '' if '' in node else body
+
+    return build(trie)
+
+
+_ATTACK_RE = re.compile('|'.join((
+    _TRAVERSAL_PREFIX,
+    _literal_union(p.lower() for _, group in ATTACK_PATTERNS for p in group),
+)))
+_ATTACK_CATEGORY_RES = tuple(
+    (attack_type, re.compile(
+        (_TRAVERSAL_PREFIX + '|' if attack_type == 'path_traversal' else '') + _literal_union(group)))
+    for attack_type, group in ATTACK_PATTERNS
+)
+_TRAVERSAL_RE = _ATTACK_CATEGORY_RES[0][1]
+_STATIC_DIR_RE = re.compile(r'/(?:static|css|js|images)/')
+_SENSITIVE_STATIC_RE = re.compile(_literal_union(SENSITIVE_STATIC_PATTERNS))
+_ROOT_SENSITIVE_RE = re.compile(_literal_union(ROOT_SENSITIVE_PATTERNS))
 
 def rate_limit(max_requests: int = 10, window_seconds: int = 60, key_func: Optional[Callable] = None):
     """
@@ -69,31 +184,19 @@ def rate_limit(max_requests: int = 10, window_seconds: int = 60, key_func: Optio
             # Add route name to key for per-route limiting
             route_key = f"{key}:{request.endpoint}"
             
-            current_time = time.time()
-            
-            # Clean old entries periodically
-            if current_time % 60 < 1:  # Clean every minute
-                clean_rate_limit_storage()
-            
-            # Get timestamps for this key
-            timestamps = _rate_limit_storage[route_key]
-            
-            # Remove old timestamps outside the window
-            timestamps[:] = [ts for ts in timestamps if current_time - ts < window_seconds]
-            
-            # Check if limit exceeded
-            if len(timestamps) >= max_requests:
-                logger.warning(f"Rate limit exceeded for {route_key}: {len(timestamps)} requests in {window_seconds}s")
+            allowed, retry_after = rate_limiter.hit(route_key, max_requests, window_seconds,
+                                                    endpoint=request.endpoint)
+            if not allowed:
+                logger.warning(f"Rate limit exceeded for {route_key}: {max_requests} requests in {window_seconds}s")
                 return jsonify({
                     'success': False,
                     'message': 'Too many requests. Please try again later.',
-                    'retry_after': window_seconds
+                    'retry_after': int(retry_after) + 1
                 }), 429
             
-            # Add current timestamp
-            timestamps.append(current_time)
-            
             return f(*args, **kwargs)
+        # Marks the view for the stricter limit on suspicious IPs in secure_before_request
+        decorated_function.rate_limit = (max_requests, window_seconds)
         return decorated_function
     return decorator
 
@@ -366,32 +469,7 @@ def apply_security_headers(response: Response) -> Response:
 
 def detect_path_traversal(path: str) -> bool:
     """Detect path traversal attacks (../, ..\\, encoded versions)"""
-    path_lower = path.lower()
-    
-    # Check for common path traversal patterns
-    traversal_patterns = [
-        '../', '..\\', '%2e%2e%2f', '%2e%2e%5c',  # Basic traversal
-        '....//', '....\\\\',  # Double encoding attempts
-        '%252e%252e%252f',  # Double URL encoding
-        '..%2f', '..%5c',  # Mixed encoding
-        '/../', '\\..\\',  # With separators
-    ]
-    
-    # Check for excessive directory separators (potential traversal)
-    if path.count('../') > 3 or path.count('..\\') > 3:
-        return True
-    
-    # Check for encoded traversal
-    if any(pattern in path_lower for pattern in traversal_patterns):
-        return True
-    
-    # Check for absolute paths on Windows/Linux
-    if path.startswith('/etc/') or path.startswith('/proc/') or path.startswith('/sys/'):
-        return True
-    if re.match(r'^[a-z]:\\', path_lower):  # Windows drive letters
-        return True
-    
-    return False
+    return _TRAVERSAL_RE.search(path.lower()) is not None
 
 def detect_malformed_request() -> bool:
     """Detect malformed HTTP requests (binary data, invalid characters)"""
@@ -443,100 +521,26 @@ def detect_malformed_request() -> bool:
 def detect_attack_patterns(path: str) -> Tuple[bool, str]:
     """Detect common attack patterns and return (is_attack, attack_type)"""
     path_lower = path.lower()
-    
-    # Path traversal
-    if detect_path_traversal(path):
-        return True, 'path_traversal'
-    
-    # PHP exploitation attempts (from logs: phpinfo, config.php, etc.)
-    php_attack_patterns = [
-        'phpunit', 'eval-stdin', 'phpinfo', 'php://', 'phar://',
-        'vendor/phpunit', 'composer.json', 'composer.lock',
-        'config.php', 'pinfo.php', 'test.php', 'info.php',
-        '?phpinfo', 'phpinfo=-1', 'phpinfo()'
-    ]
-    if any(pattern in path_lower for pattern in php_attack_patterns):
-        return True, 'php_exploitation'
-    
-    # WordPress scanning
-    wp_patterns = [
-        'wp-admin', 'wp-includes', 'wp-content', 'xmlrpc.php',
-        'wlwmanifest.xml', 'wp-config.php', 'wp-login.php'
-    ]
-    if any(pattern in path_lower for pattern in wp_patterns):
-        return True, 'wordpress_scanning'
-    
-    # Sensitive file access (from logs: .env, .git, robots.txt, etc.)
-    sensitive_patterns = [
-        '.env', '.git', '.svn', '.hg', '.bzr',  # Version control
-        '.sql', '.db', '.sqlite', '.sqlite3',  # Databases
-        'config.yaml', 'config.yml', 'docker-compose',  # Config files
-        'credentials', 'secrets', 'private',  # Sensitive names
-        '.backup', 'backup.sql', 'backup.zip', 'backup.tar', 'backup.tgz',  # Backup files
-        '.pem', '.key', '.crt', '.p12', '.pfx',  # Certificates
-        'phpinfo', 'info.php', 'test.php',  # Info disclosure
-        'admin.php', 'login.php', 'config.php',  # Admin files
-        'robots.txt',  # Common scanning target
-        'client_secrets.json',  # OAuth secrets
-        'appsettings.json',  # .NET config
-    ]
-    if any(pattern in path_lower for pattern in sensitive_patterns):
-        return True, 'sensitive_file_access'
-    
-    # CGI/Shell access attempts (from logs: /cgi-bin/luci/)
-    cgi_patterns = [
-        '/cgi-bin/', '/bin/sh', '/bin/bash', '/usr/bin/env',
-        'cmd.exe', 'powershell.exe', 'wmic.exe',
-        'cgi-bin/luci', 'cgi-bin/', '/locale'
-    ]
-    if any(pattern in path_lower for pattern in cgi_patterns):
-        return True, 'shell_access_attempt'
-    
-    # Cisco router exploits
-    if '/+csco' in path_lower or '/+csce' in path_lower:
-        return True, 'cisco_exploit'
-    
-    # Laravel/Symfony exploits (from logs: app_dev.php, _profiler/)
-    laravel_patterns = [
-        '/.env', '/app_dev.php', '/_profiler/', '/debug/',
-        '/api/.env', '/laravel/.env', '/backend/.env',
-        '/misc/.env', '/content/.env', '/docker/.env',
-        '/env/.env', '/Dev/.env', '/cron/.env',
-        '/localhost/.env', '/.gitlab-ci/.env',
-        '/laravel/.env.production', '/local/.env.prod',
-        '/public/.env', '/frontend/.env', '/locally/.env',
-        '/v2/.env', '/lab/.env', '/.vscode/.env',
-        '/.env.backup', '/.env.example'
-    ]
-    if any(pattern in path_lower for pattern in laravel_patterns):
-        return True, 'framework_exploit'
-    
-    # Java exploitation (from logs: actuator/gateway/routes)
-    java_patterns = [
-        'actuator', '/gateway/routes', '.jar',
-        'spring-boot-actuator', '/actuator/'
-    ]
-    if any(pattern in path_lower for pattern in java_patterns):
-        return True, 'java_exploit'
-    
-    # XDEBUG exploitation attempts (from logs: ?XDEBUG_SESSION_START=phpstorm)
-    if 'xdebug' in path_lower or 'xdebug_session' in path_lower:
-        return True, 'xdebug_exploit'
-    
-    # Development server scanning (from logs: developmentserver/metadatauploader)
-    dev_patterns = [
-        'developmentserver', 'metadatauploader', 'dev.php',
-        'development', 'staging', 'test.php'
-    ]
-    if any(pattern in path_lower for pattern in dev_patterns):
-        return True, 'dev_server_scanning'
-    
-    # HTTP/2.0 protocol attacks (from logs: PRI * HTTP/2.0)
-    if 'http/2.0' in path_lower or 'pri *' in path_lower:
-        return True, 'http2_protocol_attack'
-    
+    if _ATTACK_RE.search(path_lower) is None:
+        return False, ''
+    # Attack found - name the first matching category (rare path, may scan again)
+    for attack_type, pattern in _ATTACK_CATEGORY_RES:
+        if pattern.search(path_lower):
+            return True, attack_type
     return False, ''
 
+def is_static_file_path(path_lower: str) -> bool:
+    """Whether a lowercased path is a legitimate static asset (skips attack checks)"""
+    return path_lower.endswith(STATIC_FILE_EXTENSIONS) or _STATIC_DIR_RE.search(path_lower) is not None
+
+def is_sensitive_static_path(path_lower: str) -> bool:
+    """Sensitive file requested under /static/ (e.g. /static/.env, /static/backup.sql)"""
+    return _SENSITIVE_STATIC_RE.search(path_lower) is not None
+
+def is_root_sensitive_path(path_lower: str) -> bool:
+    """Sensitive file requested outside /static/ (e.g. /.env, /.git/config)"""
+    return _ROOT_SENSITIVE_RE.search(path_lower) is not None
+
 def secure_before_request():
     """Comprehensive security check before every request"""
     # Clean expired blocks periodically
@@ -572,42 +576,24 @@ def secure_before_request():
         record_suspicious_activity(client_ip, 'malformed_request', request.path)
         return Response('Bad Request', status=400, mimetype='text/plain')
     
-    # Check for attack patterns
-    path_lower = request.path.lower()
-    
-    # Allow legitimate static files
-    allowed_static_extensions = ['.css', '.js', '.jpg', '.jpeg', '.png', '.gif', '.svg', 
-                                 '.woff', '.woff2', '.ttf', '.eot', '.ico', '.webp']
-    is_static_file = (path_lower.endswith(tuple(allowed_static_extensions)) or 
-                     '/static/' in path_lower or 
-                     '/css/' in path_lower or 
-                     '/js/' in path_lower or 
-                     '/images/' in path_lower)
-    
-    # Only check for attacks if not a legitimate static file
-    if not is_static_file:
+    # Check for attack patterns - only if not a legitimate static file
+    if not is_static_file_path(request.path.lower()):
         is_attack, attack_type = detect_attack_patterns(request.path)
         if is_attack:
             record_suspicious_activity(client_ip, attack_type, request.path)
             return Response('Not Found', status=404, mimetype='text/plain')
     
-    # Additional rate limiting for suspicious IPs
+    # Additional rate limiting for suspicious IPs on rate limited routes
     suspicious_count = get_suspicious_activity_count(client_ip, 60)  # Last minute
     if suspicious_count > 0:
-        # Apply stricter rate limiting for suspicious IPs
-        route_key = f"{client_ip}:{request.endpoint}"
-        current_time = time.time()
-        
-        if route_key in _rate_limit_storage:
-            timestamps = _rate_limit_storage[route_key]
-            timestamps[:] = [ts for ts in timestamps if current_time - ts < 60]
-            
+        view = current_app.view_functions.get(request.endpoint)
+        if getattr(view, 'rate_limit', None):
             # Limit to 2 requests per minute for suspicious IPs
-            if len(timestamps) >= 2:
+            allowed, _ = rate_limiter.hit(f"suspicious:{client_ip}:{request.endpoint}", 2, 60,
+                                          endpoint=request.endpoint)
+            if not allowed:
                 logger.warning(f"Rate limit exceeded for suspicious IP {client_ip} on {request.endpoint}")
                 return Response('Too Many Requests', status=429, mimetype='text/plain')
-            
-            timestamps.append(current_time)
     
     return None  # Continue with request
 
@@ -0,0 +1,75 @@
+"""
+Static Asset Manifest
+Points url_for('static', ...) at the fingerprinted files built by build_static.py.
+
+The manifest (static/dist/manifest.json) maps a source path such as
+'css/style.css' to 'dist/css/style.<hash>.css'. init_app() registers a URL
+defaults hook, so templates keep calling url_for('static', filename=...)
+and get the fingerprinted URL when a build exists, or the original file
+when it doesn't (development). The manifest is re-read when its mtime
+changes, so a rebuild does not need a restart.
+"""
+
+import os
+import json
+import logging
+import threading
+from typing import Dict
+
+logger = logging.getLogger(__name__)
+
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+
+class AssetManifest:
+    """Source path → fingerprinted path lookup"""
+
+    def __init__(self, static_dir: str):
+        self.path = os.path.join(static_dir, 'dist', 'manifest.json')
+        self._entries: Dict[str, str] = {}
+        self._mtime = None
+        self._lock = threading.Lock()
+
+    def _reload_if_changed(self):
+        try:
+            mtime = os.path.getmtime(self.path)
+        except OSError:
+            if self._entries:
+                self._entries, self._mtime = {}, None
+            return
+        if mtime == self._mtime:
+            return
+        with self._lock:
+            if mtime == self._mtime:
+                return
+            try:
+                with open(self.path) as f:
+                    self._entries = json.load(f)
+                self._mtime = mtime
+                logger.info(f"📦 Loaded static asset manifest ({len(self._entries)} assets)")
+            except (OSError, ValueError) as e:
+                logger.warning(f"⚠️ Could not read static asset manifest: {e}")
+
+    def resolve(self, filename: str) -> str:
+        self._reload_if_changed()
+        return self._entries.get(filename, filename)
+
+
+def init_app(app):
+    """Serve fingerprinted assets through url_for and mark them immutable"""
+    manifest = AssetManifest(app.static_folder)
+
+    @app.url_defaults
+    def fingerprint_static_urls(endpoint, values):
+        if endpoint == 'static' and 'filename' in values:
+            values['filename'] = manifest.resolve(values['filename'])
+
+    @app.after_request
+    def cache_fingerprinted_assets(response):
+        # Normally nginx serves /static/dist/ directly; this covers running without it
+        from flask import request
+        if request.path.startswith('/static/dist/') and response.status_code in (200, 304):
+            response.headers['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
+        return response
+
+    return manifest
@@ -0,0 +1,50 @@
+"""
+Subscription Link Builder
+The one place that decides what subscription link a client gets.
+
+3x-ui links are built from the panel's subscription_url and the client's
+UUID without dashes (falling back to sub_id); the other panel types
+(Marzban, Rebecca, Pasargad, Marzneshin, Guard) hand out their own
+subscription URL, which is stored as the client's config_link. The result is
+stored in `clients.subscription_link` when a client is written and recomputed
+in bulk when a panel's subscription_url changes, so pages only read it.
+"""
+
+from typing import Dict, Optional
+
+DIRECT_CONFIG_SCHEMES = ('vless://', 'vmess://', 'trojan://', 'ss://')
+
+
+def join_subscription_url(sub_url: str, sub_id: str) -> str:
+    """Append a sub_id to a panel subscription URL, adding /sub only when missing"""
+    if sub_url.endswith('/sub') or sub_url.endswith('/sub/'):
+        return f"{sub_url.rstrip('/')}/{sub_id}"
+    elif '/sub' in sub_url:
+        return f"{sub_url}/{sub_id}"
+    return f"{sub_url}/sub/{sub_id}"
+
+
+def build_subscription_link(panel: Optional[Dict], client: Dict) -> str:
+    """
+    Canonical subscription link of a client
+
+    Args:
+        panel: panels row (panel_type, subscription_url) - may be None
+        client: clients row (client_uuid, sub_id, config_link)
+
+    Returns:
+        The link, or '' when none can be built (e.g. only a direct config link is known)
+    """
+    panel = panel or {}
+    panel_type = panel.get('panel_type') or '3x-ui'
+
+    if panel_type == '3x-ui':
+        sub_id = (client.get('client_uuid') or '').replace('-', '') or client.get('sub_id')
+        sub_url = panel.get('subscription_url') or ''
+        if sub_id and sub_url:
+            return join_subscription_url(sub_url, sub_id)
+
+    config_link = client.get('config_link') or ''
+    if config_link and not config_link.startswith(DIRECT_CONFIG_SCHEMES):
+        return config_link
+    return ''
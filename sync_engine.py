@@ -0,0 +1,658 @@
+"""
+Panel Sync Engine
+Single leader-elected poller shared by the bot and all webapp workers.
+
+Every process that starts a SyncEngine competes for a MySQL named lock
+(GET_LOCK). Only the lock holder polls the panels: each cycle it fetches the
+panels that are due in parallel, writes traffic/online state to `clients` in
+one bulk statement, and publishes the per-panel client maps as a snapshot
+(in memory for local subscribers, and in `panel_sync_snapshots` for other
+processes). TrafficMonitor reads panel data from the snapshot instead of
+polling, and webapp workers only watch `sync_state` for finished cycles.
+Which panels are polled in a cycle is decided by PanelScheduler: each panel
+has its own adaptive interval, and at most `max_workers` are fetched at once.
+The lock is tied to a dedicated connection, so if the leader dies MySQL
+releases it and the next candidate takes over on its following attempt.
+"""
+
+import json
+import os
+import socket
+import threading
+import time
+import zlib
+import logging
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+from typing import Dict, List, Optional, Callable, Any
+
+import mysql.connector
+from mysql.connector import Error
+
+from panel_scheduler import PanelScheduler, create_panel_scheduler
+from panel_health import PanelHealthRegistry, panel_health
+
+logger = logging.getLogger(__name__)
+
+
+def extract_panel_clients(inbounds: List[Dict], panel_id: int = None) -> Dict[str, Dict]:
+    """
+    Build {client_uuid: client_details} from a panel's inbound list
+
+    Handles both inbound['clients'] (newer 3x-ui and Marzban-family managers)
+    and inbound['settings']['clients'], and matches clientStats by id, uuid or
+    uuid-prefixed email.
+
+    Args:
+        inbounds: Result of panel_manager.get_inbounds()
+        panel_id: Panel ID (for logging only)
+
+    Returns:
+        Dict mapping client UUID to traffic details (bytes / ms timestamps)
+    """
+    all_clients = {}
+
+    for inbound in inbounds or []:
+        try:
+            if not isinstance(inbound, dict):
+                continue
+
+            inbound_id = inbound.get('id')
+            if not inbound_id:
+                continue
+
+            clients = []
+            if 'clients' in inbound and isinstance(inbound['clients'], list):
+                clients = inbound['clients']
+
+            if not clients:
+                settings = inbound.get('settings') or {}
+                if isinstance(settings, str):
+                    try:
+                        settings = json.loads(settings)
+                    except ValueError:
+                        continue
+                if isinstance(settings, dict):
+                    clients = settings.get('clients', [])
+
+            if not isinstance(clients, list) or not clients:
+                continue
+
+            # Index clientStats once per inbound instead of scanning it per client
+            stats_by_key = {}
+            for stat_item in inbound.get('clientStats') or []:
+                if not isinstance(stat_item, dict):
+                    continue
+                for key in (stat_item.get('id'), stat_item.get('uuid')):
+                    if key:
+                        stats_by_key.setdefault(str(key), stat_item)
+                email = str(stat_item.get('email') or '')
+                if '@' in email:
+                    email_uuid = email.split('@')[0]
+                    if len(email_uuid) > 30:  # UUID-like length
+                        stats_by_key.setdefault(email_uuid, stat_item)
+
+            for client in clients:
+                if not isinstance(client, dict):
+                    continue
+
+                client_uuid = client.get('id')
+                if not client_uuid:
+                    continue
+                client_uuid = str(client_uuid)
+
+                stat = stats_by_key.get(client_uuid)
+                used_traffic = 0
+                last_activity = 0
+
+                if stat:
+                    used_traffic = (stat.get('up', 0) or 0) + (stat.get('down', 0) or 0)
+                    last_activity = stat.get('lastOnline', 0) or 0
+
+                if used_traffic == 0:
+                    if 'up' in client and 'down' in client:
+                        used_traffic = (client.get('up', 0) or 0) + (client.get('down', 0) or 0)
+                    elif 'upload' in client and 'download' in client:
+                        used_traffic = (client.get('upload', 0) or 0) + (client.get('download', 0) or 0)
+
+                if last_activity == 0:
+                    last_activity = client.get('lastOnline', 0) or 0
+
+                total_traffic = client.get('totalGB', 0) or client.get('total', 0) or 0
+
+                all_clients[client_uuid] = {
+                    'id': client_uuid,
+                    'inbound_id': inbound_id,
+                    'total_traffic': total_traffic,
+                    'used_traffic': used_traffic,
+                    'expiryTime': client.get('expiryTime', 0),
+                    'enable': client.get('enable', True),
+                    'last_activity': last_activity,
+                    'email': client.get('email', 'Unknown')
+                }
+        except Exception as e:
+            logger.debug(f"⚠️ Error processing inbound in panel {panel_id}: {e}")
+            continue
+
+    return all_clients
+
+
+class SyncSnapshot:
+    """Client data of the panels polled in one sync cycle"""
+
+    def __init__(self, cycle_id: int):
+        self.cycle_id = cycle_id
+        self.taken_at = time.time()
+        self.panels: Dict[int, Dict[str, Dict]] = {}  # {panel_id: {client_uuid: details}}
+        self.fresh_until: Dict[int, float] = {}  # {panel_id: epoch until the data counts as current}
+        self.at_risk: Dict[int, int] = {}  # {panel_id: clients near a threshold}
+        self.failed_panels: List[int] = []
+
+    @property
+    def client_count(self) -> int:
+        return sum(len(clients) for clients in self.panels.values())
+
+    def age(self) -> float:
+        return time.time() - self.taken_at
+
+
+class SyncEngine:
+    """Leader-elected panel poller that publishes one snapshot per cycle"""
+
+    STATE_NAME = 'panels'
+    ONLINE_WINDOW_MS = 120000  # Client counts as online if seen in the last 2 minutes
+    WARNING_RISK_PERCENT = 65  # Clients this close to the 70% warning count as at risk
+
+    def __init__(self, db, admin_manager=None, interval_seconds: int = 180,
+                 max_workers: int = 20, leader_candidate: bool = True,
+                 tick_seconds: int = 15, scheduler: PanelScheduler = None):
+        """
+        Initialize sync engine
+
+        Args:
+            db: ProfessionalDatabaseManager instance
+            admin_manager: AdminManager used to build panel managers
+            interval_seconds: Base per-panel polling interval
+            max_workers: Global cap on panels fetched at the same time
+            leader_candidate: Whether this process may become the poller
+            tick_seconds: How often the leader checks which panels are due
+            scheduler: PanelScheduler (default: from SYNC_ENGINE_CONFIG around interval_seconds)
+        """
+        self.db = db
+        if admin_manager is None:
+            from admin_manager import AdminManager
+            admin_manager = AdminManager(db)
+        self.admin_manager = admin_manager
+        self.interval_seconds = interval_seconds
+        self.max_workers = max_workers
+        self.leader_candidate = leader_candidate
+        self.tick_seconds = tick_seconds
+        self.scheduler = scheduler or create_panel_scheduler(interval_seconds)
+
+        # MySQL lock names are limited to 64 characters
+        self.lock_name = f"sync_leader:{db.database_name}"[:64]
+        self.instance_id = f"{socket.gethostname()}:{os.getpid()}"[:255]
+        self.is_leader = False
+        self._leader_conn = None
+
+        self.snapshot: Optional[SyncSnapshot] = None
+        self._local_panels: Dict[int, tuple] = {}  # {panel_id: (fresh_until, clients)} polled here
+        self._subscribers: List[Callable[[SyncSnapshot], Any]] = []
+        self._remote_cache: Dict[int, tuple] = {}  # {panel_id: (cycle_id, clients)}
+        self._cache_lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = None
+
+        self._ensure_tables_exist()
+        PanelHealthRegistry.ensure_table(db)
+
+    def _ensure_tables_exist(self):
+        """Create sync state and snapshot tables"""
+        try:
+            with self.db.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS sync_state (
+                        name VARCHAR(64) PRIMARY KEY,
+                        leader VARCHAR(255),
+                        cycle_id BIGINT DEFAULT 0,
+                        started_at TIMESTAMP NULL,
+                        finished_at TIMESTAMP NULL,
+                        panels_ok INT DEFAULT 0,
+                        panels_failed INT DEFAULT 0,
+                        clients_seen INT DEFAULT 0,
+                        clients_updated INT DEFAULT 0,
+                        duration_ms INT DEFAULT 0
+                    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+                ''')
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS panel_sync_snapshots (
+                        panel_id INT PRIMARY KEY,
+                        cycle_id BIGINT NOT NULL,
+                        taken_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                        fresh_until TIMESTAMP NULL,
+                        client_count INT DEFAULT 0,
+                        payload MEDIUMBLOB
+                    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+                ''')
+                cursor.execute('''
+                    SELECT COUNT(*) FROM information_schema.COLUMNS
+                    WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'panel_sync_snapshots'
+                    AND COLUMN_NAME = 'fresh_until'
+                ''')
+                if cursor.fetchone()[0] == 0:
+                    cursor.execute('ALTER TABLE panel_sync_snapshots ADD COLUMN fresh_until TIMESTAMP NULL AFTER taken_at')
+                conn.commit()
+                cursor.close()
+        except Exception as e:
+            logger.error(f"❌ Error creating sync engine tables: {e}")
+
+    # ==================== Leader election ====================
+
+    def try_acquire_leadership(self) -> bool:
+        """
+        Try to become the poller (non-blocking GET_LOCK)
+
+        The lock lives on a dedicated, non-pooled connection: pooled
+        connections reset their session on return, which would drop the lock.
+        """
+        if self.is_leader and self._check_leadership():
+            return True
+        if not self.leader_candidate:
+            return False
+
+        try:
+            cfg = self.db.db_config
+            conn = mysql.connector.connect(
+                host=cfg['host'],
+                port=cfg['port'],
+                user=cfg['user'],
+                password=cfg['password'],
+                database=self.db.database_name,
+                autocommit=True,
+                connection_timeout=10
+            )
+            cursor = conn.cursor()
+            cursor.execute("SELECT GET_LOCK(%s, 0)", (self.lock_name,))
+            row = cursor.fetchone()
+            cursor.close()
+            if row and row[0] == 1:
+                self._leader_conn = conn
+                self.is_leader = True
+                logger.info(f"👑 Sync leadership acquired by {self.instance_id}")
+                return True
+            conn.close()
+        except Error as e:
+            logger.warning(f"⚠️ Could not attempt sync leadership: {e}")
+        return False
+
+    def _check_leadership(self) -> bool:
+        """Verify the leader connection still holds the lock"""
+        try:
+            self._leader_conn.ping(reconnect=False)
+            cursor = self._leader_conn.cursor()
+            cursor.execute("SELECT IS_USED_LOCK(%s) = CONNECTION_ID()", (self.lock_name,))
+            row = cursor.fetchone()
+            cursor.close()
+            if row and row[0] == 1:
+                return True
+        except Exception as e:
+            logger.warning(f"⚠️ Sync leader connection lost: {e}")
+        self._drop_leadership()
+        return False
+
+    def _drop_leadership(self):
+        conn, self._leader_conn = self._leader_conn, None
+        if self.is_leader:
+            logger.warning(f"⚠️ Sync leadership lost by {self.instance_id}")
+        self.is_leader = False
+        if conn:
+            try:
+                conn.close()
+            except Exception:
+                pass
+
+    def release_leadership(self):
+        """Release the lock so another process can take over immediately"""
+        if self._leader_conn:
+            try:
+                cursor = self._leader_conn.cursor()
+                cursor.execute("SELECT RELEASE_LOCK(%s)", (self.lock_name,))
+                cursor.fetchone()
+                cursor.close()
+            except Exception:
+                pass
+        self._drop_leadership()
+
+    # ==================== Sync cycle ====================
+
+    def fetch_panel(self, panel_id: int) -> Optional[Dict[str, Dict]]:
+        """
+        Fetch all clients of one panel in a single inbound listing
+
+        Returns:
+            {client_uuid: details}, or None if the panel could not be read
+        """
+        try:
+            panel_manager = self.admin_manager.get_panel_manager(panel_id)
+            if not panel_manager:
+                return None
+            if not panel_manager.login():
+                logger.warning(f"⚠️ Could not login to panel {panel_id}")
+                return None
+            inbounds = panel_manager.get_inbounds()
+            if inbounds is None:
+                return None
+            return extract_panel_clients(inbounds, panel_id)
+        except Exception as e:
+            logger.error(f"❌ Error fetching panel {panel_id}: {e}")
+            return None
+
+    def _poll_panel(self, panel_id: int):
+        start = time.time()
+        return self.fetch_panel(panel_id), time.time() - start
+
+    def run_cycle(self) -> Optional[SyncSnapshot]:
+        """Poll the panels that are due, write clients and publish the snapshot"""
+        cycle_start = time.time()
+        started_at = datetime.now()
+
+        panels = self.db.get_panels(active_only=True)
+        if not panels:
+            return None
+
+        due = self.scheduler.due_panels([panel['id'] for panel in panels], now=cycle_start)
+        if not due:
+            return None
+
+        snapshot = SyncSnapshot(cycle_id=int(cycle_start * 1000))
+        durations = {}
+        # Due panels are submitted most urgent first, so at-risk panels take
+        # the first of the max_workers slots
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(due))) as executor:
+            futures = {executor.submit(self._poll_panel, panel_id): panel_id for panel_id in due}
+            for future in as_completed(futures):
+                panel_id = futures[future]
+                try:
+                    clients, durations[panel_id] = future.result(timeout=120)
+                except Exception as e:
+                    logger.error(f"❌ Error fetching panel {panel_id}: {e}")
+                    clients = None
+                if clients is None:
+                    snapshot.failed_panels.append(panel_id)
+                    self.scheduler.record_failure(panel_id, durations.get(panel_id, 0.0))
+                else:
+                    snapshot.panels[panel_id] = clients
+
+        updated = self.write_clients(snapshot)
+
+        for panel_id, clients in snapshot.panels.items():
+            previous = self._local_panels.get(panel_id)
+            changed_ratio = None
+            if previous and clients:
+                old_clients = previous[1]
+                changed = sum(1 for uuid, details in clients.items()
+                              if uuid not in old_clients or
+                              old_clients[uuid].get('used_traffic') != details.get('used_traffic'))
+                changed_ratio = changed / len(clients)
+            self.scheduler.record_success(panel_id, len(clients), changed_ratio,
+                                          snapshot.at_risk.get(panel_id, 0), durations.get(panel_id, 0.0))
+            snapshot.fresh_until[panel_id] = snapshot.taken_at + self.scheduler.freshness_window(panel_id)
+            self._local_panels[panel_id] = (snapshot.fresh_until[panel_id], clients)
+
+        self._persist_snapshot(snapshot)
+        self.snapshot = snapshot
+        # The leader talks to every panel, so its breaker view is the one shown to admins
+        panel_health.persist(self.db)
+
+        duration_ms = int((time.time() - cycle_start) * 1000)
+        self._record_state(snapshot, started_at, updated, duration_ms)
+
+        for callback in list(self._subscribers):
+            try:
+                callback(snapshot)
+            except Exception as e:
+                logger.error(f"❌ Sync subscriber error: {e}")
+
+        logger.info(f"✅ Sync cycle {snapshot.cycle_id}: {len(snapshot.panels)}/{len(panels)} panels, "
+                    f"{snapshot.client_count} clients ({sum(snapshot.at_risk.values())} at risk), "
+                    f"{updated} rows updated, {len(snapshot.failed_panels)} failed in {duration_ms / 1000:.2f}s")
+        return snapshot
+
+    def write_clients(self, snapshot: SyncSnapshot) -> int:
+        """
+        Write traffic, online and expiry state of the snapshot to `clients`
+
+        Also counts per panel the clients close to a threshold into
+        snapshot.at_risk, which the scheduler uses to poll those panels sooner.
+        """
+        if not snapshot.panels:
+            return 0
+
+        panel_ids = list(snapshot.panels.keys())
+        placeholders = ', '.join(['%s'] * len(panel_ids))
+        try:
+            with self.db.get_connection() as conn:
+                cursor = conn.cursor(dictionary=True)
+                cursor.execute(f'''
+                    SELECT id, panel_id, client_uuid, total_gb, status, warned_70_percent, expires_at
+                    FROM clients
+                    WHERE is_active = 1 AND panel_id IN ({placeholders})
+                ''', panel_ids)
+                db_clients = cursor.fetchall()
+                cursor.close()
+        except Exception as e:
+            logger.error(f"❌ Error loading clients for sync: {e}")
+            return 0
+
+        now = datetime.now()
+        now_ms = int(time.time() * 1000)
+        risk_horizon = self.scheduler.base_interval * 2
+        updates = []
+        for db_client in db_clients:
+            panel_id = db_client['panel_id']
+            details = snapshot.panels.get(panel_id, {}).get(str(db_client.get('client_uuid') or ''))
+            if not details:
+                continue
+
+            used_traffic = details.get('used_traffic', 0) or 0
+            last_activity = details.get('last_activity', 0) or 0
+            expires_at = None
+            expiry_time = details.get('expiryTime', 0) or 0
+            if expiry_time > 0:
+                try:
+                    expiry_ts = expiry_time / 1000 if expiry_time > 1000000000000 else expiry_time
+                    expires_at = datetime.fromtimestamp(expiry_ts)
+                except (ValueError, OverflowError, OSError):
+                    pass
+
+            used_gb = round(used_traffic / (1024 ** 3), 4) if used_traffic > 0 else 0
+            updates.append({
+                'id': db_client['id'],
+                'used_gb': used_gb,
+                'last_activity': last_activity,
+                'is_online': last_activity > 0 and (now_ms - last_activity) < self.ONLINE_WINDOW_MS,
+                'expires_at': expires_at
+            })
+
+            if self._is_at_risk(db_client, used_gb, expires_at or db_client.get('expires_at'), now, risk_horizon):
+                snapshot.at_risk[panel_id] = snapshot.at_risk.get(panel_id, 0) + 1
+
+        if updates and self.db.bulk_update_client_sync_data(updates):
+            return len(updates)
+        return 0
+
+    def _is_at_risk(self, db_client: Dict, used_gb: float, expires_at, now: datetime, horizon: float) -> bool:
+        """Whether a client is close to a warning, exhaustion or expiry"""
+        total_gb = db_client.get('total_gb') or 0
+        status = db_client.get('status')
+        if total_gb > 0:
+            usage = used_gb / total_gb * 100
+            if usage >= 100 and status != 'disabled':
+                return True
+            if self.WARNING_RISK_PERCENT <= usage < 100 and not db_client.get('warned_70_percent'):
+                return True
+        if isinstance(expires_at, datetime) and status != 'disabled':
+            if 0 <= (expires_at - now).total_seconds() <= horizon:
+                return True
+        return False
+
+    def _persist_snapshot(self, snapshot: SyncSnapshot):
+        """Store per-panel client maps so follower processes can read them"""
+        if not snapshot.panels:
+            return
+        rows = [
+            (panel_id, snapshot.cycle_id,
+             datetime.fromtimestamp(snapshot.fresh_until.get(panel_id, snapshot.taken_at)), len(clients),
+             zlib.compress(json.dumps(clients, separators=(',', ':')).encode('utf-8'), 6))
+            for panel_id, clients in snapshot.panels.items()
+        ]
+        try:
+            with self.db.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.executemany('''
+                    INSERT INTO panel_sync_snapshots (panel_id, cycle_id, taken_at, fresh_until, client_count, payload)
+                    VALUES (%s, %s, NOW(), %s, %s, %s)
+                    ON DUPLICATE KEY UPDATE cycle_id = VALUES(cycle_id), taken_at = VALUES(taken_at),
+                        fresh_until = VALUES(fresh_until), client_count = VALUES(client_count),
+                        payload = VALUES(payload)
+                ''', rows)
+                conn.commit()
+                cursor.close()
+        except Exception as e:
+            logger.error(f"❌ Error persisting sync snapshot: {e}")
+
+    def _record_state(self, snapshot: SyncSnapshot, started_at: datetime, updated: int, duration_ms: int):
+        try:
+            with self.db.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    INSERT INTO sync_state (name, leader, cycle_id, started_at, finished_at,
+                                            panels_ok, panels_failed, clients_seen, clients_updated, duration_ms)
+                    VALUES (%s, %s, %s, %s, NOW(), %s, %s, %s, %s, %s)
+                    ON DUPLICATE KEY UPDATE leader = VALUES(leader), cycle_id = VALUES(cycle_id),
+                        started_at = VALUES(started_at), finished_at = VALUES(finished_at),
+                        panels_ok = VALUES(panels_ok), panels_failed = VALUES(panels_failed),
+                        clients_seen = VALUES(clients_seen), clients_updated = VALUES(clients_updated),
+                        duration_ms = VALUES(duration_ms)
+                ''', (self.STATE_NAME, self.instance_id, snapshot.cycle_id, started_at,
+                      len(snapshot.panels), len(snapshot.failed_panels), snapshot.client_count,
+                      updated, duration_ms))
+                conn.commit()
+                cursor.close()
+        except Exception as e:
+            logger.error(f"❌ Error recording sync state: {e}")
+
+    # ==================== Consumers ====================
+
+    def subscribe(self, callback: Callable[[SyncSnapshot], Any]):
+        """Call `callback(snapshot)` after every cycle this process runs as leader"""
+        self._subscribers.append(callback)
+
+    def get_panel_clients(self, panel_id: int, max_age: float = None) -> Optional[Dict[str, Dict]]:
+        """
+        Get the latest published client map of a panel
+
+        Args:
+            panel_id: Panel ID
+            max_age: Maximum snapshot age in seconds (default: the panel's
+                scheduled freshness window, which grows with its interval)
+
+        Returns:
+            {client_uuid: details}, or None if no fresh snapshot exists
+        """
+        local = self._local_panels.get(panel_id)
+        if local:
+            fresh_until, clients = local
+            if max_age is None and time.time() <= fresh_until:
+                return clients
+
+        try:
+            with self.db.get_connection() as conn:
+                cursor = conn.cursor(dictionary=True)
+                if max_age is None:
+                    cursor.execute('''
+                        SELECT cycle_id FROM panel_sync_snapshots
+                        WHERE panel_id = %s AND fresh_until >= NOW()
+                    ''', (panel_id,))
+                else:
+                    cursor.execute('''
+                        SELECT cycle_id FROM panel_sync_snapshots
+                        WHERE panel_id = %s AND taken_at >= NOW() - INTERVAL %s SECOND
+                    ''', (panel_id, int(max_age)))
+                row = cursor.fetchone()
+                if not row:
+                    cursor.close()
+                    return None
+
+                with self._cache_lock:
+                    cached = self._remote_cache.get(panel_id)
+                if cached and cached[0] == row['cycle_id']:
+                    cursor.close()
+                    return cached[1]
+
+                cursor.execute('SELECT cycle_id, payload FROM panel_sync_snapshots WHERE panel_id = %s',
+                               (panel_id,))
+                row = cursor.fetchone()
+                cursor.close()
+        except Exception as e:
+            logger.error(f"❌ Error reading sync snapshot for panel {panel_id}: {e}")
+            return None
+
+        if not row or not row.get('payload'):
+            return None
+        clients = json.loads(zlib.decompress(row['payload']).decode('utf-8'))
+        with self._cache_lock:
+            self._remote_cache[panel_id] = (row['cycle_id'], clients)
+        return clients
+
+    def get_state(self) -> Optional[Dict]:
+        """Latest cycle summary written by whichever process is leader"""
+        try:
+            with self.db.get_connection() as conn:
+                cursor = conn.cursor(dictionary=True)
+                cursor.execute('SELECT * FROM sync_state WHERE name = %s', (self.STATE_NAME,))
+                row = cursor.fetchone()
+                cursor.close()
+                return row
+        except Exception as e:
+            logger.error(f"❌ Error reading sync state: {e}")
+            return None
+
+    # ==================== Loop ====================
+
+    def run_forever(self):
+        """Compete for leadership and poll due panels while leader"""
+        logger.info(f"🚀 Sync engine started on {self.instance_id} "
+                    f"(base interval: {self.interval_seconds}s, candidate: {self.leader_candidate})")
+        while not self._stop_event.is_set():
+            tick_start = time.time()
+            try:
+                if self.try_acquire_leadership():
+                    self.run_cycle()
+                    wait = self.tick_seconds
+                else:
+                    # Followers only need to notice a dead leader, once per base interval
+                    wait = self.interval_seconds
+            except Exception as e:
+                logger.error(f"❌ Error in sync cycle: {e}", exc_info=True)
+                wait = self.tick_seconds
+
+            elapsed = time.time() - tick_start
+            self._stop_event.wait(max(1, wait - elapsed))
+
+        self.release_leadership()
+        logger.info("🛑 Sync engine stopped")
+
+    def start(self) -> threading.Thread:
+        """Run the engine in a daemon thread"""
+        if self._thread and self._thread.is_alive():
+            return self._thread
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self.run_forever, daemon=True, name="SyncEngine")
+        self._thread.start()
+        return self._thread
+
+    def stop(self):
+        """Stop the loop and release leadership"""
+        self._stop_event.set()
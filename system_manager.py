@@ -15,7 +15,7 @@ import shutil
 from typing import Dict, Optional, Tuple
 from telegram import Bot
 from database_backup_system import DatabaseBackupManager
-from database_optimization import create_database_indexes
+from database_optimization import create_database_indexes, IndexManager
 from professional_database import ProfessionalDatabaseManager
 
 logger = logging.getLogger(__name__)
@@ -89,9 +89,16 @@ class SystemManager:
             Tuple (success, message)
         """
         try:
-            # Run optimization
-            create_database_indexes(self.db_manager)
-            return True, "✅ دیتابیس با موفقیت بهینه سازی شد."
+            # Run optimization: create missing indexes, then report hot query plans
+            result = create_database_indexes(self.db_manager)
+            index_manager = IndexManager(self.db_manager)
+            report = index_manager.explain_hot_queries()
+            message = "✅ دیتابیس با موفقیت بهینه سازی شد."
+            message += f"\n\n🗂 ایندکس‌های جدید: {len(result['created'])}"
+            if result['failed']:
+                message += f"\n⚠️ ناموفق: {', '.join(result['failed'])}"
+            message += "\n\n" + index_manager.format_report(report)
+            return True, message
         except Exception as e:
             logger.error(f"Error optimizing database: {e}")
             return False, f"❌ خطا در بهینه سازی: {str(e)}"
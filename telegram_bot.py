@@ -135,6 +135,7 @@ class VPNBot:
         
         # Initialize traffic monitor (will be set later in main)
         self.traffic_monitor = None
+        self.sync_engine = None
         
         # Initialize reporting system (will be set later in main)
         self.reporting_system = None
@@ -172,6 +173,14 @@ class VPNBot:
         except Exception as e:
             logger.warning(f"⚠️ Could not initialize ResellerManager: {e}")
             self.reseller_manager = None
+        
+        # Initialize background export jobs (worker is started in post_init)
+        try:
+            from export_system import ExportJobManager
+            self.export_job_manager = ExportJobManager(self.db)
+        except Exception as e:
+            logger.warning(f"⚠️ Could not initialize ExportJobManager: {e}")
+            self.export_job_manager = None
 
     def get_discounted_price(self, original_price: int, telegram_id: int) -> tuple:
         """
@@ -2891,7 +2900,8 @@ class VPNBot:
                 None, 
                 self.admin_manager.migrate_panel, 
                 source_id, 
-                dest_id
+                dest_id,
+                False
             )
             
             if success:
@@ -2905,7 +2915,8 @@ class VPNBot:
                     f"کل: {stats.get('total', 0)}\n"
                     f"✅ موفق: {stats.get('success', 0)}\n"
                     f"❌ ناموفق: {stats.get('failed', 0)}\n"
-                    f"⏭️ نادیده گرفته شده: {stats.get('skipped', 0)}\n\n"
+                    f"⏭️ نادیده گرفته شده: {stats.get('skipped', 0)}\n"
+                    f"⏱️ زمان: {stats.get('duration_seconds', 0)} ثانیه ({stats.get('clients_per_second', 0)} کاربر در ثانیه)\n\n"
                     f"📝 **جزئیات:**\n{details}"
                 )
             else:
@@ -11933,6 +11944,7 @@ class VPNBot:
                     WHERE id = %s
                 ''', (new_client_info['new_uuid'], preserved_sub_id, subscription_link, service_id))
                 conn.commit()
+            self.db.refresh_subscription_links(client_ids=[service_id])
             
             message = f"""
 ✅ لینک جدید با موفقیت ساخته شد!
@@ -17188,9 +17200,18 @@ class VPNBot:
              InlineKeyboardButton("📦 سفارشات", callback_data="export_orders")],
             [InlineKeyboardButton("💰 پرداخت‌ها", callback_data="export_payments"),
              InlineKeyboardButton("🔧 سرویس‌ها", callback_data="export_services")],
-            [InlineKeyboardButton("🔙 بازگشت", callback_data="admin_panel")]
         ]
         
+        # Recent artifacts can be downloaded again until they expire
+        if self.export_job_manager:
+            for job in self.export_job_manager.get_recent_jobs(limit=5):
+                keyboard.append([InlineKeyboardButton(
+                    f"📥 {job['export_type']} - {job['finished_at'].strftime('%m/%d %H:%M')}",
+                    callback_data=f"export_dl_{job['id']}"
+                )])
+        
+        keyboard.append([InlineKeyboardButton("🔙 بازگشت", callback_data="admin_panel")])
+        
         await query.edit_message_text(
             message,
             reply_markup=InlineKeyboardMarkup(keyboard),
@@ -17568,44 +17589,47 @@ class VPNBot:
         await query.answer()
         
         try:
-            from export_system import data_exporter, ExportFormat, ExportType
-            data_exporter.set_database(self.db)
+            from export_system import ExportFormat, ExportType, ExportJobStatus
             
             export_map = {
-                "export_users": (data_exporter.export_users, "users", "کاربران"),
-                "export_orders": (data_exporter.export_orders, "orders", "سفارشات"),
-                "export_payments": (data_exporter.export_payments, "payments", "پرداخت‌ها"),
-                "export_services": (data_exporter.export_services, "services", "سرویس‌ها"),
+                "export_users": (ExportType.USERS, "کاربران"),
+                "export_orders": (ExportType.ORDERS, "سفارشات"),
+                "export_payments": (ExportType.PAYMENTS, "پرداخت‌ها"),
+                "export_services": (ExportType.SERVICES, "سرویس‌ها"),
             }
+            back_keyboard = InlineKeyboardMarkup([[InlineKeyboardButton("🔙 بازگشت", callback_data="admin_export")]])
+            
+            if not self.export_job_manager:
+                await query.edit_message_text("❌ سیستم خروجی در دسترس نیست.", reply_markup=back_keyboard)
+                return
+            
+            if data.startswith("export_dl_"):
+                # Re-download a stored artifact
+                job = self.export_job_manager.get_job(int(data.replace("export_dl_", "")))
+                if not job or job['status'] != ExportJobStatus.DONE.value:
+                    await query.edit_message_text("❌ این فایل خروجی منقضی شده است.", reply_markup=back_keyboard)
+                    return
+                await self._send_export_artifact(context.bot, job, update.effective_chat.id)
+                return
             
             if data in export_map:
-                await query.edit_message_text("⏳ در حال تهیه خروجی...")
-                
-                export_func, name, fa_name = export_map[data]
-                file_bytes = export_func(ExportFormat.CSV)
-                
-                if file_bytes:
-                    from datetime import datetime
-                    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-                    filename = f"hooshnet_{name}_{timestamp}.csv"
-                    
-                    from io import BytesIO
-                    file = BytesIO(file_bytes)
-                    file.name = filename
-                    
-                    await context.bot.send_document(
-                        chat_id=update.effective_chat.id,
-                        document=file,
-                        caption=f"📤 خروجی {fa_name}\n📅 {datetime.now().strftime('%Y-%m-%d %H:%M')}"
-                    )
-                    
-                    keyboard = [[InlineKeyboardButton("🔙 بازگشت", callback_data="admin_export")]]
+                export_type, fa_name = export_map[data]
+                job = self.export_job_manager.submit(export_type, update.effective_user.id, ExportFormat.CSV)
+                
+                if not job:
+                    await query.edit_message_text("❌ خطا در ثبت درخواست خروجی.", reply_markup=back_keyboard)
+                elif job.get('watcher_notified'):
+                    # The reused job finished meanwhile and its result was already sent to this admin
+                    await query.edit_message_text(f"📤 نتیجه خروجی {fa_name} برای شما ارسال شد.", reply_markup=back_keyboard)
+                elif job['status'] == ExportJobStatus.DONE.value:
+                    # Identical export finished recently - send the stored file
+                    await query.edit_message_text(f"✅ خروجی {fa_name} از قبل آماده است.", reply_markup=back_keyboard)
+                    await self._send_export_artifact(context.bot, job, update.effective_chat.id)
+                else:
                     await query.edit_message_text(
-                        f"✅ فایل خروجی {fa_name} ارسال شد.",
-                        reply_markup=InlineKeyboardMarkup(keyboard)
+                        f"⏳ خروجی {fa_name} در صف تهیه قرار گرفت.\nپس از آماده شدن، فایل برای شما ارسال می‌شود.",
+                        reply_markup=back_keyboard
                     )
-                else:
-                    await query.edit_message_text("❌ داده‌ای برای خروجی وجود ندارد یا خطا رخ داد.")
             else:
                 await query.edit_message_text("نوع خروجی نامعتبر.")
         except Exception as e:
@@ -17614,6 +17638,27 @@ class VPNBot:
             logger.error(traceback.format_exc())
             await query.edit_message_text("❌ خطا در خروجی گرفتن.")
     
+    async def _send_export_artifact(self, bot, job: dict, chat_id: int):
+        """Send a finished export job's file to a chat"""
+        from export_system import ExportJobStatus
+        
+        if job['status'] != ExportJobStatus.DONE.value:
+            await bot.send_message(chat_id=chat_id, text=f"❌ تهیه خروجی {job['export_type']} با خطا مواجه شد.")
+            return
+        
+        file_bytes = await asyncio.to_thread(self.export_job_manager.read_artifact, job)
+        if not file_bytes:
+            await bot.send_message(chat_id=chat_id, text="❌ فایل خروجی در دسترس نیست.")
+            return
+        
+        file = io.BytesIO(file_bytes)
+        file.name = job['file_name']
+        await bot.send_document(
+            chat_id=chat_id,
+            document=file,
+            caption=f"📤 خروجی {job['export_type']}\n📅 {job['finished_at'].strftime('%Y-%m-%d %H:%M')}"
+        )
+    
     async def handle_role_callbacks(self, update: Update, context: ContextTypes.DEFAULT_TYPE, data: str):
         """Handle role-related callbacks"""
         query = update.callback_query
@@ -19477,6 +19522,25 @@ def main():
             if bot.backup_manager:
                 asyncio.create_task(bot.backup_manager.start_auto_backup(interval_hours=6))
                 logger.info("✅ Auto-backup scheduler started (every 6 hours)")
+            
+            # Periodic per-method DB timing report to the reports channel
+            from config import DB_PROFILING_CONFIG
+            report_hours = DB_PROFILING_CONFIG.get('report_interval_hours', 0)
+            if bot.reporting_system and report_hours > 0:
+                asyncio.create_task(bot.reporting_system.start_db_performance_reports(interval_hours=report_hours))
+                logger.info(f"✅ DB performance reports scheduled (every {report_hours} hours)")
+            
+            # Start export worker; finished files are sent back on the bot's loop
+            if bot.export_job_manager:
+                loop = asyncio.get_running_loop()
+                
+                def notify_export_ready(job, telegram_id):
+                    asyncio.run_coroutine_threadsafe(
+                        bot._send_export_artifact(application.bot, job, telegram_id), loop
+                    )
+                
+                bot.export_job_manager.set_notifier(notify_export_ready)
+                bot.export_job_manager.start()
                 
         except Exception as e:
             logger.error(f"Failed in post_init: {e}")
@@ -19497,6 +19561,20 @@ def main():
     # Also set bot_instance on TrafficMonitor so it can access reporting_system
     bot.traffic_monitor.bot_instance = bot
     
+    # Start the panel sync engine: the single poller (elected via MySQL lock across the bot
+    # and webapp workers) that writes traffic to the database and publishes the snapshot
+    # TrafficMonitor reads instead of listing panels itself
+    from sync_engine import SyncEngine
+    from config import SYNC_ENGINE_CONFIG
+    bot.sync_engine = SyncEngine(
+        bot.db, bot.admin_manager,
+        interval_seconds=SYNC_ENGINE_CONFIG['interval_seconds'],
+        max_workers=SYNC_ENGINE_CONFIG['max_workers']
+    )
+    bot.traffic_monitor.sync_engine = bot.sync_engine
+    bot.sync_engine.start()
+    logger.info("✅ Sync engine thread started successfully")
+    
     # Start traffic monitoring in background (for notifications and auto-disable)
     def start_traffic_monitoring():
         loop = asyncio.new_event_loop()
@@ -19507,23 +19585,6 @@ def main():
     traffic_monitoring_thread = threading.Thread(target=start_traffic_monitoring, daemon=True)
     traffic_monitoring_thread.start()
     
-    # Start optimized monitoring in background (for database updates every 3 minutes)
-    from optimized_monitor import OptimizedMonitor
-    optimized_monitor = OptimizedMonitor(bot.db, bot.admin_manager, bot=None)
-    
-    def start_optimized_monitoring():
-        logger.info("🚀 Starting OptimizedMonitor (updates every 10 minutes)")
-        try:
-            optimized_monitor.start_monitoring(interval_seconds=600)  # 10 minutes = 600 seconds
-        except Exception as e:
-            logger.error(f"❌ Error in OptimizedMonitor loop: {e}")
-            import traceback
-            logger.error(traceback.format_exc())
-    
-    optimized_monitoring_thread = threading.Thread(target=start_optimized_monitoring, daemon=True, name="OptimizedMonitor")
-    optimized_monitoring_thread.start()
-    logger.info("✅ OptimizedMonitor thread started successfully")
-    
     application.run_polling()
 
 
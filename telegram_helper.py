@@ -1,11 +1,21 @@
 """
 Helper functions for Telegram Bot API
-Used by webapp to get user profile photos
+Used by webapp to get user profile photos and send messages
+
+All Bot API calls of a process run on one dedicated asyncio loop thread that
+owns the shared Bot (and its HTTP connection pool). Synchronous code (Flask
+handlers) submits coroutines to it with run_sync()/submit(), so concurrent
+requests share connections instead of each building a new event loop.
 """
 
+import os
+import time
 import logging
 import asyncio
+import threading
+from typing import Dict, Iterable
 from telegram import Bot
+from telegram.error import RetryAfter, Forbidden, BadRequest
 from config import BOT_CONFIG
 
 logger = logging.getLogger(__name__)
@@ -14,29 +24,78 @@ logger = logging.getLogger(__name__)
 class TelegramHelper:
     """Helper class for Telegram Bot API operations"""
     
+    CONNECTION_POOL_SIZE = 32
+    SEND_CONCURRENCY = 20  # Messages in flight during batch sends
+    SEND_RATE_PER_SECOND = 25  # Stay under Telegram's ~30 msg/s broadcast limit
+    
     _bot = None
+    _loop = None
+    _loop_thread = None
+    _loop_pid = None
+    _loop_lock = threading.Lock()
+    
+    @classmethod
+    def get_loop(cls) -> asyncio.AbstractEventLoop:
+        """Get the process-wide Telegram loop, starting its thread on first use (and after fork)"""
+        if cls._loop is not None and cls._loop_pid == os.getpid() and cls._loop_thread.is_alive():
+            return cls._loop
+        with cls._loop_lock:
+            if cls._loop is None or cls._loop_pid != os.getpid() or not cls._loop_thread.is_alive():
+                loop = asyncio.new_event_loop()
+                thread = threading.Thread(target=loop.run_forever, name='telegram-loop', daemon=True)
+                thread.start()
+                # A Bot created for a previous loop (or parent process) cannot be reused
+                cls._bot = None
+                cls._loop, cls._loop_thread, cls._loop_pid = loop, thread, os.getpid()
+                logger.info("🔄 Telegram helper event loop started")
+        return cls._loop
+    
+    @classmethod
+    def submit(cls, coro):
+        """Schedule a coroutine on the Telegram loop; returns a concurrent.futures.Future"""
+        return asyncio.run_coroutine_threadsafe(coro, cls.get_loop())
+    
+    @classmethod
+    def run_sync(cls, coro, timeout: float = 60):
+        """Run a coroutine on the Telegram loop and wait for its result (from any non-loop thread)"""
+        loop = cls.get_loop()
+        if threading.current_thread() is cls._loop_thread:
+            coro.close()
+            raise RuntimeError("run_sync() called from the Telegram loop thread; await the coroutine instead")
+        return asyncio.run_coroutine_threadsafe(coro, loop).result(timeout)
+    
+    @classmethod
+    async def run_async(cls, coro):
+        """Await a coroutine on the Telegram loop from another event loop"""
+        loop = cls.get_loop()
+        try:
+            if asyncio.get_running_loop() is loop:
+                return await coro
+        except RuntimeError:
+            pass
+        return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(coro, loop))
+    
+    @classmethod
+    def create_bot(cls, connection_pool_size: int = 8) -> Bot:
+        """Create a standalone Bot (for code that runs its own event loop)"""
+        from telegram.request import HTTPXRequest
+        pool_kwargs = dict(connection_pool_size=connection_pool_size, pool_timeout=30.0,
+                           read_timeout=20.0, write_timeout=20.0, connect_timeout=20.0)
+        # Import NoProxyRequest from telegram_bot if available so system proxies are ignored
+        try:
+            from telegram_bot import NoProxyRequest
+            request = NoProxyRequest(**pool_kwargs)
+        except ImportError:
+            # Fallback if cannot import
+            request = HTTPXRequest(**pool_kwargs)
+        return Bot(token=BOT_CONFIG['token'], request=request)
     
     @classmethod
-    def get_bot(cls):
-        """Get or create Bot instance"""
+    def get_bot(cls) -> Bot:
+        """Get or create the shared Bot instance (use it on the Telegram loop only)"""
+        cls.get_loop()
         if cls._bot is None:
-            from telegram.request import HTTPXRequest
-            request = HTTPXRequest(connection_pool_size=8, read_timeout=20.0, write_timeout=20.0, connect_timeout=20.0)
-            # Hack to force trust_env=False for httpx
-            # Since HTTPXRequest doesn't expose trust_env directly in constructor in some versions,
-            # we might need to rely on the fact that we are not passing proxy_url.
-            # But wait, python-telegram-bot's HTTPXRequest might pick up env vars.
-            # Let's try to pass an empty proxy dictionary if possible, or use a custom request class if defined in telegram_bot.py
-            
-            # Better approach: Import NoProxyRequest from telegram_bot if available, or define a local one
-            try:
-                from telegram_bot import NoProxyRequest
-                request = NoProxyRequest()
-            except ImportError:
-                # Fallback if cannot import
-                request = HTTPXRequest()
-            
-            cls._bot = Bot(token=BOT_CONFIG['token'], request=request)
+            cls._bot = cls.create_bot(connection_pool_size=cls.CONNECTION_POOL_SIZE)
         return cls._bot
     
     @classmethod
@@ -93,24 +152,49 @@ class TelegramHelper:
             Photo URL or empty string if not available
         """
         try:
-            # Try to get existing event loop
-            try:
-                loop = asyncio.get_event_loop()
-                if loop.is_closed():
-                    raise RuntimeError("Event loop is closed")
-            except RuntimeError:
-                # Create a new event loop if none exists or is closed
-                loop = asyncio.new_event_loop()
-                asyncio.set_event_loop(loop)
-            
-            # Run the async function
-            result = loop.run_until_complete(cls.get_user_profile_photo_url(user_id))
-            return result
-                
+            return cls.run_sync(cls.get_user_profile_photo_url(user_id))
         except Exception as e:
             logger.error(f"Error in sync wrapper for user {user_id}: {e}")
             return ''
     
+    @classmethod
+    async def fetch_user_profile_photo(cls, user_id: int, min_size: int = 160, known_unique_id: str = None):
+        """
+        Get user's current profile photo, downloading it only if it changed
+        
+        Args:
+            user_id: Telegram user ID
+            min_size: Smallest acceptable width; the smallest size at least this wide is used
+            known_unique_id: file_unique_id already cached by the caller
+            
+        Returns:
+            (file_unique_id, image bytes or None when unchanged) - ('', None) if the user has no photo
+        """
+        bot = cls.get_bot()
+        photos = await bot.get_user_profile_photos(user_id, limit=1)
+        if not photos.total_count or not photos.photos:
+            return '', None
+
+        # Sizes are ordered small to large
+        sizes = photos.photos[0]
+        photo = next((size for size in sizes if size.width >= min_size), sizes[-1])
+        if photo.file_unique_id == known_unique_id:
+            return photo.file_unique_id, None
+
+        file = await bot.get_file(photo.file_id)
+        data = await file.download_as_bytearray()
+        return photo.file_unique_id, bytes(data)
+    
+    @classmethod
+    def fetch_user_profile_photo_sync(cls, user_id: int, min_size: int = 160, known_unique_id: str = None):
+        """
+        Synchronous wrapper for fetch_user_profile_photo
+        
+        Raises:
+            Exception: Bot API errors are left to the caller (so they are not cached as "no photo")
+        """
+        return cls.run_sync(cls.fetch_user_profile_photo(user_id, min_size, known_unique_id))
+    
     @classmethod
     async def send_message(cls, chat_id: int, text: str) -> bool:
         """
@@ -144,24 +228,79 @@ class TelegramHelper:
             True if successful, False otherwise
         """
         try:
-            # Try to get existing event loop
-            try:
-                loop = asyncio.get_event_loop()
-                if loop.is_closed():
-                    raise RuntimeError("Event loop is closed")
-            except RuntimeError:
-                # Create a new event loop if none exists or is closed
-                loop = asyncio.new_event_loop()
-                asyncio.set_event_loop(loop)
-            
-            # Run the async function
-            result = loop.run_until_complete(cls.send_message(chat_id, text))
-            return result
-                
+            return cls.run_sync(cls.send_message(chat_id, text))
         except Exception as e:
             logger.error(f"Error in sync wrapper for sending message to {chat_id}: {e}")
             return False
     
+    @classmethod
+    async def send_messages(cls, chat_ids: Iterable[int], text: str, **kwargs) -> Dict[int, bool]:
+        """
+        Send the same message to many chats concurrently
+        
+        Sends are paced to SEND_RATE_PER_SECOND with at most SEND_CONCURRENCY in
+        flight; a RetryAfter from Telegram pauses and retries that chat once.
+        
+        Args:
+            chat_ids: Telegram chat IDs
+            text: Message text
+            **kwargs: Extra send_message arguments (parse_mode, reply_markup, ...)
+            
+        Returns:
+            {chat_id: success}
+        """
+        bot = cls.get_bot()
+        semaphore = asyncio.Semaphore(cls.SEND_CONCURRENCY)
+        interval = 1.0 / cls.SEND_RATE_PER_SECOND
+        next_slot = [time.monotonic()]
+        
+        async def send(chat_id):
+            async with semaphore:
+                for attempt in range(2):
+                    # Reserve the next send slot
+                    now = time.monotonic()
+                    slot = max(now, next_slot[0])
+                    next_slot[0] = slot + interval
+                    if slot > now:
+                        await asyncio.sleep(slot - now)
+                    try:
+                        await bot.send_message(chat_id=chat_id, text=text, **kwargs)
+                        return chat_id, True
+                    except RetryAfter as e:
+                        retry_after = e.retry_after.total_seconds() if hasattr(e.retry_after, 'total_seconds') else e.retry_after
+                        logger.warning(f"⚠️ Telegram flood limit, pausing sends for {retry_after}s")
+                        next_slot[0] = max(next_slot[0], time.monotonic() + retry_after)
+                    except (Forbidden, BadRequest) as e:
+                        # Blocked the bot / chat not found - retrying won't help
+                        logger.debug(f"Cannot send to {chat_id}: {e}")
+                        return chat_id, False
+                    except Exception as e:
+                        logger.error(f"Error sending message to user {chat_id}: {e}")
+                        return chat_id, False
+                return chat_id, False
+        
+        results = await asyncio.gather(*(send(chat_id) for chat_id in chat_ids))
+        return dict(results)
+    
+    @classmethod
+    def send_messages_sync(cls, chat_ids: Iterable[int], text: str, **kwargs) -> Dict[int, bool]:
+        """
+        Synchronous wrapper for send_messages (blocks until every chat was tried)
+        
+        Returns:
+            {chat_id: success}
+        """
+        chat_ids = list(chat_ids)
+        if not chat_ids:
+            return {}
+        # Long broadcasts legitimately take minutes; allow for pacing plus flood waits
+        timeout = 120 + len(chat_ids) / cls.SEND_RATE_PER_SECOND * 2
+        try:
+            return cls.run_sync(cls.send_messages(chat_ids, text, **kwargs), timeout=timeout)
+        except Exception as e:
+            logger.error(f"Error in batch send to {len(chat_ids)} chats: {e}")
+            return {chat_id: False for chat_id in chat_ids}
+    
     @classmethod
     async def create_forum_topic(cls, chat_id: int, name: str) -> int:
         """
@@ -176,7 +315,8 @@ class TelegramHelper:
         """
         try:
             bot = cls.get_bot()
-            topic = await bot.create_forum_topic(chat_id=chat_id, name=name)
+            # Callers may be on another event loop (e.g. the bot's); the shared Bot lives on ours
+            topic = await cls.run_async(bot.create_forum_topic(chat_id=chat_id, name=name))
             logger.info(f"✅ Created forum topic '{name}' (ID: {topic.message_thread_id}) in chat {chat_id}")
             return topic.message_thread_id
         except Exception as e:
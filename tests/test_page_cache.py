@@ -0,0 +1,70 @@
+"""
+Per-user page cache (webapp.cached_user_page): ETag revalidation
+"""
+
+import os
+
+os.environ.setdefault('BOT_TOKEN', '0:test')
+os.environ.setdefault('ADMIN_ID', '1')
+os.environ.setdefault('MYSQL_PASSWORD', 'test')
+
+from flask import Flask, g, session
+
+import webapp
+
+
+class FakeDB:
+    def __init__(self):
+        self.version = {'seconds_since_change': 60, 'clients': 3}
+
+    def get_user_page_version(self, user_id):
+        return dict(self.version)
+
+
+def make_client(db, user_id):
+    app = Flask(__name__)
+    app.secret_key = 'test'
+    renders = []
+
+    @app.before_request
+    def use_fake_db():
+        g.db = db
+
+    @app.route('/login')
+    def login():
+        session['user_id'] = user_id
+        return 'ok'
+
+    @app.route('/services')
+    @webapp.cached_user_page
+    def services():
+        renders.append(1)
+        return '<html>services</html>'
+
+    client = app.test_client()
+    client.get('/login')
+    return client, renders
+
+
+def test_matching_if_none_match_gets_304():
+    client, renders = make_client(FakeDB(), user_id=1001)
+    first = client.get('/services')
+    assert first.status_code == 200
+    etag = first.headers['ETag']
+    assert etag.startswith('W/"')
+
+    second = client.get('/services', headers={'If-None-Match': etag})
+    assert second.status_code == 304
+    assert renders == [1]
+
+
+def test_changed_version_renders_again():
+    db = FakeDB()
+    client, renders = make_client(db, user_id=1002)
+    etag = client.get('/services').headers['ETag']
+
+    db.version['clients'] = 4
+    response = client.get('/services', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
+    assert renders == [1, 1]
@@ -14,6 +14,10 @@ from admin_manager import AdminManager
 from telegram import Bot, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.request import HTTPXRequest
 from config import BOT_CONFIG
+from sync_engine import extract_panel_clients
+from notification_dispatcher import NotificationDispatcher, NotificationPriority
+from expiry_index import ExpiryIndex
+from panel_batch import PanelActionQueue
 
 class NoProxyRequest(HTTPXRequest):
     """Custom request class to disable system proxies"""
@@ -24,6 +28,9 @@ class NoProxyRequest(HTTPXRequest):
 logger = logging.getLogger(__name__)
 
 class TrafficMonitor:
+    # Concurrent per-client lookups for services the panel's batch listing reports without traffic
+    DIRECT_LOOKUP_CONCURRENCY = 8
+    
     def __init__(self, db: ProfessionalDatabaseManager, admin_manager: AdminManager, bot: Bot):
         """
         Initialize TrafficMonitor
@@ -44,12 +51,16 @@ class TrafficMonitor:
             self.bot_token = BOT_CONFIG.get('token')
         self.bot_instance = None  # VPNBot instance - will be set separately if available (for reporting_system access)
         self.monitoring = False
-        # Rate limiting for message sending (avoid Telegram flood control)
-        self.message_queue = asyncio.Queue()
-        self.message_semaphore = asyncio.Semaphore(5)  # Max 5 concurrent messages
-        self.last_message_time = {}  # Track last message time per user
-        self.min_message_interval = 1.0  # Minimum 1 second between messages to same user
+        # Prioritized, rate-limited, persisted user notifications (created in start_monitoring)
+        self.dispatcher = None
         self.pending_updates = []  # Store updates for bulk commit
+        self.sync_engine = None  # SyncEngine - when set, panel data is read from its published snapshot
+        # Deadline heap: only services whose expiry/warning/grace deadline passed are evaluated
+        self.expiry_index = ExpiryIndex(db)
+        self._due_plan_services = set()
+        self._due_deletions = {}
+        # Panel disable/delete calls collected during a cycle and flushed per panel
+        self.panel_actions = PanelActionQueue()
         
     async def start_monitoring(self):
         """Start traffic monitoring - checks every 3 minutes (exactly 180 seconds)"""
@@ -84,8 +95,15 @@ class TrafficMonitor:
         self.monitoring = True
         logger.info("🚀 Traffic monitoring started")
         
-        # Start message queue processor in background for rate-limited messaging
-        asyncio.create_task(self._process_message_queue())
+        # Build the expiry deadline index once; later cycles only apply changed rows
+        try:
+            await asyncio.to_thread(self.expiry_index.load)
+        except Exception as e:
+            logger.error(f"❌ Could not load expiry index, falling back to full scans: {e}")
+        
+        # Start the notification dispatcher on this loop, with the loop-bound bot
+        self.dispatcher = NotificationDispatcher(self.db, self.bot)
+        asyncio.create_task(self.dispatcher.run())
         
         while self.monitoring:
             try:
@@ -125,51 +143,21 @@ class TrafficMonitor:
         except Exception as e:
             logger.debug(f"Error shutting down bot: {e}")
     
-    async def _process_message_queue(self):
-        """Process message queue with rate limiting to avoid Telegram flood control"""
-        while self.monitoring:
-            try:
-                # Get message from queue (wait max 1 second)
-                try:
-                    chat_id, message, reply_markup = await asyncio.wait_for(
-                        self.message_queue.get(), timeout=1.0
-                    )
-                except asyncio.TimeoutError:
-                    continue
-                
-                # Rate limiting: check if we need to wait before sending to this user
-                now = asyncio.get_event_loop().time()
-                last_time = self.last_message_time.get(chat_id, 0)
-                time_since_last = now - last_time
-                
-                if time_since_last < self.min_message_interval:
-                    await asyncio.sleep(self.min_message_interval - time_since_last)
-                
-                # Send message with semaphore (limit concurrent sends)
-                async with self.message_semaphore:
-                    try:
-                        await self.bot.send_message(
-                            chat_id=chat_id,
-                            text=message,
-                            parse_mode='Markdown',
-                            reply_markup=reply_markup
-                        )
-                        self.last_message_time[chat_id] = asyncio.get_event_loop().time()
-                    except Exception as e:
-                        # Log but don't spam - user might have blocked bot
-                        if "blocked" not in str(e).lower() and "forbidden" not in str(e).lower():
-                            logger.debug(f"Error sending message to {chat_id}: {e}")
-                
-                self.message_queue.task_done()
-                
-            except Exception as e:
-                logger.debug(f"Error in message queue processor: {e}")
-                await asyncio.sleep(0.1)
-    
-    async def _send_message_safe(self, chat_id: int, message: str, reply_markup=None):
-        """Send message safely with rate limiting"""
+    async def _send_message_safe(self, chat_id: int, message: str, reply_markup=None,
+                                 priority: NotificationPriority = NotificationPriority.NORMAL,
+                                 kind: str = None, dedup_key: str = None):
+        """Queue a user notification on the dispatcher (priority, rate limits, dedup, persistence)"""
         try:
-            await self.message_queue.put((chat_id, message, reply_markup))
+            if self.dispatcher:
+                await asyncio.to_thread(self.dispatcher.enqueue, chat_id, message, reply_markup,
+                                        priority, kind, dedup_key)
+            else:
+                await self.bot.send_message(
+                    chat_id=chat_id,
+                    text=message,
+                    parse_mode='Markdown',
+                    reply_markup=reply_markup
+                )
         except Exception as e:
             logger.debug(f"Error queuing message: {e}")
 
@@ -193,6 +181,43 @@ class TrafficMonitor:
         except Exception as e:
             logger.error(f"❌ Error flushing updates: {e}")
     
+    async def flush_panel_actions(self):
+        """Execute queued panel actions: one batch per panel and action, panels in parallel"""
+        if not len(self.panel_actions):
+            return
+        
+        import time
+        flush_start = time.time()
+        batches_by_panel = defaultdict(list)
+        for (panel_id, action), entries in self.panel_actions.drain().items():
+            batches_by_panel[panel_id].append((action, entries))
+        
+        async def run_panel(panel_id, batches):
+            def execute(action, services):
+                panel_manager = self.admin_manager.get_panel_manager(panel_id)
+                if not panel_manager or not panel_manager.login():
+                    logger.error(f"Could not connect to panel {panel_id} to {action} {len(services)} services")
+                    return {}
+                return PanelActionQueue.execute(panel_manager, action, services)
+            
+            # Disables before deletes on the same panel
+            for action, entries in sorted(batches, key=lambda b: PanelActionQueue.ACTIONS.index(b[0])):
+                services = [service for service, _ in entries]
+                try:
+                    results = await asyncio.to_thread(execute, action, services)
+                except Exception as e:
+                    logger.error(f"❌ Panel {panel_id} batch {action} failed: {e}")
+                    results = {}
+                ok = sum(1 for service in services if results.get(service['client_uuid']))
+                logger.info(f"📦 Panel {panel_id}: {action} {ok}/{len(services)} clients")
+                for service, callback in entries:
+                    if callback:
+                        await callback(service, results.get(service['client_uuid'], False))
+        
+        await asyncio.gather(*(run_panel(panel_id, batches) for panel_id, batches in batches_by_panel.items()),
+                             return_exceptions=True)
+        logger.info(f"📦 Flushed panel actions for {len(batches_by_panel)} panels in {time.time() - flush_start:.2f}s")
+    
     async def check_all_services(self):
         """Check all active services - OPTIMIZED with batch data for maximum speed"""
         try:
@@ -204,6 +229,8 @@ class TrafficMonitor:
             
             # Clear pending updates at start of cycle
             self.pending_updates = []
+            
+            await self.collect_due_deadlines()
 
             
             if not services:
@@ -227,8 +254,15 @@ class TrafficMonitor:
             if tasks:
                 await asyncio.gather(*tasks, return_exceptions=True)
             
+            # Run the queued panel disables/deletes, grouped per panel
+            await self.flush_panel_actions()
+            
             # Flush any pending updates to database in bulk
             await self.flush_updates()
+            
+            # Re-evaluate handled deadlines; anything still pending (panel down) comes due again
+            if self._due_plan_services:
+                await asyncio.to_thread(self.expiry_index.refresh, self._due_plan_services)
 
             
             check_duration = time.time() - check_start
@@ -237,6 +271,25 @@ class TrafficMonitor:
         except Exception as e:
             logger.error(f"❌ Error in check_all_services: {e}", exc_info=True)
     
+    async def collect_due_deadlines(self):
+        """Sync the expiry index with changed rows and take the deadlines that passed"""
+        try:
+            await asyncio.to_thread(self.expiry_index.sync_changes)
+            due = self.expiry_index.pop_due()
+            self._due_plan_services = set(due.get(ExpiryIndex.PLAN_EXPIRY, []) +
+                                          due.get(ExpiryIndex.THREE_DAY_WARNING, []))
+            self._due_deletions = {
+                ExpiryIndex.EXHAUSTED_DELETION: due.get(ExpiryIndex.EXHAUSTED_DELETION, []),
+                ExpiryIndex.EXPIRED_DELETION: due.get(ExpiryIndex.EXPIRED_DELETION, []),
+            }
+            if due:
+                logger.info(f"⏱️ Due deadlines: {', '.join(f'{kind}={len(ids)}' for kind, ids in due.items())} "
+                            f"({len(self.expiry_index)} tracked)")
+        except Exception as e:
+            logger.error(f"❌ Error collecting due deadlines: {e}")
+            self._due_plan_services = set()
+            self._due_deletions = {}
+    
     async def check_panel_services_parallel(self, panel_id: int, services: List[Dict]):
         """Check all services for a single panel - OPTIMIZED with batch data for maximum speed"""
         try:
@@ -245,15 +298,23 @@ class TrafficMonitor:
             if not panel_manager:
                 return
             
-            # Login once per panel
-            try:
-                if not panel_manager.login():
-                    return
-            except Exception as e:
-                return
+            # Prefer the sync engine snapshot: the leader already fetched this panel
+            # and wrote used_gb, so no panel listing and no duplicate DB write here
+            all_panel_clients = None
+            if self.sync_engine:
+                all_panel_clients = await asyncio.to_thread(self.sync_engine.get_panel_clients, panel_id)
+            from_snapshot = all_panel_clients is not None
             
-            # Get ALL clients from panel in ONE API call (batch) - MUCH FASTER
-            all_panel_clients = self.get_all_clients_from_panel_batch(panel_manager)
+            if not from_snapshot:
+                # Login once per panel
+                try:
+                    if not panel_manager.login():
+                        return
+                except Exception as e:
+                    return
+                
+                # Get ALL clients from panel in ONE API call (batch) - MUCH FASTER
+                all_panel_clients = self.get_all_clients_from_panel_batch(panel_manager)
             
             if not all_panel_clients:
                 # Fallback: if batch fails, try individual calls (slower)
@@ -263,6 +324,12 @@ class TrafficMonitor:
                     await asyncio.gather(*tasks, return_exceptions=True)
                 return
             
+            # The sync engine's snapshot is authoritative; without it, services the batch
+            # listing reports with no traffic are looked up once each on the logged-in manager
+            direct_details = {}
+            if not from_snapshot:
+                direct_details = await self.fetch_direct_client_details(panel_manager, services, all_panel_clients)
+            
             # Process services in parallel using batch data - VERY FAST
             # Use semaphore to limit concurrent operations (avoid overwhelming panel)
             # INCREASED CONCURRENCY: Database bottleneck removed, can handle more parallel checks
@@ -271,7 +338,9 @@ class TrafficMonitor:
             
             async def check_service_with_semaphore(service):
                 async with semaphore:
-                    return await self.check_service_traffic_optimized(service, panel_manager, all_panel_clients)
+                    return await self.check_service_traffic_optimized(service, panel_manager, all_panel_clients,
+                                                                      from_snapshot=from_snapshot,
+                                                                      direct_details=direct_details.get(service.get('id')))
             
             tasks = [check_service_with_semaphore(service) for service in services]
             if tasks:
@@ -290,133 +359,83 @@ class TrafficMonitor:
             inbounds = panel_manager.get_inbounds()
             if not inbounds:
                 return {}
-            
-            all_clients = {}
-            
-            # Extract all clients from all inbounds
-            for inbound in inbounds:
-                inbound_id = inbound.get('id')
-                if not inbound_id:
-                    continue
-                
-                # Get clients - check both direct clients and settings.clients
-                clients = []
-                
-                # First check direct clients (newer 3x-ui versions)
-                if 'clients' in inbound and isinstance(inbound['clients'], list):
-                    clients = inbound['clients']
-                
-                # If no direct clients, check settings.clients
-                if not clients:
-                    settings = inbound.get('settings', {})
-                    if settings is None:
-                        settings = {}
-                    
-                    if isinstance(settings, str):
-                        import json
-                        try:
-                            settings = json.loads(settings)
-                        except:
-                            continue
-                    
-                    if isinstance(settings, dict) and 'clients' in settings:
-                        clients = settings.get('clients', [])
-                
-                # Ensure clients is a list
-                if not isinstance(clients, list) or len(clients) == 0:
-                    continue
-                
-                # Get clientStats for traffic data - use advanced matching like optimized_monitor
-                client_stats = inbound.get('clientStats', [])
-                
-                # Process each client
-                for client in clients:
-                    client_uuid = client.get('id')
-                    if not client_uuid:
-                        continue
-                    
-                    # Get traffic stats - try multiple matching methods (like optimized_monitor)
-                    stat = None
-                    used_traffic = 0
-                    last_activity = 0
-                    
-                    # Priority 1: Match from clientStats using multiple methods
-                    if client_stats and isinstance(client_stats, list):
-                        for stat_item in client_stats:
-                            if not isinstance(stat_item, dict):
-                                continue
-                            
-                            # Try multiple field names for matching
-                            stat_id = stat_item.get('id', '')
-                            stat_uuid = stat_item.get('uuid', '')
-                            stat_email = stat_item.get('email', '')
-                            
-                            stat_id_str = str(stat_id) if stat_id else ''
-                            stat_uuid_str = str(stat_uuid) if stat_uuid else ''
-                            
-                            # Extract UUID from email if present
-                            email_uuid = ''
-                            if '@' in str(stat_email):
-                                email_parts = str(stat_email).split('@')[0]
-                                if len(email_parts) > 30:  # UUID-like length
-                                    email_uuid = email_parts
-                            
-                            # Match using multiple methods
-                            if (stat_id_str == str(client_uuid) or 
-                                stat_uuid_str == str(client_uuid) or
-                                email_uuid == str(client_uuid)):
-                                stat = stat_item
-                                up_bytes = stat.get('up', 0) or 0
-                                down_bytes = stat.get('down', 0) or 0
-                                used_traffic = up_bytes + down_bytes
-                                last_activity = stat.get('lastOnline', 0) or 0
-                                break
-                    
-                    # Priority 2: Get from client object directly
-                    if used_traffic == 0:
-                        if 'up' in client and 'down' in client:
-                            up_bytes = client.get('up', 0) or 0
-                            down_bytes = client.get('down', 0) or 0
-                            used_traffic = up_bytes + down_bytes
-                        elif 'upload' in client and 'download' in client:
-                            up_bytes = client.get('upload', 0) or 0
-                            down_bytes = client.get('download', 0) or 0
-                            used_traffic = up_bytes + down_bytes
-                    
-                    # Get last activity
-                    if last_activity == 0:
-                        last_activity = stat.get('lastOnline', 0) if stat else 0
-                        if last_activity == 0:
-                            last_activity = client.get('lastOnline', 0) or 0
-                    
-                    # Get total traffic
-                    total_traffic = client.get('totalGB', 0)
-                    if total_traffic == 0:
-                        total_traffic = client.get('total', 0)  # Alternative field name
-                    
-                    client_details = {
-                        'id': client_uuid,
-                        'inbound_id': inbound_id,
-                        'total_traffic': total_traffic,
-                        'used_traffic': used_traffic,
-                        'expiryTime': client.get('expiryTime', 0),
-                        'enable': client.get('enable', True),
-                        'last_activity': last_activity,
-                        'email': client.get('email', 'Unknown')
-                    }
-                    
-                    all_clients[str(client_uuid)] = client_details
-            
-            return all_clients
+            return extract_panel_clients(inbounds)
             
         except Exception as e:
             logger.error(f"❌ Error getting batch clients from panel: {e}")
             return {}
     
-    async def check_service_traffic_optimized(self, service: Dict, panel_manager, all_panel_clients: Dict):
-        """Check traffic for a service using cached panel data"""
+    def get_direct_client_details(self, panel_manager, service: Dict) -> Optional[Dict]:
+        """Real-time details of one client from the panel API (blocking)"""
+        client_uuid = str(service.get('client_uuid', ''))
+        try:
+            import inspect
+            sig = inspect.signature(panel_manager.get_client_details)
+            params = list(sig.parameters.keys())
+            
+            # Check if panel manager supports optional parameters (Marzban does, PanelManager doesn't)
+            if 'update_inbound_callback' in params and 'service_id' in params:
+                # MarzbanPanelManager - supports callback and client_name
+                kwargs = {
+                    'update_inbound_callback': None,
+                    'service_id': service.get('id')
+                }
+                if 'client_name' in params:
+                    kwargs['client_name'] = service.get('client_name')
+                return panel_manager.get_client_details(service.get('inbound_id'), client_uuid, **kwargs)
+            if 'client_name' in params:
+                return panel_manager.get_client_details(
+                    service.get('inbound_id'),
+                    client_uuid,
+                    client_name=service.get('client_name')
+                )
+            # PanelManager - only accepts inbound_id and client_uuid
+            return panel_manager.get_client_details(service.get('inbound_id'), client_uuid)
+        except Exception as e:
+            logger.debug(f"Direct lookup of service {service.get('id')} failed, using batch data: {e}")
+            return None
+    
+    async def fetch_direct_client_details(self, panel_manager, services: List[Dict],
+                                          all_panel_clients: Dict) -> Dict[int, Dict]:
+        """
+        Look up, with bounded concurrency, the services whose batch entry is missing
+        or shows no traffic (some panels only report usage per client)
+        
+        Returns:
+            {service_id: client_details} for the lookups that succeeded
+        """
+        pending = []
+        for service in services:
+            client_uuid = str(service.get('client_uuid', ''))
+            if not client_uuid:
+                continue
+            batch = all_panel_clients.get(client_uuid)
+            if not batch or batch.get('used_traffic', 0) == 0:
+                pending.append(service)
+        if not pending:
+            return {}
+        
+        semaphore = asyncio.Semaphore(self.DIRECT_LOOKUP_CONCURRENCY)
+        
+        async def lookup(service):
+            async with semaphore:
+                return service.get('id'), await asyncio.to_thread(self.get_direct_client_details,
+                                                                  panel_manager, service)
+        
+        results = await asyncio.gather(*(lookup(service) for service in pending))
+        logger.debug(f"Direct lookups for {len(pending)} services without batch traffic")
+        return {service_id: details for service_id, details in results if details}
+    
+    async def check_service_traffic_optimized(self, service: Dict, panel_manager, all_panel_clients: Dict,
+                                              from_snapshot: bool = False, direct_details: Dict = None):
+        """
+        Check traffic for a service using cached panel data
+        
+        Args:
+            from_snapshot: all_panel_clients is the sync engine's snapshot - trusted as is
+            direct_details: Result of fetch_direct_client_details() for this service, if any
+        """
         try:
-            service_id = service.get('id')
             client_uuid = str(service.get('client_uuid', ''))
             
             if not client_uuid:
@@ -424,58 +443,20 @@ class TrafficMonitor:
             
             # Get client details from batch data
             client_details = all_panel_clients.get(client_uuid)
+            batch_details = client_details
             
-            # If batch data has no traffic or missing, try direct API call for accuracy
-            if not client_details or client_details.get('used_traffic', 0) == 0:
-                # Fallback: Get real-time data directly from panel API
-                try:
-                    import inspect
-                    sig = inspect.signature(panel_manager.get_client_details)
-                    params = list(sig.parameters.keys())
-                    
-                    # Check if panel manager supports optional parameters (Marzban does, PanelManager doesn't)
-                    # Check if panel manager supports optional parameters (Marzban does, PanelManager doesn't)
-                    if 'update_inbound_callback' in params and 'service_id' in params:
-                        # MarzbanPanelManager - supports callback and client_name
-                        kwargs = {
-                            'update_inbound_callback': None,
-                            'service_id': service_id
-                        }
-                        if 'client_name' in params:
-                            kwargs['client_name'] = service.get('client_name')
-                            
-                        direct_details = panel_manager.get_client_details(
-                            service.get('inbound_id'),
-                            client_uuid,
-                            **kwargs
-                        )
-                    else:
-                        # PanelManager - only accepts inbound_id and client_uuid
-                        # Note: We updated PanelManager to accept these, but check just in case
-                        if 'client_name' in params:
-                             direct_details = panel_manager.get_client_details(
-                                service.get('inbound_id'),
-                                client_uuid,
-                                client_name=service.get('client_name')
-                            )
-                        else:
-                            direct_details = panel_manager.get_client_details(
-                                service.get('inbound_id'),
-                                client_uuid
-                            )
-                    
-                    # Use direct data if available and has traffic, otherwise use batch data
-                    if direct_details and direct_details.get('used_traffic', 0) > 0:
-                        client_details = direct_details
-                    elif not client_details:
-                        client_details = direct_details
-                except:
-                    pass  # Use batch data if direct call fails
-                
-                if not client_details:
-                    return
+            # Use direct data if it has traffic, otherwise batch data
+            if direct_details and direct_details.get('used_traffic', 0) > 0:
+                client_details = direct_details
+            elif not client_details:
+                client_details = direct_details
             
-            await self.process_client_traffic(service, client_details)
+            if not client_details:
+                return
+            
+            # Snapshot values were already written by the sync engine
+            queue_update = not (from_snapshot and client_details is batch_details)
+            await self.process_client_traffic(service, client_details, queue_update=queue_update)
                     
         except Exception as e:
             logger.error(f"❌ Error checking service {service.get('id')}: {e}", exc_info=True)
@@ -562,15 +543,17 @@ class TrafficMonitor:
             import traceback
             logger.debug(traceback.format_exc())
     
-    async def process_client_traffic(self, service: Dict, client: Dict):
+    async def process_client_traffic(self, service: Dict, client: Dict, queue_update: bool = True):
         """Process traffic data for a client - REAL-TIME from panel API"""
         try:
             service_id = service.get('id')
             client_name = service.get('client_name', 'Unknown')
             
-            # Check expiration for plan-based services first
+            # Check expiration for plan-based services first - only when a deadline is due,
+            # or during the grace period where overage needs the live traffic
             is_plan_service = service.get('product_id') is not None
-            if is_plan_service:
+            if is_plan_service and (not self.expiry_index.loaded or service_id in self._due_plan_services
+                                    or service.get('status') == 'disabled'):
                 await self.check_plan_expiration(service, client)
             
             # Get traffic data from client details (REAL-TIME from panel API)
@@ -605,10 +588,11 @@ class TrafficMonitor:
             
             # Update used_gb in database - CRITICAL: This updates the database with real-time data
             # OPTIMIZATION: Queue update for bulk commit instead of individual DB call
-            self.pending_updates.append({
-                'id': service_id,
-                'used_gb': used_gb
-            })
+            if queue_update:
+                self.pending_updates.append({
+                    'id': service_id,
+                    'used_gb': used_gb
+                })
             # self.db.update_client_status(service_id, used_gb=used_gb)
 
             
@@ -685,31 +669,30 @@ class TrafficMonitor:
         except Exception as e:
             logger.error(f"Error checking disabled service overage for service {service.get('id')}: {e}")
     
-    async def handle_traffic_exhausted(self, service: Dict):
+    async def handle_traffic_exhausted(self, service: Dict, panel_success: bool = None):
         """Handle traffic exhaustion - disable service and set grace period"""
         try:
             # Check if already disabled
             if service.get('status') == 'disabled':
                 return
             
-            # Disable service on panel
-            panel_manager = self.admin_manager.get_panel_manager(service['panel_id'])
-            if panel_manager and panel_manager.login():
-                success = panel_manager.disable_client(service['inbound_id'], service['client_uuid'], client_name=service.get('client_name'))
-                if success:
-                    # Update database - set status to disabled but keep is_active=True during grace period
-                    self.db.update_service_status(service['id'], 'disabled')
-                    self.db.update_service_exhaustion_time(service['id'])
-                    # Note: We do NOT set is_active=False here - service remains visible during 24h grace period
-                    # is_active will be set to False only when service is actually deleted after 24 hours
-                    
-                    # Send notification
-                    await self.send_exhaustion_notification(service)
-                    
-                else:
-                    logger.error(f"Failed to disable service {service['id']} on panel")
+            # Disable service on panel - batched per panel, called again with the result after the flush
+            if panel_success is None:
+                self.panel_actions.add('disable', service, self.handle_traffic_exhausted)
+                return
+            
+            if panel_success:
+                # Update database - set status to disabled but keep is_active=True during grace period
+                self.db.update_service_status(service['id'], 'disabled')
+                self.db.update_service_exhaustion_time(service['id'])
+                # Note: We do NOT set is_active=False here - service remains visible during 24h grace period
+                # is_active will be set to False only when service is actually deleted after 24 hours
+                
+                # Send notification
+                await self.send_exhaustion_notification(service)
+                
             else:
-                logger.error(f"Could not connect to panel to disable service {service['id']}")
+                logger.error(f"Failed to disable service {service['id']} on panel")
             
         except Exception as e:
             logger.error(f"Error handling traffic exhaustion for service {service['id']}: {e}")
@@ -770,7 +753,10 @@ class TrafficMonitor:
             await self._send_message_safe(
                 user['telegram_id'],
                 message,
-                reply_markup
+                reply_markup,
+                priority=NotificationPriority.CRITICAL,
+                kind='exhausted',
+                dedup_key=f"service:{service['id']}"
             )
             
             
@@ -859,7 +845,10 @@ class TrafficMonitor:
             await self._send_message_safe(
                 user['telegram_id'],
                 message,
-                reply_markup
+                reply_markup,
+                priority=NotificationPriority.LOW,
+                kind='70_percent',
+                dedup_key=f"service:{service['id']}"
             )
             
             # Report to channel
@@ -889,19 +878,19 @@ class TrafficMonitor:
         except Exception as e:
             logger.error(f"Error sending 70% warning: {e}")
     
-    async def delete_service_for_overage(self, service: Dict, usage_percentage: float, overage_gb: float):
+    async def delete_service_for_overage(self, service: Dict, usage_percentage: float, overage_gb: float,
+                                         panel_success: bool = None):
         """Delete service immediately due to overage during grace period"""
         try:
             service_id = service.get('id')
             
-            # Delete from panel first
-            panel_manager = self.admin_manager.get_panel_manager(service['panel_id'])
-            if panel_manager and panel_manager.login():
-                success = panel_manager.delete_client(service['inbound_id'], service['client_uuid'])
-                if not success:
-                    logger.warning(f"Failed to delete overage service {service_id} from panel")
-            else:
-                logger.warning(f"Could not connect to panel to delete overage service {service_id}")
+            # Delete from panel first - batched per panel, called again with the result after the flush
+            if panel_success is None:
+                self.panel_actions.add('delete', service, lambda s, ok: self.delete_service_for_overage(
+                    s, usage_percentage, overage_gb, panel_success=ok))
+                return
+            if not panel_success:
+                logger.warning(f"Failed to delete overage service {service_id} from panel")
             
             # Delete from database
             self.db.delete_service(service_id)
@@ -924,11 +913,13 @@ class TrafficMonitor:
                 keyboard = [[InlineKeyboardButton("🏠 صفحه اصلی", callback_data="main_menu")]]
                 reply_markup = InlineKeyboardMarkup(keyboard)
                 
-                await self.bot.send_message(
-                    chat_id=user['telegram_id'],
-                    text=message,
-                    parse_mode='Markdown',
-                    reply_markup=reply_markup
+                await self._send_message_safe(
+                    user['telegram_id'],
+                    message,
+                    reply_markup,
+                    priority=NotificationPriority.CRITICAL,
+                    kind='deleted_overage',
+                    dedup_key=f"service:{service['id']}"
                 )
             
             # Report to channel
@@ -961,31 +952,43 @@ class TrafficMonitor:
     async def check_for_deletion(self):
         """Check for services that should be deleted after 24 hours"""
         try:
-            # Get services that were exhausted more than 24 hours ago
-            services_to_delete = self.db.get_services_for_deletion()
+            if self.expiry_index.loaded:
+                # Only services whose grace deadline passed; the query re-validates them
+                exhausted_ids = self._due_deletions.get(ExpiryIndex.EXHAUSTED_DELETION, [])
+                expired_ids = self._due_deletions.get(ExpiryIndex.EXPIRED_DELETION, [])
+                self._due_deletions = {}
+                services_to_delete = self.db.get_services_for_deletion(service_ids=exhausted_ids)
+                expired_plan_services = self.db.get_expired_plan_services_for_deletion(service_ids=expired_ids)
+            else:
+                exhausted_ids = expired_ids = []
+                # Get services that were exhausted more than 24 hours ago
+                services_to_delete = self.db.get_services_for_deletion()
+                # Check for expired plan services that need deletion
+                expired_plan_services = self.db.get_expired_plan_services_for_deletion()
             
             for service in services_to_delete:
                 await self.delete_exhausted_service(service)
             
-            # Check for expired plan services that need deletion
-            expired_plan_services = self.db.get_expired_plan_services_for_deletion()
             for service in expired_plan_services:
                 await self.delete_expired_plan_service(service)
+            
+            await self.flush_panel_actions()
+            
+            if exhausted_ids or expired_ids:
+                await asyncio.to_thread(self.expiry_index.refresh, exhausted_ids + expired_ids)
                 
         except Exception as e:
             logger.error(f"Error checking for deletion: {e}")
     
-    async def delete_exhausted_service(self, service: Dict):
+    async def delete_exhausted_service(self, service: Dict, panel_success: bool = None):
         """Delete an exhausted service after 24 hours grace period"""
         try:
-            # Delete from panel first
-            panel_manager = self.admin_manager.get_panel_manager(service['panel_id'])
-            if panel_manager and panel_manager.login():
-                success = panel_manager.delete_client(service['inbound_id'], service['client_uuid'])
-                if not success:
-                    logger.warning(f"Failed to delete service {service['id']} from panel")
-            else:
-                logger.warning(f"Could not connect to panel to delete service {service['id']}")
+            # Delete from panel first - batched per panel, called again with the result after the flush
+            if panel_success is None:
+                self.panel_actions.add('delete', service, self.delete_exhausted_service)
+                return
+            if not panel_success:
+                logger.warning(f"Failed to delete service {service['id']} from panel")
             
             # Delete from database
             self.db.delete_service(service['id'])
@@ -1004,11 +1007,13 @@ class TrafficMonitor:
                 keyboard = [[InlineKeyboardButton("🏠 صفحه اصلی", callback_data="main_menu")]]
                 reply_markup = InlineKeyboardMarkup(keyboard)
                 
-                await self.bot.send_message(
-                    chat_id=user['telegram_id'],
-                    text=message,
-                    parse_mode='Markdown',
-                    reply_markup=reply_markup
+                await self._send_message_safe(
+                    user['telegram_id'],
+                    message,
+                    reply_markup,
+                    priority=NotificationPriority.CRITICAL,
+                    kind='deleted_grace_period',
+                    dedup_key=f"service:{service['id']}"
                 )
             
             
@@ -1141,28 +1146,27 @@ class TrafficMonitor:
         except Exception as e:
             logger.error(f"Error checking expired service overage for service {service.get('id')}: {e}")
     
-    async def handle_plan_expiration(self, service: Dict):
+    async def handle_plan_expiration(self, service: Dict, panel_success: bool = None):
         """Handle plan service expiration - disable service and set grace period"""
         try:
             service_id = service.get('id')
             
-            # Disable service on panel
-            panel_manager = self.admin_manager.get_panel_manager(service['panel_id'])
-            if panel_manager and panel_manager.login():
-                success = panel_manager.disable_client(service['inbound_id'], service['client_uuid'])
-                if success:
-                    # Update database - set status to disabled but keep is_active=True during grace period
-                    self.db.update_service_status(service_id, 'disabled')
-                    self.db.update_service_expiration_time(service_id)
-                    # Note: We do NOT set is_active=False here - service remains visible during 24h grace period
-                    # is_active will be set to False only when service is actually deleted after 24 hours
-                    
-                    # Send notification
-                    await self.send_plan_expiration_notification(service)
-                else:
-                    logger.error(f"Failed to disable expired plan service {service_id} on panel")
+            # Disable service on panel - batched per panel, called again with the result after the flush
+            if panel_success is None:
+                self.panel_actions.add('disable', service, self.handle_plan_expiration)
+                return
+            
+            if panel_success:
+                # Update database - set status to disabled but keep is_active=True during grace period
+                self.db.update_service_status(service_id, 'disabled')
+                self.db.update_service_expiration_time(service_id)
+                # Note: We do NOT set is_active=False here - service remains visible during 24h grace period
+                # is_active will be set to False only when service is actually deleted after 24 hours
+                
+                # Send notification
+                await self.send_plan_expiration_notification(service)
             else:
-                logger.error(f"Could not connect to panel to disable expired plan service {service_id}")
+                logger.error(f"Failed to disable expired plan service {service_id} on panel")
             
         except Exception as e:
             logger.error(f"Error handling plan expiration for service {service['id']}: {e}")
@@ -1212,7 +1216,10 @@ class TrafficMonitor:
             await self._send_message_safe(
                 user['telegram_id'],
                 message,
-                reply_markup
+                reply_markup,
+                priority=NotificationPriority.NORMAL,
+                kind='expiring_soon',
+                dedup_key=f"service:{service['id']}"
             )
             
             # Report to channel
@@ -1296,7 +1303,10 @@ class TrafficMonitor:
             await self._send_message_safe(
                 user['telegram_id'],
                 message,
-                reply_markup
+                reply_markup,
+                priority=NotificationPriority.HIGH,
+                kind='expired',
+                dedup_key=f"service:{service['id']}"
             )
             
             # Update warning status
@@ -1326,17 +1336,15 @@ class TrafficMonitor:
         except Exception as e:
             logger.error(f"Error sending plan expiration notification: {e}")
     
-    async def delete_expired_plan_service(self, service: Dict):
+    async def delete_expired_plan_service(self, service: Dict, panel_success: bool = None):
         """Delete an expired plan service after 24 hours grace period"""
         try:
-            # Delete from panel first
-            panel_manager = self.admin_manager.get_panel_manager(service['panel_id'])
-            if panel_manager and panel_manager.login():
-                success = panel_manager.delete_client(service['inbound_id'], service['client_uuid'])
-                if not success:
-                    logger.warning(f"Failed to delete expired plan service {service['id']} from panel")
-            else:
-                logger.warning(f"Could not connect to panel to delete expired plan service {service['id']}")
+            # Delete from panel first - batched per panel, called again with the result after the flush
+            if panel_success is None:
+                self.panel_actions.add('delete', service, self.delete_expired_plan_service)
+                return
+            if not panel_success:
+                logger.warning(f"Failed to delete expired plan service {service['id']} from panel")
             
             # Delete from database
             self.db.delete_service(service['id'])
@@ -1355,11 +1363,13 @@ class TrafficMonitor:
                 keyboard = [[InlineKeyboardButton("🏠 صفحه اصلی", callback_data="main_menu")]]
                 reply_markup = InlineKeyboardMarkup(keyboard)
                 
-                await self.bot.send_message(
-                    chat_id=user['telegram_id'],
-                    text=message,
-                    parse_mode='Markdown',
-                    reply_markup=reply_markup
+                await self._send_message_safe(
+                    user['telegram_id'],
+                    message,
+                    reply_markup,
+                    priority=NotificationPriority.CRITICAL,
+                    kind='deleted_expired_plan',
+                    dedup_key=f"service:{service['id']}"
                 )
             
             # Report to channel
@@ -12,12 +12,18 @@ import logging
 import threading
 import time
 from datetime import datetime, timedelta
-from flask import Flask, render_template, request, jsonify, session, redirect, url_for, Response, flash
+from flask import Flask, render_template, request, jsonify, session, redirect, url_for, Response, flash, g, make_response
 from flask_cors import CORS
 from functools import wraps
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from professional_database import ProfessionalDatabaseManager
 from panel_manager import PanelManager
-from config import BOT_CONFIG, WEBAPP_CONFIG
+from config import BOT_CONFIG, WEBAPP_CONFIG, SYNC_ENGINE_CONFIG, QR_CACHE_CONFIG
+from sync_engine import extract_panel_clients
+from qr_cache import qr_cache
+from subscription_links import build_subscription_link, join_subscription_url
+import static_assets
+from photo_cache import profile_photo_cache
 from telegram_helper import TelegramHelper
 from country_translator import extract_country_from_panel_name
 from typing import Dict, List, Optional, Any
@@ -26,7 +32,8 @@ from security_utils import (
     validate_telegram_id, validate_amount, validate_positive_int, 
     validate_panel_id, validate_discount_code, secure_before_request, 
     secure_after_request, get_client_ip, block_ip, is_ip_blocked,
-    record_suspicious_activity, sanitize_error_message
+    record_suspicious_activity, sanitize_error_message,
+    STATIC_FILE_EXTENSIONS, is_sensitive_static_path, is_root_sensitive_path
 )
 
 import httpx
@@ -68,7 +75,7 @@ def secure_error_response(error: Exception, default_message: str = 'خطای س
         safe_message = default_message
     
     return jsonify({'success': False, 'message': safe_message}), 500
-from cache_utils import cache, cache_key_user, cache_key_user_services, cache_key_stats, invalidate_user_cache
+from cache_utils import cache, cache_key_user, cache_key_user_services, cache_key_stats, cache_key_user_pages, invalidate_user_cache
 
 # Configure logging with UTF-8 encoding to handle emoji and Persian characters
 import sys
@@ -138,6 +145,9 @@ app.config['MAX_CONTENT_LENGTH'] = 10 * 1024 * 1024  # 10MB
 
 CORS(app)
 
+# Fingerprinted static assets (built by build_static.py, served by nginx)
+static_assets.init_app(app)
+
 # Add nl2br filter for Jinja2
 @app.template_filter('nl2br')
 def nl2br_filter(value):
@@ -278,40 +288,25 @@ except Exception as e:
 @app.before_request
 def security_check():
     """Comprehensive security check before every request"""
-    # DEBUG: Log headers to diagnose login loop
-    if request.endpoint in ['index', 'telegram_auth', 'dashboard', 'health_check']:
-        logger.info(f"DEBUG HEADERS for {request.endpoint}:")
-        logger.info(f"  Scheme: {request.scheme}")
-        logger.info(f"  Host: {request.host}")
-        logger.info(f"  Headers: {dict(request.headers)}")
+    # Header dump to diagnose login loops - only when DEBUG logging is enabled
+    if logger.isEnabledFor(logging.DEBUG) and \
+       request.endpoint in ('index', 'telegram_auth', 'dashboard', 'health_check'):
+        logger.debug(f"DEBUG HEADERS for {request.endpoint}: scheme={request.scheme} host={request.host}")
         for header, value in request.headers.items():
-            logger.info(f"  {header}: {value}")
+            logger.debug(f"  {header}: {'<redacted>' if header in ('Cookie', 'Authorization') else value}")
             
     path_lower = request.path.lower()
+    has_static_extension = path_lower.endswith(STATIC_FILE_EXTENSIONS)
+    is_static_request = request.endpoint == 'static' or request.path.startswith('/static/')
     
     # Allow all legitimate static files (CSS, JS, images, fonts, icons)
-    allowed_static_extensions = ['.css', '.js', '.jpg', '.jpeg', '.png', '.gif', '.svg', '.woff', '.woff2', '.ttf', '.eot', '.ico', '.webp']
-    if (request.endpoint == 'static' or request.path.startswith('/static/')) and \
-       any(path_lower.endswith(ext) for ext in allowed_static_extensions):
-        # Allow legitimate static files - don't block them
+    if is_static_request and has_static_extension:
         return None
     
-    # Check for suspicious static file requests (only for non-legitimate files)
-    if request.endpoint == 'static' or request.path.startswith('/static/'):
-        client_ip = get_client_ip()
-        
-        # Only block truly sensitive file types, not CSS/JS/images
-        blocked_patterns = [
-            '.env', '.git', 'config.env', '.sql', '.db', '.sqlite', 
-            '.log', '.ini', '.conf', '.key', '.pem', '.p12', '.pfx', 
-            '.crt', 'secret', 'private', 'backup', '.bak', 'credentials'
-        ]
-        
-        # Only block if it's NOT a legitimate static file
-        if not any(path_lower.endswith(ext) for ext in allowed_static_extensions):
-            if any(pattern in path_lower for pattern in blocked_patterns):
-                record_suspicious_activity(client_ip, 'suspicious_static_file', request.path)
-                return Response('Not Found', status=404, mimetype='text/plain')
+    # Check for suspicious static file requests (only truly sensitive file types)
+    if is_static_request and is_sensitive_static_path(path_lower):
+        record_suspicious_activity(get_client_ip(), 'suspicious_static_file', request.path)
+        return Response('Not Found', status=404, mimetype='text/plain')
     
     # Apply comprehensive security checks
     security_result = secure_before_request()
@@ -320,11 +315,9 @@ def security_check():
     
     # Additional protection: Block access to .env and other sensitive files at root
     # But allow legitimate paths
-    if not any(path_lower.endswith(ext) for ext in allowed_static_extensions) and \
-       not path_lower.startswith('/static/') and \
-       any(pattern in path_lower for pattern in ['/.env', '/config.env', '/.git/', '/.env.', '/env.js']):
-        client_ip = get_client_ip()
-        record_suspicious_activity(client_ip, 'root_sensitive_file', request.path)
+    if not has_static_extension and not path_lower.startswith('/static/') and \
+       is_root_sensitive_path(path_lower):
+        record_suspicious_activity(get_client_ip(), 'root_sensitive_file', request.path)
         return Response('Not Found', status=404, mimetype='text/plain')
     
     return None  # Continue with request
@@ -367,6 +360,18 @@ def set_db_for_request():
     
     # _db_global will be set by get_db() if needed (only in single-bot mode)
 
+# Share one pooled DB connection across all database calls of a request
+@app.before_request
+def open_db_connection_scope():
+    """Open a request-scoped DB connection scope (connection is checked out lazily)"""
+    g.db_scope = ProfessionalDatabaseManager.begin_connection_scope()
+
+@app.teardown_request
+def close_db_connection_scope(exception=None):
+    """Return the request's DB connection to the pool"""
+    if g.pop('db_scope', None) is not None:
+        ProfessionalDatabaseManager.end_connection_scope()
+
 # Apply security headers after every request
 @app.after_request
 def security_headers(response):
@@ -396,11 +401,19 @@ def health_check():
 # Initialize managers (will be overridden in multi-bot mode)
 # In multi-bot mode, these are set via app.config
 _db_global = None
+_db_global_lock = threading.Lock()
 panel_manager = None
+sync_engine = None  # This worker's SyncEngine (set by sync_all_clients_data)
 
 # Create a property-like accessor for db that always uses get_db()
 class DatabaseProxy:
-    """Proxy object that always returns the current database instance"""
+    """
+    Proxy object that always returns the current database instance
+    
+    Holds no state itself, so it is safe to share between the threads or
+    greenlets of one worker (gunicorn.conf.py); get_db() resolves the instance
+    per request and connections are scoped per thread.
+    """
     def __getattr__(self, name):
         return getattr(get_db(), name)
     
@@ -451,8 +464,11 @@ def get_db():
     # Fallback to global _db_global (only for single-bot mode)
     global _db_global
     if _db_global is None:
-        logger.warning("get_db() falling back to creating new ProfessionalDatabaseManager")
-        _db_global = ProfessionalDatabaseManager()
+        # Threaded workers: only the first request creates the manager (and its pool)
+        with _db_global_lock:
+            if _db_global is None:
+                logger.warning("get_db() falling back to creating new ProfessionalDatabaseManager")
+                _db_global = ProfessionalDatabaseManager()
     return _db_global
 
 def get_bot_config():
@@ -526,283 +542,73 @@ def cleanup_old_receipts():
         logger.error(f"Error in receipt cleanup: {e}")
 
 def sync_all_clients_data():
-    """OPTIMIZED: Sync all clients data from panels every 3 minutes with parallel processing and batching"""
-    from concurrent.futures import ThreadPoolExecutor, as_completed
-    from collections import defaultdict
+    """
+    Run this worker's sync engine and react to finished sync cycles
     
+    Panels are polled only by the process holding the sync leader lock (the bot,
+    or one webapp worker as fallback - see sync_engine.py). Every worker just
+    watches sync_state and drops its cached data for users whose clients
+    changed in the latest cycle.
+    """
+    from sync_engine import SyncEngine
+    from config import SYNC_ENGINE_CONFIG
+    
+    global db, sync_engine
+    if db is None:
+        db = ProfessionalDatabaseManager()
+    current_db = db
+    
+    engine = sync_engine = SyncEngine(
+        current_db,
+        interval_seconds=SYNC_ENGINE_CONFIG['interval_seconds'],
+        max_workers=SYNC_ENGINE_CONFIG['max_workers'],
+        leader_candidate=SYNC_ENGINE_CONFIG['webapp_leader_candidate']
+    )
+    engine.start()
+    
+    last_cycle_id = None
     while True:
         try:
-            # Check if we're in multi-bot mode - if so, skip this thread
-            try:
-                import os
-                if os.getenv('MULTI_BOT_MODE') == 'true':
-                    logger.debug("Multi-bot mode detected, skipping global sync thread")
-                    time.sleep(180)
-                    continue
-            except:
-                pass
-            
-            sync_start = time.time()
-            logger.info("🔄 Starting OPTIMIZED background sync of all clients data...")
-            
-            from admin_manager import AdminManager
-            from datetime import datetime
-            
-            # Use global db for background thread
-            global db
-            if db is None:
-                db = ProfessionalDatabaseManager()
-            current_db = db
-            admin_mgr = AdminManager(current_db)
-            
-            # Get all active panels
-            active_panels = current_db.get_panels(active_only=True)
-            if not active_panels:
-                logger.warning("⚠️ No active panels found")
-                time.sleep(180)
-                continue
-            
-            # Group clients by panel_id for batch processing
-            clients_by_panel = defaultdict(list)
-            for panel in active_panels:
-                panel_id = panel['id']
+            state = engine.get_state()
+            if state and state.get('cycle_id') != last_cycle_id:
+                last_cycle_id = state.get('cycle_id')
+                
+                # Invalidate cache for users whose clients changed during the cycle
                 with current_db.get_connection() as conn:
                     cursor = conn.cursor(dictionary=True)
                     try:
-                        cursor.execute(
-                            'SELECT * FROM clients WHERE panel_id = %s AND is_active = 1',
-                            (panel_id,)
-                        )
-                        panel_clients = cursor.fetchall()
-                        if panel_clients:
-                            clients_by_panel[panel_id] = panel_clients
+                        cursor.execute('''
+                            SELECT DISTINCT u.telegram_id FROM clients c
+                            JOIN users u ON u.id = c.user_id
+                            WHERE c.updated_at >= %s
+                        ''', (state.get('started_at'),))
+                        changed_users = cursor.fetchall()
                     finally:
                         cursor.close()
-            
-            total_clients = sum(len(clients) for clients in clients_by_panel.values())
-            logger.info(f"📊 Found {total_clients} clients across {len(clients_by_panel)} panels")
-            
-            if total_clients == 0:
-                logger.info("ℹ️ No clients to sync")
-                time.sleep(180)
-                continue
-            
-            # Process panels in parallel
-            synced_count = 0
-            error_count = 0
-            batch_updates = []
-            users_to_invalidate = set()
-            
-            def process_panel_clients(panel_id, db_clients):
-                """Process all clients for a single panel"""
-                panel_synced = 0
-                panel_errors = 0
-                panel_updates = []
-                panel_users = set()
                 
-                try:
-                    panel_mgr = admin_mgr.get_panel_manager(panel_id)
-                    if not panel_mgr:
-                        return panel_synced, panel_errors, panel_updates, panel_users
-                    
-                    # Login once per panel
-                    if not panel_mgr.login():
-                        logger.warning(f"⚠️ Could not login to panel {panel_id}")
-                        return panel_synced, len(db_clients), panel_updates, panel_users
-                    
-                    # Get ALL clients from panel in ONE API call (batch)
-                    inbounds = panel_mgr.get_inbounds()
-                    if not inbounds:
-                        return panel_synced, len(db_clients), panel_updates, panel_users
-                    
-                    # Build map of all clients from panel
-                    panel_clients_map = {}
-                    for inbound in inbounds:
-                        settings = inbound.get('settings', {})
-                        if isinstance(settings, str):
-                            import json
-                            try:
-                                settings = json.loads(settings)
-                            except:
-                                continue
-                        
-                        clients = settings.get('clients', [])
-                        client_stats = inbound.get('clientStats', [])
-                        stats_map = {str(stat.get('id') or stat.get('uuid', '')): stat for stat in client_stats if stat.get('id') or stat.get('uuid')}
-                        
-                        for client in clients:
-                            client_uuid = str(client.get('id', ''))
-                            if not client_uuid:
-                                continue
-                            
-                            stat = stats_map.get(client_uuid, {})
-                            used_traffic = 0
-                            if stat:
-                                used_traffic = (stat.get('up', 0) or 0) + (stat.get('down', 0) or 0)
-                            elif 'up' in client and 'down' in client:
-                                used_traffic = (client.get('up', 0) or 0) + (client.get('down', 0) or 0)
-                            
-                            panel_clients_map[client_uuid] = {
-                                'used_traffic': used_traffic,
-                                'total_traffic': client.get('totalGB', 0),
-                                'expiryTime': client.get('expiryTime', 0),
-                                'last_activity': stat.get('lastOnline', 0) or 0
-                            }
-                    
-                    # Process each database client
-                    now = datetime.now()
-                    for db_client in db_clients:
-                        try:
-                            client_uuid = str(db_client.get('client_uuid', ''))
-                            if not client_uuid:
-                                panel_errors += 1
-                                continue
-                            
-                            panel_client = panel_clients_map.get(client_uuid)
-                            if not panel_client:
-                                panel_errors += 1
-                                continue
-                            
-                            # Extract data
-                            used_traffic = panel_client['used_traffic']
-                            used_gb = round(used_traffic / (1024**3), 4) if used_traffic > 0 else 0
-                            last_activity = panel_client['last_activity']
-                            
-                            # Check if online
-                            current_time = int(time.time() * 1000)
-                            is_online = (current_time - last_activity) < 120000 if last_activity > 0 else False
-                            
-                            # Process expiry
-                            expiry_time = panel_client['expiryTime']
-                            remaining_days = None
-                            expires_at = None
-                            
-                            if expiry_time and expiry_time > 0:
-                                try:
-                                    if expiry_time > 1000000000000:
-                                        expiry_timestamp = expiry_time / 1000
-                                    else:
-                                        expiry_timestamp = expiry_time
-                                    
-                                    expires_at_dt = datetime.fromtimestamp(expiry_timestamp)
-                                    expires_at = expires_at_dt
-                                    time_diff = expires_at_dt - now
-                                    remaining_days = max(0, int(time_diff.total_seconds() / 86400))
-                                except:
-                                    pass
-                            
-                            # Prepare batch update
-                            panel_updates.append({
-                                'client_id': int(db_client.get('id', 0)),
-                                'used_gb': used_gb,
-                                'last_activity': last_activity,
-                                'is_online': is_online,
-                                'remaining_days': remaining_days,
-                                'expires_at': expires_at.isoformat() if expires_at else None,
-                                'user_id': db_client.get('user_id')
-                            })
-                            
-                            if db_client.get('user_id'):
-                                panel_users.add(db_client['user_id'])
-                            
-                            panel_synced += 1
-                            
-                        except Exception as e:
-                            logger.error(f"Error processing client {db_client.get('id')}: {e}")
-                            panel_errors += 1
-                    
-                except Exception as e:
-                    logger.error(f"Error processing panel {panel_id}: {e}")
-                    panel_errors = len(db_clients)
+                for row in changed_users:
+                    if row.get('telegram_id'):
+                        invalidate_user_cache(row['telegram_id'])
                 
-                return panel_synced, panel_errors, panel_updates, panel_users
-            
-            # Process panels in parallel using thread pool
-            with ThreadPoolExecutor(max_workers=20) as executor:
-                futures = {
-                    executor.submit(process_panel_clients, panel_id, clients): panel_id
-                    for panel_id, clients in clients_by_panel.items()
-                }
+                logger.info(f"🔄 Sync cycle {last_cycle_id} by {state.get('leader')}: "
+                            f"{state.get('clients_updated', 0)} clients updated, "
+                            f"{len(changed_users)} user caches invalidated")
                 
-                for future in as_completed(futures):
-                    panel_id = futures[future]
-                    try:
-                        p_synced, p_errors, p_updates, p_users = future.result(timeout=60)
-                        synced_count += p_synced
-                        error_count += p_errors
-                        batch_updates.extend(p_updates)
-                        users_to_invalidate.update(p_users)
-                    except Exception as e:
-                        logger.error(f"Error processing panel {panel_id}: {e}")
-                        error_count += len(clients_by_panel[panel_id])
-            
-            # Batch update database (much faster than individual updates)
-            if batch_updates:
-                try:
-                    with current_db.get_connection() as conn:
-                        cursor = conn.cursor()
-                        try:
-                            update_query = '''
-                                UPDATE clients 
-                                SET used_gb = %s,
-                                    last_activity = %s,
-                                    cached_is_online = %s,
-                                    remaining_days = %s,
-                                    expires_at = %s,
-                                    updated_at = NOW()
-                                WHERE id = %s
-                            '''
-                            
-                            values = [
-                                (u['used_gb'], u['last_activity'], u['is_online'], 
-                                 u['remaining_days'], u['expires_at'], u['client_id'])
-                                for u in batch_updates
-                            ]
-                            
-                            cursor.executemany(update_query, values)
-                            conn.commit()
-                            logger.debug(f"✅ Batch updated {len(batch_updates)} clients")
-                        finally:
-                            cursor.close()
-                except Exception as e:
-                    logger.error(f"Error in batch update: {e}")
-            
-            # Invalidate cache for affected users
-            for user_id in users_to_invalidate:
-                try:
-                    user = current_db.get_user_by_id(user_id)
-                    if user and user.get('telegram_id'):
-                        invalidate_user_cache(user['telegram_id'])
-                except:
-                    pass
-            
-            sync_duration = time.time() - sync_start
-            logger.info(f"✅ OPTIMIZED sync completed in {sync_duration:.2f}s: {synced_count} synced, {error_count} errors")
-            
-            # Clear cache periodically
-            if synced_count > 0:
                 cache.cleanup_expired()
                 
                 # Cleanup old receipts (older than 48 hours)
                 cleanup_old_receipts()
-            
+                
         except Exception as e:
             logger.error(f"Error in background sync: {e}")
             import traceback
             logger.error(traceback.format_exc())
-        except KeyboardInterrupt:
-            logger.info("Background sync thread interrupted")
-            break
-        except SystemExit:
+        except (KeyboardInterrupt, SystemExit):
             logger.info("Background sync thread exiting")
+            engine.stop()
             break
         
-        # Wait 3 minutes (180 seconds) before next sync
-        try:
-            time.sleep(180)
-        except KeyboardInterrupt:
-            logger.info("Background sync thread interrupted")
-            break
+        time.sleep(60)
 
 # Start background sync thread (only if not in multi-bot mode)
 # In multi-bot mode, each bot should have its own sync thread
@@ -821,7 +627,7 @@ try:
         # Single bot mode - start sync thread
         sync_thread = threading.Thread(target=sync_all_clients_data, daemon=True)
         sync_thread.start()
-        logger.info("✅ Background client data sync thread started (every 3 minutes)")
+        logger.info("✅ Background sync engine thread started")
 except:
     # If we can't check, don't start thread to avoid errors
     logger.info("⚠️ Could not determine mode - skipping global sync thread")
@@ -974,16 +780,27 @@ def ensure_photo_url():
     if 'user_id' in session and (not session.get('photo_url') or session.get('photo_url') == ''):
         user_id = session.get('user_id')
         try:
-            logger.info(f"📸 Photo URL not in session for user {user_id}, attempting to fetch from Telegram...")
-            photo_url = TelegramHelper.get_user_profile_photo_url_sync(user_id)
+            photo_url = cached_photo_url(user_id)
             if photo_url:
                 session['photo_url'] = photo_url
-                logger.info(f"✅ Photo URL fetched and saved to session for user {user_id}")
-            else:
-                logger.info(f"⚠️ No photo available for user {user_id}")
         except Exception as e:
             logger.error(f"Error fetching photo URL for user {user_id}: {e}")
 
+def cached_photo_url(telegram_id):
+    """Local avatar URL if the user has a profile photo (Bot API only on first check / daily refresh)"""
+    return bot_url_for('user_photo') if profile_photo_cache.has_photo(telegram_id) else ''
+
+def _avatar_response(telegram_id):
+    """Cached avatar with a strong ETag; 304 when the browser already has it"""
+    cached = profile_photo_cache.get(telegram_id)
+    if not cached:
+        return None
+    data, etag = cached
+    headers = {'ETag': etag, 'Cache-Control': 'private, max-age=3600'}
+    if etag.strip('"') in request.if_none_match:
+        return Response(status=304, headers=headers)
+    return Response(data, mimetype='image/jpeg', headers=headers)
+
 # Authentication decorator
 def login_required(f):
     @wraps(f)
@@ -1036,47 +853,69 @@ def admin_required(f):
         return f(*args, **kwargs)
     return decorated_function
 
+def _code_version() -> str:
+    """Newest mtime of the app code and templates, so a deploy changes every page ETag (same in every worker)"""
+    base_dir = os.path.dirname(os.path.abspath(__file__))
+    newest = os.path.getmtime(os.path.abspath(__file__))
+    for root, _, files in os.walk(os.path.join(base_dir, 'templates')):
+        for name in files:
+            newest = max(newest, os.path.getmtime(os.path.join(root, name)))
+    return str(int(newest))
+
+_PAGE_CACHE_CODE_VERSION = _code_version()
+
+def cached_user_page(f):
+    """
+    Per-user response cache for read-only pages (use after login_required)
+
+    The ETag is derived from a cheap DB version stamp (see
+    get_user_page_version); a matching If-None-Match gets a 304 without
+    rendering, and an unchanged page is served from memory. The sync watcher's
+    invalidate_user_cache() drops a user's pages after each monitor cycle.
+    """
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        user_id = session.get('user_id')
+        if request.method != 'GET' or not user_id or session.get('_flashes'):
+            return f(*args, **kwargs)
+
+        version = get_db().get_user_page_version(user_id)
+        # Changes in the current second could still be missed by the stamp
+        if not version or (version.get('seconds_since_change') or 0) < 2:
+            return f(*args, **kwargs)
+
+        stamp = repr((_PAGE_CACHE_CODE_VERSION, request.full_path, session.get('photo_url', ''),
+                      sorted(version.items())))
+        etag = hashlib.sha1(stamp.encode()).hexdigest()
+        headers = {'ETag': f'W/"{etag}"', 'Cache-Control': 'private, no-cache'}
+        # The tag is sent weak, and ETags.__contains__ only matches strong ones
+        if request.if_none_match.contains_weak(etag):
+            return Response(status=304, headers=headers)
+
+        pages_key = cache_key_user_pages(user_id)
+        pages = cache.get(pages_key) or {}
+        cached = pages.get(request.full_path)
+        if cached and cached[0] == etag:
+            return Response(cached[1], mimetype='text/html', headers=headers)
+
+        response = make_response(f(*args, **kwargs))
+        if response.status_code == 200 and response.mimetype == 'text/html':
+            pages = dict(pages)
+            pages[request.full_path] = (etag, response.get_data())
+            cache.set(pages_key, pages, ttl=300)
+            response.headers.update(headers)
+        return response
+    return decorated_function
+
 # Serve user profile photo via server to avoid client-side loading issues
 @app.route('/user/photo')
 @login_required
 def user_photo():
-    """Proxy the Telegram profile photo so the browser can load it reliably"""
-    photo_url = session.get('photo_url', '')
-    
-    # If no photo in session, try to fetch it
-    if not photo_url:
-        try:
-            user_id = session.get('user_id')
-            db_instance = get_db()
-            user = db_instance.get_user(user_id)
-            if user:
-                photo_url = TelegramHelper.get_user_profile_photo_url_sync(user['telegram_id'])
-                if photo_url:
-                    session['photo_url'] = photo_url
-        except Exception as e:
-            logger.error(f"Error fetching photo URL: {e}")
-
-    if not photo_url:
-        return '', 404
-        
-    try:
-        import requests
-        # Use Session with trust_env=False to strictly disable proxies
-        s = requests.Session()
-        s.trust_env = False
-        
-        resp = s.get(photo_url, timeout=10)
-        if resp.status_code == 200:
-            content_type = resp.headers.get('Content-Type', 'image/jpeg')
-            return Response(
-                resp.content, 
-                mimetype=content_type,
-                headers={'Cache-Control': 'public, max-age=3600'}
-            )
-        return '', 404
-    except Exception as e:
-        logger.error(f"Error proxying user photo: {e}")
+    """Serve the user's cached Telegram profile photo"""
+    response = _avatar_response(session.get('user_id'))
+    if response is None:
         return '', 404
+    return response
 
 # Routes
 @app.route('/blocked')
@@ -1164,9 +1003,9 @@ def telegram_auth():
         if not photo_url:
             try:
                 logger.info(f"Attempting to fetch photo URL from Bot API for user {user_id}")
-                photo_url = TelegramHelper.get_user_profile_photo_url_sync(user_id)
+                photo_url = cached_photo_url(user_id)
                 if photo_url:
-                    logger.info(f"✅ Photo URL fetched from Bot API for user {user_id}: {photo_url[:100]}")
+                    logger.info(f"✅ Profile photo cached for user {user_id}")
                 else:
                     logger.info(f"⚠️ No photo URL available from Bot API for user {user_id}")
             except Exception as e:
@@ -1286,8 +1125,8 @@ def telegram_webapp_auth(bot_name=None):
         # If photo_url is empty, try to get it from Telegram Bot API
         if not photo_url:
             try:
-                photo_url = TelegramHelper.get_user_profile_photo_url_sync(user_id)
-                logger.info(f"Photo URL fetched from Bot API for user {user_id}: {photo_url}")
+                photo_url = cached_photo_url(user_id)
+                logger.info(f"Profile photo for user {user_id}: {photo_url or 'Not available'}")
             except Exception as e:
                 logger.error(f"Error fetching photo URL for user {user_id}: {e}")
                 photo_url = ''
@@ -1415,7 +1254,7 @@ def admin_telegram_webapp_auth(bot_name=None):
         
         if not photo_url:
             try:
-                photo_url = TelegramHelper.get_user_profile_photo_url_sync(user_id)
+                photo_url = cached_photo_url(user_id)
             except:
                 pass
                 
@@ -1448,6 +1287,7 @@ def logout():
 
 @app.route('/dashboard')
 @login_required
+@cached_user_page
 def dashboard():
     """Main dashboard with caching"""
     user_id = session.get('user_id')
@@ -1471,43 +1311,13 @@ def dashboard():
     db_instance = get_db()
     services = db_instance.get_user_clients(user_id)
     
-    # OPTIMIZATION: Fetch all panels once to avoid DB calls in loop
-    all_panels = db_instance.get_panels(active_only=False)
-    panels_map = {p['id']: p for p in all_panels}
-    
     # Use real-time monitoring data from database (updated every 3 minutes by monitoring system)
     total_used_traffic_bytes = 0
     online_services_count = 0
     
     for service in services:
-        # Generate subscription link
-        # Default to saved config_link
-        subscription_link = service.get('config_link', '')
-        
-        # For 3x-ui, ALWAYS try to regenerate to ensure correct format (UUID without dashes)
-        panel = panels_map.get(service.get('panel_id'))
-        if panel:
-            panel_type = panel.get('panel_type', '3x-ui')
-            if panel_type == '3x-ui':
-                sub_id_to_use = service.get('sub_id')
-                if service.get('client_uuid'):
-                    sub_id_to_use = service.get('client_uuid').replace('-', '')
-                
-                if sub_id_to_use:
-                    sub_url = panel.get('subscription_url', '')
-                    if sub_url:
-                        if sub_url.endswith('/sub') or sub_url.endswith('/sub/'):
-                            sub_url = sub_url.rstrip('/')
-                            new_link = f"{sub_url}/{sub_id_to_use}"
-                        elif '/sub' in sub_url:
-                            new_link = f"{sub_url}/{sub_id_to_use}"
-                        else:
-                            new_link = f"{sub_url}/sub/{sub_id_to_use}"
-                        
-                        # Use the regenerated link
-                        subscription_link = new_link
-        
-        service['subscription_link'] = subscription_link or ''
+        # Subscription link is computed when the client is written (see subscription_links.py)
+        service['subscription_link'] = service.get('subscription_link') or service.get('config_link', '')
 
         # Use actual monitoring data (updated by monitoring system every 3 minutes)
         # Priority: used_gb (from monitoring) > cached_used_gb (fallback)
@@ -1615,6 +1425,7 @@ def dashboard():
 
 @app.route('/services')
 @login_required
+@cached_user_page
 def services():
     """Services page - view all services with caching"""
     user_id = session.get('user_id')
@@ -1644,41 +1455,11 @@ def services():
     # Log for debugging
     logger.info(f"Services page - user_id: {user_id}, services count: {len(user_services)}")
     
-    # OPTIMIZATION: Fetch all panels once to avoid DB calls in loop
-    all_panels = db_instance.get_panels(active_only=False)
-    panels_map = {p['id']: p for p in all_panels}
-    
     # Use real-time monitoring data from database (updated every 3 minutes by monitoring system)
     for service in user_services:
         try:
-            # Get subscription link
-            # Default to saved config_link
-            subscription_link = service.get('config_link', '')
-            
-            # For 3x-ui, ALWAYS try to regenerate to ensure correct format (UUID without dashes)
-            panel = panels_map.get(service.get('panel_id'))
-            if panel:
-                panel_type = panel.get('panel_type', '3x-ui')
-                
-                if panel_type == '3x-ui':
-                    # For 3x-ui, use subscription link (not direct config link)
-                    # User requested full UUID without dashes
-                    sub_id_to_use = service.get('sub_id')
-                    if service.get('client_uuid'):
-                        sub_id_to_use = service.get('client_uuid').replace('-', '')
-                        
-                    if sub_id_to_use:
-                        sub_url = panel.get('subscription_url', '')
-                        if sub_url:
-                            if sub_url.endswith('/sub') or sub_url.endswith('/sub/'):
-                                sub_url = sub_url.rstrip('/')
-                                subscription_link = f"{sub_url}/{sub_id_to_use}"
-                            else:
-                                subscription_link = f"{sub_url}/sub/{sub_id_to_use}"
-                # OPTIMIZATION: Removed synchronous Marzban API call
-                # For Marzban, we rely on the background sync to populate config_link
-            
-            service['subscription_link'] = subscription_link or ''
+            # Subscription link is computed when the client is written (see subscription_links.py)
+            service['subscription_link'] = service.get('subscription_link') or service.get('config_link', '')
             
             # Use actual monitoring data (updated by monitoring system every 3 minutes)
             # Priority: used_gb (from monitoring) > cached_used_gb (fallback)
@@ -1929,88 +1710,7 @@ def service_detail(service_id):
     except Exception as e:
         logger.error(f"Error getting service details: {e}")
     
-    # Get subscription link - always construct subscription link (not direct config)
-    subscription_link = service.get('config_link', '')
-    db_instance = get_db()
-    panel = db_instance.get_panel(service.get('panel_id'))
-    
-    # Always construct subscription link, never use direct config link
-    if panel:
-        panel_type = panel.get('panel_type', '3x-ui')
-        
-        if panel_type == 'marzban':
-            # For Marzban, get subscription link from panel API
-            from admin_manager import AdminManager
-            admin_mgr = AdminManager(db_instance)
-            panel_mgr = admin_mgr.get_panel_manager(service.get('panel_id'))
-            
-            if panel_mgr:
-                try:
-                    # Get subscription URL from panel (Marzban returns subscription link)
-                    subscription_link = panel_mgr.get_client_config_link(
-                        service.get('inbound_id'),
-                        service.get('client_uuid'),
-                        service.get('protocol', 'vless')
-                    )
-                    if subscription_link:
-                        db_instance = get_db()
-                        db_instance.update_client_config(service['id'], subscription_link)
-                except Exception as e:
-                    logger.error(f"Error getting subscription from panel API: {e}")
-        else:
-            # For 3x-ui, ALWAYS construct subscription link from subscription_url + sub_id (or client_uuid)
-            # User requested full UUID without dashes
-            sub_id_to_use = service.get('sub_id')
-            if service.get('client_uuid'):
-                sub_id_to_use = service.get('client_uuid').replace('-', '')
-
-            if sub_id_to_use:
-                sub_url = service.get('subscription_url') or panel.get('subscription_url', '')
-                if sub_url:
-                    if sub_url.endswith('/sub') or sub_url.endswith('/sub/'):
-                        sub_url = sub_url.rstrip('/')
-                        subscription_link = f"{sub_url}/{sub_id_to_use}"
-                    elif '/sub' in sub_url:
-                        subscription_link = f"{sub_url}/{sub_id_to_use}"
-                    else:
-                        subscription_link = f"{sub_url}/sub/{sub_id_to_use}"
-
-                    # Save subscription link to database
-                    if subscription_link:
-                        db_instance = get_db()
-                        db_instance.update_client_config(service['id'], subscription_link)
-        
-        # Fallback: check if saved config_link is actually a subscription link
-        if not subscription_link and service.get('config_link'):
-            config_link = service.get('config_link', '')
-            # Check if it's a subscription link (contains /sub/ or /sub or ends with sub_id)
-            if '/sub/' in config_link or '/sub' in config_link or (service.get('sub_id') and service.get('sub_id') in config_link):
-                # Only use if it's NOT a direct config link
-                if not config_link.startswith(('vless://', 'vmess://', 'trojan://', 'ss://')):
-                    subscription_link = config_link
-            else:
-                # If it's a direct config link (starts with vless://, vmess://, etc.), construct subscription link
-                if config_link.startswith(('vless://', 'vmess://', 'trojan://', 'ss://')):
-                    # This is a direct config link, not subscription - construct subscription link
-                    # User requested full UUID without dashes
-                    sub_id_to_use = service.get('sub_id')
-                    if service.get('client_uuid'):
-                        sub_id_to_use = service.get('client_uuid').replace('-', '')
-
-                    if panel.get('subscription_url') and sub_id_to_use:
-                        sub_url = panel.get('subscription_url', '')
-                        if sub_url.endswith('/sub') or sub_url.endswith('/sub/'):
-                            sub_url = sub_url.rstrip('/')
-                            subscription_link = f"{sub_url}/{sub_id_to_use}"
-                        elif '/sub' in sub_url:
-                            subscription_link = f"{sub_url}/{sub_id_to_use}"
-                        else:
-                            subscription_link = f"{sub_url}/sub/{sub_id_to_use}"
-                        if subscription_link:
-                            db_instance = get_db()
-                        db_instance.update_client_config(service['id'], subscription_link)
-    
-    service['subscription_link'] = subscription_link or ''
+    service['subscription_link'] = get_service_subscription_link(get_db(), service)
     
     # Calculate statistics - ensure total_gb is float and rounded to 2 decimal places
     total_gb = float(service.get('total_gb', 0) or 0)
@@ -2264,6 +1964,7 @@ def recharge():
 
 @app.route('/transactions')
 @login_required
+@cached_user_page
 def transactions():
     """User transactions history page"""
     user_id = session.get('user_id')
@@ -3512,6 +3213,7 @@ def api_recharge():
 
 @app.route('/profile')
 @login_required
+@cached_user_page
 def profile():
     """User profile page"""
     user_id = session.get('user_id')
@@ -3720,80 +3422,12 @@ def get_service_config(service_id):
     
     # Get service
     db_instance = get_db()
-    services = db_instance.get_user_clients(user_id)
-    service = next((s for s in services if s['id'] == service_id), None)
+    service = db_instance.get_user_client(user_id, service_id)
     
     if not service:
         return jsonify({'success': False, 'message': 'Service not found'}), 404
     
-    # Get panel to construct subscription link
-    panel = db_instance.get_panel(service.get('panel_id'))
-    subscription_link = ""
-    
-    if panel:
-        panel_type = panel.get('panel_type', '3x-ui')
-        
-        if panel_type == 'marzban':
-            # For Marzban, get subscription link from panel API
-            from admin_manager import AdminManager
-            admin_mgr = AdminManager(db_instance)
-            panel_mgr = admin_mgr.get_panel_manager(service.get('panel_id'))
-            
-            if panel_mgr:
-                try:
-                    subscription_link = panel_mgr.get_client_config_link(
-                        service.get('inbound_id'),
-                        service.get('client_uuid'),
-                        service.get('protocol', 'vless')
-                    )
-                    if subscription_link:
-                        db_instance = get_db()
-                        db_instance.update_client_config(service['id'], subscription_link)
-                except Exception as e:
-                    logger.error(f"Error getting subscription from panel API: {e}")
-        else:
-            # For 3x-ui, ALWAYS construct subscription link from subscription_url + sub_id
-            # NEVER use get_client_config_link for 3x-ui (it returns direct config, not subscription)
-            if service.get('sub_id'):
-                sub_url = service.get('subscription_url') or panel.get('subscription_url', '')
-                if sub_url:
-                    if sub_url.endswith('/sub') or sub_url.endswith('/sub/'):
-                        sub_url = sub_url.rstrip('/')
-                        subscription_link = f"{sub_url}/{service.get('sub_id')}"
-                    elif '/sub' in sub_url:
-                        # If sub is in the middle of URL
-                        subscription_link = f"{sub_url}/{service.get('sub_id')}"
-                    else:
-                        subscription_link = f"{sub_url}/sub/{service.get('sub_id')}"
-                    
-                    if subscription_link:
-                        db_instance = get_db()
-                        db_instance.update_client_config(service['id'], subscription_link)
-        
-        # Fallback: check if saved config_link is actually a subscription link
-        if not subscription_link and service.get('config_link'):
-            config_link = service.get('config_link', '')
-            # Check if it's a subscription link (contains /sub/ or /sub or ends with sub_id)
-            if '/sub/' in config_link or '/sub' in config_link or (service.get('sub_id') and service.get('sub_id') in config_link):
-                # Only use if it's NOT a direct config link
-                if not config_link.startswith(('vless://', 'vmess://', 'trojan://', 'ss://')):
-                    subscription_link = config_link
-            else:
-                # If it's a direct config link (starts with vless://, vmess://, etc.), construct subscription link
-                if config_link.startswith(('vless://', 'vmess://', 'trojan://', 'ss://')):
-                    # This is a direct config link, not subscription - construct subscription link
-                    if panel.get('subscription_url') and service.get('sub_id'):
-                        sub_url = panel.get('subscription_url', '')
-                        if sub_url.endswith('/sub') or sub_url.endswith('/sub/'):
-                            sub_url = sub_url.rstrip('/')
-                            subscription_link = f"{sub_url}/{service.get('sub_id')}"
-                        elif '/sub' in sub_url:
-                            subscription_link = f"{sub_url}/{service.get('sub_id')}"
-                        else:
-                            subscription_link = f"{sub_url}/sub/{service.get('sub_id')}"
-                        if subscription_link:
-                            db_instance = get_db()
-                        db_instance.update_client_config(service['id'], subscription_link)
+    subscription_link = get_service_subscription_link(db_instance, service)
     
     if not subscription_link:
         return jsonify({'success': False, 'message': 'No subscription link available'}), 404
@@ -3807,6 +3441,7 @@ def get_service_config(service_id):
         telegram_bot = Bot(token=bot_config['token'])
         reporting_system = ReportingSystem(telegram_bot, bot_config=bot_config)
         user = db_instance.get_user(user_id)
+        panel = db_instance.get_panel(service.get('panel_id'))
         service_data = {
             'service_name': service.get('client_name', 'سرویس'),
             'total_gb': service.get('total_gb', 0),
@@ -4152,13 +3787,7 @@ def api_change_service_panel(service_id):
                 # For 3x-ui, ALWAYS construct subscription link from subscription_url + sub_id
                 # NEVER use get_client_config_link (it returns direct config, not subscription)
                 if new_sub_id and subscription_url:
-                    if subscription_url.endswith('/sub') or subscription_url.endswith('/sub/'):
-                        sub_url = subscription_url.rstrip('/')
-                        new_subscription_link = f"{sub_url}/{new_sub_id}"
-                    elif '/sub' in subscription_url:
-                        new_subscription_link = f"{subscription_url}/{new_sub_id}"
-                    else:
-                        new_subscription_link = f"{subscription_url}/sub/{new_sub_id}"
+                    new_subscription_link = join_subscription_url(subscription_url, new_sub_id)
                     
                     logger.info(f"✅ Constructed subscription link: {new_subscription_link[:50]}...")
                 else:
@@ -4271,22 +3900,68 @@ def api_change_service_panel(service_id):
 def get_service_qr(service_id):
     """Generate QR code for service - returns JSON with base64 image"""
     user_id = session.get('user_id')
-    
     db_instance = get_db()
-    # Get service
-    services = db_instance.get_user_clients(user_id)
-    service = next((s for s in services if s['id'] == service_id), None)
-    
+    service = db_instance.get_user_client(user_id, service_id)
     if not service:
         return jsonify({'success': False, 'message': 'Service not found'}), 404
-    
-    # Get config link - try to get from panel first
-    config_link = None
+
+    config_link = _get_service_qr_link(db_instance, service)
+    if not config_link:
+        return jsonify({'success': False, 'message': 'No config available'}), 404
+
+    return _qr_json_response(config_link)
+
+@app.route('/api/service/<int:service_id>/qr.png')
+@login_required
+def get_service_qr_png(service_id):
+    """QR code for service as a cacheable PNG image"""
+    user_id = session.get('user_id')
+    db_instance = get_db()
+    service = db_instance.get_user_client(user_id, service_id)
+    if not service:
+        return jsonify({'success': False, 'message': 'Service not found'}), 404
+
+    config_link = _get_service_qr_link(db_instance, service)
+    if not config_link:
+        return jsonify({'success': False, 'message': 'No config available'}), 404
+
+    return _qr_png_response(config_link)
+
+def get_service_subscription_link(db_instance, service):
+    """Stored subscription link of a service (computed on write, see subscription_links.py)"""
+    subscription_link = service.get('subscription_link') or ''
+    if not subscription_link:
+        panel = db_instance.get_panel(service.get('panel_id'))
+        if panel and panel.get('panel_type') == 'marzban':
+            # Marzban hands out its own subscription link; fetch it once and store it
+            from admin_manager import AdminManager
+            admin_mgr = AdminManager(db_instance)
+            panel_mgr = admin_mgr.get_panel_manager(service.get('panel_id'))
+            if panel_mgr:
+                try:
+                    config_link = panel_mgr.get_client_config_link(
+                        service.get('inbound_id'),
+                        service.get('client_uuid'),
+                        service.get('protocol', 'vless')
+                    )
+                    if config_link:
+                        db_instance.update_client_config(service['id'], config_link)
+                        subscription_link = build_subscription_link(panel, dict(service, config_link=config_link))
+                except Exception as e:
+                    logger.error(f"Error getting subscription from panel API: {e}")
+    return subscription_link
+
+def _get_service_qr_link(db_instance, service):
+    """Config link for a service QR - the stored link, the panel only when none is stored"""
+    config_link = service.get('config_link')
+    if config_link:
+        return config_link
+
     try:
         from admin_manager import AdminManager
         admin_mgr = AdminManager(db_instance)
         panel_mgr = admin_mgr.get_panel_manager(service.get('panel_id'))
-        
+
         if panel_mgr and panel_mgr.login():
             config_link = panel_mgr.get_client_config_link(
                 service.get('inbound_id'),
@@ -4295,46 +3970,38 @@ def get_service_qr(service_id):
             )
     except Exception as e:
         logger.error(f"Error getting config from panel: {e}")
-    
-    # Fallback to saved config_link
-    if not config_link:
-        config_link = service.get('config_link', '')
-    
-    # For 3x-ui, construct subscription link if needed
-    if not config_link:
-        panel = db_instance.get_panel(service.get('panel_id'))
-        if panel and panel.get('panel_type') == '3x-ui' and service.get('sub_id'):
-            sub_url = panel.get('subscription_url', '')
-            if sub_url:
-                if sub_url.endswith('/sub') or sub_url.endswith('/sub/'):
-                    sub_url = sub_url.rstrip('/')
-                    config_link = f"{sub_url}/{service.get('sub_id')}"
-                elif '/sub' in sub_url:
-                    config_link = f"{sub_url}/{service.get('sub_id')}"
-                else:
-                    config_link = f"{sub_url}/sub/{service.get('sub_id')}"
-    
-    if not config_link:
-        return jsonify({'success': False, 'message': 'No config available'}), 404
-    
-    # Generate QR code
-    import qrcode
+
+    if config_link:
+        return config_link
+
+    # Fall back to the stored subscription link
+    if service.get('subscription_link'):
+        return service['subscription_link']
+    panel = db_instance.get_panel(service.get('panel_id'))
+    sub_url = (panel or {}).get('subscription_url', '')
+    if not sub_url:
+        return None
+    if panel.get('panel_type') == 'marzban' and service.get('client_uuid'):
+        return f"{sub_url}/sub/{service['client_uuid']}"
+    return None
+
+def _qr_json_response(config_link):
+    """JSON with the (cached) QR PNG base64-encoded"""
     import base64
-    from io import BytesIO
-    
-    qr = qrcode.QRCode(version=1, box_size=10, border=5)
-    qr.add_data(config_link)
-    qr.make(fit=True)
-    
-    img = qr.make_image(fill_color="black", back_color="white")
-    
-    # Convert to base64
-    buffer = BytesIO()
-    img.save(buffer, format='PNG')
-    buffer.seek(0)
-    qr_base64 = base64.b64encode(buffer.read()).decode()
-    
-    return jsonify({'success': True, 'qr_code': qr_base64, 'config_link': config_link})
+
+    png, _ = qr_cache.get_png(config_link)
+    return jsonify({'success': True, 'qr_code': base64.b64encode(png).decode(), 'config_link': config_link})
+
+def _qr_png_response(config_link):
+    """The (cached) QR PNG with validators; 304 when the browser already has it"""
+    png, etag = qr_cache.get_png(config_link)
+    headers = {
+        'ETag': etag,
+        'Cache-Control': f"private, max-age={QR_CACHE_CONFIG.get('max_age', 86400)}",
+    }
+    if etag.strip('"') in request.if_none_match:
+        return Response(status=304, headers=headers)
+    return Response(png, mimetype='image/png', headers=headers)
 
 @app.route('/api/stats')
 @login_required
@@ -4502,7 +4169,6 @@ def api_create_ticket():
     if ticket_id:
         # Send notification to admin
         try:
-            from telegram_helper import TelegramHelper
             bot_config = get_bot_config()
             admin_id = bot_config.get('admin_id')
             if admin_id:
@@ -4559,7 +4225,6 @@ def api_ticket_reply():
     if reply_id:
         # Send notification to admin
         try:
-            from telegram_helper import TelegramHelper
             bot_config = get_bot_config()
             admin_id = bot_config.get('admin_id')
             if admin_id:
@@ -4581,10 +4246,72 @@ def api_ticket_reply():
     else:
         return jsonify({'success': False, 'message': 'خطا در ارسال پاسخ'}), 500
 
+# Shared pool for /api/services/refresh: one task per panel, across all requests
+_refresh_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix='panel-refresh')
+
+def _fetch_panel_service_details(admin_mgr, db_instance, panel_id: int, panel_services: List[Dict]) -> Dict[int, Dict]:
+    """
+    Client details of one panel's services for a refresh
+    
+    Uses the sync engine's snapshot when it is younger than
+    refresh_snapshot_max_age, and otherwise reads the panel once: a single
+    inbound listing on 3x-ui, per-client lookups on a single logged-in
+    manager elsewhere.
+    
+    Returns:
+        {service_id: client_details}
+    """
+    details = {}
+    max_age = SYNC_ENGINE_CONFIG.get('refresh_snapshot_max_age', 60)
+    if sync_engine and max_age > 0:
+        snapshot = sync_engine.get_panel_clients(panel_id, max_age=max_age)
+        if snapshot:
+            for service in panel_services:
+                client = snapshot.get(str(service.get('client_uuid')))
+                if client:
+                    details[service['id']] = client
+    
+    missing = [service for service in panel_services if service['id'] not in details]
+    if not missing:
+        return details
+    
+    panel_mgr = admin_mgr.get_panel_manager(panel_id)
+    if not panel_mgr:
+        return details
+    
+    if isinstance(panel_mgr, PanelManager) and len(missing) > 1:
+        # 3x-ui: one listing covers all of this user's clients on the panel
+        if panel_mgr.login():
+            listing = extract_panel_clients(panel_mgr.get_inbounds(), panel_id)
+            for service in missing:
+                client = listing.get(str(service.get('client_uuid')))
+                if client:
+                    details[service['id']] = client
+        return details
+    
+    # Create callback to update inbound_id if found in different inbound
+    def update_inbound_callback(service_id, new_inbound_id):
+        try:
+            db_instance.update_service_inbound_id(service_id, new_inbound_id)
+            logger.info(f"✅ Updated service {service_id} inbound_id to {new_inbound_id}")
+        except Exception as e:
+            logger.error(f"Failed to update inbound_id for service {service_id}: {e}")
+    
+    for service in missing:
+        client = panel_mgr.get_client_details(
+            service.get('inbound_id'),
+            service.get('client_uuid'),
+            update_inbound_callback=update_inbound_callback,
+            service_id=service.get('id')
+        )
+        if client:
+            details[service['id']] = client
+    return details
+
 @app.route('/api/services/refresh')
 @login_required
 def refresh_services():
-    """Refresh services data from panel"""
+    """Refresh services data from panel - panels fetched in parallel, one bulk write"""
     user_id = session.get('user_id')
     db_instance = get_db()
     services = db_instance.get_user_clients(user_id)
@@ -4592,37 +4319,35 @@ def refresh_services():
     from admin_manager import AdminManager
     admin_mgr = AdminManager(db_instance)
     
+    # Do not hold the request's pooled connection during panel HTTP calls
+    ProfessionalDatabaseManager.release_connection_scope()
+    
+    services_by_panel = {}
+    for service in services:
+        if service.get('panel_id'):
+            services_by_panel.setdefault(service['panel_id'], []).append(service)
+    
+    futures = {
+        _refresh_pool.submit(_fetch_panel_service_details, admin_mgr, db_instance, panel_id, panel_services): panel_id
+        for panel_id, panel_services in services_by_panel.items()
+    }
+    details_by_service = {}
+    for future in as_completed(futures):
+        try:
+            details_by_service.update(future.result())
+        except Exception as e:
+            logger.error(f"Error refreshing services of panel {futures[future]}: {e}")
+    
     updated_services = []
+    updates = []
+    current_time = int(time.time() * 1000)
     
     for service in services:
         try:
-            panel_mgr = admin_mgr.get_panel_manager(service.get('panel_id'))
-            client_details = None
-            
-            if panel_mgr:
-                # Create callback to update inbound_id if found in different inbound
-                def update_inbound_callback(service_id, new_inbound_id):
-                    try:
-                        db_instance.update_service_inbound_id(service_id, new_inbound_id)
-                        logger.info(f"✅ Updated service {service_id} inbound_id to {new_inbound_id}")
-                    except Exception as e:
-                        logger.error(f"Failed to update inbound_id for service {service_id}: {e}")
-                
-                client_details = panel_mgr.get_client_details(
-                    service.get('inbound_id'),
-                    service.get('client_uuid'),
-                    update_inbound_callback=update_inbound_callback,
-                    service_id=service.get('id')
-                )
-            
+            client_details = details_by_service.get(service['id'])
             if client_details:
-                used_traffic = client_details.get('used_traffic', 0)
+                used_traffic = client_details.get('used_traffic', 0) or 0
                 used_gb = round(used_traffic / (1024**3), 2)
-                
-                # Update database
-                db_instance = get_db()
-                db_instance.update_client_status(service['id'], used_gb=used_gb)
-                
                 service['used_gb'] = used_gb
                 
                 # Get last_activity and handle different formats
@@ -4635,7 +4360,6 @@ def refresh_services():
                 # Handle string datetime (from Marzban) - convert to timestamp
                 if isinstance(last_activity, str):
                     try:
-                        from datetime import datetime
                         # Parse ISO format datetime string
                         dt = datetime.fromisoformat(last_activity.replace('Z', '+00:00'))
                         last_activity = int(dt.timestamp() * 1000)  # Convert to milliseconds
@@ -4646,11 +4370,8 @@ def refresh_services():
                 service['last_activity'] = last_activity
                 
                 # Check if service is online
-                import time
                 if last_activity > 0:
-                    current_time = int(time.time() * 1000)
-                    time_since_last_activity = current_time - last_activity
-                    service['is_online'] = time_since_last_activity < (5 * 60 * 1000)
+                    service['is_online'] = current_time - last_activity < (5 * 60 * 1000)
                 else:
                     service['is_online'] = False
                 
@@ -4659,12 +4380,24 @@ def refresh_services():
                     service['usage_percentage'] = min(100, round((used_gb / total_gb) * 100, 1))
                 else:
                     service['usage_percentage'] = 0
+                
+                updates.append({
+                    'id': service['id'],
+                    'used_gb': used_gb,
+                    'last_activity': last_activity,
+                    'is_online': service['is_online'],
+                    'expires_at': None
+                })
             
             updated_services.append(service)
         except Exception as e:
             logger.error(f"Error refreshing service {service['id']}: {e}")
             updated_services.append(service)
     
+    # One statement for all of the user's services
+    if updates:
+        db_instance.bulk_update_client_sync_data(updates)
+    
     return jsonify({
         'success': True,
         'services': updated_services
@@ -4846,6 +4579,10 @@ def admin_panels():
     db_instance = get_db()
     user = db_instance.get_user(user_id)
     panels = db_instance.get_panels(active_only=True)
+    from panel_health import panel_health
+    health = panel_health.load(db_instance)
+    for panel in panels:
+        panel['health'] = health.get(panel['id'])
     photo_url = session.get('photo_url', '')
     return render_template('admin/panels.html', user=user, panels=panels, photo_url=photo_url)
 
@@ -4928,8 +4665,6 @@ def api_recover_services():
 @login_required
 def serve_user_photo(user_id):
     """Serve user profile photo securely"""
-    import requests
-    
     # Access control
     current_user_id = session.get('user_id')
     db_instance = get_db()
@@ -4947,28 +4682,12 @@ def serve_user_photo(user_id):
     if not target_user:
         return jsonify({'error': 'User not found'}), 404
         
-    # Get photo URL
-    # Use sync wrapper since we are in a sync route
     try:
-        photo_url = TelegramHelper.get_user_profile_photo_url_sync(target_user['telegram_id'])
-        
-        if not photo_url:
+        response = _avatar_response(target_user['telegram_id'])
+        if response is None:
             # Return 404 so the frontend shows the default icon
             return jsonify({'error': 'No photo'}), 404
-            
-        # Stream the image
-        # Use requests to download - DISABLE PROXIES to avoid SOCKS errors
-        resp = requests.get(photo_url, stream=True, timeout=10, proxies={"http": None, "https": None})
-        if resp.status_code == 200:
-            headers = {
-                'Content-Type': resp.headers.get('Content-Type', 'image/jpeg'),
-                'Cache-Control': 'public, max-age=3600'
-            }
-            return Response(
-                resp.iter_content(chunk_size=1024),
-                headers=headers,
-                direct_passthrough=True
-            )
+        return response
     except Exception as e:
         logger.error(f"Error serving user photo: {e}")
         
@@ -4995,8 +4714,7 @@ def admin_user_detail(user_id):
     
     # Check if user has photo
     try:
-        user_photo_url = TelegramHelper.get_user_profile_photo_url_sync(user['telegram_id'])
-        user['has_photo'] = bool(user_photo_url)
+        user['has_photo'] = profile_photo_cache.has_photo(user['telegram_id'])
     except Exception as e:
         logger.error(f"Error checking user photo: {e}")
         user['has_photo'] = False
@@ -5082,12 +4800,20 @@ def admin_users():
     page = request.args.get('page', 1, type=int)
     search = request.args.get('search', '', type=str)
     
-    users, total = db_instance.get_all_users_paginated(page=page, per_page=10, search=search if search else None)
+    after = request.args.get('after', '', type=str)
+    before = request.args.get('before', '', type=str)
+    
+    users, total = db_instance.get_all_users_paginated(page=page, per_page=10, search=search if search else None,
+                                                       after=after or None, before=before or None)
     total_pages = (total + 9) // 10
+    # Keyset cursors so deep pages do not use OFFSET
+    prev_cursor = db_instance.encode_page_cursor(users[0]) if users else None
+    next_cursor = db_instance.encode_page_cursor(users[-1]) if users else None
     
     photo_url = session.get('photo_url', '')
     return render_template('admin/users.html', user=user, users=users, photo_url=photo_url, 
-                         page=page, total_pages=total_pages, total=total, search=search)
+                         page=page, total_pages=total_pages, total=total, search=search,
+                         prev_cursor=prev_cursor, next_cursor=next_cursor)
 
 @app.route('/admin/broadcast')
 @admin_required
@@ -5213,8 +4939,15 @@ def admin_services():
     page = request.args.get('page', 1, type=int)
     search = request.args.get('search', '', type=str)
     
-    services, total = db_instance.get_all_services_paginated(page=page, per_page=10, search=search if search else None)
+    after = request.args.get('after', '', type=str)
+    before = request.args.get('before', '', type=str)
+    
+    services, total = db_instance.get_all_services_paginated(page=page, per_page=10, search=search if search else None,
+                                                             after=after or None, before=before or None)
     total_pages = (total + 9) // 10
+    # Keyset cursors so deep pages do not use OFFSET
+    prev_cursor = db_instance.encode_page_cursor(services[0]) if services else None
+    next_cursor = db_instance.encode_page_cursor(services[-1]) if services else None
     
     # Get statistics for ALL services (not just current page) - use real-time monitoring data
     with db_instance.get_connection() as conn:
@@ -5249,7 +4982,8 @@ def admin_services():
     
     photo_url = session.get('photo_url', '')
     return render_template('admin/services.html', user=user, services=services, photo_url=photo_url,
-                         page=page, total_pages=total_pages, total=total, search=search, stats=stats)
+                         page=page, total_pages=total_pages, total=total, search=search, stats=stats,
+                         prev_cursor=prev_cursor, next_cursor=next_cursor)
 
 @app.route('/admin/services/<int:service_id>')
 @admin_required
@@ -5338,13 +5072,21 @@ def admin_transactions():
     search = request.args.get('search', '', type=str)
     status_filter = request.args.get('status', 'all', type=str)  # all, successful, pending
     
+    after = request.args.get('after', '', type=str)
+    before = request.args.get('before', '', type=str)
+    
     invoices, total = db_instance.get_gateway_invoices_paginated(
         page=page, 
         per_page=20, 
         search=search if search else None,
-        status_filter=status_filter if status_filter != 'all' else None
+        status_filter=status_filter if status_filter != 'all' else None,
+        after=after or None,
+        before=before or None
     )
     total_pages = (total + 19) // 20
+    # Keyset cursors so deep pages do not use OFFSET
+    prev_cursor = db_instance.encode_page_cursor(invoices[0]) if invoices else None
+    next_cursor = db_instance.encode_page_cursor(invoices[-1]) if invoices else None
     
     # Get statistics for ALL transactions (not just current page)
     with db_instance.get_connection() as conn:
@@ -5386,7 +5128,8 @@ def admin_transactions():
     
     photo_url = session.get('photo_url', '')
     return render_template('admin/transactions.html', user=user, invoices=invoices, photo_url=photo_url,
-                         page=page, total_pages=total_pages, total=total, search=search, stats=stats, status_filter=status_filter)
+                         page=page, total_pages=total_pages, total=total, search=search, stats=stats, status_filter=status_filter,
+                         prev_cursor=prev_cursor, next_cursor=next_cursor)
 
 @app.route('/api/admin/transactions/<int:invoice_id>/receipt/approve', methods=['POST'])
 @admin_required
@@ -5438,7 +5181,6 @@ def api_approve_receipt(invoice_id):
         
         # Send notification to user
         try:
-            from telegram_helper import TelegramHelper
             notification_message = f"""✅ **پرداخت شما تایید شد**
 
 💰 مبلغ: {invoice['amount']:,} تومان
@@ -5495,7 +5237,6 @@ def api_reject_receipt(invoice_id):
         try:
             user = db_instance.get_user_by_id(invoice['user_id'])
             if user:
-                from telegram_helper import TelegramHelper
                 notification_message = f"""❌ **رسید شما رد شد**
 
 💰 مبلغ: {invoice['amount']:,} تومان
@@ -5618,7 +5359,6 @@ def api_admin_settings_backup():
             def trigger_backup():
                 try:
                     from database_backup_system import DatabaseBackupManager
-                    from telegram_helper import TelegramHelper
                     import asyncio
                     
                     # Create new DB instance for thread
@@ -5626,8 +5366,8 @@ def api_admin_settings_backup():
                     from config import DB_CONFIG
                     thread_db = ProfessionalDatabaseManager(DB_CONFIG)
                     
-                    # Initialize backup manager
-                    bot = TelegramHelper.get_bot()
+                    # Initialize backup manager (own Bot: this thread runs its own event loop)
+                    bot = TelegramHelper.create_bot()
                     backup_mgr = DatabaseBackupManager(thread_db, bot, BOT_CONFIG)
                     
                     # Run async backup in new event loop
@@ -6154,7 +5894,6 @@ def api_admin_ticket_reply():
             
             # Send notification to user
             try:
-                from telegram_helper import TelegramHelper
                 ticket_user = db_instance.get_user_by_id(ticket.get('user_id'))
                 if ticket_user and ticket_user.get('telegram_id'):
                     notification_message = f"""✅ **پاسخ به تیکت شما**
@@ -6222,7 +5961,6 @@ def api_admin_close_ticket(ticket_id):
             
             # Send notification to user
             try:
-                from telegram_helper import TelegramHelper
                 ticket_user = db_instance.get_user_by_id(ticket.get('user_id'))
                 if ticket_user and ticket_user.get('telegram_id'):
                     notification_message = f"""🔒 **تیکت شما بسته شد**
@@ -6349,6 +6087,44 @@ def api_admin_stats():
         logger.error(f"Error getting admin stats: {e}")
         return secure_error_response(e)
 
+@app.route('/api/admin/db-metrics')
+@admin_required
+def api_admin_db_metrics():
+    """Get per-method database timing and slow queries for this worker process"""
+    try:
+        from query_profiler import query_profiler
+        top = min(request.args.get('top', 20, type=int), 200)
+        sort_by = request.args.get('sort', 'total_ms', type=str)
+        if sort_by not in ('total_ms', 'avg_ms', 'p95_ms', 'p99_ms', 'calls', 'queries', 'rows', 'errors'):
+            sort_by = 'total_ms'
+        return jsonify({'success': True, 'metrics': query_profiler.snapshot(top=top, sort_by=sort_by)})
+    except Exception as e:
+        logger.error(f"Error getting DB metrics: {e}")
+        return secure_error_response(e)
+
+@app.route('/api/admin/db-metrics/reset', methods=['POST'])
+@admin_required
+def api_admin_db_metrics_reset():
+    """Reset database timing statistics for this worker process"""
+    try:
+        from query_profiler import query_profiler
+        query_profiler.reset()
+        return jsonify({'success': True})
+    except Exception as e:
+        logger.error(f"Error resetting DB metrics: {e}")
+        return secure_error_response(e)
+
+@app.route('/api/admin/rate-limit-metrics')
+@admin_required
+def api_admin_rate_limit_metrics():
+    """Get rate limiter counters for this worker process and key table occupancy"""
+    try:
+        from rate_limiter import rate_limiter
+        return jsonify({'success': True, 'metrics': rate_limiter.get_stats()})
+    except Exception as e:
+        logger.error(f"Error getting rate limit metrics: {e}")
+        return secure_error_response(e)
+
 @app.route('/api/admin/panels', methods=['GET'])
 @admin_required
 def api_admin_panels():
@@ -6777,7 +6553,6 @@ def api_admin_user_balance(user_id):
         if success:
             # Send notification to user via Telegram
             try:
-                from telegram_helper import TelegramHelper
                 TelegramHelper.send_message_sync(user['telegram_id'], notification_message)
             except Exception as e:
                 logger.error(f"Error sending balance notification to user {user['telegram_id']}: {e}")
@@ -7054,7 +6829,6 @@ def api_admin_ban_user(user_id):
         
         # Send notification to user
         try:
-            from telegram_helper import TelegramHelper
             if is_banned:
                 notification_message = f"""🚫 **حساب کاربری شما مسدود شده است**
 
@@ -7156,7 +6930,6 @@ def api_admin_send_message(user_id):
         
         # Send message via Telegram
         try:
-            from telegram_helper import TelegramHelper
             admin_user = db_instance.get_user(session.get('user_id'))
             admin_name = admin_user.get('first_name', 'مدیر') if admin_user else 'مدیر'
             
@@ -7194,7 +6967,6 @@ def api_admin_gift_all_users():
         success_count = 0
         failed_count = 0
         
-        from telegram_helper import TelegramHelper
         
         for user in all_users:
             try:
@@ -7365,22 +7137,14 @@ def api_admin_broadcast():
             return jsonify({'success': False, 'message': 'هیچ کاربری با فیلتر انتخابی یافت نشد'}), 400
         
         # Send broadcast via Telegram bot
-        from telegram_helper import TelegramHelper
         
-        success_count = 0
-        failed_count = 0
-        
-        for user_id in user_ids:
-            try:
-                if broadcast_type == 'message':
-                    TelegramHelper.send_message_sync(user_id, message)
-                else:
-                    # Forward message - would need message_id and chat_id
-                    pass
-                success_count += 1
-            except Exception as e:
-                logger.error(f"Error broadcasting to user {user_id}: {e}")
-                failed_count += 1
+        if broadcast_type == 'message':
+            results = TelegramHelper.send_messages_sync(user_ids, message)
+            success_count = sum(1 for ok in results.values() if ok)
+            failed_count = len(results) - success_count
+        else:
+            # Forward message - would need message_id and chat_id
+            success_count, failed_count = len(user_ids), 0
         
         filter_names = {
             'all': 'همه کاربران',
@@ -8012,7 +7776,6 @@ def api_payment_upload_receipt():
         else:
             # No channel configured - send notification to admin via bot
             try:
-                from telegram_helper import TelegramHelper
                 import io
                 
                 # Read file content
@@ -8383,52 +8146,14 @@ def api_admin_get_service_qr(service_id):
         service = db.get_client_by_id(service_id)
         if not service:
             return jsonify({'success': False, 'message': 'سرویس یافت نشد'}), 404
-        
-        # Get config link
-        from admin_manager import AdminManager
-        db_instance = get_db()
-        admin_mgr = AdminManager(db_instance)
-        panel_mgr = admin_mgr.get_panel_manager(service['panel_id'])
-        
-        if not panel_mgr or not panel_mgr.login():
-            return jsonify({'success': False, 'message': 'خطا در اتصال به پنل'}), 500
-        
-        config_link = panel_mgr.get_client_config_link(
-            service['inbound_id'],
-            service['client_uuid'],
-            service.get('protocol', 'vless')
-        )
-        
-        if not config_link:
-            config_link = service.get('config_link', '')
-        
-        if not config_link:
-            panel = db.get_panel(service['panel_id'])
-            if panel and panel.get('panel_type') == 'marzban':
-                sub_url = panel.get('subscription_url', '')
-                if sub_url:
-                    config_link = f"{sub_url}/sub/{service['client_uuid']}"
-        
+
+        config_link = _get_service_qr_link(get_db(), service)
         if not config_link:
             return jsonify({'success': False, 'message': 'کانفیگ یافت نشد'}), 404
-        
-        # Generate QR code
-        import qrcode
-        import io
-        import base64
-        
-        qr = qrcode.QRCode(version=1, box_size=10, border=5)
-        qr.add_data(config_link)
-        qr.make(fit=True)
-        
-        img = qr.make_image(fill_color="black", back_color="white")
-        buffer = io.BytesIO()
-        img.save(buffer, format='PNG')
-        buffer.seek(0)
-        
-        qr_base64 = base64.b64encode(buffer.read()).decode()
-        
-        return jsonify({'success': True, 'qr_code': qr_base64, 'config_link': config_link})
+
+        if request.args.get('format') == 'png':
+            return _qr_png_response(config_link)
+        return _qr_json_response(config_link)
     except Exception as e:
         logger.error(f"Error generating QR code: {e}")
         return secure_error_response(e)
@@ -8923,10 +8648,9 @@ def admin_settings_backup():
                 # Reset last backup time to NOW so the scheduler picks it up based on new interval
                 # BUT user requested immediate backup, so we do it now and set last time to now
                 from database_backup_system import DatabaseBackupManager
-                from telegram_helper import TelegramHelper
                 
-                # Get bot instance for backup manager
-                bot = TelegramHelper.get_bot()
+                # Get bot instance for backup manager (own Bot: the backup runs on its own event loop)
+                bot = TelegramHelper.create_bot()
                 
                 # Initialize backup manager
                 # We need to construct a minimal bot_config for the backup manager